@@ -1,6 +1,6 @@
 import os
 import logging
-from flask import Flask
+from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
@@ -225,6 +225,14 @@ app.config['STRIPE_WEBHOOK_SECRET'] = os.environ.get('STRIPE_WEBHOOK_SECRET')
 app.config['TEST_MODE'] = os.environ.get('TEST_MODE', 'false').lower() == 'true'
 app.config['TEST_MODE_ENABLED'] = app.config['TEST_MODE']  # Alias for easier access
 
+# Report per-request user loads in an X-User-Loads header (debugging aid)
+app.config['USER_LOAD_DEBUG'] = os.environ.get('USER_LOAD_DEBUG', 'false').lower() == 'true'
+
+# Real-time events: fan-out backend (postgres/sqlite/local, defaults to the database dialect)
+# and how many streams one worker may hold open at once
+app.config['EVENT_BUS_BACKEND'] = os.environ.get('EVENT_BUS_BACKEND')
+app.config['EVENT_STREAM_MAX_CONNECTIONS'] = int(os.environ.get('EVENT_STREAM_MAX_CONNECTIONS', '4'))
+
 # Initialize Stripe
 if app.config['STRIPE_SECRET_KEY']:
     import stripe
@@ -238,14 +246,21 @@ db.init_app(app)
 migrate.init_app(app, db)
 mail.init_app(app)
 
-# Initialize notification scheduler for production deployment
+# Bind the notification jobs for the /api/scheduler webhook; the timed runs happen in
+# job_runner.py, a separate process, so web workers never scan in the background
 try:
     from notification_scheduler import init_notification_scheduler
     init_notification_scheduler(app)
-    app.logger.info("Notification scheduler initialized successfully")
 except Exception as e:
     app.logger.error(f"Error initializing notification scheduler: {e}")
 
+# Start cross-worker fan-out for the real-time event stream
+try:
+    from event_bus import init_event_bus
+    init_event_bus(app)
+except Exception as e:
+    app.logger.error(f"Error initializing event bus: {e}")
+
 with app.app_context():
     # Import models to ensure they are registered with SQLAlchemy
     import models
@@ -380,9 +395,60 @@ with app.app_context():
     except Exception as e:
         app.logger.error(f"Error during auto-migration: {e}")
     
+    # Add message.payload on existing databases and parse card fields for older messages
+    try:
+        from message_payload import prepare_message_payloads
+        prepare_message_payloads()
+    except Exception as e:
+        app.logger.error(f"Error preparing message payloads: {e}")
+
+    # Fill freshly created conversation tables from the existing message history
+    try:
+        from conversation_manager import backfill_conversations_if_empty
+        backfill_conversations_if_empty()
+    except Exception as e:
+        app.logger.error(f"Error backfilling conversations: {e}")
+
+    # Mirror existing bookings into calendar_event, which conflict checks and upcoming lists read
+    try:
+        from calendar_events import backfill_calendar_events_if_empty
+        backfill_calendar_events_if_empty()
+    except Exception as e:
+        app.logger.error(f"Error backfilling calendar events: {e}")
+    
+    # Make call_notification a once-per-type ledger on databases created before its unique index
+    try:
+        from scheduling_utils import ensure_call_notification_ledger
+        with db.engine.begin() as connection:
+            ensure_call_notification_ledger(connection)
+    except Exception as e:
+        app.logger.error(f"Error adding the call notification ledger index: {e}")
+    
+    # Enqueue reminder and auto-complete jobs for bookings made before scheduled_job existed
+    try:
+        from job_queue import backfill_scheduled_jobs_if_empty
+        backfill_scheduled_jobs_if_empty()
+    except Exception as e:
+        app.logger.error(f"Error backfilling scheduled jobs: {e}")
+    
+    # Convert the per-day working-hour columns into weekly availability rules
+    try:
+        from free_busy import backfill_weekly_rules_if_empty
+        backfill_weekly_rules_if_empty()
+    except Exception as e:
+        app.logger.error(f"Error backfilling weekly availability rules: {e}")
+    
     # Apply the fixes
     apply_database_fixes()
     
+    # Introspect tables/columns once for this worker (refreshed after DDL or on SIGHUP)
+    try:
+        from schema_capabilities import init_schema_capabilities
+        tables = init_schema_capabilities(app)
+        app.logger.info(f"Schema capabilities loaded for {len(tables)} tables")
+    except Exception as e:
+        app.logger.error(f"Error loading schema capabilities: {e}")
+    
     # Database migration and fixes are handled by Flask-Migrate
     # These modules are not essential for core functionality
     app.logger.info("Database migration handled by Flask-Migrate")
@@ -404,317 +470,30 @@ def profile_pic_url(profile_picture):
     from flask import url_for
     return url_for('static', filename=profile_picture)
 
-# Template helper function to extract contract information from message content
+# Template helpers for contract / session / consultation cards. New messages carry these
+# fields in Message.payload (see message_payload.py); the filters parse raw content for
+# anything else and keep the original behaviour.
+from message_payload import parse_contract_info, parse_session_info, parse_consultation_info
+
 @app.template_filter('extract_contract_info')
 def extract_contract_info(content):
     """Extract contract information from message content with enhanced parsing"""
-    import re
-    import json
-    from datetime import datetime
-    
-    if not content:
-        return None
-    
-    contract_info = {}
-    
-    try:
-        # First, try to parse as JSON (for structured contract messages)
-        if content.strip().startswith('{') and content.strip().endswith('}'):
-            try:
-                json_data = json.loads(content)
-                if isinstance(json_data, dict):
-                    contract_info.update({
-                        'project': json_data.get('project', 'Learning Project'),
-                        'sessions': str(json_data.get('sessions', 'N/A')),
-                        'amount': json_data.get('amount', 'N/A'),  # Keep as number for JSON data
-                        'start_date': json_data.get('start_date', 'N/A'),
-                        'contract_id': json_data.get('contract_id'),
-                        'status': json_data.get('status', 'pending'),
-                        'duration': json_data.get('duration', 'N/A'),
-                        'rate': json_data.get('rate', 'N/A')
-                    })
-                    return contract_info
-            except json.JSONDecodeError:
-                pass  # Continue with regex parsing
-        
-        # Enhanced regex patterns for different contract message formats
-        patterns = [
-            # Format 1: **Project:** Title
-            (r'\*\*Project:\*\* (.+?)(?:\n|$)', 'project'),
-            # Format 2: Project: Title
-            (r'Project:\s*(.+?)(?:\n|$)', 'project'),
-            # Format 3: 📋 **New Contract Created** format
-            (r'📋 \*\*New Contract Created\*\*\n\n\*\*Project:\*\* (.+?)(?:\n|$)', 'project'),
-            
-            # Sessions patterns
-            (r'\*\*Sessions:\*\* (\d+)', 'sessions'),
-            (r'Sessions:\s*(\d+)', 'sessions'),
-            (r'(\d+)\s*sessions?', 'sessions'),
-            
-            # Amount patterns
-            (r'\*\*Total Amount:\*\* \$([\d,]+\.?\d*)', 'amount'),
-            (r'Total Amount:\s*\$([\d,]+\.?\d*)', 'amount'),
-            (r'\$([\d,]+\.?\d*)', 'amount'),
-            
-            # Start date patterns
-            (r'\*\*Start Date:\*\* (.+?)(?:\n|$)', 'start_date'),
-            (r'Start Date:\s*(.+?)(?:\n|$)', 'start_date'),
-            (r'(\w+ \d{1,2}, \d{4})', 'start_date'),
-            
-            # Contract ID patterns
-            (r'Contract ID:\s*(\d+)', 'contract_id'),
-            (r'ID:\s*(\d+)', 'contract_id'),
-            
-            # Status patterns
-            (r'Status:\s*(pending|active|completed|cancelled)', 'status'),
-            (r'\*\*Status:\*\* (pending|active|completed|cancelled)', 'status'),
-            
-            # Duration patterns
-            (r'Duration:\s*(\d+)\s*minutes?', 'duration'),
-            (r'\*\*Duration:\*\* (\d+)\s*minutes?', 'duration'),
-            
-            # Rate patterns
-            (r'Rate:\s*\$([\d,]+\.?\d*)/session', 'rate'),
-            (r'\*\*Rate:\*\* \$([\d,]+\.?\d*)/session', 'rate')
-        ]
-        
-        # Apply all patterns
-        for pattern, key in patterns:
-            match = re.search(pattern, content, re.IGNORECASE | re.MULTILINE)
-            if match:
-                value = match.group(1).strip()
-                if key == 'amount' and not value.startswith('$'):
-                    value = f"${value}"
-                elif key == 'sessions':
-                    value = str(value)
-                contract_info[key] = value
-        
-        # Clean up and validate extracted data
-        if contract_info:
-            # Ensure amount has proper formatting (only for regex-extracted amounts)
-            if 'amount' in contract_info and contract_info['amount'] != 'N/A':
-                amount = contract_info['amount']
-                # Only add $ prefix if it's a string and doesn't already have it
-                if isinstance(amount, str) and not amount.startswith('$'):
-                    contract_info['amount'] = f"${amount}"
-            
-            # Ensure sessions is a string
-            if 'sessions' in contract_info:
-                contract_info['sessions'] = str(contract_info['sessions'])
-            
-            # Set defaults for missing fields
-            contract_info.setdefault('project', 'Learning Project')
-            contract_info.setdefault('sessions', 'N/A')
-            contract_info.setdefault('amount', 'N/A')
-            contract_info.setdefault('start_date', 'N/A')
-            contract_info.setdefault('status', 'pending')
-            contract_info.setdefault('duration', 'N/A')
-            contract_info.setdefault('rate', 'N/A')
-            
-            return contract_info
-        
-        return None
-        
-    except Exception as e:
-        app.logger.error(f"Error extracting contract info: {e}")
-        return None
+    return parse_contract_info(content)
 
-# Template helper function to extract session information from message content
 @app.template_filter('extract_session_info')
 def extract_session_info(content):
     """Extract session information from message content"""
-    import re
-    import json
-    from datetime import datetime
-    
-    if not content:
-        return None
-    
-    session_info = {}
-    
-    try:
-        # First, try to parse as JSON (for structured session messages)
-        if content.strip().startswith('{') and content.strip().endswith('}'):
-            try:
-                json_data = json.loads(content)
-                if isinstance(json_data, dict):
-                    session_info.update({
-                        'session_id': json_data.get('session_id'),
-                        'session_number': json_data.get('session_number'),
-                        'scheduled_at': json_data.get('scheduled_at'),
-                        'duration': json_data.get('duration', '60'),
-                        'status': json_data.get('status', 'scheduled'),
-                        'session_type': json_data.get('session_type', 'paid'),
-                        'contract_title': json_data.get('contract_title'),
-                        'coach_name': json_data.get('coach_name'),
-                        'student_name': json_data.get('student_name')
-                    })
-                    return session_info
-            except json.JSONDecodeError:
-                pass  # Continue with regex parsing
-        
-        # Enhanced regex patterns for different session message formats
-        patterns = [
-            # Session ID patterns
-            (r'Session ID:\s*(\d+)', 'session_id'),
-            (r'ID:\s*(\d+)', 'session_id'),
-            
-            # Session number patterns
-            (r'Session #(\d+)', 'session_number'),
-            (r'Session Number:\s*(\d+)', 'session_number'),
-            
-            # Date and time patterns
-            (r'Scheduled:\s*(.+?)(?:\n|$)', 'scheduled_at'),
-            (r'Date:\s*(.+?)(?:\n|$)', 'scheduled_at'),
-            (r'Time:\s*(.+?)(?:\n|$)', 'scheduled_at'),
-            (r'(\w+ \d{1,2}, \d{4} at \d{1,2}:\d{2} [AP]M)', 'scheduled_at'),
-            
-            # Duration patterns
-            (r'Duration:\s*(\d+)\s*minutes?', 'duration'),
-            (r'(\d+)\s*min', 'duration'),
-            
-            # Status patterns
-            (r'Status:\s*(scheduled|confirmed|completed|cancelled|missed)', 'status'),
-            (r'\*\*Status:\*\* (scheduled|confirmed|completed|cancelled|missed)', 'status'),
-            
-            # Session type patterns
-            (r'Type:\s*(free consultation|paid session|learning session)', 'session_type'),
-            (r'\*\*Type:\*\* (free consultation|paid session|learning session)', 'session_type'),
-            
-            # Contract title patterns
-            (r'Contract:\s*(.+?)(?:\n|$)', 'contract_title'),
-            (r'\*\*Contract:\*\* (.+?)(?:\n|$)', 'contract_title'),
-            
-            # Coach name patterns
-            (r'Coach:\s*(.+?)(?:\n|$)', 'coach_name'),
-            (r'\*\*Coach:\*\* (.+?)(?:\n|$)', 'coach_name'),
-            
-            # Student name patterns
-            (r'Student:\s*(.+?)(?:\n|$)', 'student_name'),
-            (r'\*\*Student:\*\* (.+?)(?:\n|$)', 'student_name')
-        ]
-        
-        # Apply all patterns
-        for pattern, key in patterns:
-            match = re.search(pattern, content, re.IGNORECASE | re.MULTILINE)
-            if match:
-                value = match.group(1).strip()
-                session_info[key] = value
-        
-        # Clean up and validate extracted data
-        if session_info:
-            # Set defaults for missing fields
-            session_info.setdefault('session_id', None)
-            session_info.setdefault('session_number', 'N/A')
-            session_info.setdefault('scheduled_at', 'N/A')
-            session_info.setdefault('duration', '60')
-            session_info.setdefault('status', 'scheduled')
-            session_info.setdefault('session_type', 'paid')
-            session_info.setdefault('contract_title', 'N/A')
-            session_info.setdefault('coach_name', 'N/A')
-            session_info.setdefault('student_name', 'N/A')
-            
-            return session_info
-        
-        return None
-        
-    except Exception as e:
-        app.logger.error(f"Error extracting session info: {e}")
-        return None
+    return parse_session_info(content)
 
-# Template helper function to extract consultation information from message content
 @app.template_filter('extract_consultation_info')
 def extract_consultation_info(content):
     """Extract consultation information from message content"""
-    import re
-    import json
-    from datetime import datetime
-    
-    if not content:
-        return None
-    
-    consultation_info = {}
-    
-    try:
-        # First, try to parse as JSON (for structured consultation messages)
-        if content.strip().startswith('{') and content.strip().endswith('}'):
-            try:
-                json_data = json.loads(content)
-                if isinstance(json_data, dict):
-                    consultation_info.update({
-                        'consultation_id': json_data.get('consultation_id'),
-                        'scheduled_at': json_data.get('scheduled_at'),
-                        'status': json_data.get('status', 'scheduled'),
-                        'coach_name': json_data.get('coach_name'),
-                        'student_name': json_data.get('student_name'),
-                        'duration': json_data.get('duration', '15')
-                    })
-                    return consultation_info
-            except json.JSONDecodeError:
-                pass  # Continue with regex parsing
-        
-        # Enhanced regex patterns for different consultation message formats
-        patterns = [
-            # Consultation ID patterns
-            (r'Consultation ID:\s*(\d+)', 'consultation_id'),
-            (r'ID:\s*(\d+)', 'consultation_id'),
-            
-            # Date and time patterns
-            (r'Scheduled:\s*(.+?)(?:\n|$)', 'scheduled_at'),
-            (r'Date:\s*(.+?)(?:\n|$)', 'scheduled_at'),
-            (r'Time:\s*(.+?)(?:\n|$)', 'scheduled_at'),
-            (r'(\w+ \d{1,2}, \d{4} at \d{1,2}:\d{2} [AP]M)', 'scheduled_at'),
-            
-            # Status patterns
-            (r'Status:\s*(scheduled|confirmed|completed|cancelled|missed)', 'status'),
-            (r'\*\*Status:\*\* (scheduled|confirmed|completed|cancelled|missed)', 'status'),
-            
-            # Coach name patterns
-            (r'Coach:\s*(.+?)(?:\n|$)', 'coach_name'),
-            (r'\*\*Coach:\*\* (.+?)(?:\n|$)', 'coach_name'),
-            
-            # Student name patterns
-            (r'Student:\s*(.+?)(?:\n|$)', 'student_name'),
-            (r'\*\*Student:\*\* (.+?)(?:\n|$)', 'student_name'),
-            
-            # Duration patterns (consultations are typically 15 minutes)
-            (r'Duration:\s*(\d+)\s*minutes?', 'duration'),
-            (r'(\d+)\s*min', 'duration')
-        ]
-        
-        # Apply all patterns
-        for pattern, key in patterns:
-            match = re.search(pattern, content, re.IGNORECASE | re.MULTILINE)
-            if match:
-                value = match.group(1).strip()
-                consultation_info[key] = value
-        
-        # Clean up and validate extracted data
-        if consultation_info:
-            # Set defaults for missing fields
-            consultation_info.setdefault('consultation_id', None)
-            consultation_info.setdefault('scheduled_at', 'N/A')
-            consultation_info.setdefault('status', 'scheduled')
-            consultation_info.setdefault('coach_name', 'N/A')
-            consultation_info.setdefault('student_name', 'N/A')
-            consultation_info.setdefault('duration', '15')
-            
-            return consultation_info
-        
-        return None
-        
-    except Exception as e:
-        app.logger.error(f"Error extracting consultation info: {e}")
-        return None
+    return parse_consultation_info(content)
 
 # Import timezone utilities before routes to avoid circular imports
-from utils import (
-    get_user_timezone, 
-    convert_utc_to_user_timezone, 
-    format_datetime_for_user,
-    format_relative_time,
-    get_timezone_offset
-)
+from utils import get_timezone_offset
+# Template filters format through one formatter per request, bound to the user's zone
+from timezone_utils import get_request_formatter
 
 # Import routes after app creation
 import routes
@@ -735,6 +514,16 @@ try:
 except Exception as e:
     print(f"❌ Error registering template globals: {e}")
 
+@app.after_request
+def report_user_loads(response):
+    """Expose how many times the current user was loaded during this request"""
+    if app.config.get('USER_LOAD_DEBUG'):
+        from utils import get_user_load_count
+        load_count = get_user_load_count()
+        response.headers['X-User-Loads'] = str(load_count)
+        app.logger.debug(f"{request.method} {request.path}: {load_count} user load(s)")
+    return response
+
 # Exempt webhook endpoints from CSRF protection (moved to avoid circular import)
 try:
     csrf.exempt(routes.scheduler_webhook)
@@ -750,63 +539,19 @@ except AttributeError:
 @app.template_filter('user_timezone')
 def user_timezone_filter(datetime_obj):
     """Convert datetime to user's timezone"""
-    from utils import get_current_user
-    from datetime import date, datetime
-    
     if not datetime_obj:
         return ''
-    
-    # Handle date objects (no timezone conversion needed for dates)
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        return datetime_obj
-    
-    # Get current user
-    user = get_current_user()
-    user_tz = get_user_timezone(user)
-    return convert_utc_to_user_timezone(datetime_obj, user_tz)
+    return get_request_formatter().to_local(datetime_obj)
 
 @app.template_filter('format_datetime')
 def format_datetime_filter(datetime_obj, format_type='full'):
     """Format datetime for user's timezone"""
-    from utils import get_current_user
-    from datetime import date, datetime
-    
-    if not datetime_obj:
-        return ''
-    
-    # Handle date objects differently
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        # For date objects, just format the date directly
-        if format_type == 'date':
-            return datetime_obj.strftime('%B %d, %Y')
-        elif format_type == 'short':
-            return datetime_obj.strftime('%m/%d/%Y')
-        else:  # full or any other type
-            return datetime_obj.strftime('%B %d, %Y')
-    
-    # Get current user
-    user = get_current_user()
-    user_tz = get_user_timezone(user)
-    return format_datetime_for_user(datetime_obj, user_tz, format_type)
+    return get_request_formatter().format(datetime_obj, format_type)
 
 @app.template_filter('relative_time')
 def relative_time_filter(datetime_obj):
     """Format datetime as relative time"""
-    from utils import get_current_user
-    from datetime import date, datetime
-    
-    if not datetime_obj:
-        return ''
-    
-    # Handle date objects (no timezone conversion needed for dates)
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        return format_relative_time(datetime_obj)
-    
-    # Get current user
-    user = get_current_user()
-    user_tz = get_user_timezone(user)
-    local_time = convert_utc_to_user_timezone(datetime_obj, user_tz)
-    return format_relative_time(local_time)
+    return get_request_formatter().relative(datetime_obj)
 
 @app.template_filter('timezone_offset')
 def timezone_offset_filter(timezone_name):
@@ -847,9 +592,9 @@ def initialize_app():
     """Initialize the application - create tables, etc."""
     with app.app_context():
         try:
-            # Initialize notification scheduler
-            from notification_scheduler import init_notification_scheduler
-            init_notification_scheduler(app)
+            # The development server runs the jobs in-process; the lease keeps it to one runner
+            from job_runner import init_job_runner
+            init_job_runner(app).start()
             
             app.logger.info("App initialization completed successfully")
         except Exception as e:
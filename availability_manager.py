@@ -3,19 +3,69 @@ Availability Manager for preventing double-booking and managing coach schedules
 Handles real-time availability checking, conflict detection, and scheduling patterns
 """
 
+import calendar
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date as date_type, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 from models import Session, ScheduledCall, User, db
 from timezone_utils import get_timezone_manager, convert_to_user_timezone
+from free_busy import get_free_busy_engine, to_naive_utc
+from occupancy_bitmap import get_occupancy_cache
+from event_bus import get_event_bus, EVENT_AVAILABILITY
 
 logger = logging.getLogger(__name__)
 
+class MonthCalendarCache:
+    """Per-day slot counts keyed by (coach_id, year, month, duration), dropped per coach on change"""
+    
+    def __init__(self, max_entries: int = 2048, ttl_seconds: int = 600):
+        self.max_entries = max_entries
+        # Safety net for changes made outside the ORM (raw SQL, other services)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+    
+    def get(self, key: Tuple[int, int, int, int]) -> Optional[Dict[str, int]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, counts = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return counts
+    
+    def set(self, key: Tuple[int, int, int, int], counts: Dict[str, int]):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), counts)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate_coach(self, coach_id: int):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == coach_id]:
+                del self._entries[key]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
 class AvailabilityManager:
     """Manages coach availability and prevents double-booking"""
     
     def __init__(self):
         self.timezone_manager = get_timezone_manager()
+        self.free_busy = get_free_busy_engine()
+        self.occupancy = get_occupancy_cache()
+        self.calendar_cache = MonthCalendarCache()
+        # Bookings and exception edits publish this on every worker after commit
+        get_event_bus().add_listener(EVENT_AVAILABILITY, self._on_availability_changed)
     
     def check_coach_availability(self, coach_id: int, start_time: datetime, 
                                end_time: datetime, exclude_session_id: int = None) -> Dict[str, Any]:
@@ -32,51 +82,24 @@ class AvailabilityManager:
             Dict with availability status and conflicts
         """
         try:
-            # Get all sessions for this coach
-            sessions = Session.query.join(Session.proposal).filter(
-                Session.proposal.has(coach_id=coach_id),
-                Session.status.in_(['scheduled', 'active']),
-                Session.scheduled_at.isnot(None)
-            ).all()
-            
-            # Get all scheduled calls for this coach
-            calls = ScheduledCall.query.filter_by(
-                coach_id=coach_id,
-                status='scheduled'
-            ).filter(
-                ScheduledCall.scheduled_at.isnot(None)
-            ).all()
-            
-            conflicts = []
-            
-            # Check session conflicts
-            for session in sessions:
-                if exclude_session_id and session.id == exclude_session_id:
-                    continue
-                    
-                if self._times_overlap(start_time, end_time, session.scheduled_at, 
-                                     session.scheduled_at + timedelta(minutes=session.duration_minutes or 60)):
-                    conflicts.append({
-                        'type': 'session',
-                        'id': session.id,
-                        'title': session.proposal.learning_request.title if session.proposal else 'Unknown Session',
-                        'start_time': session.scheduled_at,
-                        'end_time': session.scheduled_at + timedelta(minutes=session.duration_minutes or 60),
-                        'duration': session.duration_minutes or 60
-                    })
-            
-            # Check call conflicts
-            for call in calls:
-                if self._times_overlap(start_time, end_time, call.scheduled_at,
-                                     call.scheduled_at + timedelta(minutes=call.duration_minutes or 60)):
-                    conflicts.append({
-                        'type': 'call',
-                        'id': call.id,
-                        'title': f'Scheduled Call with {call.student.user.first_name} {call.student.user.last_name}',
-                        'start_time': call.scheduled_at,
-                        'end_time': call.scheduled_at + timedelta(minutes=call.duration_minutes or 60),
-                        'duration': call.duration_minutes or 60
-                    })
+            # A free slot is answered from the occupancy bitmaps; otherwise one query
+            # for every booking that overlaps it
+            if exclude_session_id is None and self.occupancy.is_busy(coach_id, start_time, end_time) is False:
+                entries = []
+            else:
+                entries = self.free_busy.get_conflicts(coach_id, start_time, end_time,
+                                                       exclude_session_id=exclude_session_id)
+            conflicts = [
+                {
+                    'type': entry.kind,
+                    'id': entry.id,
+                    'title': self._conflict_title(entry),
+                    'start_time': entry.start,
+                    'end_time': entry.end,
+                    'duration': int((entry.end - entry.start).total_seconds() // 60)
+                }
+                for entry in entries
+            ]
             
             # Check if requested time is in the past
             if start_time < datetime.utcnow():
@@ -135,185 +158,160 @@ class AvailabilityManager:
             List of available time slots
         """
         try:
-            # Get coach's working hours (you can extend this to be configurable)
-            working_hours = self._get_coach_working_hours(coach_id)
-            
-            # Get all sessions and calls for this date
-            start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_day = start_of_day + timedelta(days=1)
-            
-            sessions = Session.query.join(Session.proposal).filter(
-                Session.proposal.has(coach_id=coach_id),
-                Session.status.in_(['scheduled', 'active']),
-                Session.scheduled_at >= start_of_day,
-                Session.scheduled_at < end_of_day
-            ).all()
-            
-            calls = ScheduledCall.query.filter_by(
-                coach_id=coach_id,
-                status='scheduled'
-            ).filter(
-                ScheduledCall.scheduled_at >= start_of_day,
-                ScheduledCall.scheduled_at < end_of_day
-            ).all()
+            # Bit scan over the coach's cached working and booked time
+            day = date.date() if isinstance(date, datetime) else date
+            slots = self.occupancy.get_slots(coach_id, day, day, duration_minutes, step_minutes=30)
+            
+            return [
+                {
+                    'start_time': slot['start_utc'].replace(tzinfo=None),
+                    'end_time': slot['end_utc'].replace(tzinfo=None),
+                    'duration_minutes': duration_minutes,
+                    'available': True
+                }
+                for slot in slots.get(day.isoformat(), [])
+            ]
             
-            # Combine all booked times
-            booked_times = []
+        except Exception as e:
+            logger.error(f"Error getting coach availability slots: {e}")
+            return []
+    
+    def get_month_slot_counts(self, coach_id: int, year: int, month: int,
+                              duration_minutes: int = 60) -> Dict[str, int]:
+        """
+        Number of free slots per day of a month (ISO date -> count)
+        
+        Computed from one bit scan over the month's occupancy bitmaps and cached
+        until the coach's bookings, exceptions or working hours change.
+        """
+        key = (coach_id, year, month, duration_minutes)
+        counts = self.calendar_cache.get(key)
+        if counts is None:
+            first_day = date_type(year, month, 1)
+            last_day = date_type(year, month, calendar.monthrange(year, month)[1])
+            slots = self.occupancy.get_slots(coach_id, first_day, last_day, duration_minutes, step_minutes=30)
+            counts = {day: len(day_slots) for day, day_slots in slots.items()}
+            self.calendar_cache.set(key, counts)
+        return counts
+    
+    def get_coach_calendar_days(self, coach_id: int, year: int, month: int,
+                                duration_minutes: int = 60) -> List[Dict[str, Any]]:
+        """
+        Get calendar days for a coach for a specific month
+        
+        Args:
+            coach_id: ID of the coach
+            year: Year to get calendar for
+            month: Month to get calendar for (1-12)
+            duration_minutes: Duration of requested slot
             
-            for session in sessions:
-                booked_times.append({
-                    'start': session.scheduled_at,
-                    'end': session.scheduled_at + timedelta(minutes=session.duration_minutes or 60)
-                })
+        Returns:
+            List of calendar days with availability information
+        """
+        try:
+            counts = self.get_month_slot_counts(coach_id, year, month, duration_minutes)
+            today = date_type.today()
             
-            for call in calls:
-                booked_times.append({
-                    'start': call.scheduled_at,
-                    'end': call.scheduled_at + timedelta(minutes=call.duration_minutes or 60)
+            calendar_days = []
+            for day in range(1, calendar.monthrange(year, month)[1] + 1):
+                day_date = date_type(year, month, day)
+                available_slots = counts.get(day_date.isoformat(), 0)
+                
+                # Determine availability status
+                is_available = available_slots > 0
+                is_today = day_date == today
+                is_past = day_date < today
+                
+                # Build classes list
+                classes = []
+                if is_today:
+                    classes.append('today')
+                if is_available and not is_past:
+                    classes.append('available')
+                elif is_past or not is_available:
+                    classes.append('unavailable')
+                
+                calendar_days.append({
+                    'date': day_date.isoformat(),
+                    'day_number': day,
+                    'is_today': is_today,
+                    'is_available': is_available and not is_past,
+                    'is_past': is_past,
+                    'available_slots': available_slots,
+                    'classes': classes
                 })
             
-            # Generate available slots
-            available_slots = self._generate_available_slots(
-                working_hours, booked_times, duration_minutes, date
-            )
-            
-            return available_slots
+            return calendar_days
             
         except Exception as e:
-            logger.error(f"Error getting coach availability slots: {e}")
+            logger.error(f"Error getting coach calendar days: {e}")
             return []
     
     def suggest_alternative_times(self, coach_id: int, requested_start: datetime,
-                                requested_end: datetime, duration_minutes: int = 60) -> List[Dict[str, Any]]:
+                                requested_end: datetime, duration_minutes: int = 60,
+                                limit: int = 5, horizon_days: int = 60) -> List[Dict[str, Any]]:
         """
-        Suggest alternative times when requested slot is not available
+        Suggest the free times nearest to a requested slot, ranked by distance
         
         Args:
             coach_id: ID of the coach
             requested_start: Requested start time
-            requested_end: Requested end time
+            requested_end: Requested end time (used when no duration is given)
             duration_minutes: Duration of meeting
+            limit: Number of suggestions (K)
+            horizon_days: Days searched either side of the requested time
             
         Returns:
-            List of alternative time suggestions
+            List of alternative time suggestions (naive UTC), nearest first
         """
         try:
-            suggestions = []
-            
-            # Check same day alternatives
-            same_day_slots = self.get_coach_availability_slots(
-                coach_id, requested_start.date(), duration_minutes
-            )
+            requested_start = to_naive_utc(requested_start)
+            if not duration_minutes:
+                duration_minutes = int((to_naive_utc(requested_end) - requested_start).total_seconds() // 60)
             
-            # Filter slots that are close to requested time
-            for slot in same_day_slots:
-                slot_start = slot['start_time']
-                time_diff = abs((slot_start - requested_start).total_seconds() / 3600)  # hours
-                
-                if time_diff <= 4:  # Within 4 hours
-                    suggestions.append({
-                        'start_time': slot_start,
-                        'end_time': slot_start + timedelta(minutes=duration_minutes),
-                        'type': 'same_day',
-                        'time_diff_hours': time_diff
-                    })
+            # One sweep over the horizon's occupancy bitmaps, built from the coach's
+            # saved hours, exceptions and bookings
+            starts = self.occupancy.nearest_free_starts(coach_id, requested_start, duration_minutes,
+                                                        limit, horizon_days)
             
-            # Check next few days
-            for days_ahead in [1, 2, 3, 7]:
-                check_date = requested_start.date() + timedelta(days=days_ahead)
-                future_slots = self.get_coach_availability_slots(
-                    coach_id, check_date, duration_minutes
-                )
-                
-                if future_slots:
-                    # Take the first available slot of the day
-                    suggestions.append({
-                        'start_time': future_slots[0]['start_time'],
-                        'end_time': future_slots[0]['start_time'] + timedelta(minutes=duration_minutes),
-                        'type': f'{days_ahead}_days_ahead',
-                        'days_ahead': days_ahead
-                    })
-                    break
-            
-            # Sort suggestions by preference (same day first, then by time difference)
-            suggestions.sort(key=lambda x: (
-                0 if x['type'] == 'same_day' else 1,
-                x.get('time_diff_hours', 0)
-            ))
-            
-            return suggestions[:5]  # Return top 5 suggestions
+            suggestions = []
+            for rank, start in enumerate(starts, 1):
+                days_ahead = (start.date() - requested_start.date()).days
+                if days_ahead == 0:
+                    suggestion_type = 'same_day'
+                elif days_ahead > 0:
+                    suggestion_type = f'{days_ahead}_days_ahead'
+                else:
+                    suggestion_type = f'{-days_ahead}_days_before'
+                suggestions.append({
+                    'rank': rank,
+                    'start_time': start,
+                    'end_time': start + timedelta(minutes=duration_minutes),
+                    'type': suggestion_type,
+                    'time_diff_hours': round(abs((start - requested_start).total_seconds()) / 3600, 2),
+                    'days_ahead': days_ahead
+                })
+            return suggestions
             
         except Exception as e:
             logger.error(f"Error suggesting alternative times: {e}")
             return []
     
-    def _times_overlap(self, start1: datetime, end1: datetime, 
-                      start2: datetime, end2: datetime) -> bool:
-        """Check if two time ranges overlap"""
-        return start1 < end2 and start2 < end1
-    
-    def _get_coach_working_hours(self, coach_id: int) -> Dict[str, Any]:
-        """Get coach's working hours (default implementation)"""
-        # You can extend this to be configurable per coach
-        return {
-            'monday': {'start': '09:00', 'end': '17:00'},
-            'tuesday': {'start': '09:00', 'end': '17:00'},
-            'wednesday': {'start': '09:00', 'end': '17:00'},
-            'thursday': {'start': '09:00', 'end': '17:00'},
-            'friday': {'start': '09:00', 'end': '17:00'},
-            'saturday': {'start': '10:00', 'end': '15:00'},
-            'sunday': {'start': '10:00', 'end': '15:00'}
-        }
+    def _conflict_title(self, entry) -> str:
+        """Human readable label for a conflicting booking"""
+        if entry.kind == 'call':
+            call = db.session.get(ScheduledCall, entry.id)
+            if call and call.student:
+                return f'Scheduled Call with {call.student.first_name} {call.student.last_name}'
+            return 'Scheduled Call'
+        
+        session = db.session.get(Session, entry.id) if entry.kind == 'session' else None
+        if session and session.proposal and session.proposal.learning_request:
+            return session.proposal.learning_request.title
+        return 'Scheduled Session' if entry.kind == 'scheduled_session' else 'Unknown Session'
     
-    def _generate_available_slots(self, working_hours: Dict[str, Any], 
-                                booked_times: List[Dict[str, datetime]], 
-                                duration_minutes: int, date: datetime) -> List[Dict[str, Any]]:
-        """Generate available time slots based on working hours and booked times"""
-        try:
-            day_name = date.strftime('%A').lower()
-            day_hours = working_hours.get(day_name)
-            
-            if not day_hours:
-                return []  # Coach doesn't work on this day
-            
-            # Parse working hours
-            start_hour, start_minute = map(int, day_hours['start'].split(':'))
-            end_hour, end_minute = map(int, day_hours['end'].split(':'))
-            
-            # Create working hours range
-            work_start = date.replace(hour=start_hour, minute=start_minute, second=0, microsecond=0)
-            work_end = date.replace(hour=end_hour, minute=end_minute, second=0, microsecond=0)
-            
-            # Generate slots every 30 minutes
-            slot_interval = 30  # minutes
-            available_slots = []
-            
-            current_slot = work_start
-            while current_slot + timedelta(minutes=duration_minutes) <= work_end:
-                slot_end = current_slot + timedelta(minutes=duration_minutes)
-                
-                # Check if this slot conflicts with any booked time
-                slot_conflicts = False
-                for booked in booked_times:
-                    if self._times_overlap(current_slot, slot_end, booked['start'], booked['end']):
-                        slot_conflicts = True
-                        break
-                
-                if not slot_conflicts:
-                    available_slots.append({
-                        'start_time': current_slot,
-                        'end_time': slot_end,
-                        'duration_minutes': duration_minutes,
-                        'available': True
-                    })
-                
-                current_slot += timedelta(minutes=slot_interval)
-            
-            return available_slots
-            
-        except Exception as e:
-            logger.error(f"Error generating available slots: {e}")
-            return []
+    def _on_availability_changed(self, event: Dict[str, Any]):
+        self.calendar_cache.invalidate_coach(event['data'].get('coach_id', event['user_id']))
 
 # Global availability manager instance
 availability_manager = AvailabilityManager()
@@ -332,71 +330,14 @@ def get_coach_availability_slots(coach_id: int, date: datetime,
     """Get available time slots for a coach on a specific date"""
     return availability_manager.get_coach_availability_slots(coach_id, date, duration_minutes)
 
-def get_coach_calendar_days(coach_id: int, year: int, month: int) -> List[Dict[str, Any]]:
-    """
-    Get calendar days for a coach for a specific month
-    
-    Args:
-        coach_id: ID of the coach
-        year: Year to get calendar for
-        month: Month to get calendar for (1-12)
-        
-    Returns:
-        List of calendar days with availability information
-    """
-    try:
-        import calendar
-        from datetime import date
-        
-        # Get the calendar for the month
-        cal = calendar.monthcalendar(year, month)
-        today = date.today()
-        
-        calendar_days = []
-        
-        for week in cal:
-            for day in week:
-                if day == 0:  # Empty day
-                    continue
-                
-                # Create date object
-                day_date = date(year, month, day)
-                
-                # Check if this day is available
-                day_dt = datetime.combine(day_date, datetime.min.time())
-                available_slots = get_coach_availability_slots(coach_id, day_dt, 60)
-                
-                # Determine availability status
-                is_available = len(available_slots) > 0
-                is_today = day_date == today
-                is_past = day_date < today
-                
-                # Build classes list
-                classes = []
-                if is_today:
-                    classes.append('today')
-                if is_available and not is_past:
-                    classes.append('available')
-                elif is_past or not is_available:
-                    classes.append('unavailable')
-                
-                calendar_days.append({
-                    'date': day_date.isoformat(),
-                    'day_number': day,
-                    'is_today': is_today,
-                    'is_available': is_available and not is_past,
-                    'is_past': is_past,
-                    'available_slots': len(available_slots),
-                    'classes': classes
-                })
-        
-        return calendar_days
-        
-    except Exception as e:
-        logger.error(f"Error getting coach calendar days: {e}")
-        return []
+def get_coach_calendar_days(coach_id: int, year: int, month: int,
+                            duration_minutes: int = 60) -> List[Dict[str, Any]]:
+    """Get calendar days for a coach for a specific month"""
+    return availability_manager.get_coach_calendar_days(coach_id, year, month, duration_minutes)
 
 def suggest_alternative_times(coach_id: int, requested_start: datetime,
-                            requested_end: datetime, duration_minutes: int = 60) -> List[Dict[str, Any]]:
-    """Suggest alternative times when requested slot is not available"""
-    return availability_manager.suggest_alternative_times(coach_id, requested_start, requested_end, duration_minutes)
+                            requested_end: datetime, duration_minutes: int = 60,
+                            limit: int = 5) -> List[Dict[str, Any]]:
+    """Suggest the free times nearest to a requested slot, ranked by distance"""
+    return availability_manager.suggest_alternative_times(coach_id, requested_start, requested_end,
+                                                          duration_minutes, limit)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Script to rebuild the conversation tables (last message, unread counters)
+from the existing message history
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app import app, db
+from conversation_manager import backfill_conversations
+
+def run_backfill():
+    """Rebuild conversation and conversation_participant in one transaction"""
+    print("🔄 Rebuilding conversations from message history...")
+
+    try:
+        with app.app_context():
+            db.create_all()
+            with db.engine.begin() as connection:
+                conversation_count = backfill_conversations(connection)
+
+        print(f"✅ Backfilled {conversation_count} conversations")
+        return True
+
+    except Exception as e:
+        print(f"❌ Backfill failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    success = run_backfill()
+    sys.exit(0 if success else 1)
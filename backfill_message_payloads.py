@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Script to parse contract, session and consultation card fields into
+message.payload for messages written before the column existed
+"""
+
+import sys
+from pathlib import Path
+
+# Add the project root to the Python path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app import app, db
+from message_payload import ensure_payload_column, backfill_message_payloads
+
+def run_backfill():
+    """Add the column if needed, then fill missing payloads in batches"""
+    print("🔄 Parsing message payloads...")
+
+    try:
+        with app.app_context():
+            with db.engine.begin() as connection:
+                ensure_payload_column(connection)
+            with db.engine.begin() as connection:
+                message_count = backfill_message_payloads(connection)
+
+        print(f"✅ Backfilled payloads for {message_count} messages")
+        return True
+
+    except Exception as e:
+        print(f"❌ Backfill failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    success = run_backfill()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,46 @@
+"""
+Database-enforced booking conflicts
+Every booking has a calendar_event row, written in the booking's own transaction.
+PostgreSQL refuses overlapping busy rows with an exclusion constraint and SQLite
+with a trigger that runs under its single writer lock, so two requests racing for
+the same slot can never both commit. The loser's flush fails and the guard turns
+that into BookingConflictError.
+"""
+
+from sqlalchemy.exc import IntegrityError
+
+from models import BOOKING_OVERLAP_CONSTRAINT
+
+class BookingConflictError(ValueError):
+    """The slot was taken by another booking of the same coach"""
+
+def is_booking_conflict(error: Exception) -> bool:
+    """Whether an IntegrityError came from the overlap constraint or trigger"""
+    return BOOKING_OVERLAP_CONSTRAINT in str(getattr(error, 'orig', error))
+
+class BookingGuard:
+    """Commits bookings against the calendar_event overlap constraint"""
+
+    def commit(self, orm_session):
+        """
+        Commit a session holding a new or moved booking. An overlap refused by the
+        database rolls the session back and raises BookingConflictError.
+        """
+        try:
+            orm_session.commit()
+        except IntegrityError as e:
+            orm_session.rollback()
+            if is_booking_conflict(e):
+                raise BookingConflictError("Selected time slot was just booked by someone else") from e
+            raise
+
+# Global booking guard
+booking_guard = BookingGuard()
+
+def get_booking_guard() -> BookingGuard:
+    """Get the global booking guard"""
+    return booking_guard
+
+def commit_booking(orm_session):
+    """Commit a booking, raising BookingConflictError if the slot was taken meanwhile"""
+    booking_guard.commit(orm_session)
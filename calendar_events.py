@@ -0,0 +1,180 @@
+"""
+Calendar event reads
+calendar_event mirrors every ScheduledSession, Session and ScheduledCall that has a
+time (see models.sync_calendar_events). Busy time, conflicts and upcoming-event
+lists are range queries on its coach or student index, whatever kind of booking
+is involved, instead of one query per booking table with its own status filter.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Iterable
+
+from sqlalchemy import select, and_, not_, text, inspect as sa_inspect
+
+from models import (
+    db, CalendarEvent, ScheduledSession, ScheduledCall, Session, Proposal, LearningRequest,
+    CALENDAR_EVENT_SOURCES, CALENDAR_EVENT_DELETED, calendar_event_row
+)
+from schema_capabilities import has_table, has_column
+
+logger = logging.getLogger(__name__)
+
+def utc_bound(value: datetime) -> datetime:
+    """A naive-UTC or aware datetime as an aware UTC bound for starts_at / ends_at"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc)
+    return value.replace(tzinfo=timezone.utc)
+
+class CalendarEventStore:
+    """Range queries over calendar_event"""
+
+    def busy_statement(self, coach_ids: List[int], earliest: datetime, window_start: datetime,
+                       window_end: datetime, exclude_session_id: int = None,
+                       exclude_scheduled_session_id: int = None):
+        """
+        Busy rows (coach_id, start, end, kind, id) overlapping the window, for rows
+        starting at or after earliest. exclude_session_id drops a contract session and
+        its scheduled sessions; exclude_scheduled_session_id drops one scheduled session.
+        """
+        event = CalendarEvent
+        statement = select(
+            event.coach_id, event.starts_at, event.ends_at, event.source_type, event.source_id
+        ).where(
+            event.coach_id.in_(coach_ids),
+            event.starts_at >= utc_bound(earliest),
+            event.starts_at < utc_bound(window_end),
+            event.ends_at > utc_bound(window_start),
+            event.busy == True
+        )
+        if exclude_session_id:
+            statement = statement.where(not_(and_(
+                event.source_type.in_(('session', 'scheduled_session')),
+                event.booking_key == f'session:{exclude_session_id}'
+            )))
+        if exclude_scheduled_session_id:
+            statement = statement.where(not_(and_(
+                event.source_type == 'scheduled_session',
+                event.source_id == exclude_scheduled_session_id
+            )))
+        return statement
+
+    def upcoming_query(self, model, user_id: int, role: str = 'student', statuses: Iterable[str] = None,
+                       after: datetime = None):
+        """
+        Query for a user's bookings of one kind starting after `after` (default now),
+        ordered by start: a range scan on calendar_event joined to the booking rows,
+        so eager-loading options can still be added.
+        """
+        event = CalendarEvent
+        user_column = event.coach_id if role == 'coach' else event.student_id
+        query = model.query.join(event, and_(
+            event.source_type == CALENDAR_EVENT_SOURCES[model][0],
+            event.source_id == model.id
+        )).filter(
+            user_column == user_id,
+            event.starts_at > utc_bound(after or datetime.utcnow())
+        )
+        if statuses is not None:
+            query = query.filter(event.status.in_(list(statuses)))
+        return query.order_by(event.starts_at)
+
+    def upcoming(self, model, user_id: int, role: str = 'student', statuses: Iterable[str] = None,
+                 limit: int = 10, after: datetime = None) -> List[Any]:
+        """A user's next bookings of one kind, soonest first (one query)"""
+        return self.upcoming_query(model, user_id, role, statuses, after).limit(limit).all()
+
+    def events(self, user_id: int, window_start: datetime, window_end: datetime, role: str = 'coach',
+               busy_only: bool = False) -> List[CalendarEvent]:
+        """Every calendar event of a coach or student overlapping a window, by start (one query)"""
+        event = CalendarEvent
+        user_column = event.coach_id if role == 'coach' else event.student_id
+        query = event.query.filter(
+            user_column == user_id,
+            event.starts_at < utc_bound(window_end),
+            event.ends_at > utc_bound(window_start),
+            event.status != CALENDAR_EVENT_DELETED
+        )
+        if busy_only:
+            query = query.filter(event.busy == True)
+        return query.order_by(event.starts_at, event.id).all()
+
+    def ensure_updated_at_column(self, connection) -> bool:
+        """Add calendar_event.updated_at, and its indexes, to tables created before the column existed"""
+        if not has_table(CalendarEvent.__tablename__, connection) or \
+                has_column(CalendarEvent.__tablename__, 'updated_at', connection):
+            return False
+        timestamp = 'TIMESTAMP WITH TIME ZONE' if connection.dialect.name == 'postgresql' else 'DATETIME'
+        connection.execute(text(f"ALTER TABLE calendar_event ADD COLUMN updated_at {timestamp}"))
+        connection.execute(text("UPDATE calendar_event SET updated_at = CURRENT_TIMESTAMP"))
+        for index in CalendarEvent.__table__.indexes:
+            if index.name.endswith('_updated'):
+                index.create(connection, checkfirst=True)
+        logger.info("Added updated_at column to calendar_event table")
+        return True
+
+    def backfill_if_empty(self) -> int:
+        """Fill calendar_event from every booking with a time, on first start after the table is created"""
+        if not sa_inspect(db.engine).has_table(CalendarEvent.__tablename__):
+            return 0
+        with db.engine.begin() as connection:
+            self.ensure_updated_at_column(connection)
+        if db.session.query(CalendarEvent.id).first() is not None:
+            return 0
+
+        rows = self._accept_non_overlapping(self._booking_rows())
+        if rows:
+            db.session.execute(CalendarEvent.__table__.insert(), rows)
+        db.session.commit()
+        logger.info(f"Backfilled {len(rows)} calendar events")
+        return len(rows)
+
+    def _booking_rows(self) -> List[Dict[str, Any]]:
+        rows = []
+        for booking in ScheduledSession.query.filter(ScheduledSession.scheduled_at.isnot(None)):
+            rows.append(calendar_event_row(booking, booking.coach_id, booking.student_id))
+        for booking, coach_id, student_id in db.session.query(
+                Session, Proposal.coach_id, LearningRequest.student_id).join(
+                Proposal, Session.proposal_id == Proposal.id).join(
+                LearningRequest, Proposal.learning_request_id == LearningRequest.id).filter(
+                Session.scheduled_at.isnot(None)):
+            rows.append(calendar_event_row(booking, coach_id, student_id))
+        for booking in ScheduledCall.query.filter(ScheduledCall.scheduled_at.isnot(None)):
+            rows.append(calendar_event_row(booking, booking.coach_id, booking.student_id))
+        return [row for row in rows if row]
+
+    def _accept_non_overlapping(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Keep the earliest of any busy bookings that already overlap; the others are
+        written as not busy, which the constraint accepts, and logged.
+        """
+        by_coach = {}
+        for row in sorted(rows, key=lambda row: (row['starts_at'], row['source_type'], row['source_id'])):
+            if not row['busy']:
+                continue
+            held = by_coach.setdefault(row['coach_id'], [])
+            clash = next((other for other in held if other['booking_key'] != row['booking_key']
+                          and other['starts_at'] < row['ends_at'] and other['ends_at'] > row['starts_at']), None)
+            if clash:
+                logger.warning(f"Marking {row['source_type']} {row['source_id']} not busy: overlaps "
+                               f"{clash['source_type']} {clash['source_id']} for coach {row['coach_id']}")
+                row['busy'] = False
+                continue
+            held.append(row)
+        return rows
+
+# Global calendar event store
+calendar_event_store = CalendarEventStore()
+
+def get_calendar_event_store() -> CalendarEventStore:
+    """Get the global calendar event store"""
+    return calendar_event_store
+
+def get_upcoming(model, user_id: int, role: str = 'student', statuses: Iterable[str] = None,
+                 limit: int = 10) -> List[Any]:
+    """Get a user's next bookings of one kind, soonest first"""
+    return calendar_event_store.upcoming(model, user_id, role, statuses, limit)
+
+def backfill_calendar_events_if_empty() -> int:
+    """Backfill calendar_event once, on first start after it is created"""
+    return calendar_event_store.backfill_if_empty()
@@ -0,0 +1,192 @@
+"""
+iCalendar feeds for coaches and students
+Every user gets a private .ics URL listing their sessions and calls, read from
+calendar_event and streamed one event at a time. A conditional GET is answered
+from a single count/max(updated_at) probe, so calendar clients polling every few
+minutes mostly get a 304. Responses carry a sync token; fetching with
+?sync-token=... returns only the events written since, cancelled and deleted
+ones included as STATUS:CANCELLED.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import select, func, or_
+from sqlalchemy.orm import aliased
+
+from models import db, User, CalendarEvent, CALENDAR_EVENT_DELETED
+from calendar_events import utc_bound
+
+logger = logging.getLogger(__name__)
+
+PRODID = '-//Skileez//Calendar Feed//EN'
+
+# Full feeds cover this much history and future
+FEED_PAST_DAYS = 30
+FEED_FUTURE_DAYS = 365
+
+# Rows fetched per round-trip while streaming
+FEED_BATCH_SIZE = 500
+
+# A token reaches back this far before it was issued, covering transactions still open at the time
+SYNC_TOKEN_GRACE = timedelta(minutes=2)
+SYNC_TOKEN_PREFIX = 'v1-'
+
+# Longest content line in octets (RFC 5545 section 3.1)
+MAX_LINE_OCTETS = 75
+
+CANCELLED_STATUSES = ('cancelled', 'canceled', 'rescheduled', CALENDAR_EVENT_DELETED)
+EVENT_TITLES = {'scheduled_session': 'Session', 'session': 'Session', 'call': 'Call'}
+
+FeedVersion = namedtuple('FeedVersion', ['event_count', 'last_modified'])
+
+def escape_text(value: str) -> str:
+    """Escape a TEXT property value"""
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+def fold_line(line: str) -> str:
+    """A content line folded at 75 octets without splitting UTF-8 characters, with its CRLF"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line + '\r\n'
+
+    parts = []
+    limit = MAX_LINE_OCTETS
+    while encoded:
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = MAX_LINE_OCTETS - 1  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+def format_utc(value: datetime) -> str:
+    """DATE-TIME in UTC form, e.g. 20300603T140000Z"""
+    return utc_bound(value).strftime('%Y%m%dT%H%M%SZ')
+
+class CalendarFeed:
+    """Builds per-user iCalendar feeds from calendar_event"""
+
+    def _serializer(self) -> URLSafeSerializer:
+        return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='calendar-feed')
+
+    def feed_token(self, user_id: int) -> str:
+        """Secret URL token identifying a user's feed"""
+        return self._serializer().dumps(user_id)
+
+    def user_for_token(self, token: str) -> Optional[int]:
+        """User id a feed token was issued for, or None when it was not issued by us"""
+        try:
+            user_id = self._serializer().loads(token)
+        except BadSignature:
+            return None
+        return user_id if isinstance(user_id, int) else None
+
+    def _user_filter(self, user_id: int):
+        return or_(CalendarEvent.coach_id == user_id, CalendarEvent.student_id == user_id)
+
+    def version(self, user_id: int) -> FeedVersion:
+        """Row count and newest write for a user's events (one query on the updated_at indexes)"""
+        event_count, last_modified = db.session.execute(
+            select(func.count(CalendarEvent.id), func.max(CalendarEvent.updated_at)).where(
+                self._user_filter(user_id))
+        ).one()
+        return FeedVersion(event_count, utc_bound(last_modified) if last_modified else None)
+
+    def window(self, now: datetime = None):
+        """Start and end of a full feed: whole days, so the window only moves at midnight UTC"""
+        today = utc_bound(now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=FEED_PAST_DAYS), today + timedelta(days=FEED_FUTURE_DAYS)
+
+    def etag(self, user_id: int, version: FeedVersion, sync_token: str = None, now: datetime = None) -> str:
+        """Weak validator for one user's feed, or for one delta of it"""
+        changed = int(version.last_modified.timestamp() * 1000000) if version.last_modified else 0
+        window_start = self.window(now)[0].strftime('%Y%m%d')
+        return f'W/"ics-{user_id}-{version.event_count}-{changed}-{window_start}-{sync_token or "full"}"'
+
+    def issue_sync_token(self, now: datetime = None) -> str:
+        """Token for the next delta, reaching back SYNC_TOKEN_GRACE before now"""
+        cutoff = utc_bound(now or datetime.utcnow()) - SYNC_TOKEN_GRACE
+        return f'{SYNC_TOKEN_PREFIX}{int(cutoff.timestamp() * 1000000)}'
+
+    def parse_sync_token(self, token: str) -> datetime:
+        """Cutoff encoded in a sync token; ValueError for tokens we did not issue"""
+        if not token.startswith(SYNC_TOKEN_PREFIX):
+            raise ValueError(f"Unknown sync token: {token}")
+        micros = int(token[len(SYNC_TOKEN_PREFIX):])
+        try:
+            return datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=micros)
+        except OverflowError:
+            raise ValueError(f"Sync token out of range: {token}")
+
+    def rows(self, user_id: int, changed_since: datetime = None, now: datetime = None) -> Iterator:
+        """
+        A user's events with both people's names, by start time, fetched in batches.
+        A full feed has the window's events that were not deleted; a delta has every
+        event written after changed_since.
+        """
+        coach, student = aliased(User), aliased(User)
+        event = CalendarEvent
+        statement = select(
+            event.source_type, event.source_id, event.coach_id, event.starts_at, event.ends_at,
+            event.status, event.busy, event.updated_at,
+            coach.first_name, coach.last_name, student.first_name, student.last_name
+        ).join(coach, coach.id == event.coach_id).outerjoin(student, student.id == event.student_id).where(
+            self._user_filter(user_id)
+        )
+        if changed_since is not None:
+            statement = statement.where(event.updated_at > utc_bound(changed_since))
+        else:
+            window_start, window_end = self.window(now)
+            statement = statement.where(
+                event.starts_at < window_end,
+                event.ends_at > window_start,
+                event.status != CALENDAR_EVENT_DELETED
+            )
+        statement = statement.order_by(event.starts_at, event.id).execution_options(yield_per=FEED_BATCH_SIZE)
+        return db.session.execute(statement)
+
+    def event_lines(self, row, user_id: int) -> Iterable[str]:
+        """Content lines of one VEVENT"""
+        (source_type, source_id, coach_id, starts_at, ends_at, status, busy, updated_at,
+         coach_first, coach_last, student_first, student_last) = row
+        if coach_id == user_id:
+            other = ' '.join(name for name in (student_first, student_last) if name)
+        else:
+            other = ' '.join(name for name in (coach_first, coach_last) if name)
+        title = EVENT_TITLES.get(source_type, 'Booking')
+        summary = f"{title} with {other}" if other else title
+
+        yield 'BEGIN:VEVENT'
+        yield f'UID:{source_type}-{source_id}@skileez'
+        yield f'DTSTAMP:{format_utc(updated_at)}'
+        yield f'LAST-MODIFIED:{format_utc(updated_at)}'
+        yield f'DTSTART:{format_utc(starts_at)}'
+        yield f'DTEND:{format_utc(ends_at)}'
+        yield f'SUMMARY:{escape_text(summary)}'
+        yield f'STATUS:{"CANCELLED" if status in CANCELLED_STATUSES else "CONFIRMED"}'
+        yield f'TRANSP:{"OPAQUE" if busy else "TRANSPARENT"}'
+        yield 'END:VEVENT'
+
+    def write(self, user_id: int, changed_since: datetime = None, now: datetime = None) -> Iterator[str]:
+        """Stream a VCALENDAR, one chunk per event"""
+        yield ''.join(fold_line(line) for line in (
+            'BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+            'X-WR-CALNAME:Skileez'
+        ))
+        for row in self.rows(user_id, changed_since, now):
+            yield ''.join(fold_line(line) for line in self.event_lines(row, user_id))
+        yield fold_line('END:VCALENDAR')
+
+# Global calendar feed
+calendar_feed = CalendarFeed()
+
+def get_calendar_feed() -> CalendarFeed:
+    """Get the global calendar feed"""
+    return calendar_feed
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Check that the hot query paths (inbox, conversations, unread badges,
+notifications, contract/session lookups, scheduler scans) are served by an
+index instead of a full table scan.
+
+By default a throw-away SQLite database is created from the models and seeded
+with synthetic rows, then every query shape is run through EXPLAIN QUERY PLAN.
+Point --database-url (or DATABASE_URL) at a Postgres database to check the
+real schema with EXPLAIN instead.
+
+Usage:
+    python check_query_plans.py                      # 20k seeded messages
+    python check_query_plans.py --messages 1000000   # full-size seed
+    python check_query_plans.py --database-url postgresql://...
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from sqlalchemy import select, func, or_, and_, text
+
+import models
+from models import db, Message, Notification, Session, Contract, ScheduledCall, LearningRequest
+from models import Conversation, ConversationParticipant
+
+DEFAULT_MESSAGES = 20000
+
+
+def hot_queries():
+    """Return (name, statement) pairs mirroring the queries issued by routes.py"""
+    user_id, other_id = 1, 2
+    now = datetime(2024, 1, 15, 12, 0)
+
+    return [
+        ('inbox', select(Message).where(
+            or_(Message.sender_id == user_id, Message.recipient_id == user_id)
+        ).order_by(Message.created_at.desc())),
+        ('conversation', select(Message).where(
+            or_(and_(Message.sender_id == user_id, Message.recipient_id == other_id),
+                and_(Message.sender_id == other_id, Message.recipient_id == user_id))
+        ).order_by(Message.created_at.asc())),
+        ('poll_after_id', select(Message).where(
+            or_(and_(Message.sender_id == user_id, Message.recipient_id == other_id),
+                and_(Message.sender_id == other_id, Message.recipient_id == user_id)),
+            Message.id > 1000
+        ).order_by(Message.id.asc()).limit(200)),
+        ('unread_per_partner', select(func.count(Message.id)).where(
+            Message.sender_id == other_id, Message.recipient_id == user_id, Message.is_read == False
+        )),
+        ('unread_total', select(func.count(Message.id)).where(
+            Message.recipient_id == user_id, Message.is_read == False
+        )),
+        ('inbox_conversations', select(ConversationParticipant, Conversation).join(
+            Conversation, Conversation.id == ConversationParticipant.conversation_id
+        ).where(ConversationParticipant.user_id == user_id)),
+        ('conversation_lookup', select(Conversation).where(
+            Conversation.user_low_id == user_id, Conversation.user_high_id == other_id
+        )),
+        ('notifications_recent', select(Notification).where(
+            Notification.user_id == user_id
+        ).order_by(Notification.created_at.desc()).limit(20)),
+        ('notifications_unread_count', select(func.count(Notification.id)).where(
+            Notification.user_id == user_id, Notification.is_read == False
+        )),
+        ('sessions_for_proposal', select(Session).where(
+            Session.proposal_id == 1, Session.status == 'scheduled'
+        ).order_by(Session.scheduled_at.asc())),
+        ('coach_contracts', select(Contract).where(
+            Contract.coach_id == user_id, Contract.status == 'active'
+        )),
+        ('student_contracts', select(Contract).where(
+            Contract.student_id == user_id, Contract.status == 'active'
+        )),
+        ('calls_due', select(ScheduledCall).where(
+            ScheduledCall.status == 'scheduled',
+            ScheduledCall.scheduled_at >= now,
+            ScheduledCall.scheduled_at <= now + timedelta(hours=1)
+        )),
+        ('coach_upcoming_calls', select(ScheduledCall).where(
+            ScheduledCall.coach_id == user_id,
+            ScheduledCall.status.in_(['scheduled', 'ready']),
+            ScheduledCall.scheduled_at >= now
+        ).order_by(ScheduledCall.scheduled_at.asc())),
+        ('active_learning_requests', select(LearningRequest).where(
+            LearningRequest.is_active == True
+        ).order_by(LearningRequest.created_at.desc())),
+    ]
+
+
+def create_app(database_url):
+    """Minimal app bound to the database being checked"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    models.db.init_app(app)
+    return app
+
+
+def seed_database(message_count, user_count=500):
+    """Seed synthetic rows with raw executemany so large seeds stay fast"""
+    rng = random.Random(42)
+    base = datetime(2024, 1, 1)
+    conn = db.session.connection()
+
+    conn.execute(text(
+        'INSERT INTO "user" (id, email, password_hash, first_name, last_name, is_student, is_coach, '
+        'current_role, email_verified, created_at) '
+        "VALUES (:id, :email, 'x', 'Test', 'User', 1, 1, 'student', 1, :created_at)"
+    ), [{'id': i, 'email': f'user{i}@example.com', 'created_at': base} for i in range(1, user_count + 1)])
+
+    batch = []
+    for i in range(message_count):
+        sender = rng.randint(1, user_count)
+        recipient = rng.randint(1, user_count)
+        batch.append({
+            'sender_id': sender,
+            'recipient_id': recipient,
+            'content': 'hello',
+            'is_read': rng.random() < 0.8,
+            'created_at': base + timedelta(seconds=i),
+        })
+        if len(batch) >= 50000:
+            _insert_messages(conn, batch)
+            batch = []
+    if batch:
+        _insert_messages(conn, batch)
+
+    conn.execute(text(
+        "INSERT INTO notification (user_id, title, message, type, is_read, created_at) "
+        "VALUES (:user_id, 'n', 'n', 'general', :is_read, :created_at)"
+    ), [{'user_id': rng.randint(1, user_count), 'is_read': rng.random() < 0.8,
+         'created_at': base + timedelta(minutes=i)} for i in range(max(message_count // 10, 1))])
+
+    db.session.commit()
+    conn = db.session.connection()
+    conn.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def _insert_messages(conn, rows):
+    conn.execute(text(
+        "INSERT INTO message (sender_id, recipient_id, content, is_read, created_at) "
+        "VALUES (:sender_id, :recipient_id, :content, :is_read, :created_at)"
+    ), rows)
+
+
+def explain(statement):
+    """Return the plan lines for a statement on the current dialect"""
+    dialect = db.engine.dialect
+    compiled = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + compiled)).fetchall()
+        return [row[-1] for row in rows]
+    rows = db.session.execute(text('EXPLAIN ' + compiled)).fetchall()
+    return [row[0] for row in rows]
+
+
+def find_full_scans(plan_lines, dialect_name):
+    """
+    Return the plan lines that read a whole table or a whole index. On SQLite only
+    SEARCH is a lookup; SCAN walks every row, including "SCAN t USING [COVERING]
+    INDEX". On Postgres a Seq Scan, or an index scan without an Index Cond, does.
+    """
+    tables = {'message', 'notification', 'session', 'contract', 'scheduled_call', 'learning_request',
+              'conversation', 'conversation_participant'}
+    scans = []
+    if dialect_name == 'sqlite':
+        for line in plan_lines:
+            parts = line.strip().split()
+            if len(parts) >= 2 and parts[0] == 'SCAN' and parts[1] in tables:
+                scans.append(line.strip())
+        return scans
+
+    # Plan nodes are the first line and the "->" lines; the lines under each describe it
+    nodes = []
+    for line in plan_lines:
+        stripped = line.strip()
+        if not nodes or stripped.startswith('->'):
+            nodes.append([stripped, False])
+        elif stripped.startswith('Index Cond:'):
+            nodes[-1][1] = True
+    for node, has_index_cond in nodes:
+        if 'Seq Scan on' in node or ('Index' in node and 'Scan using' in node and not has_index_cond):
+            scans.append(node)
+    return scans
+
+
+def check_query_plans(database_url=None, message_count=DEFAULT_MESSAGES, verbose=True):
+    """Run every hot query through the planner; returns {name: [full scan lines]}"""
+    temp_path = None
+    if not database_url:
+        fd, temp_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = f'sqlite:///{temp_path}'
+
+    app = create_app(database_url)
+    failures = {}
+    try:
+        with app.app_context():
+            dialect_name = db.engine.dialect.name
+            if temp_path:
+                db.create_all()
+                if verbose:
+                    print(f"🌱 Seeding {message_count:,} messages...")
+                seed_database(message_count)
+            elif dialect_name == 'postgresql':
+                # Small tables make seq scans cheapest; ask whether an index is usable at all
+                db.session.execute(text('SET enable_seqscan = off'))
+
+            for name, statement in hot_queries():
+                plan = explain(statement)
+                scans = find_full_scans(plan, dialect_name)
+                if scans:
+                    failures[name] = scans
+                if verbose:
+                    status = '❌' if scans else '✅'
+                    print(f"{status} {name}")
+                    for line in plan:
+                        print(f"     {line}")
+            db.session.remove()
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    if verbose:
+        if failures:
+            print(f"\n❌ {len(failures)} hot queries fall back to a full table scan")
+        else:
+            print("\n✅ All hot queries use an index")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN the hot query paths')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--messages', type=int, default=DEFAULT_MESSAGES,
+                        help='number of messages to seed into the throw-away SQLite database')
+    args = parser.parse_args()
+
+    failures = check_query_plans(args.database_url, args.messages)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Claiming due rows from a table worked by several runners
+scheduled_job and email_outbox are both tables of rows that fall due and are worked
+by whichever runner gets to them first. A runner claims due rows in one UPDATE ...
+WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING, so two runners never
+claim the same row (SQLite has a single writer and ignores SKIP LOCKED), records an
+outcome only on rows it still holds, hands back rows whose runner died holding them,
+and retries failed rows after 1, 2, 4... minutes.
+"""
+
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import select, update
+
+from models import db
+
+# A row claimed this long ago by a runner that never finished it is claimed again
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+# A failed row is retried after RETRY_DELAY, then twice as long after each further failure
+RETRY_DELAY = timedelta(minutes=1)
+
+def new_worker_id() -> str:
+    """host:pid:nonce naming one runner in locked_by"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+def retry_at(attempts: int, now: datetime) -> datetime:
+    """When to retry a row that has failed attempts times: 1, 2, 4... minutes from now"""
+    return now + RETRY_DELAY * 2 ** (attempts - 1)
+
+class ClaimQueue:
+    """
+    Claims, records and releases the rows of one table that has a status, a due time,
+    locked_by and locked_at. Subclasses name the model and those columns.
+    """
+
+    model = None
+    status_column = 'status'
+    due_column = 'due_at'
+    pending_status = 'pending'
+    claimed_status = 'running'
+    # Stamped with the time of every change, on tables that have such a column
+    updated_column = None
+
+    def __init__(self):
+        self.worker_id = new_worker_id()
+
+    def _values(self, now: datetime, values: dict) -> dict:
+        if self.updated_column:
+            values.setdefault(self.updated_column, now)
+        return values
+
+    def release_stale(self, now: datetime = None) -> int:
+        """Hand back rows claimed by runners that died before recording the outcome"""
+        now = now or datetime.utcnow()
+        status = getattr(self.model, self.status_column)
+        result = db.session.execute(update(self.model).where(
+            status == self.claimed_status, self.model.locked_at < now - LOCK_TIMEOUT
+        ).values(**self._values(now, {self.status_column: self.pending_status, 'locked_by': None,
+                                      'locked_at': None})))
+        db.session.commit()
+        return result.rowcount
+
+    def claim_rows(self, columns: Iterable, now: datetime, limit: int, *criteria, **values) -> list:
+        """
+        Mark up to limit due pending rows that also match criteria as claimed by this
+        runner, setting values on them as well, and return the given columns of each.
+        Rows another runner is claiming are skipped, not waited for.
+        """
+        status, due = getattr(self.model, self.status_column), getattr(self.model, self.due_column)
+        ids = select(self.model.id).where(
+            status == self.pending_status, due <= now, *criteria
+        ).order_by(due).limit(limit).with_for_update(skip_locked=True)
+        rows = db.session.execute(
+            update(self.model).where(self.model.id.in_(ids)).values(**self._values(now, {
+                self.status_column: self.claimed_status, 'locked_by': self.worker_id, 'locked_at': now, **values
+            })).returning(*columns).execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return rows
+
+    def record(self, ids: Iterable[int], now: datetime, **values):
+        """
+        Set values on claimed rows this runner still holds and unlock them; rows that
+        were released or changed meanwhile are left alone. The caller commits.
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        db.session.execute(update(self.model).where(
+            self.model.id.in_(ids), getattr(self.model, self.status_column) == self.claimed_status,
+            self.model.locked_by == self.worker_id
+        ).values(**self._values(now, {'locked_by': None, 'locked_at': None, **values})))
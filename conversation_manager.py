@@ -0,0 +1,488 @@
+"""
+Conversation Manager for inbox summaries and the denormalized conversation tables
+Maintains Conversation / ConversationParticipant (last message, unread counters) as
+messages are written, and serves inbox summaries with keyset pagination over partners
+"""
+
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import select, update, delete, func, case, literal, union_all, and_, or_
+from sqlalchemy.orm import aliased, joinedload
+from models import Message, User, Conversation, ConversationParticipant, db
+from schema_capabilities import has_table
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+POLL_BATCH_SIZE = 200
+
+def conversation_tables_available(connection) -> bool:
+    """True when the conversation tables exist in the connected database"""
+    return (has_table(Conversation.__tablename__, connection) and
+            has_table(ConversationParticipant.__tablename__, connection))
+
+def serialize_message(message: Message) -> Dict[str, Any]:
+    """Message fields sent to the conversation view's poller"""
+    return {
+        'id': message.id,
+        'content': message.content,
+        'sender_id': message.sender_id,
+        'recipient_id': message.recipient_id,
+        'created_at': message.created_at.replace(tzinfo=timezone.utc).isoformat(),
+        'is_read': message.is_read,
+        'time_display': message.created_at.strftime('%H:%M')
+    }
+
+def _insert_ignoring_conflicts(connection, table):
+    """INSERT that skips rows violating a unique constraint (Postgres and SQLite)"""
+    dialect_name = connection.dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return table.insert()
+    return insert(table).on_conflict_do_nothing()
+
+def _unread_count_subquery(conversation_user_id, partner_user_id):
+    """Correlated count of unread messages sent by the partner to the user"""
+    return select(func.count(Message.id)).where(
+        Message.sender_id == partner_user_id,
+        Message.recipient_id == conversation_user_id,
+        Message.is_read == False
+    ).scalar_subquery()
+
+def _pair_filter(user_a_id, user_b_id):
+    """Messages exchanged between two users, in either direction"""
+    return or_(
+        and_(Message.sender_id == user_a_id, Message.recipient_id == user_b_id),
+        and_(Message.sender_id == user_b_id, Message.recipient_id == user_a_id)
+    )
+
+def _newest_pair_ids(user_a_id, user_b_id, before_id, limit):
+    """
+    IDs of the newest `limit` messages between two users below before_id.
+    Each direction is read backwards on (sender_id, recipient_id, id) and cut at
+    `limit`, so the cost does not grow with the length of the conversation
+    (an OR over both directions makes the database sort the whole thread).
+    """
+    directions = []
+    for sender_id, recipient_id in ((user_a_id, user_b_id), (user_b_id, user_a_id)):
+        query = select(Message.id).where(
+            Message.sender_id == sender_id,
+            Message.recipient_id == recipient_id
+        )
+        if before_id is not None:
+            query = query.where(Message.id < before_id)
+        directions.append(select(query.order_by(Message.id.desc()).limit(limit).subquery().c.id))
+
+    thread = union_all(*directions).subquery('thread')
+    return select(thread.c.id).order_by(thread.c.id.desc()).limit(limit)
+
+class ConversationManager:
+    """Builds inbox summaries and keeps the conversation tables up to date"""
+
+    def record_message(self, connection, message: Message):
+        """
+        Fold a newly inserted message into its conversation.
+
+        Runs on the flush connection (from the Message after_insert hook) so the
+        conversation row and unread counter commit or roll back with the message.
+        """
+        if not conversation_tables_available(connection):
+            return
+
+        conversation_table = Conversation.__table__
+        participant_table = ConversationParticipant.__table__
+        user_low_id, user_high_id = Conversation.pair_for(message.sender_id, message.recipient_id)
+        activity_at = message.created_at or datetime.utcnow()
+
+        conversation_id = self._find_conversation_id(connection, user_low_id, user_high_id)
+        if conversation_id is None:
+            connection.execute(
+                _insert_ignoring_conflicts(connection, conversation_table).values(
+                    user_low_id=user_low_id,
+                    user_high_id=user_high_id,
+                    created_at=activity_at
+                )
+            )
+            conversation_id = self._find_conversation_id(connection, user_low_id, user_high_id)
+
+            participants = [{'conversation_id': conversation_id, 'user_id': user_low_id,
+                             'partner_id': user_high_id, 'unread_count': 0}]
+            if user_low_id != user_high_id:
+                participants.append({'conversation_id': conversation_id, 'user_id': user_high_id,
+                                     'partner_id': user_low_id, 'unread_count': 0})
+            connection.execute(_insert_ignoring_conflicts(connection, participant_table), participants)
+
+        # Only move forward; a slower concurrent writer must not roll the pointer back
+        connection.execute(
+            update(conversation_table).where(
+                conversation_table.c.id == conversation_id,
+                or_(conversation_table.c.last_message_id.is_(None),
+                    conversation_table.c.last_message_id < message.id)
+            ).values(last_message_id=message.id, last_activity_at=activity_at)
+        )
+
+        if not message.is_read and message.sender_id != message.recipient_id:
+            connection.execute(
+                update(participant_table).where(
+                    participant_table.c.conversation_id == conversation_id,
+                    participant_table.c.user_id == message.recipient_id
+                ).values(unread_count=participant_table.c.unread_count + 1)
+            )
+
+    def mark_conversation_read(self, user_id: int, partner_id: int):
+        """
+        Refresh the user's unread counter after their messages were marked read.
+        Recounting (an index-only probe) instead of zeroing keeps messages that
+        arrived in the meantime. The caller commits.
+        """
+        if not conversation_tables_available(db.session.connection()):
+            return
+
+        db.session.execute(
+            update(ConversationParticipant).where(
+                ConversationParticipant.user_id == user_id,
+                ConversationParticipant.partner_id == partner_id
+            ).values(unread_count=_unread_count_subquery(user_id, partner_id))
+        )
+
+    def get_conversation(self, user_a_id: int, user_b_id: int) -> Optional[Conversation]:
+        """Get the conversation between two users, if they have exchanged messages"""
+        if not conversation_tables_available(db.session.connection()):
+            return None
+
+        user_low_id, user_high_id = Conversation.pair_for(user_a_id, user_b_id)
+        return Conversation.query.filter_by(user_low_id=user_low_id, user_high_id=user_high_id).first()
+
+    def get_last_message_id(self, user_a_id: int, user_b_id: int) -> int:
+        """ID of the newest message between two users, 0 when they have none"""
+        if conversation_tables_available(db.session.connection()):
+            user_low_id, user_high_id = Conversation.pair_for(user_a_id, user_b_id)
+            last_message_id = db.session.execute(
+                select(Conversation.last_message_id).where(
+                    Conversation.user_low_id == user_low_id,
+                    Conversation.user_high_id == user_high_id
+                )
+            ).scalar()
+        else:
+            last_message_id = db.session.execute(
+                select(func.max(Message.id)).where(_pair_filter(user_a_id, user_b_id))
+            ).scalar()
+        return last_message_id or 0
+
+    def get_messages_after(self, user_a_id: int, user_b_id: int, after_id: int,
+                           limit: int = POLL_BATCH_SIZE) -> List[Message]:
+        """Messages between two users with an ID above the cursor, oldest first"""
+        return Message.query.filter(
+            _pair_filter(user_a_id, user_b_id),
+            Message.id > after_id
+        ).order_by(Message.id.asc()).limit(limit).all()
+
+    def get_latest_messages(self, user_a_id: int, user_b_id: int,
+                            limit: int = DEFAULT_PAGE_SIZE) -> List[Message]:
+        """The newest messages between two users, returned oldest first"""
+        messages, _ = self.get_message_page(user_a_id, user_b_id, limit=limit)
+        return messages
+
+    def get_message_page(self, user_a_id: int, user_b_id: int, before_id: int = None,
+                         limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Message], bool]:
+        """
+        One page of conversation history, returned oldest first
+
+        Args:
+            user_a_id: One participant
+            user_b_id: The other participant
+            before_id: Keyset cursor; only messages with a lower ID are returned.
+                       None starts from the newest message.
+            limit: Page size, capped at MAX_PAGE_SIZE
+
+        Returns:
+            (messages, has_more) where has_more tells whether older messages remain
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        # One extra row answers "is there more?" without a COUNT
+        messages = Message.query.filter(
+            Message.id.in_(_newest_pair_ids(user_a_id, user_b_id, before_id, limit + 1))
+        ).order_by(Message.id.desc()).all()
+        has_more = len(messages) > limit
+        return list(reversed(messages[:limit])), has_more
+
+    def mark_messages_read(self, user_id: int, partner_id: int, from_id: int = None,
+                           up_to_id: int = None) -> int:
+        """
+        Mark the partner's messages to the user as read, limited to an ID window
+        (the messages on screen) when bounds are given, and refresh the unread
+        counter. Returns the number of messages marked. The caller commits.
+        """
+        query = Message.query.filter(
+            Message.sender_id == partner_id,
+            Message.recipient_id == user_id,
+            Message.is_read == False
+        )
+        if from_id is not None:
+            query = query.filter(Message.id >= from_id)
+        if up_to_id is not None:
+            query = query.filter(Message.id <= up_to_id)
+
+        updated = query.update({'is_read': True})
+        if updated:
+            self.mark_conversation_read(user_id, partner_id)
+        return updated
+
+    def get_unread_message_count(self, user_id: int) -> int:
+        """Total unread messages for a user (sum of per-conversation counters)"""
+        if conversation_tables_available(db.session.connection()):
+            total = db.session.execute(
+                select(func.coalesce(func.sum(ConversationParticipant.unread_count), 0)).where(
+                    ConversationParticipant.user_id == user_id
+                )
+            ).scalar()
+        else:
+            total = Message.query.filter_by(recipient_id=user_id, is_read=False).count()
+        return int(total or 0)
+
+    def get_conversation_summaries(self, user_id: int, limit: int = DEFAULT_PAGE_SIZE,
+                                   before_message_id: int = None) -> Tuple[Dict[int, Dict[str, Any]], Optional[int]]:
+        """
+        Get one summary per conversation partner, most recent conversation first
+
+        Args:
+            user_id: ID of the user whose inbox is being built
+            limit: Maximum number of partners to return
+            before_message_id: Keyset cursor; only conversations whose last message
+                is older than this message ID are returned
+
+        Returns:
+            Tuple of (OrderedDict partner_id -> {'partner', 'last_message', 'unread_count'},
+            cursor for the next page or None when there are no more partners)
+        """
+        limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+        if conversation_tables_available(db.session.connection()):
+            summary = self._conversation_table_subquery(user_id)
+        else:
+            summary = self._message_history_subquery(user_id)
+        partner = aliased(User)
+
+        query = select(
+            Message, partner, summary.c.unread_count
+        ).join(
+            summary, Message.id == summary.c.message_id
+        ).join(
+            partner, partner.id == summary.c.partner_id
+        ).options(
+            joinedload(partner.student_profile),
+            joinedload(partner.coach_profile)
+        ).order_by(
+            summary.c.message_id.desc()
+        ).limit(limit + 1)
+
+        if before_message_id:
+            query = query.where(summary.c.message_id < before_message_id)
+
+        rows = db.session.execute(query).unique().all()
+
+        conversations = OrderedDict()
+        for message, partner_user, unread_count in rows[:limit]:
+            conversations[partner_user.id] = {
+                'partner': partner_user,
+                'last_message': message,
+                'unread_count': int(unread_count or 0)
+            }
+
+        next_cursor = None
+        if len(rows) > limit and conversations:
+            next_cursor = next(reversed(conversations.values()))['last_message'].id
+
+        return conversations, next_cursor
+
+    def backfill_conversations(self, connection) -> int:
+        """
+        Rebuild the conversation tables from the message history in bulk.
+        Returns the number of conversations created.
+        """
+        conversation_table = Conversation.__table__
+        participant_table = ConversationParticipant.__table__
+        message_table = Message.__table__
+
+        connection.execute(delete(participant_table))
+        connection.execute(delete(conversation_table))
+
+        user_low_id = case(
+            (message_table.c.sender_id < message_table.c.recipient_id, message_table.c.sender_id),
+            else_=message_table.c.recipient_id
+        )
+        user_high_id = case(
+            (message_table.c.sender_id < message_table.c.recipient_id, message_table.c.recipient_id),
+            else_=message_table.c.sender_id
+        )
+        pairs = select(
+            user_low_id.label('user_low_id'),
+            user_high_id.label('user_high_id'),
+            message_table.c.id,
+            message_table.c.created_at
+        ).subquery('pairs')
+
+        connection.execute(conversation_table.insert().from_select(
+            ['user_low_id', 'user_high_id', 'last_message_id', 'last_activity_at', 'created_at'],
+            select(
+                pairs.c.user_low_id,
+                pairs.c.user_high_id,
+                func.max(pairs.c.id),
+                func.max(pairs.c.created_at),
+                func.min(pairs.c.created_at)
+            ).group_by(pairs.c.user_low_id, pairs.c.user_high_id)
+        ))
+
+        participant_columns = ['conversation_id', 'user_id', 'partner_id', 'unread_count']
+        connection.execute(participant_table.insert().from_select(
+            participant_columns,
+            select(
+                conversation_table.c.id,
+                conversation_table.c.user_low_id,
+                conversation_table.c.user_high_id,
+                _unread_count_subquery(conversation_table.c.user_low_id, conversation_table.c.user_high_id)
+            )
+        ))
+        connection.execute(participant_table.insert().from_select(
+            participant_columns,
+            select(
+                conversation_table.c.id,
+                conversation_table.c.user_high_id,
+                conversation_table.c.user_low_id,
+                _unread_count_subquery(conversation_table.c.user_high_id, conversation_table.c.user_low_id)
+            ).where(conversation_table.c.user_low_id != conversation_table.c.user_high_id)
+        ))
+
+        return connection.execute(select(func.count()).select_from(conversation_table)).scalar()
+
+    def backfill_if_empty(self) -> int:
+        """Backfill when the conversation table is empty but messages exist (first deploy)"""
+        with db.engine.begin() as connection:
+            if not conversation_tables_available(connection):
+                return 0
+            has_conversations = connection.execute(select(Conversation.__table__.c.id).limit(1)).first()
+            has_messages = connection.execute(select(Message.__table__.c.id).limit(1)).first()
+            if has_conversations or not has_messages:
+                return 0
+            conversation_count = self.backfill_conversations(connection)
+        logger.info(f"Backfilled {conversation_count} conversations from message history")
+        return conversation_count
+
+    def _find_conversation_id(self, connection, user_low_id: int, user_high_id: int) -> Optional[int]:
+        conversation_table = Conversation.__table__
+        return connection.execute(
+            select(conversation_table.c.id).where(
+                conversation_table.c.user_low_id == user_low_id,
+                conversation_table.c.user_high_id == user_high_id
+            )
+        ).scalar()
+
+    def _conversation_table_subquery(self, user_id: int):
+        """One row per partner straight from the maintained participant rows"""
+        return select(
+            ConversationParticipant.partner_id.label('partner_id'),
+            Conversation.last_message_id.label('message_id'),
+            ConversationParticipant.unread_count.label('unread_count')
+        ).join(
+            Conversation, Conversation.id == ConversationParticipant.conversation_id
+        ).where(
+            ConversationParticipant.user_id == user_id,
+            Conversation.last_message_id.isnot(None)
+        ).subquery('conversation_summary')
+
+    def _message_history_subquery(self, user_id: int):
+        """
+        One row per partner: the ID of the last message and the unread count.
+        Used until the conversation tables exist.
+
+        Sent and received messages are read through separate index-only branches
+        (sender and recipient indexes) so only IDs, partner IDs and read flags are
+        aggregated. Message IDs are monotonic, so the highest ID is the last message.
+        """
+        sent = select(
+            Message.recipient_id.label('partner_id'),
+            Message.id.label('message_id'),
+            literal(0).label('unread')
+        ).where(Message.sender_id == user_id)
+
+        received = select(
+            Message.sender_id.label('partner_id'),
+            Message.id.label('message_id'),
+            case((Message.is_read == False, 1), else_=0).label('unread')
+        ).where(
+            Message.recipient_id == user_id,
+            Message.sender_id != user_id
+        )
+
+        thread = union_all(sent, received).subquery('thread')
+
+        return select(
+            thread.c.partner_id,
+            func.max(thread.c.message_id).label('message_id'),
+            func.sum(thread.c.unread).label('unread_count')
+        ).group_by(thread.c.partner_id).subquery('conversation_summary')
+
+# Global conversation manager instance
+conversation_manager = ConversationManager()
+
+def get_conversation_manager() -> ConversationManager:
+    """Get the global conversation manager instance"""
+    return conversation_manager
+
+def get_conversation_summaries(user_id: int, limit: int = DEFAULT_PAGE_SIZE,
+                               before_message_id: int = None) -> Tuple[Dict[int, Dict[str, Any]], Optional[int]]:
+    """Get inbox summaries (last message, partner, unread count) for a user"""
+    return conversation_manager.get_conversation_summaries(user_id, limit, before_message_id)
+
+def record_message(connection, message: Message):
+    """Update the conversation tables for a newly inserted message"""
+    return conversation_manager.record_message(connection, message)
+
+def mark_conversation_read(user_id: int, partner_id: int):
+    """Refresh a user's unread counter for one conversation"""
+    return conversation_manager.mark_conversation_read(user_id, partner_id)
+
+def get_conversation(user_a_id: int, user_b_id: int) -> Optional[Conversation]:
+    """Get the conversation between two users"""
+    return conversation_manager.get_conversation(user_a_id, user_b_id)
+
+def get_last_message_id(user_a_id: int, user_b_id: int) -> int:
+    """Get the newest message ID between two users"""
+    return conversation_manager.get_last_message_id(user_a_id, user_b_id)
+
+def get_messages_after(user_a_id: int, user_b_id: int, after_id: int,
+                       limit: int = POLL_BATCH_SIZE) -> List[Message]:
+    """Get messages between two users newer than a message ID"""
+    return conversation_manager.get_messages_after(user_a_id, user_b_id, after_id, limit)
+
+def get_latest_messages(user_a_id: int, user_b_id: int, limit: int = DEFAULT_PAGE_SIZE) -> List[Message]:
+    """Get the newest messages between two users"""
+    return conversation_manager.get_latest_messages(user_a_id, user_b_id, limit)
+
+def get_message_page(user_a_id: int, user_b_id: int, before_id: int = None,
+                     limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Message], bool]:
+    """Get one page of history between two users, older than a message ID"""
+    return conversation_manager.get_message_page(user_a_id, user_b_id, before_id, limit)
+
+def mark_messages_read(user_id: int, partner_id: int, from_id: int = None, up_to_id: int = None) -> int:
+    """Mark a partner's messages read within an ID window"""
+    return conversation_manager.mark_messages_read(user_id, partner_id, from_id, up_to_id)
+
+def get_unread_message_count(user_id: int) -> int:
+    """Get the total unread message count for a user"""
+    return conversation_manager.get_unread_message_count(user_id)
+
+def backfill_conversations(connection) -> int:
+    """Rebuild the conversation tables from existing messages"""
+    return conversation_manager.backfill_conversations(connection)
+
+def backfill_conversations_if_empty() -> int:
+    """Backfill the conversation tables once, on first start after they are created"""
+    return conversation_manager.backfill_if_empty()
@@ -0,0 +1,213 @@
+"""
+Transactional email outbox
+send_email used to open a Flask-Mail connection for every message, inside the web
+request or scheduler thread that asked for it, so one slow SMTP handshake held that
+thread for up to MAIL_TIMEOUT. Now send_email only writes an email_outbox row in the
+caller's transaction, and the job runner's email_outbox job drains the table: each
+batch goes out over one SMTP connection (Flask-Mail's connect(), which reconnects
+every MAIL_MAX_EMAILS messages). Failed messages are retried after 1, 2, 4...
+minutes and dead-lettered after MAX_ATTEMPTS or a permanent (5xx) refusal; a server
+that cannot be reached leaves the batch pending without counting it against them.
+"""
+
+import logging
+import smtplib
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app
+from flask_mail import Message, BadHeaderError, email_dispatched
+from sqlalchemy import update, delete
+
+from models import db, EmailOutbox
+from schema_capabilities import has_table
+from claim_queue import ClaimQueue, RETRY_DELAY, retry_at
+
+logger = logging.getLogger(__name__)
+
+# Emails claimed per batch; each batch is sent over one SMTP connection
+BATCH_SIZE = 50
+
+# A failing email is retried after 1, 2, 4, 8 minutes (claim_queue.py), then dead-lettered
+MAX_ATTEMPTS = 5
+
+# Sent emails are kept this long; dead letters are kept until someone looks at them
+RETENTION = timedelta(days=30)
+
+def normalize_recipients(recipients) -> List[str]:
+    """A single address or any iterable of them as a list"""
+    if isinstance(recipients, str):
+        return [recipients]
+    return [recipient for recipient in recipients if recipient]
+
+def is_permanent(error: Exception) -> bool:
+    """Whether retrying a message can never help: a 5xx refusal or a malformed message"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return isinstance(error, (BadHeaderError, AssertionError, ValueError))
+
+def is_connection_error(error: Exception) -> bool:
+    """Whether the connection broke, as opposed to the server answering this message"""
+    if isinstance(error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+        return False
+    return isinstance(error, (smtplib.SMTPException, OSError))
+
+class EmailOutboxSender(ClaimQueue):
+    """Queues emails in email_outbox and sends them in batches over pooled connections"""
+
+    model = EmailOutbox
+    due_column = 'next_attempt_at'
+    claimed_status = 'sending'
+
+    def enqueue(self, recipients, subject: str, html: str = None, text: str = None,
+                sender: str = None, commit: bool = True) -> EmailOutbox:
+        """
+        Add an email to the outbox in the current transaction. With commit=False the
+        caller's own commit sends it, and a rollback drops it with the caller's changes.
+        """
+        email = EmailOutbox(recipients=normalize_recipients(recipients), subject=subject, html=html, text=text,
+                            sender=sender, status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+        if not email.recipients:
+            raise ValueError('An email needs at least one recipient')
+        db.session.add(email)
+        if commit:
+            db.session.commit()
+        return email
+
+    def claim(self, now: datetime = None, limit: int = BATCH_SIZE) -> list:
+        """Mark up to limit due emails as being sent by this sender and return them, oldest first"""
+        now = now or datetime.utcnow()
+        emails = self.claim_rows(
+            (EmailOutbox.id, EmailOutbox.recipients, EmailOutbox.subject, EmailOutbox.html, EmailOutbox.text,
+             EmailOutbox.sender, EmailOutbox.attempts),
+            now, limit
+        )
+        return sorted(emails, key=lambda email: email.id)
+
+    def message(self, email) -> Message:
+        """The Flask-Mail message for a claimed email"""
+        return Message(email.subject, recipients=list(email.recipients), html=email.html, body=email.text,
+                       sender=email.sender or None)
+
+    def _fail(self, email, error: Exception, now: datetime) -> str:
+        """Retry a refused message after 1, 2, 4... minutes, or dead-letter it"""
+        attempts = email.attempts + 1
+        if is_permanent(error) or attempts >= MAX_ATTEMPTS:
+            logger.error(f"❌ Email {email.id} to {email.recipients} dead-lettered after {attempts} attempts: {error}")
+            self.record([email.id], now, status='dead', attempts=attempts, last_error=str(error)[-4000:])
+            return 'dead'
+        logger.warning(f"⚠️ Email {email.id} to {email.recipients} failed, retrying: {error}")
+        self.record([email.id], now, status='pending', attempts=attempts, last_error=str(error)[-4000:],
+                    next_attempt_at=retry_at(attempts, now))
+        return 'retried'
+
+    def send_batch(self, emails: list, now: datetime = None) -> Counter:
+        """
+        Send claimed emails over one SMTP connection and record each outcome. A
+        connection that breaks after sending something is reopened; when the server
+        cannot be reached or refuses the login, the rest of the batch is deferred.
+        """
+        now = now or datetime.utcnow()
+        app = current_app._get_current_object()
+        mail = app.extensions['mail']
+        outcomes = Counter()
+        waiting = list(emails)
+        sent = []
+        dispatched = []
+
+        # Flask-Mail 0.10+ (see requirements.txt) signals email_dispatched from the app with message=
+        def record_dispatch(sender, message, **kwargs):
+            dispatched.append(message)
+
+        with email_dispatched.connected_to(record_dispatch, sender=app):
+            while waiting:
+                sent_before = len(sent)
+                try:
+                    with mail.connect() as connection:
+                        while waiting:
+                            email = waiting[0]
+                            message = self.message(email)
+                            try:
+                                connection.send(message)
+                            except Exception as e:
+                                # Flask-Mail reconnects right after every MAIL_MAX_EMAILS-th message,
+                                # so a connection error may follow a delivered one
+                                if dispatched and dispatched[-1] is message:
+                                    sent.append(waiting.pop(0).id)
+                                elif not is_connection_error(e):
+                                    outcomes[self._fail(waiting.pop(0), e, now)] += 1
+                                    continue
+                                raise
+                            sent.append(waiting.pop(0).id)
+                except Exception as e:
+                    # Connecting, logging in or a broken connection: not the messages' fault
+                    if len(sent) > sent_before and is_connection_error(e):
+                        logger.warning(f"⚠️ SMTP connection lost after {len(sent) - sent_before} emails, reconnecting: {e}")
+                        continue
+                    logger.error(f"❌ SMTP server unavailable, {len(waiting)} emails wait for the next run: {e}")
+                    self.record([email.id for email in waiting], now, status='pending', last_error=str(e)[-4000:],
+                                next_attempt_at=now + RETRY_DELAY)
+                    outcomes['deferred'] += len(waiting)
+                    waiting = []
+
+        self.record(sent, now, status='sent', sent_at=datetime.utcnow(), last_error=None)
+        db.session.commit()
+        outcomes['sent'] += len(sent)
+        return +outcomes
+
+    def drain(self, now: datetime = None, limit: int = BATCH_SIZE) -> Dict[str, int]:
+        """Send every due email, a batch per connection; counts per outcome"""
+        now = now or datetime.utcnow()
+        if not has_table(EmailOutbox.__tablename__):
+            return {'warning': 'Database schema needs update', 'emails_due': 0}
+
+        self.release_stale(now)
+        outcomes = Counter()
+        while True:
+            emails = self.claim(now, limit)
+            if emails:
+                outcomes.update(self.send_batch(emails, now))
+            # A deferred batch would only be claimed again once its delay is over
+            if len(emails) < limit or outcomes['deferred']:
+                break
+        if outcomes['sent']:
+            logger.info(f"📧 Sent {outcomes['sent']} queued emails")
+        return {'emails_due': sum(outcomes.values()), **outcomes}
+
+    def purge(self, now: datetime = None) -> int:
+        """Delete emails sent longer than RETENTION ago"""
+        now = now or datetime.utcnow()
+        result = db.session.execute(delete(EmailOutbox).where(
+            EmailOutbox.status == 'sent', EmailOutbox.sent_at < now - RETENTION
+        ))
+        db.session.commit()
+        return result.rowcount
+
+    def requeue_dead(self, ids: Optional[Iterable[int]] = None) -> int:
+        """Give dead letters (all, or the given ones) a fresh set of attempts"""
+        statement = update(EmailOutbox).where(EmailOutbox.status == 'dead')
+        if ids is not None:
+            statement = statement.where(EmailOutbox.id.in_(list(ids)))
+        result = db.session.execute(statement.values(status='pending', attempts=0,
+                                                     next_attempt_at=datetime.utcnow()))
+        db.session.commit()
+        return result.rowcount
+
+# Global email outbox instance
+email_outbox = EmailOutboxSender()
+
+def get_email_outbox() -> EmailOutboxSender:
+    """Get the global email outbox instance"""
+    return email_outbox
+
+def queue_email(recipients, subject: str, html: str = None, text: str = None, sender: str = None,
+                commit: bool = True) -> EmailOutbox:
+    """Add an email to the outbox; it is sent by the next email_outbox run"""
+    return email_outbox.enqueue(recipients, subject, html, text, sender, commit)
+
+def send_queued_emails(now: datetime = None) -> Dict[str, int]:
+    """Send every due email in the outbox"""
+    return email_outbox.drain(now)
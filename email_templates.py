@@ -0,0 +1,87 @@
+"""
+Precompiled email templates
+Every email is one Jinja file in templates/emails/ holding its subject, plain-text
+and HTML parts: `subject` and `text` blocks, and the HTML body in `content`, laid
+out by emails/email_base.html. Each file is compiled once per process and kept;
+a recipient's email is rendered from one context, the subject and text blocks and
+then the HTML layout, and a batch of recipients shares the compiled template
+instead of each send building its HTML with f-strings or parsing the file again.
+"""
+
+import logging
+import os
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, List
+
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'text', 'html'])
+
+class EmailRenderer:
+    """Compiles each email template once and renders recipients against it"""
+
+    def __init__(self, template_folder: str = TEMPLATE_FOLDER):
+        # Templates never change while the process runs, so nothing is checked for reloading
+        self.environment = Environment(
+            loader=FileSystemLoader(template_folder),
+            autoescape=select_autoescape(['html']),
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self._templates: Dict[str, Template] = {}
+        self._lock = threading.Lock()
+        self.compile_count = 0
+
+    def template(self, name: str) -> Template:
+        """The compiled emails/<name>.html, compiled on first use"""
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+                if template is None:
+                    template = self.environment.get_template(f'emails/{name}.html')
+                    missing = {'subject', 'text'} - set(template.blocks)
+                    if missing:
+                        raise ValueError(f"Email template {name} has no {', '.join(sorted(missing))} block")
+                    self._templates[name] = template
+                    self.compile_count += 1
+                    logger.info(f"📧 Compiled email template {name}")
+        return template
+
+    def _render(self, template: Template, variables: dict) -> RenderedEmail:
+        context = template.new_context(variables)
+        concat = self.environment.concat
+        subject = ' '.join(concat(template.blocks['subject'](context)).split())
+        text = concat(template.blocks['text'](context)).strip() + '\n'
+        html = concat(template.root_render_func(context))
+        return RenderedEmail(subject, text, html)
+
+    def render(self, name: str, **context) -> RenderedEmail:
+        """Subject, text and HTML of one email"""
+        return self._render(self.template(name), context)
+
+    def render_batch(self, name: str, recipients: Iterable[dict], **shared) -> List[RenderedEmail]:
+        """One email per recipient context, each merged over the shared context"""
+        template = self.template(name)
+        return [self._render(template, {**shared, **recipient}) for recipient in recipients]
+
+# Global email renderer instance
+email_renderer = EmailRenderer()
+
+def get_email_renderer() -> EmailRenderer:
+    """Get the global email renderer instance"""
+    return email_renderer
+
+def render_email(name: str, **context) -> RenderedEmail:
+    """Render one email from templates/emails/<name>.html"""
+    return email_renderer.render(name, **context)
+
+def render_emails(name: str, recipients: Iterable[dict], **shared) -> List[RenderedEmail]:
+    """Render an email for each recipient context against one compiled template"""
+    return email_renderer.render_batch(name, recipients, **shared)
@@ -3,7 +3,11 @@ import logging
 from datetime import datetime, timedelta
 from flask import url_for, current_app, render_template_string
 from flask_mail import Message
-from models import User
+from models import db, User, EmailOutbox
+from email_outbox import queue_email, normalize_recipients
+from schema_capabilities import has_table
+from email_templates import render_email, render_emails
+from timezone_utils import get_formatter
 
 def get_mail():
     """Get mail instance from current app context"""
@@ -18,12 +22,84 @@ def generate_verification_token():
     """Generate a secure verification token"""
     return secrets.token_urlsafe(32)
 
-def send_email(recipients, subject, html_content, text_content=None):
-    """Send email using Flask-Mail"""
+def queue_emails(emails, commit=False):
+    """
+    Queue (recipients, subject, html, text) emails in one savepoint. If any cannot
+    be queued none are, and the caller's own pending changes are left untouched.
+    """
+    try:
+        with db.session.begin_nested():
+            for recipients, subject, html_content, text_content in emails:
+                queue_email(recipients, subject, html_content, text_content, commit=False)
+    except Exception as e:
+        logging.error(f"Error queueing email: {e}")
+        return False
+    if commit:
+        try:
+            db.session.commit()
+        except Exception as e:
+            logging.error(f"Error committing queued email: {e}")
+            db.session.rollback()
+            return False
+    return True
+
+def send_email(recipients, subject, html_content, text_content=None, commit=False):
+    """
+    Queue an email in the outbox; the job runner's email_outbox job sends it.
+    The email goes out with the caller's commit and is dropped by their rollback;
+    commit=True commits the session right away. Sent directly until the
+    email_outbox table exists.
+    """
+    if not has_table(EmailOutbox.__tablename__):
+        return send_email_now(recipients, subject, html_content, text_content)
+    return queue_emails([(recipients, subject, html_content, text_content)], commit)
+
+def send_template_email(recipients, template, commit=False, **context):
+    """Queue one email rendered from templates/emails/<template>.html"""
+    try:
+        email = render_email(template, **context)
+    except Exception as e:
+        logging.error(f"Error rendering email {template}: {e}")
+        return False
+    return send_email(recipients, email.subject, email.html, email.text, commit)
+
+def send_template_emails(template, recipients, commit=False, **shared):
+    """
+    Queue one email per (address, context) pair, all rendered against one compiled
+    template and queued together; returns how many were queued.
+    """
+    recipients = [(address, context) for address, context in recipients if address]
+    try:
+        emails = render_emails(template, [context for _, context in recipients], **shared)
+    except Exception as e:
+        logging.error(f"Error rendering {template} emails: {e}")
+        return 0
+    if not has_table(EmailOutbox.__tablename__):
+        return sum(send_email_now(address, email.subject, email.html, email.text)
+                   for (address, _), email in zip(recipients, emails))
+    queued = queue_emails([(address, email.subject, email.html, email.text)
+                           for (address, _), email in zip(recipients, emails)], commit)
+    return len(emails) if queued else 0
+
+def email_url(path):
+    """Absolute link to an app path, for use in emails"""
+    base_url = current_app.config.get('BASE_URL', 'http://localhost:5000').rstrip('/')
+    return f"{base_url}{path}"
+
+def time_until_text(start, now=None):
+    """How long until start, as a reminder would say it: '30 minutes', '1 hour', '24 hours'"""
+    minutes = max(1, round((start - (now or datetime.utcnow())).total_seconds() / 60))
+    if minutes >= 90:
+        hours = round(minutes / 60)
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+def send_email_now(recipients, subject, html_content, text_content=None):
+    """Send email using Flask-Mail, in this thread"""
     try:
         mail = get_mail()
         if mail:
-            msg = Message(subject, recipients=recipients, html=html_content)
+            msg = Message(subject, recipients=normalize_recipients(recipients), html=html_content)
             if text_content:
                 msg.body = text_content
             mail.send(msg)
@@ -45,32 +121,8 @@ def send_verification_email(user):
         from app import db
         db.session.commit()
         
-        # Get verification URL
-        base_url = current_app.config.get('BASE_URL', 'http://localhost:5000')
-        if base_url.endswith('/'):
-            base_url = base_url[:-1]
-        verification_url = f"{base_url}/verify-email/{token}"
-        
-        # Email content
-        subject = "Verify Your Skileez Account"
-        html_content = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <h2 style="color: #333;">Welcome to Skileez!</h2>
-            <p>Thank you for creating an account. Please click the button below to verify your email address:</p>
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{verification_url}" style="background-color: #4CAF50; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; display: inline-block;">Verify Email Address</a>
-            </div>
-            <p>Or copy and paste this link into your browser:</p>
-            <p style="word-break: break-all; background-color: #f5f5f5; padding: 10px; border-radius: 3px;">{verification_url}</p>
-            <p><strong>This link will expire in 24 hours.</strong></p>
-            <p>If you didn't create this account, please ignore this email.</p>
-        </body>
-        </html>
-        """
-        
-        # Send email
-        return send_email([user.email], subject, html_content)
+        verification_url = email_url(f"/verify-email/{token}")
+        return send_template_email([user.email], 'verification', commit=True, verification_url=verification_url)
         
     except Exception as e:
         logging.error(f"Error sending verification email: {e}")
@@ -125,44 +177,74 @@ def verify_email_change_token(token):
 def send_email_change_verification(user, new_email):
     """Send email change verification"""
     print(f"DEBUG: Sending email change verification to {new_email}")
-    return send_email([new_email], "Email Change Verification", "Please verify your new email address")
+    return send_email([new_email], "Email Change Verification", "Please verify your new email address", commit=True)
 
 def send_session_scheduled_email(user, session):
     """Send session scheduled email"""
     print(f"DEBUG: Sending session scheduled email to {user.email}")
-    return send_email([user.email], "Session Scheduled", f"Your session has been scheduled for {session.scheduled_at}")
+    return send_email([user.email], "Session Scheduled", f"Your session has been scheduled for {session.scheduled_at}", commit=True)
 
 def send_reschedule_request_email(user, session):
     """Send reschedule request email"""
     print(f"DEBUG: Sending reschedule request email to {user.email}")
-    return send_email([user.email], "Reschedule Request", "A reschedule request has been made for your session")
+    return send_email([user.email], "Reschedule Request", "A reschedule request has been made for your session", commit=True)
 
 def send_reschedule_approved_email(user, session):
     """Send reschedule approved email"""
     print(f"DEBUG: Sending reschedule approved email to {user.email}")
-    return send_email([user.email], "Reschedule Approved", "Your session reschedule has been approved")
+    return send_email([user.email], "Reschedule Approved", "Your session reschedule has been approved", commit=True)
 
 def send_reschedule_declined_email(user, session):
     """Send reschedule declined email"""
     print(f"DEBUG: Sending reschedule declined email to {user.email}")
-    return send_email([user.email], "Reschedule Declined", "Your session reschedule request has been declined")
+    return send_email([user.email], "Reschedule Declined", "Your session reschedule request has been declined", commit=True)
 
 def send_contract_accepted_email(user, contract):
     """Send contract accepted email"""
     print(f"DEBUG: Sending contract accepted email to {user.email}")
-    return send_email([user.email], "Contract Accepted", "Your contract has been accepted")
+    return send_email([user.email], "Contract Accepted", "Your contract has been accepted", commit=True)
 
 def send_contract_rejected_email(user, contract):
     """Send contract rejected email"""
     print(f"DEBUG: Sending contract rejected email to {user.email}")
-    return send_email([user.email], "Contract Rejected", "Your contract has been rejected")
+    return send_email([user.email], "Contract Rejected", "Your contract has been rejected", commit=True)
 
 def send_payment_successful_email(user, payment):
     """Send payment successful email"""
     print(f"DEBUG: Sending payment successful email to {user.email}")
-    return send_email([user.email], "Payment Successful", "Your payment has been processed successfully")
-
-def send_session_reminder_email(user, session):
-    """Send session reminder email"""
-    print(f"DEBUG: Sending session reminder email to {user.email}")
-    return send_email([user.email], "Session Reminder", f"Reminder: You have a session scheduled for {session.scheduled_at}")
\ No newline at end of file
+    return send_email([user.email], "Payment Successful", "Your payment has been processed successfully", commit=True)
+
+def send_meeting_link_email(meeting):
+    """Tell the student of a session or call that its Google Meet link is ready"""
+    student = meeting.student
+    free = getattr(meeting, 'is_consultation', False) or getattr(meeting, 'is_free_consultation', False)
+    return send_template_email(
+        [student.email], 'meeting_link_ready', commit=True,
+        user_name=student.first_name,
+        coach_name=meeting.coach.first_name,
+        meeting_time=get_formatter(student.timezone).format(meeting.scheduled_at),
+        duration=meeting.duration_minutes,
+        meeting_type='Free Consultation' if free else 'Paid Session',
+        meeting_url=meeting.google_meet_url,
+    )
+
+def send_session_reminder_email(session, now=None):
+    """Send the session reminder to the student and the coach, each in their own timezone"""
+    proposal = session.proposal
+    if not proposal:
+        return 0
+    recipients = []
+    for user in (proposal.learning_request.student, proposal.coach):
+        if user:
+            recipients.append((user.email, {
+                'user_name': user.first_name,
+                'session_time': get_formatter(user.timezone).format(session.scheduled_at),
+            }))
+    return send_template_emails(
+        'session_reminder', recipients, commit=True,
+        session_title=proposal.learning_request.title,
+        time_until=time_until_text(session.scheduled_at, now),
+        session_duration=session.duration_minutes or 60,
+        join_url=email_url(f"/sessions/{session.id}/join"),
+        reschedule_url=email_url(f"/sessions/{session.id}/reschedule"),
+    )
@@ -0,0 +1,454 @@
+"""
+Event Bus for pushing real-time updates to the browser
+In-process pub/sub for new messages, notification counts, session status and coach
+availability changes, with Postgres LISTEN/NOTIFY or a shared SQLite file for fan-out across gunicorn workers
+"""
+
+import json
+import logging
+import os
+import queue
+import select
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session as SASession
+
+logger = logging.getLogger(__name__)
+
+EVENT_MESSAGE = 'message'
+EVENT_NOTIFICATION_COUNT = 'notification_count'
+EVENT_SESSION_STATUS = 'session_status'
+EVENT_AVAILABILITY = 'availability_changed'
+
+# Event ids are milliseconds * EVENT_ID_SEQUENCE + a per-worker sequence within the millisecond
+EVENT_ID_SEQUENCE = 1000
+
+class EventSubscription:
+    """A subscriber queue for one user's events"""
+
+    def __init__(self, bus, user_id: int):
+        self.bus = bus
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=200)
+
+    def get(self, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """Wait for the next event; None on timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Return every event already queued without waiting"""
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class LocalBackend:
+    """Single-process backend: events never leave this worker"""
+
+    name = 'local'
+
+    def start(self, deliver):
+        pass
+
+    def publish(self, event: Dict[str, Any]):
+        pass
+
+    def stop(self):
+        pass
+
+class PostgresNotifyBackend:
+    """Fan-out through Postgres LISTEN/NOTIFY on a dedicated listener connection"""
+
+    name = 'postgres'
+    channel = 'skileez_events'
+    max_payload_bytes = 7500  # NOTIFY payloads are capped at 8000 bytes
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+        self._thread = threading.Thread(target=self._listen_loop, name='event-bus-listener', daemon=True)
+        self._thread.start()
+
+    def publish(self, event: Dict[str, Any]):
+        from sqlalchemy import text
+
+        payload = json.dumps(event, default=str)
+        if len(payload.encode('utf-8')) > self.max_payload_bytes:
+            # Receivers refetch the details; only the envelope crosses workers
+            payload = json.dumps(dict(event, data={'truncated': True}), default=str)
+
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                               {'channel': self.channel, 'payload': payload})
+            connection.commit()
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            raw_connection = None
+            try:
+                raw_connection = self.engine.raw_connection()
+                raw_connection.detach()  # keep the long-lived listener out of the pool
+                dbapi_connection = raw_connection.driver_connection
+                dbapi_connection.autocommit = True
+                dbapi_connection.cursor().execute(f'LISTEN {self.channel}')
+                logger.info("Event bus listening on Postgres channel %s", self.channel)
+
+                while not self._stop.is_set():
+                    if select.select([dbapi_connection], [], [], 5) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notification = dbapi_connection.notifies.pop(0)
+                        self._deliver(json.loads(notification.payload))
+            except Exception as e:
+                logger.error(f"Event bus listener error: {e}")
+                self._stop.wait(5)
+            finally:
+                if raw_connection is not None:
+                    try:
+                        raw_connection.close()
+                    except Exception:
+                        pass
+
+class SQLiteFileBackend:
+    """Fan-out through an append-only event log in a shared SQLite file"""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, poll_interval: float = 0.5, retention_seconds: int = 300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        self._publish_count = 0
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS event_log ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, '
+                'payload TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def start(self, deliver):
+        self._deliver = deliver
+        with self._connect() as connection:
+            self._last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM event_log').fetchone()[0]
+        self._thread = threading.Thread(target=self._poll_loop, name='event-bus-listener', daemon=True)
+        self._thread.start()
+
+    def publish(self, event: Dict[str, Any]):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('INSERT INTO event_log (origin, payload, created_at) VALUES (?, ?, ?)',
+                               (event['origin'], json.dumps(event, default=str), now))
+            self._publish_count += 1
+            if self._publish_count % 100 == 0:
+                connection.execute('DELETE FROM event_log WHERE created_at < ?', (now - self.retention_seconds,))
+
+    def stop(self):
+        self._stop.set()
+
+    def poll_once(self):
+        """Deliver events written by other workers since the last poll"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT id, payload FROM event_log WHERE id > ? ORDER BY id', (self._last_id,)
+            ).fetchall()
+        for row_id, payload in rows:
+            self._last_id = row_id
+            self._deliver(json.loads(payload))
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Event bus poll error: {e}")
+
+class EventBus:
+    """Per-user publish/subscribe with a short replay buffer for reconnects and long-polls"""
+
+    def __init__(self, buffer_size: int = 50, max_streams: int = 4):
+        self.buffer_size = buffer_size
+        # Identifies this bus so events echoed back by the backend are not delivered twice
+        self.origin = uuid.uuid4().hex
+        self.backend = LocalBackend()
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._listeners = defaultdict(list)
+        self._buffers = defaultdict(lambda: deque(maxlen=self.buffer_size))
+        self._last_event_id = 0
+        self._stream_slots = threading.BoundedSemaphore(max_streams)
+
+    def configure(self, backend=None, max_streams: int = None):
+        """Swap the fan-out backend and/or the per-worker stream limit"""
+        if backend is not None:
+            self.backend.stop()
+            self.backend = backend
+            self.backend.start(self.receive)
+        if max_streams is not None:
+            self._stream_slots = threading.BoundedSemaphore(max_streams)
+
+    def publish(self, user_id: int, event_type: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Publish an event to one user on every worker"""
+        return self._send({
+            'id': self._next_event_id(),
+            'user_id': user_id,
+            'type': event_type,
+            'data': data or {},
+            'origin': self.origin
+        })
+
+    def broadcast(self, event_type: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Publish an internal event to the listeners on every worker. It has no user,
+        so it never reaches a browser or takes a place in anyone's replay buffer.
+        """
+        return self._send({
+            'id': self._next_event_id(),
+            'user_id': None,
+            'type': event_type,
+            'data': data or {},
+            'origin': self.origin
+        })
+
+    def _send(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.deliver(event)
+        try:
+            self.backend.publish(event)
+        except Exception as e:
+            logger.error(f"Error publishing {event['type']} event through {self.backend.name}: {e}")
+        return event
+
+    def receive(self, event: Dict[str, Any]):
+        """Accept an event from the backend, skipping ones this bus published itself"""
+        if event.get('origin') != self.origin:
+            self.deliver(event)
+
+    def deliver(self, event: Dict[str, Any]):
+        """Hand an event to this worker's subscribers, replay buffer and listeners"""
+        user_id = event['user_id']
+        with self._lock:
+            self._last_event_id = max(self._last_event_id, event['id'])
+            subscribers = []
+            if user_id is not None:
+                self._buffers[user_id].append(event)
+                subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                logger.warning(f"Dropping {event['type']} event for slow subscriber of user {user_id}")
+        for listener in self._listeners.get(event['type'], ()):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Error in {event['type']} listener: {e}")
+
+    def add_listener(self, event_type: str, listener):
+        """Call listener(event) in this worker for every event of a type, published or broadcast"""
+        with self._lock:
+            if listener not in self._listeners[event_type]:
+                self._listeners[event_type].append(listener)
+
+    def subscribe(self, user_id: int) -> EventSubscription:
+        subscription = EventSubscription(self, user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def events_since(self, user_id: int, last_event_id: int) -> List[Dict[str, Any]]:
+        """Buffered events for a user newer than the given event ID"""
+        with self._lock:
+            return [e for e in self._buffers.get(user_id, ()) if e['id'] > last_event_id]
+
+    def acquire_stream_slot(self) -> bool:
+        """Reserve one of the worker threads allowed to hold a stream open"""
+        return self._stream_slots.acquire(blocking=False)
+
+    def release_stream_slot(self):
+        try:
+            self._stream_slots.release()
+        except ValueError:
+            pass
+
+    def _next_event_id(self) -> int:
+        # Millisecond timestamps order events across workers and the sequence keeps them
+        # unique here; ids stay below 2**53 so the browser's JSON.parse keeps them exact
+        with self._lock:
+            self._last_event_id = max(self._last_event_id + 1, time.time_ns() // 1_000_000 * EVENT_ID_SEQUENCE)
+            return self._last_event_id
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize an event in text/event-stream framing"""
+    payload = json.dumps({'id': event['id'], 'type': event['type'], 'data': event['data']}, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+def public_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Event fields sent to the browser"""
+    return {'id': event['id'], 'type': event['type'], 'data': event['data']}
+
+# ============================================================================
+# PUBLISH AFTER COMMIT
+# ============================================================================
+
+def queue_event(orm_session, user_ids: Iterable[int], event_type: str, data: Dict[str, Any] = None):
+    """Queue an event on an ORM session; it is published only if the transaction commits"""
+    if orm_session is None:
+        return
+    pending = orm_session.info.setdefault('pending_events', [])
+    for user_id in set(user_ids):
+        if user_id is not None:
+            pending.append((user_id, event_type, data or {}))
+
+def queue_notification_count(orm_session, user_id: int):
+    """Queue a notification-count refresh; the count is read after commit"""
+    if orm_session is None:
+        return
+    orm_session.info.setdefault('pending_notification_counts', set()).add(user_id)
+
+def queue_session_status(orm_session, session_id: int, status: str):
+    """Queue a session status change; participants are resolved after commit"""
+    if orm_session is None or session_id is None:
+        return
+    orm_session.info.setdefault('pending_session_status', {})[session_id] = status
+
+def queue_availability_change(orm_session, coach_id: int):
+    """Queue a change to a coach's bookings or hours; cached calendars are dropped after commit"""
+    if orm_session is None or coach_id is None:
+        return
+    orm_session.info.setdefault('pending_availability_coaches', set()).add(coach_id)
+
+@sa_event.listens_for(SASession, 'after_commit')
+def _publish_pending_events(orm_session):
+    pending = orm_session.info.pop('pending_events', [])
+    notification_users = orm_session.info.pop('pending_notification_counts', set())
+    session_statuses = orm_session.info.pop('pending_session_status', {})
+    availability_coaches = orm_session.info.pop('pending_availability_coaches', set())
+    if not (pending or notification_users or session_statuses or availability_coaches):
+        return
+
+    try:
+        for user_id, event_type, data in pending:
+            event_bus.publish(user_id, event_type, data)
+        if notification_users:
+            for user_id, count in _unread_notification_counts(notification_users).items():
+                event_bus.publish(user_id, EVENT_NOTIFICATION_COUNT, {'count': count})
+        if session_statuses:
+            for session_id, user_ids in _session_participants(session_statuses.keys()).items():
+                for user_id in user_ids:
+                    event_bus.publish(user_id, EVENT_SESSION_STATUS,
+                                      {'session_id': session_id, 'status': session_statuses[session_id]})
+        for coach_id in availability_coaches:
+            event_bus.broadcast(EVENT_AVAILABILITY, {'coach_id': coach_id})
+    except Exception as e:
+        # The transaction is already committed; never fail the request over a push
+        logger.error(f"Error publishing events after commit: {e}")
+
+@sa_event.listens_for(SASession, 'after_rollback')
+def _discard_pending_events(orm_session):
+    orm_session.info.pop('pending_events', None)
+    orm_session.info.pop('pending_notification_counts', None)
+    orm_session.info.pop('pending_session_status', None)
+    orm_session.info.pop('pending_availability_coaches', None)
+
+def _unread_notification_counts(user_ids) -> Dict[int, int]:
+    from sqlalchemy import select, func
+    from models import Notification, db
+
+    user_ids = list(user_ids)
+    with db.engine.connect() as connection:
+        rows = connection.execute(
+            select(Notification.user_id, func.count(Notification.id)).where(
+                Notification.user_id.in_(user_ids),
+                Notification.is_read == False
+            ).group_by(Notification.user_id)
+        ).all()
+    counts = {user_id: 0 for user_id in user_ids}
+    counts.update({user_id: count for user_id, count in rows})
+    return counts
+
+def _session_participants(session_ids) -> Dict[int, List[int]]:
+    from sqlalchemy import select
+    from models import Session, Proposal, LearningRequest, db
+
+    with db.engine.connect() as connection:
+        rows = connection.execute(
+            select(Session.id, Proposal.coach_id, LearningRequest.student_id)
+            .join(Proposal, Proposal.id == Session.proposal_id)
+            .join(LearningRequest, LearningRequest.id == Proposal.learning_request_id)
+            .where(Session.id.in_(list(session_ids)))
+        ).all()
+    return {session_id: [coach_id, student_id] for session_id, coach_id, student_id in rows}
+
+# Global event bus instance
+event_bus = EventBus()
+
+def get_event_bus() -> EventBus:
+    """Get the global event bus instance"""
+    return event_bus
+
+def publish_event(user_id: int, event_type: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Publish an event to a user immediately"""
+    return event_bus.publish(user_id, event_type, data)
+
+def create_backend(app, engine):
+    """Pick the fan-out backend from EVENT_BUS_BACKEND or the database dialect"""
+    backend_name = app.config.get('EVENT_BUS_BACKEND') or engine.dialect.name
+    if backend_name in ('postgres', 'postgresql'):
+        return PostgresNotifyBackend(engine)
+    if backend_name == 'sqlite':
+        path = app.config.get('EVENT_BUS_SQLITE_PATH') or os.path.join(app.instance_path, 'events.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return SQLiteFileBackend(path)
+    return LocalBackend()
+
+def init_event_bus(app):
+    """Start cross-worker fan-out for this worker (call once per process)"""
+    from models import db
+
+    with app.app_context():
+        backend = create_backend(app, db.engine)
+    event_bus.configure(backend=backend, max_streams=app.config.get('EVENT_STREAM_MAX_CONNECTIONS', 4))
+    logger.info(f"Event bus started with {backend.name} backend")
+    return event_bus
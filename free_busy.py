@@ -0,0 +1,469 @@
+"""
+Free/Busy engine for coach slot generation
+Fetches every busy interval a coach has in a window (ScheduledSession, Session and
+ScheduledCall) with one range query on calendar_event, merges them into a sorted
+interval list and subtracts them from working hours and AvailabilityException rows
+in a single sweep.
+Slot lists for a day or a whole range cost the same three queries, and a search
+across many coaches costs four.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from timezone_utils import zone_or_utc, localize, UTC
+from sqlalchemy import select, and_, or_, func, inspect as sa_inspect
+
+from models import (
+    CoachAvailability, AvailabilityException, WeeklyAvailabilityRule, DAY_NAMES, weekly_rule_rows, db
+)
+from calendar_events import get_calendar_event_store
+
+logger = logging.getLogger(__name__)
+
+# Statuses that keep a booking on the coach's calendar
+SCHEDULED_SESSION_BUSY_STATUSES = ('scheduled', 'confirmed', 'started')
+SESSION_BUSY_STATUSES = ('scheduled', 'active')
+CALL_BUSY_STATUSES = ('scheduled',)
+
+# Bookings without a duration block an hour
+DEFAULT_BUSY_MINUTES = 60
+
+# Longest booking we expect; bookings starting this long before a window can still overlap it
+MAX_BOOKING_MINUTES = 24 * 60
+
+# Longest window a multi-coach search may scan
+MAX_SEARCH_DAYS = 7
+
+BusyInterval = namedtuple('BusyInterval', ['start', 'end', 'kind', 'id'])
+
+Interval = Tuple[datetime, datetime]
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Bookings are stored as naive UTC; accept aware datetimes from callers"""
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return value
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort intervals and merge the ones that overlap or touch"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_intervals(free: List[Interval], busy: List[Interval]) -> List[Interval]:
+    """
+    Remove busy time from free time in one sweep.
+    Both lists must be sorted and non-overlapping (see merge_intervals).
+    """
+    result = []
+    first_busy = 0
+    for start, end in free:
+        # Busy intervals that end before this free interval can't affect later ones either
+        while first_busy < len(busy) and busy[first_busy][1] <= start:
+            first_busy += 1
+
+        cursor = start
+        index = first_busy
+        while index < len(busy) and busy[index][0] < end:
+            busy_start, busy_end = busy[index]
+            if busy_start > cursor:
+                result.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            index += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+def ceil_to_grid(value: datetime, minutes: int = 5) -> datetime:
+    """Round up to the next multiple of `minutes` past the hour"""
+    if value.second or value.microsecond:
+        value = value.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    return value + timedelta(minutes=-value.minute % minutes)
+
+def availability_setting(availability: Optional[CoachAvailability], name: str):
+    """Attribute of a coach's availability, falling back to the column default"""
+    value = getattr(availability, name, None) if availability is not None else None
+    if value is None:
+        default = CoachAvailability.__table__.c[name].default
+        value = default.arg if default is not None else None
+    return value
+
+def weekly_windows(availability: Optional[CoachAvailability]) -> List[List[Tuple[int, int]]]:
+    """Working windows (start, end minutes from midnight) for Monday..Sunday"""
+    if availability is None:
+        # Never saved availability: every day has the default hours
+        window = (availability_setting(None, 'monday_start'), availability_setting(None, 'monday_end'))
+        return [[window] for _ in DAY_NAMES]
+    return availability.weekly_windows
+
+class FreeBusyEngine:
+    """Computes busy and free time for coaches from a fixed number of queries"""
+
+    def busy_statement(self, coach_ids: List[int], window_start: datetime, window_end: datetime,
+                       exclude_session_id: int = None, exclude_scheduled_session_id: int = None):
+        """
+        Busy calendar_event rows overlapping the window: (coach_id, start, end, kind, id).
+        Rows start before window_end and at most MAX_BOOKING_MINUTES before window_start,
+        which keeps the scan on a bounded range of the coach index.
+        """
+        earliest = window_start - timedelta(minutes=MAX_BOOKING_MINUTES)
+        return get_calendar_event_store().busy_statement(
+            coach_ids, earliest, window_start, window_end, exclude_session_id, exclude_scheduled_session_id
+        )
+
+    def get_busy_entries_by_coach(self, coach_ids: List[int], window_start: datetime, window_end: datetime,
+                                  exclude_session_id: int = None,
+                                  exclude_scheduled_session_id: int = None) -> Dict[int, List[BusyInterval]]:
+        """Bookings overlapping the window for each coach, sorted by start (one query)"""
+        window_start = to_naive_utc(window_start)
+        window_end = to_naive_utc(window_end)
+        entries = {coach_id: [] for coach_id in coach_ids}
+        if not coach_ids:
+            return entries
+
+        rows = db.session.execute(self.busy_statement(
+            list(coach_ids), window_start, window_end, exclude_session_id, exclude_scheduled_session_id
+        ))
+        for coach_id, start, end, kind, entry_id in rows:
+            entries[coach_id].append(BusyInterval(to_naive_utc(start), to_naive_utc(end), kind, entry_id))
+
+        for coach_entries in entries.values():
+            coach_entries.sort()
+        return entries
+
+    def get_busy_entries(self, coach_id: int, window_start: datetime, window_end: datetime,
+                         exclude_session_id: int = None,
+                         exclude_scheduled_session_id: int = None) -> List[BusyInterval]:
+        """Bookings overlapping the window for one coach, sorted by start"""
+        return self.get_busy_entries_by_coach(
+            [coach_id], window_start, window_end, exclude_session_id, exclude_scheduled_session_id
+        )[coach_id]
+
+    def get_busy_intervals(self, coach_id: int, window_start: datetime, window_end: datetime,
+                           exclude_session_id: int = None,
+                           exclude_scheduled_session_id: int = None) -> List[Interval]:
+        """Merged busy time for one coach (naive UTC)"""
+        entries = self.get_busy_entries(coach_id, window_start, window_end,
+                                        exclude_session_id, exclude_scheduled_session_id)
+        return merge_intervals((entry.start, entry.end) for entry in entries)
+
+    def get_conflicts(self, coach_id: int, start_time: datetime, end_time: datetime,
+                      exclude_session_id: int = None,
+                      exclude_scheduled_session_id: int = None) -> List[BusyInterval]:
+        """Bookings that overlap [start_time, end_time)"""
+        start_time = to_naive_utc(start_time)
+        end_time = to_naive_utc(end_time)
+        entries = self.get_busy_entries(coach_id, start_time, end_time,
+                                        exclude_session_id, exclude_scheduled_session_id)
+        return [entry for entry in entries if entry.start < end_time and entry.end > start_time]
+
+    def load_availability(self, coach_id: int) -> Optional[CoachAvailability]:
+        """The coach's availability settings, None when they never saved any"""
+        return CoachAvailability.query.filter_by(coach_id=coach_id).first()
+
+    def load_exceptions(self, availability: Optional[CoachAvailability], start_date: date,
+                        end_date: date) -> Dict[date, List[AvailabilityException]]:
+        """Exceptions in the date range, grouped by date (one query)"""
+        if availability is None or availability.id is None:
+            return {}
+        exceptions = {}
+        for exception in AvailabilityException.query.filter(
+            AvailabilityException.availability_id == availability.id,
+            AvailabilityException.date >= start_date,
+            AvailabilityException.date <= end_date
+        ).all():
+            exceptions.setdefault(exception.date, []).append(exception)
+        return exceptions
+
+    def load_exceptions_by_availability(self, availability_ids: List[int], start_date: date,
+                                        end_date: date) -> Dict[int, Dict[date, List[AvailabilityException]]]:
+        """Exceptions for many coaches, grouped by availability ID then date (one query)"""
+        exceptions = {availability_id: {} for availability_id in availability_ids}
+        if not availability_ids:
+            return exceptions
+        for exception in AvailabilityException.query.filter(
+            AvailabilityException.availability_id.in_(availability_ids),
+            AvailabilityException.date >= start_date,
+            AvailabilityException.date <= end_date
+        ).all():
+            exceptions[exception.availability_id].setdefault(exception.date, []).append(exception)
+        return exceptions
+
+    def hours_condition(self, timezone_name: Optional[str], window_start: datetime, window_end: datetime,
+                        duration_minutes: int):
+        """
+        SQL test on weekly_availability_rule for coaches in one timezone: do they have
+        a window long enough, inside the search window, on any local day it touches?
+        """
+        coach_tz = zone_or_utc(timezone_name)
+        local_start = window_start.replace(tzinfo=UTC).astimezone(coach_tz)
+        local_end = window_end.replace(tzinfo=UTC).astimezone(coach_tz)
+
+        rule = WeeklyAvailabilityRule
+        day_conditions = []
+        day = local_start.date()
+        while day <= local_end.date():
+            first_minute = local_start.hour * 60 + local_start.minute if day == local_start.date() else 0
+            last_minute = local_end.hour * 60 + local_end.minute if day == local_end.date() else 24 * 60
+            if last_minute - first_minute >= duration_minutes:
+                day_conditions.append(and_(
+                    rule.weekday == day.weekday(),
+                    rule.start_minute + duration_minutes <= rule.end_minute,
+                    rule.start_minute + duration_minutes <= last_minute,
+                    rule.end_minute >= first_minute + duration_minutes
+                ))
+            day += timedelta(days=1)
+        if not day_conditions:
+            return None
+
+        timezone_column = CoachAvailability.timezone
+        same_timezone = timezone_column.is_(None) if timezone_name is None else timezone_column == timezone_name
+        works = select(rule.id).where(rule.coach_id == CoachAvailability.coach_id, or_(*day_conditions)).exists()
+        return and_(same_timezone, works)
+
+    def coaches_working(self, weekday: int, start_minute: int, end_minute: int,
+                        coach_ids: Iterable[int] = None) -> List[int]:
+        """
+        Coaches whose weekly hours cover [start_minute, end_minute) on a weekday, in
+        each coach's own local time (one query on the weekday/start index). Coaches
+        who never saved availability work the default hours and are not listed.
+        """
+        rule = WeeklyAvailabilityRule
+        query = select(rule.coach_id).where(
+            rule.weekday == weekday,
+            rule.start_minute <= start_minute,
+            rule.end_minute >= end_minute
+        ).distinct().order_by(rule.coach_id)
+        if coach_ids is not None:
+            query = query.where(rule.coach_id.in_(list(coach_ids)))
+        return list(db.session.execute(query).scalars())
+
+    def get_free_coaches(self, coach_ids: Iterable[int], window_start: datetime, window_end: datetime,
+                         duration_minutes: int) -> Dict[int, datetime]:
+        """
+        Earliest start in [window_start, window_end] at which each coach is free for
+        duration_minutes, as naive UTC on the 5-minute grid. Coaches with no such
+        start are left out. Four queries however many coaches are searched: their
+        timezones, weekly hours filtered in SQL, exceptions and busy intervals.
+        """
+        coach_ids = list(dict.fromkeys(coach_ids))
+        window_start = ceil_to_grid(to_naive_utc(window_start))
+        window_end = to_naive_utc(window_end)
+        if not coach_ids or window_end < window_start:
+            return {}
+        search_end = window_end + timedelta(minutes=duration_minutes)
+
+        timezones = dict(db.session.execute(
+            select(CoachAvailability.coach_id, CoachAvailability.timezone)
+            .where(CoachAvailability.coach_id.in_(coach_ids))
+        ).all())
+
+        # Coaches who never saved availability work the default hours
+        settings = {coach_id: None for coach_id in coach_ids if coach_id not in timezones}
+        conditions = [condition for condition in (
+            self.hours_condition(timezone_name, window_start, search_end, duration_minutes)
+            for timezone_name in set(timezones.values())
+        ) if condition is not None]
+        if conditions:
+            for availability in CoachAvailability.query.filter(
+                CoachAvailability.coach_id.in_(list(timezones)),
+                self._column_or_default('is_available') == True,
+                or_(*conditions)
+            ).all():
+                settings[availability.coach_id] = availability
+        if not settings:
+            return {}
+
+        # Local days can sit a day either side of the UTC window
+        first_day = window_start.date() - timedelta(days=1)
+        last_day = search_end.date() + timedelta(days=1)
+        exceptions = self.load_exceptions_by_availability(
+            [availability.id for availability in settings.values() if availability is not None], first_day, last_day
+        )
+        busy = self.get_busy_entries_by_coach(list(settings), window_start, search_end)
+
+        earliest = {}
+        for coach_id, availability in settings.items():
+            coach_tz = zone_or_utc(availability_setting(availability, 'timezone'))
+            working = []
+            for _, _, local_free in self.working_days(
+                    availability, exceptions.get(getattr(availability, 'id', None), {}), first_day, last_day):
+                working.extend((self._to_utc(coach_tz, start), self._to_utc(coach_tz, end))
+                               for start, end in local_free)
+            free = subtract_intervals(merge_intervals(working),
+                                      merge_intervals((entry.start, entry.end) for entry in busy[coach_id]))
+
+            for free_start, free_end in free:
+                start = ceil_to_grid(max(free_start, window_start))
+                if start > window_end:
+                    break
+                if start + timedelta(minutes=duration_minutes) <= free_end:
+                    earliest[coach_id] = start
+                    break
+        return earliest
+
+    def _column_or_default(self, name: str):
+        column = CoachAvailability.__table__.c[name]
+        if column.default is None:
+            return column
+        return func.coalesce(column, column.default.arg)
+
+    def working_days(self, availability: Optional[CoachAvailability], exceptions: Dict[date, list],
+                     start_date: date, end_date: date):
+        """
+        Yield (day, windows, local_free) for each working day, where windows are the
+        day's (start, end) minutes and local_free is working time minus the day's
+        exceptions in the coach's local time.
+        A blocked exception closes the whole day; any other exception removes its hours.
+        """
+        if not availability_setting(availability, 'is_available'):
+            return
+
+        hours = weekly_windows(availability)
+        day = start_date
+        while day <= end_date:
+            windows = hours[day.weekday()]
+            day_exceptions = exceptions.get(day, [])
+            if windows and not any(exception.is_blocked for exception in day_exceptions):
+                midnight = datetime.combine(day, datetime.min.time())
+                working = [(midnight + timedelta(minutes=start), midnight + timedelta(minutes=end))
+                           for start, end in windows]
+                blocked = merge_intervals(
+                    (datetime.combine(day, exception.start_time or datetime.min.time()),
+                     datetime.combine(day, exception.end_time or datetime.max.time()))
+                    for exception in day_exceptions
+                )
+                yield day, windows, subtract_intervals(working, blocked)
+            day += timedelta(days=1)
+
+    def get_slots(self, coach_id: int, start_date: date, end_date: date, duration_minutes: int = None,
+                  timezone: str = 'UTC', availability: CoachAvailability = None,
+                  step_minutes: int = None, busy: List[Interval] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Free slots per day (ISO date -> slots) between two dates inclusive.
+
+        Slots start at each working window's start and step by duration plus buffer_after
+        (or step_minutes) in the coach's timezone; a slot is kept when it fits entirely
+        inside free time. Each slot has start/end in `timezone` plus start_utc/end_utc.
+        `busy` takes already merged busy intervals and skips the busy query.
+        """
+        if availability is None:
+            availability = self.load_availability(coach_id)
+
+        duration = duration_minutes or availability_setting(availability, 'session_duration')
+        step = step_minutes or duration + (availability_setting(availability, 'buffer_after') or 0)
+        coach_tz = zone_or_utc(availability_setting(availability, 'timezone'))
+        target_tz = zone_or_utc(timezone)
+        exceptions = self.load_exceptions(availability, start_date, end_date)
+
+        # Candidate slots and free working time, both in UTC, for the whole range
+        candidates = []
+        free = []
+        for day, windows, local_free in self.working_days(
+                availability, exceptions, start_date, end_date):
+            for local_start, local_end in local_free:
+                free.append((self._to_utc(coach_tz, local_start), self._to_utc(coach_tz, local_end)))
+
+            midnight = datetime.combine(day, datetime.min.time())
+            for start_minutes, end_minutes in windows:
+                minute = start_minutes
+                while minute + duration <= end_minutes:
+                    slot_start = self._to_utc(coach_tz, midnight + timedelta(minutes=minute))
+                    slot_end = self._to_utc(coach_tz, midnight + timedelta(minutes=minute + duration))
+                    candidates.append((slot_start, slot_end, day))
+                    minute += step
+
+        if not candidates:
+            return {}
+
+        if busy is None:
+            busy = self.get_busy_intervals(coach_id, candidates[0][0], candidates[-1][1])
+        free = subtract_intervals(merge_intervals(free), busy)
+
+        # Candidates and free intervals are both sorted: one pass keeps the slots that fit
+        slots = {}
+        index = 0
+        for slot_start, slot_end, day in sorted(candidates):
+            while index < len(free) and free[index][1] < slot_end:
+                index += 1
+            if index == len(free):
+                break
+            if free[index][0] <= slot_start:
+                start_utc = slot_start.replace(tzinfo=UTC)
+                end_utc = slot_end.replace(tzinfo=UTC)
+                slots.setdefault(day.isoformat(), []).append({
+                    'start': start_utc.astimezone(target_tz),
+                    'end': end_utc.astimezone(target_tz),
+                    'start_utc': start_utc,
+                    'end_utc': end_utc,
+                    'available': True
+                })
+        return slots
+
+    def _to_utc(self, coach_tz, local_datetime: datetime) -> datetime:
+        return localize(local_datetime, coach_tz).astimezone(UTC).replace(tzinfo=None)
+
+# Global free/busy engine instance
+free_busy_engine = FreeBusyEngine()
+
+def get_free_busy_engine() -> FreeBusyEngine:
+    """Get the global free/busy engine instance"""
+    return free_busy_engine
+
+def get_busy_intervals(coach_id: int, window_start: datetime, window_end: datetime,
+                       exclude_session_id: int = None) -> List[Interval]:
+    """Get a coach's merged busy intervals in a window"""
+    return free_busy_engine.get_busy_intervals(coach_id, window_start, window_end, exclude_session_id)
+
+def get_conflicts(coach_id: int, start_time: datetime, end_time: datetime, exclude_session_id: int = None,
+                  exclude_scheduled_session_id: int = None) -> List[BusyInterval]:
+    """Get the bookings that overlap a time range"""
+    return free_busy_engine.get_conflicts(coach_id, start_time, end_time,
+                                          exclude_session_id, exclude_scheduled_session_id)
+
+def get_free_coaches(coach_ids: Iterable[int], window_start: datetime, window_end: datetime,
+                     duration_minutes: int) -> Dict[int, datetime]:
+    """Get the earliest free start in a window for each coach who has one"""
+    return free_busy_engine.get_free_coaches(coach_ids, window_start, window_end, duration_minutes)
+
+def coaches_working(weekday: int, start_minute: int, end_minute: int,
+                    coach_ids: Iterable[int] = None) -> List[int]:
+    """Get the coaches whose weekly hours cover a local time range on a weekday"""
+    return free_busy_engine.coaches_working(weekday, start_minute, end_minute, coach_ids)
+
+def backfill_weekly_rules_if_empty() -> int:
+    """Convert the per-day columns into weekly_availability_rule once, on first start after it is created"""
+    if not sa_inspect(db.engine).has_table(WeeklyAvailabilityRule.__tablename__):
+        return 0
+    if db.session.query(WeeklyAvailabilityRule.id).first() is not None:
+        return 0
+
+    rows = []
+    for availability in CoachAvailability.query.all():
+        rows.extend(weekly_rule_rows(availability, range(7)))
+    inserted = 0
+    if rows:
+        # Every web worker and the job runner run this at start; rules another one wrote first are skipped
+        if db.session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        result = db.session.execute(insert(WeeklyAvailabilityRule.__table__).on_conflict_do_nothing(), rows)
+        inserted = result.rowcount
+    db.session.commit()
+    logger.info(f"Backfilled {inserted} weekly availability rules")
+    return inserted
+
+def get_slots(coach_id: int, start_date: date, end_date: date, duration_minutes: int = None,
+              timezone: str = 'UTC', availability: CoachAvailability = None,
+              step_minutes: int = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Get free slots per day for a date range"""
+    return free_busy_engine.get_slots(coach_id, start_date, end_date, duration_minutes, timezone,
+                                      availability, step_minutes)
@@ -0,0 +1,174 @@
+"""
+Heartbeat Manager for the combined polling endpoint
+Builds notifications, messages, session status and upcoming calls for one user in a
+fixed number of queries, with per-section version stamps so unchanged sections are skipped
+"""
+
+import hashlib
+import json
+import logging
+from typing import Dict, Any, Optional
+from sqlalchemy import select, func, or_
+from models import (
+    Message, Notification, Conversation, ConversationParticipant, Session, Contract, db
+)
+from schema_capabilities import has_table
+from conversation_manager import (
+    conversation_tables_available, serialize_message, _pair_filter, POLL_BATCH_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_LIST_SIZE = 20
+UPCOMING_CALLS_LIMIT = 10
+
+def payload_version(payload) -> str:
+    """Short stable hash of a JSON-serializable payload"""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+class HeartbeatManager:
+    """Assembles the heartbeat payload for the current user"""
+
+    def build(self, user_id: int, versions: Dict[str, str] = None, partner_id: Optional[int] = None,
+              after_id: Optional[int] = None, session_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        One counters query yields the notification and message stamps; rows are only
+        fetched for sections whose stamp differs from the client's (plus the requested
+        session and the upcoming calls). At most five queries regardless of data size.
+        """
+        versions = versions or {}
+        counters = self._load_counters(user_id, partner_id)
+
+        heartbeat = {
+            'notifications': self._notifications_section(user_id, counters, versions.get('notifications')),
+            'messages': self._messages_section(user_id, counters, versions.get('messages'), partner_id, after_id),
+            'calls': self._calls_section(user_id, versions.get('calls'))
+        }
+        if session_id is not None:
+            heartbeat['session'] = self._session_section(user_id, session_id, versions.get('session'))
+        return heartbeat
+
+    def _load_counters(self, user_id: int, partner_id: Optional[int]) -> Dict[str, int]:
+        """Every version stamp input as scalar subqueries of a single SELECT"""
+        connection = db.session.connection()
+        columns = []
+
+        if has_table(Notification.__tablename__, connection):
+            columns.append(select(func.count(Notification.id)).where(
+                Notification.user_id == user_id, Notification.is_read == False
+            ).scalar_subquery().label('notification_unread'))
+            columns.append(select(func.max(Notification.id)).where(
+                Notification.user_id == user_id
+            ).scalar_subquery().label('notification_last_id'))
+
+        if conversation_tables_available(connection):
+            columns.append(select(func.sum(ConversationParticipant.unread_count)).where(
+                ConversationParticipant.user_id == user_id
+            ).scalar_subquery().label('message_unread'))
+            if partner_id is not None:
+                user_low_id, user_high_id = Conversation.pair_for(user_id, partner_id)
+                columns.append(select(Conversation.last_message_id).where(
+                    Conversation.user_low_id == user_low_id,
+                    Conversation.user_high_id == user_high_id
+                ).scalar_subquery().label('conversation_last_id'))
+        else:
+            columns.append(select(func.count(Message.id)).where(
+                Message.recipient_id == user_id, Message.is_read == False
+            ).scalar_subquery().label('message_unread'))
+            if partner_id is not None:
+                columns.append(select(func.max(Message.id)).where(
+                    _pair_filter(user_id, partner_id)
+                ).scalar_subquery().label('conversation_last_id'))
+
+        row = db.session.execute(select(*columns)).mappings().one()
+        return {key: int(value or 0) for key, value in row.items()}
+
+    def _notifications_section(self, user_id: int, counters: Dict[str, int],
+                               client_version: Optional[str]) -> Dict[str, Any]:
+        unread_count = counters.get('notification_unread', 0)
+        version = f"{counters.get('notification_last_id', 0)}.{unread_count}"
+        section = {'version': version, 'changed': version != client_version, 'unread_count': unread_count}
+
+        if section['changed'] and 'notification_last_id' in counters:
+            section['notifications'] = [
+                notification.to_dict()
+                for notification in Notification.get_recent_notifications(user_id, limit=NOTIFICATION_LIST_SIZE)
+            ]
+        elif section['changed']:
+            section['notifications'] = []
+        return section
+
+    def _messages_section(self, user_id: int, counters: Dict[str, int], client_version: Optional[str],
+                          partner_id: Optional[int], after_id: Optional[int]) -> Dict[str, Any]:
+        unread_count = counters['message_unread']
+        last_id = counters.get('conversation_last_id', 0)
+        version = f"{last_id}.{unread_count}"
+        section = {'version': version, 'changed': version != client_version, 'unread_count': unread_count}
+
+        if partner_id is not None:
+            messages = []
+            if after_id is not None and last_id > after_id:
+                messages = Message.query.filter(
+                    _pair_filter(user_id, partner_id),
+                    Message.id > after_id
+                ).order_by(Message.id.asc()).limit(POLL_BATCH_SIZE).all()
+            # New rows always count as a change, even when a cut-short batch left the stamp as it was
+            section['changed'] = section['changed'] or bool(messages)
+            section['conversation'] = {
+                'partner_id': partner_id,
+                'messages': [serialize_message(message) for message in messages],
+                # Cut-short batches report the last row returned so the client asks again
+                'last_id': messages[-1].id if messages else max(after_id or 0, last_id)
+            }
+        return section
+
+    def _calls_section(self, user_id: int, client_version: Optional[str]) -> Dict[str, Any]:
+        from scheduling_utils import get_upcoming_calls
+
+        calls = [{
+            'id': call.id,
+            'type': call.call_type,
+            'scheduled_at': call.scheduled_at.isoformat(),
+            'duration_minutes': call.duration_minutes,
+            'status': call.status,
+            'is_ready': call.is_ready_to_join,
+            'time_until': call.time_until_call
+        } for call in get_upcoming_calls(user_id, limit=UPCOMING_CALLS_LIMIT)]
+
+        version = payload_version(calls)
+        section = {'version': version, 'changed': version != client_version}
+        if section['changed']:
+            section['calls'] = calls
+        return section
+
+    def _session_section(self, user_id: int, session_id: int, client_version: Optional[str]) -> Dict[str, Any]:
+        # Access check and session row in one query (the contract names both participants)
+        session = Session.query.join(
+            Contract, Contract.proposal_id == Session.proposal_id
+        ).filter(
+            Session.id == session_id,
+            or_(Contract.coach_id == user_id, Contract.student_id == user_id)
+        ).first()
+        if session is None:
+            return {'version': None, 'changed': False, 'error': 'Access denied'}
+
+        session.refresh_auto_status()
+        info = dict(session.get_status_info(), session_id=session.id)
+        version = payload_version(info)
+        section = {'version': version, 'changed': version != client_version}
+        if section['changed']:
+            section.update(info)
+        return section
+
+# Global heartbeat manager instance
+heartbeat_manager = HeartbeatManager()
+
+def get_heartbeat_manager() -> HeartbeatManager:
+    """Get the global heartbeat manager instance"""
+    return heartbeat_manager
+
+def build_heartbeat(user_id: int, versions: Dict[str, str] = None, partner_id: Optional[int] = None,
+                    after_id: Optional[int] = None, session_id: Optional[int] = None) -> Dict[str, Any]:
+    """Build the heartbeat payload for a user"""
+    return heartbeat_manager.build(user_id, versions, partner_id, after_id, session_id)
@@ -0,0 +1,313 @@
+"""
+Due-time queue for the timed jobs of sessions and calls
+Reminders, ready notifications, overdue marking, auto-completion and meeting
+activation used to be found by scanning every scheduled session and call on each
+run. Now each booking's jobs are written to scheduled_job when it is created, moved
+or cancelled (sync_scheduled_jobs in models.py), each due at its own moment, and a
+run claims only the rows already due - with FOR UPDATE SKIP LOCKED on PostgreSQL,
+so two workers never claim the same job. A claimed job re-reads its booking before
+acting, so one that moved or left its statuses is rescheduled or dropped instead of
+being run on stale data.
+"""
+
+import logging
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, or_
+
+from models import db, Session, ScheduledCall, ScheduledJob, SCHEDULED_JOB_TARGETS
+from free_busy import to_naive_utc
+from schema_capabilities import has_table
+from claim_queue import ClaimQueue, retry_at
+
+logger = logging.getLogger(__name__)
+
+# Jobs claimed per round-trip
+BATCH_SIZE = 100
+
+# A failing job is retried after 1, 2, 4... minutes (claim_queue.py), then left failed
+MAX_ATTEMPTS = 3
+
+# Finished jobs are kept this long after they were due
+RETENTION = timedelta(days=30)
+
+# When a kind of job is due: offset from the booking's start or end. A job with a
+# grace period is only worth running until that long after it was due, e.g. a 24h
+# reminder makes no sense 10 hours before the call; it is dropped as expired instead.
+JobKind = namedtuple('JobKind', ['name', 'target_types', 'statuses', 'anchor', 'offset', 'grace'])
+
+# Kinds are named after the notification_scheduler / meeting_activation task that runs them
+JOB_KINDS = {kind.name: kind for kind in (
+    JobKind('calls_ready', ('call',), ('scheduled',), 'start', -timedelta(minutes=5), timedelta(minutes=5)),
+    JobKind('reminders_24h', ('call',), ('scheduled',), 'start', -timedelta(hours=25), timedelta(hours=1)),
+    JobKind('reminders_1h', ('call',), ('scheduled',), 'start', -timedelta(hours=1, minutes=15),
+            timedelta(minutes=15)),
+    JobKind('session_reminders', ('session',), ('scheduled',), 'start', -timedelta(minutes=30),
+            timedelta(minutes=15)),
+    JobKind('mark_overdue', ('call',), ('scheduled',), 'start', timedelta(minutes=15), None),
+    JobKind('auto_complete_sessions', ('session',), ('scheduled', 'active'), 'end', timedelta(0), None),
+    JobKind('meeting_activation', ('session', 'call'), ('scheduled',), 'start', -timedelta(minutes=5), None),
+    JobKind('meeting_reminders', ('session', 'call'), ('scheduled',), 'start', -timedelta(minutes=30),
+            timedelta(minutes=15)),
+)}
+
+TARGET_MODELS = {target_type: model for model, target_type in SCHEDULED_JOB_TARGETS.items()}
+
+def due_at(kind: JobKind, target) -> Optional[datetime]:
+    """When a kind of job is due for a booking (naive UTC), or None when it has none"""
+    if SCHEDULED_JOB_TARGETS[type(target)] not in kind.target_types or target.status not in kind.statuses:
+        return None
+    if target.scheduled_at is None:
+        return None
+    start = to_naive_utc(target.scheduled_at)
+    if kind.anchor == 'end':
+        if not target.duration_minutes:
+            return None
+        start += timedelta(minutes=target.duration_minutes)
+    return start + kind.offset
+
+class JobQueue(ClaimQueue):
+    """Writes, claims and runs scheduled_job rows"""
+
+    model = ScheduledJob
+    status_column = 'state'
+    updated_column = 'updated_at'
+
+    def booking_job_rows(self, target, now: datetime = None) -> List[Dict]:
+        """scheduled_job values for a booking's jobs, leaving out those already past their grace"""
+        now = now or datetime.utcnow()
+        rows = []
+        for kind in JOB_KINDS.values():
+            due = due_at(kind, target)
+            if due is None or (kind.grace is not None and due + kind.grace < now):
+                continue
+            rows.append({'kind': kind.name, 'target_type': SCHEDULED_JOB_TARGETS[type(target)],
+                         'target_id': target.id, 'due_at': due, 'state': 'pending', 'attempts': 0,
+                         'created_at': now, 'updated_at': now})
+        return rows
+
+    def _upsert(self, connection):
+        """
+        INSERT ... ON CONFLICT for booking jobs: a job moves and becomes pending again
+        when its due time changed or it was cancelled; otherwise a job that already
+        ran keeps its state, so editing a booking does not resend its reminders.
+        """
+        if connection.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        table = ScheduledJob.__table__
+        statement = insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=['target_type', 'target_id', 'kind'],
+            set_={'due_at': statement.excluded.due_at, 'state': 'pending', 'attempts': 0, 'last_error': None,
+                  'locked_by': None, 'locked_at': None, 'updated_at': statement.excluded.updated_at},
+            where=or_(table.c.due_at != statement.excluded.due_at, table.c.state == 'cancelled')
+        )
+
+    def sync_booking_jobs(self, connection, fresh: Iterable, changed: Iterable, deleted: Iterable,
+                          now: datetime = None):
+        """Bring the jobs of bookings written in a flush up to date, on the flush's connection"""
+        table = ScheduledJob.__table__
+        fresh, changed, deleted = list(fresh), list(changed), list(deleted)
+
+        def target_ids(targets):
+            grouped = {}
+            for target in targets:
+                grouped.setdefault(SCHEDULED_JOB_TARGETS[type(target)], []).append(target.id)
+            return grouped.items()
+
+        # SQLite may hand a new booking the id of a deleted one, so deleted bookings keep nothing
+        for target_type, ids in target_ids(deleted):
+            connection.execute(table.delete().where(table.c.target_type == target_type,
+                                                    table.c.target_id.in_(ids)))
+        # Pending jobs the booking still has are made pending again by the upsert below
+        for target_type, ids in target_ids(changed):
+            connection.execute(table.update().where(
+                table.c.target_type == target_type, table.c.target_id.in_(ids), table.c.state == 'pending'
+            ).values(state='cancelled', updated_at=now or datetime.utcnow()))
+
+        rows = [row for target in fresh + changed for row in self.booking_job_rows(target, now)]
+        if rows:
+            connection.execute(self._upsert(connection), rows)
+
+    def claim(self, kinds: Iterable[str], now: datetime = None, limit: int = BATCH_SIZE) -> list:
+        """
+        Mark up to limit due jobs of the given kinds as running by this worker and
+        return them, earliest first, each with the attempt it is on.
+        """
+        now = now or datetime.utcnow()
+        jobs = self.claim_rows(
+            (ScheduledJob.id, ScheduledJob.kind, ScheduledJob.target_type, ScheduledJob.target_id,
+             ScheduledJob.due_at, ScheduledJob.attempts),
+            now, limit, ScheduledJob.kind.in_(list(kinds)), attempts=ScheduledJob.attempts + 1
+        )
+        return sorted(jobs, key=lambda job: (job.due_at, job.id))
+
+    def _finish(self, jobs: list, now: datetime, **values):
+        """Record the outcome of claimed jobs, except those the booking moved while they ran"""
+        if not jobs:
+            return
+        self.record([job.id for job in jobs], now, **values)
+        db.session.commit()
+
+    def _hold(self, job, target, now: datetime) -> Optional[str]:
+        """
+        Settle a claimed job that must not run now and return its outcome: cancelled
+        (no booking or wrong status), rescheduled (moved later) or expired (past its
+        grace). None when it should run.
+        """
+        kind = JOB_KINDS[job.kind]
+        expected = due_at(kind, target) if target is not None else None
+        if expected is None:
+            self._finish([job], now, state='cancelled')
+            return 'cancelled'
+        if expected > now:
+            # Moved without going through the ORM; wait for the new time
+            self._finish([job], now, state='pending', due_at=expected)
+            return 'rescheduled'
+        if kind.grace is not None and now > expected + kind.grace:
+            self._finish([job], now, state='expired')
+            return 'expired'
+        return None
+
+    def _fail(self, job, error: Exception, now: datetime) -> str:
+        """Retry a job whose handler raised after 1, 2, 4... minutes, or give up on it"""
+        logger.error(f"Error running {job.kind} for {job.target_type} {job.target_id}: {error}")
+        if job.attempts < MAX_ATTEMPTS:
+            self._finish([job], now, state='pending', last_error=str(error)[-4000:],
+                         due_at=retry_at(job.attempts, now))
+            return 'retried'
+        self._finish([job], now, state='failed', last_error=str(error)[-4000:])
+        return 'failed'
+
+    def run_job(self, job, handler: Callable, now: datetime = None) -> str:
+        """
+        Run one claimed job against a fresh read of its booking and return its new
+        state. The handler returns whether it did anything (done) or not (skipped).
+        """
+        now = now or datetime.utcnow()
+        target = db.session.get(TARGET_MODELS[job.target_type], job.target_id)
+        held = self._hold(job, target, now)
+        if held:
+            return held
+        try:
+            state = 'done' if handler(target) else 'skipped'
+        except Exception as e:
+            db.session.rollback()
+            return self._fail(job, e, now)
+        self._finish([job], now, state=state)
+        return state
+
+    def run_batch(self, jobs: list, handler: Callable, now: datetime = None) -> Counter:
+        """
+        Run claimed jobs of one kind together: their bookings are loaded in one query
+        per target type and handed to the handler in one call, which returns the
+        bookings it acted on (done); the rest are skipped. A session and a call may
+        share an id, so the returned bookings are matched by identity, not by id.
+        """
+        now = now or datetime.utcnow()
+        targets = {}
+        for target_type in {job.target_type for job in jobs}:
+            model = TARGET_MODELS[target_type]
+            ids = [job.target_id for job in jobs if job.target_type == target_type]
+            targets.update({(target_type, target.id): target for target in model.query.filter(model.id.in_(ids))})
+
+        outcomes = Counter()
+        runnable = []
+        for job in jobs:
+            held = self._hold(job, targets.get((job.target_type, job.target_id)), now)
+            if held:
+                outcomes[held] += 1
+            else:
+                runnable.append(job)
+        if not runnable:
+            return outcomes
+
+        batch = [targets[(job.target_type, job.target_id)] for job in runnable]
+        try:
+            # Handlers may commit, which expires the bookings; identity needs no reload
+            acted = {id(target) for target in handler(batch)}
+        except Exception as e:
+            db.session.rollback()
+            for job in runnable:
+                outcomes[self._fail(job, e, now)] += 1
+            return outcomes
+        done = [job for job, target in zip(runnable, batch) if id(target) in acted]
+        skipped = [job for job, target in zip(runnable, batch) if id(target) not in acted]
+        self._finish(done, now, state='done')
+        self._finish(skipped, now, state='skipped')
+        outcomes.update({'done': len(done), 'skipped': len(skipped)})
+        return +outcomes
+
+    def process_due(self, handlers: Dict[str, Callable], now: datetime = None, limit: int = BATCH_SIZE,
+                    batch_handlers: Dict[str, Callable] = None) -> Dict[str, int]:
+        """
+        Claim and run every due job of the handled kinds; counts per outcome.
+        handlers act on one booking per call, batch_handlers on all the due bookings
+        of their kind in each claimed batch.
+        """
+        now = now or datetime.utcnow()
+        batch_handlers = batch_handlers or {}
+        if not has_table(ScheduledJob.__tablename__):
+            return {'warning': 'Database schema needs update', 'jobs_due': 0}
+
+        self.release_stale(now)
+        outcomes = Counter()
+        while True:
+            jobs = self.claim(list(handlers) + list(batch_handlers), now, limit)
+            for kind, handler in batch_handlers.items():
+                batch = [job for job in jobs if job.kind == kind]
+                if batch:
+                    outcomes.update(self.run_batch(batch, handler, now))
+            for job in jobs:
+                if job.kind in handlers:
+                    outcomes[self.run_job(job, handlers[job.kind], now)] += 1
+            if len(jobs) < limit:
+                break
+        return {'jobs_due': sum(outcomes.values()), **outcomes}
+
+    def purge(self, now: datetime = None) -> int:
+        """Delete jobs that were due longer than RETENTION ago and are not running"""
+        now = now or datetime.utcnow()
+        result = db.session.execute(delete(ScheduledJob).where(
+            ScheduledJob.due_at < now - RETENTION, ScheduledJob.state != 'running'
+        ))
+        db.session.commit()
+        return result.rowcount
+
+    def backfill_if_empty(self, now: datetime = None) -> int:
+        """Enqueue the jobs of existing bookings, on first start after the table is created"""
+        if not has_table(ScheduledJob.__tablename__):
+            return 0
+        if db.session.query(ScheduledJob.id).first() is not None:
+            return 0
+
+        statuses = {status for kind in JOB_KINDS.values() for status in kind.statuses}
+        rows = []
+        for model in (Session, ScheduledCall):
+            for booking in model.query.filter(model.scheduled_at.isnot(None), model.status.in_(statuses)):
+                rows.extend(self.booking_job_rows(booking, now))
+        if rows:
+            db.session.execute(self._upsert(db.session.connection()), rows)
+        db.session.commit()
+        logger.info(f"Backfilled {len(rows)} scheduled jobs")
+        return len(rows)
+
+# Global job queue instance
+job_queue = JobQueue()
+
+def get_job_queue() -> JobQueue:
+    """Get the global job queue instance"""
+    return job_queue
+
+def process_due_jobs(handlers: Dict[str, Callable], now: datetime = None,
+                     batch_handlers: Dict[str, Callable] = None) -> Dict[str, int]:
+    """Run the due jobs of the kinds handlers or batch_handlers has a function for"""
+    return job_queue.process_due(handlers, now, batch_handlers=batch_handlers)
+
+def backfill_scheduled_jobs_if_empty() -> int:
+    """Enqueue jobs for the bookings made before scheduled_job existed"""
+    return job_queue.backfill_if_empty()
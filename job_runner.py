@@ -0,0 +1,314 @@
+"""
+Single-leader background job runner
+Runs the notification_scheduler jobs in a process of its own (`python job_runner.py`)
+instead of a thread inside every web worker. Any number of runners may be started:
+one holds the leader lease (a Postgres advisory lock, or a lease row in a shared
+SQLite lock file) and runs the jobs, the others wait to take over. Every run is
+recorded in job_run, and a job is due when its latest recorded run is older than
+its interval, so a new leader carries on the schedule instead of restarting it.
+"""
+
+import json
+import logging
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update
+
+logger = logging.getLogger(__name__)
+
+# How often runners check the lease and the schedule
+TICK_SECONDS = 15
+
+# A SQLite lease not renewed for this long is free; longer than any single job
+LEASE_SECONDS = 300
+
+# Postgres advisory lock key shared by every runner of this app
+ADVISORY_LOCK_KEY = 0x736B696C6565
+
+Job = namedtuple('Job', ['name', 'func', 'every_seconds', 'daily_at'])
+
+class PostgresAdvisoryLease:
+    """Leadership is a session-level advisory lock held on a dedicated connection"""
+
+    name = 'postgres'
+
+    def __init__(self, engine, key: int = ADVISORY_LOCK_KEY):
+        self.engine = engine
+        self.key = key
+        self._connection = None
+
+    def acquire(self) -> bool:
+        """Keep or take the lock; False while another runner holds it"""
+        if self._connection is not None:
+            try:
+                self._connection.driver_connection.cursor().execute('SELECT 1')
+                return True
+            except Exception as e:
+                # The server dropped the connection, and the lock with it
+                logger.warning(f"Job runner lost its lock connection: {e}")
+                self._close()
+                return False
+
+        raw_connection = self.engine.raw_connection()
+        raw_connection.detach()  # keep the lock holder out of the pool
+        try:
+            dbapi_connection = raw_connection.driver_connection
+            dbapi_connection.autocommit = True
+            cursor = dbapi_connection.cursor()
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', (self.key,))
+            if cursor.fetchone()[0]:
+                self._connection = raw_connection
+                return True
+        except Exception as e:
+            logger.error(f"Error taking the job runner lock: {e}")
+        raw_connection.close()
+        return False
+
+    def release(self):
+        if self._connection is not None:
+            try:
+                self._connection.driver_connection.cursor().execute('SELECT pg_advisory_unlock(%s)', (self.key,))
+            except Exception:
+                pass
+            self._close()
+
+    def _close(self):
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+
+class SQLiteLease:
+    """Leadership is a lease row in a shared SQLite file, renewed every tick"""
+
+    name = 'sqlite'
+    lease_name = 'job_runner'
+
+    def __init__(self, path: str, holder: str, lease_seconds: int = LEASE_SECONDS):
+        self.path = path
+        self.holder = holder
+        self.lease_seconds = lease_seconds
+
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS job_lease ('
+                'name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def acquire(self, now: float = None) -> bool:
+        """Renew our lease or take an expired one; False while another runner's is live"""
+        now = time.time() if now is None else now
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT holder, expires_at FROM job_lease WHERE name = ?',
+                                     (self.lease_name,)).fetchone()
+            if row and row[0] != self.holder and row[1] > now:
+                connection.execute('COMMIT')
+                return False
+            connection.execute(
+                'INSERT INTO job_lease (name, holder, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at',
+                (self.lease_name, self.holder, now + self.lease_seconds)
+            )
+            connection.execute('COMMIT')
+            return True
+        finally:
+            connection.close()
+
+    def release(self):
+        with self._connect() as connection:
+            connection.execute('DELETE FROM job_lease WHERE name = ? AND holder = ?', (self.lease_name, self.holder))
+
+def is_due(job: Job, last_started: Optional[datetime], now: datetime) -> bool:
+    """Whether a job whose latest run started at last_started should run at now (UTC)"""
+    if last_started is None:
+        return True
+    if job.daily_at:
+        hour, minute = (int(part) for part in job.daily_at.split(':'))
+        slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if slot > now:
+            slot -= timedelta(days=1)
+        return last_started < slot
+    return now - last_started >= timedelta(seconds=job.every_seconds)
+
+def json_result(result):
+    """A job's return value as JSON-safe data for job_run.result"""
+    if result is None:
+        return None
+    return json.loads(json.dumps(result, default=str))
+
+class JobRunner:
+    """Runs due jobs while holding the leader lease, recording every run"""
+
+    def __init__(self):
+        self.app = None
+        self.lease = None
+        self.jobs: List[Job] = []
+        self.runner_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, app, lease, jobs: List[Job]):
+        self.app = app
+        self.lease = lease
+        self.jobs = list(jobs)
+
+    def last_started(self) -> Dict[str, datetime]:
+        """Latest run start per job (one query on the job/started index)"""
+        from models import db, JobRun
+
+        rows = db.session.execute(
+            select(JobRun.job_name, func.max(JobRun.started_at)).group_by(JobRun.job_name)
+        )
+        return dict(rows.all())
+
+    def due_jobs(self, now: datetime = None) -> List[Job]:
+        now = now or datetime.utcnow()
+        last_started = self.last_started()
+        return [job for job in self.jobs if is_due(job, last_started.get(job.name), now)]
+
+    def run_job(self, job: Job, now: datetime = None):
+        """Run one job, recording it as running first so a crash leaves a trace"""
+        from models import db, JobRun
+
+        run = JobRun(job_name=job.name, runner_id=self.runner_id, status='running',
+                     started_at=now or datetime.utcnow())
+        db.session.add(run)
+        db.session.commit()
+
+        clock = time.perf_counter()
+        try:
+            result = job.func()
+            run.result = json_result(result)
+            run.status = 'failed' if isinstance(result, dict) and 'error' in result else 'succeeded'
+            run.error = result.get('error') if run.status == 'failed' else None
+        except Exception as e:
+            logger.error(f"Job {job.name} failed: {e}")
+            db.session.rollback()
+            run.status = 'failed'
+            run.error = ''.join(traceback.format_exception(e))[-4000:]
+        elapsed = time.perf_counter() - clock
+        run.duration_ms = int(elapsed * 1000)
+        run.finished_at = run.started_at + timedelta(seconds=elapsed)
+        db.session.commit()
+        # Loaded and detached, so the record stays readable after later commits and the app context
+        db.session.refresh(run)
+        db.session.expunge(run)
+        return run
+
+    def abandon_stale_runs(self, now: datetime = None) -> int:
+        """Close runs another runner left running when it lost the lease"""
+        from models import db, JobRun
+
+        result = db.session.execute(update(JobRun).where(
+            JobRun.status == 'running', JobRun.runner_id != self.runner_id
+        ).values(status='abandoned', finished_at=now or datetime.utcnow()))
+        db.session.commit()
+        return result.rowcount
+
+    def tick(self, now: datetime = None) -> list:
+        """Take or renew the lease and run every due job; returns the runs made"""
+        if not self.lease.acquire():
+            if self.is_leader:
+                logger.warning(f"Job runner {self.runner_id} lost the lease")
+            self.is_leader = False
+            return []
+
+        runs = []
+        with self.app.app_context():
+            if not self.is_leader:
+                self.is_leader = True
+                abandoned = self.abandon_stale_runs(now)
+                logger.info(f"Job runner {self.runner_id} is the leader ({abandoned} stale runs closed)")
+            for job in self.due_jobs(now):
+                # Renewed before every job so a slow job cannot outlive the lease unnoticed
+                if not self.lease.acquire():
+                    self.is_leader = False
+                    break
+                runs.append(self.run_job(job, now))
+        return runs
+
+    def run_forever(self, tick_seconds: float = TICK_SECONDS):
+        """Tick until stopped, then hand the lease back"""
+        logger.info(f"Job runner {self.runner_id} started with {self.lease.name} lease, {len(self.jobs)} jobs")
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.error(f"Error in job runner tick: {e}")
+                self._stop.wait(tick_seconds)
+        finally:
+            self.lease.release()
+            self.is_leader = False
+            logger.info(f"Job runner {self.runner_id} stopped")
+
+    def start(self):
+        """Run in a daemon thread (development server only)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name='job-runner', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+# Global job runner instance
+job_runner = JobRunner()
+
+def get_job_runner() -> JobRunner:
+    """Get the global job runner instance"""
+    return job_runner
+
+def create_lease(app, engine, holder: str):
+    """Pick the lease from JOB_RUNNER_LEASE or the database dialect"""
+    lease_name = app.config.get('JOB_RUNNER_LEASE') or engine.dialect.name
+    if lease_name in ('postgres', 'postgresql'):
+        return PostgresAdvisoryLease(engine)
+    path = app.config.get('JOB_RUNNER_LOCK_PATH') or os.path.join(app.instance_path, 'job_runner.lock')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return SQLiteLease(path, holder)
+
+def notification_jobs(app) -> List[Job]:
+    """The notification_scheduler jobs, bound to the app"""
+    from notification_scheduler import init_notification_scheduler
+
+    scheduler = init_notification_scheduler(app)
+    return [Job(*definition) for definition in scheduler.job_definitions()]
+
+def init_job_runner(app, lease=None, jobs: List[Job] = None) -> JobRunner:
+    """Configure the global runner for this process"""
+    from models import db
+
+    with app.app_context():
+        lease = lease or create_lease(app, db.engine, job_runner.runner_id)
+    job_runner.configure(app, lease, jobs if jobs is not None else notification_jobs(app))
+    return job_runner
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    from app import app
+
+    runner = init_job_runner(app)
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *_: runner.stop())
+    runner.run_forever()
+
+if __name__ == '__main__':
+    main()
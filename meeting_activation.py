@@ -1,14 +1,17 @@
 """
 Meeting activation utilities for Calendly-like functionality
 Handles automatic meeting activation, reminders, and lifecycle management
+Activation and reminders run from each meeting's due scheduled_job rows (job_queue.py)
 """
 
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
-from models import Session, ScheduledCall, User, db
+from sqlalchemy import and_
+from models import Session, ScheduledCall, ScheduledJob, User, db
+from job_queue import process_due_jobs
 from timezone_utils import get_timezone_manager, format_datetime_for_user
-from email_utils import send_email
+from email_utils import send_template_emails, time_until_text
 from notification_utils import create_system_notification
 
 logger = logging.getLogger(__name__)
@@ -19,89 +22,56 @@ class MeetingActivationManager:
     def __init__(self):
         self.timezone_manager = get_timezone_manager()
     
-    def get_meetings_to_activate(self) -> List[Dict[str, Any]]:
-        """Get all meetings that should be auto-activated now"""
+    def meeting_data(self, meeting) -> Dict[str, Any]:
+        """Type, object and participants of a Session or ScheduledCall"""
+        if isinstance(meeting, Session):
+            meeting_type, participants = 'session', self._get_session_participants(meeting)
+        else:
+            meeting_type, participants = 'call', self._get_call_participants(meeting)
+        return {
+            'type': meeting_type,
+            'id': meeting.id,
+            'object': meeting,
+            'scheduled_at': meeting.scheduled_at,
+            'participants': participants
+        }
+    
+    def _due_meetings(self, kind: str) -> List[Any]:
+        """Sessions and calls whose pending scheduled_job of this kind is due"""
+        now = datetime.utcnow()
         meetings = []
-        
-        # Check Sessions
-        sessions = Session.query.filter_by(
-            status='scheduled',
-            auto_activated=False
-        ).filter(
-            Session.scheduled_at.isnot(None)
-        ).all()
-        
-        for session in sessions:
-            if session.can_auto_activate():
-                meetings.append({
-                    'type': 'session',
-                    'id': session.id,
-                    'object': session,
-                    'scheduled_at': session.scheduled_at,
-                    'participants': self._get_session_participants(session)
-                })
-        
-        # Check ScheduledCalls
-        calls = ScheduledCall.query.filter_by(
-            status='scheduled',
-            auto_activated=False
-        ).filter(
-            ScheduledCall.scheduled_at.isnot(None)
-        ).all()
-        
-        for call in calls:
-            if call.can_auto_activate():
-                meetings.append({
-                    'type': 'call',
-                    'id': call.id,
-                    'object': call,
-                    'scheduled_at': call.scheduled_at,
-                    'participants': self._get_call_participants(call)
-                })
-        
+        for model, meeting_type in ((Session, 'session'), (ScheduledCall, 'call')):
+            meetings.extend(model.query.join(ScheduledJob, and_(
+                ScheduledJob.target_type == meeting_type,
+                ScheduledJob.target_id == model.id
+            )).filter(
+                ScheduledJob.kind == kind,
+                ScheduledJob.state == 'pending',
+                ScheduledJob.due_at <= now
+            ).all())
         return meetings
     
+    def get_meetings_to_activate(self) -> List[Dict[str, Any]]:
+        """Get all meetings that should be auto-activated now"""
+        return [self.meeting_data(meeting) for meeting in self._due_meetings('meeting_activation')
+                if not meeting.auto_activated and meeting.can_auto_activate()]
+    
     def get_meetings_for_reminders(self) -> List[Dict[str, Any]]:
         """Get all meetings that should receive reminders now"""
-        meetings = []
-        
-        # Check Sessions
-        sessions = Session.query.filter_by(
-            status='scheduled',
-            reminder_sent=False
-        ).filter(
-            Session.scheduled_at.isnot(None)
-        ).all()
-        
-        for session in sessions:
-            if session.should_send_reminder():
-                meetings.append({
-                    'type': 'session',
-                    'id': session.id,
-                    'object': session,
-                    'scheduled_at': session.scheduled_at,
-                    'participants': self._get_session_participants(session)
-                })
-        
-        # Check ScheduledCalls
-        calls = ScheduledCall.query.filter_by(
-            status='scheduled',
-            reminder_sent=False
-        ).filter(
-            ScheduledCall.scheduled_at.isnot(None)
-        ).all()
-        
-        for call in calls:
-            if call.should_send_reminder():
-                meetings.append({
-                    'type': 'call',
-                    'id': call.id,
-                    'object': call,
-                    'scheduled_at': call.scheduled_at,
-                    'participants': self._get_call_participants(call)
-                })
-        
-        return meetings
+        return [self.meeting_data(meeting) for meeting in self._due_meetings('meeting_reminders')
+                if meeting.should_send_reminder()]
+    
+    def activate_due_meeting(self, meeting) -> bool:
+        """meeting_activation job: activate a meeting that has not been activated yet"""
+        if meeting.auto_activated:
+            return False
+        return self.activate_meeting(self.meeting_data(meeting))
+    
+    def send_due_reminder(self, meeting) -> bool:
+        """meeting_reminders job: remind the participants unless it was already done"""
+        if not meeting.should_send_reminder():
+            return False
+        return self.send_reminder(self.meeting_data(meeting))
     
     def get_meetings_for_early_join(self) -> List[Dict[str, Any]]:
         """Get all meetings that allow early join now"""
@@ -172,8 +142,8 @@ class MeetingActivationManager:
             participants = meeting_data['participants']
             
             # Send reminder emails
+            self._send_meeting_emails('meeting_reminder', meeting_data)
             for participant in participants:
-                self._send_reminder_email(participant, meeting_data)
                 self._send_reminder_notification(participant, meeting_data)
             
             # Mark reminder as sent
@@ -264,72 +234,27 @@ class MeetingActivationManager:
                 related_id=meeting_obj.id,
                 related_type=meeting_type
             )
-            
-            # Send email notification
-            try:
-                meeting_time = format_datetime_for_user(
-                    meeting_obj.scheduled_at, 
-                    participant['timezone']
-                )
-                
-                subject = f"Your {meeting_type.title()} Has Started"
-                body = f"""
-                Hello {user.first_name},
-                
-                Your {meeting_type} has started. Please join the meeting now.
-                
-                Meeting Details:
-                - Time: {meeting_time}
-                - Duration: {getattr(meeting_obj, 'duration_minutes', 60)} minutes
-                
-                Click here to join: [Meeting Link]
-                
-                Best regards,
-                Skileez Team
-                """
-                
-                send_email(user.email, subject, body)
-                
-            except Exception as e:
-                logger.error(f"Error sending meeting activated email: {e}")
+        
+        self._send_meeting_emails('meeting_started', meeting_data)
     
-    def _send_reminder_email(self, participant: Dict[str, Any], meeting_data: Dict[str, Any]):
-        """Send reminder email to participant"""
+    def _send_meeting_emails(self, template: str, meeting_data: Dict[str, Any]):
+        """Send a meeting email to every participant, rendered from one compiled template"""
+        meeting_obj = meeting_data['object']
         try:
-            user = participant['user']
-            meeting_obj = meeting_data['object']
-            meeting_type = meeting_data['type']
-            
-            meeting_time = format_datetime_for_user(
-                meeting_obj.scheduled_at, 
-                participant['timezone']
+            send_template_emails(
+                template,
+                [(participant['user'].email, {
+                    'user_name': participant['user'].first_name,
+                    'meeting_time': format_datetime_for_user(meeting_obj.scheduled_at, participant['timezone']),
+                }) for participant in meeting_data['participants']],
+                meeting_label=meeting_data['type'].title(),
+                time_until=time_until_text(meeting_obj.scheduled_at),
+                duration=getattr(meeting_obj, 'duration_minutes', None) or 60,
+                meeting_url=getattr(meeting_obj, 'google_meet_url', None),
+                commit=True,
             )
-            
-            subject = f"Reminder: Your {meeting_type.title()} in 15 minutes"
-            body = f"""
-            Hello {user.first_name},
-            
-            This is a reminder that your {meeting_type} starts in 15 minutes.
-            
-            Meeting Details:
-            - Time: {meeting_time}
-            - Duration: {getattr(meeting_obj, 'duration_minutes', 60)} minutes
-            
-            Please ensure you have:
-            - A stable internet connection
-            - Your camera and microphone ready
-            - A quiet environment for the meeting
-            
-            Click here to join: [Meeting Link]
-            
-            Best regards,
-            Skileez Team
-            """
-            
-            send_email(user.email, subject, body)
-            
         except Exception as e:
-            logger.error(f"Error sending reminder email: {e}")
+            logger.error(f"Error sending {template} emails: {e}")
     
     def _send_reminder_notification(self, participant: Dict[str, Any], meeting_data: Dict[str, Any]):
         """Send reminder notification to participant"""
@@ -363,25 +288,17 @@ def get_meeting_activation_manager() -> MeetingActivationManager:
 def activate_pending_meetings():
     """Activate all meetings that should be activated now"""
     manager = get_meeting_activation_manager()
-    meetings = manager.get_meetings_to_activate()
-    
-    activated_count = 0
-    for meeting in meetings:
-        if manager.activate_meeting(meeting):
-            activated_count += 1
+    result = process_due_jobs({'meeting_activation': manager.activate_due_meeting})
     
+    activated_count = result.get('done', 0)
     logger.info(f"Activated {activated_count} meetings")
     return activated_count
 
 def send_pending_reminders():
     """Send reminders for all meetings that need them now"""
     manager = get_meeting_activation_manager()
-    meetings = manager.get_meetings_for_reminders()
-    
-    reminder_count = 0
-    for meeting in meetings:
-        if manager.send_reminder(meeting):
-            reminder_count += 1
+    result = process_due_jobs({'meeting_reminders': manager.send_due_reminder})
     
+    reminder_count = result.get('done', 0)
     logger.info(f"Sent {reminder_count} reminders")
     return reminder_count
@@ -0,0 +1,346 @@
+"""
+Message Payload parsing for contract, session and consultation cards
+Parses the card fields out of Message.content once, when the message is written, and stores
+them in Message.payload so conversation templates read a dict instead of running JSON
+decoding and a few dozen regexes per message on every render
+"""
+
+import json
+import logging
+import re
+from typing import Dict, Any, Optional
+from sqlalchemy import select, update, bindparam, text
+
+logger = logging.getLogger(__name__)
+
+# Message types whose card is rendered from parsed content, and the payload key they use
+PAYLOAD_KEYS = {
+    'CONTRACT_OFFER': 'contract',
+    'SESSION_SCHEDULED': 'session',
+    'FREE_CONSULTATION': 'consultation'
+}
+
+BACKFILL_BATCH_SIZE = 1000
+
+_FLAGS = re.IGNORECASE | re.MULTILINE
+
+def _compile(patterns):
+    return [(re.compile(pattern, _FLAGS), key) for pattern, key in patterns]
+
+# Later patterns win for the same key, as in the original template filters
+CONTRACT_PATTERNS = _compile([
+    # Format 1: **Project:** Title
+    (r'\*\*Project:\*\* (.+?)(?:\n|$)', 'project'),
+    # Format 2: Project: Title
+    (r'Project:\s*(.+?)(?:\n|$)', 'project'),
+    # Format 3: 📋 **New Contract Created** format
+    (r'📋 \*\*New Contract Created\*\*\n\n\*\*Project:\*\* (.+?)(?:\n|$)', 'project'),
+
+    # Sessions patterns
+    (r'\*\*Sessions:\*\* (\d+)', 'sessions'),
+    (r'Sessions:\s*(\d+)', 'sessions'),
+    (r'(\d+)\s*sessions?', 'sessions'),
+
+    # Amount patterns
+    (r'\*\*Total Amount:\*\* \$([\d,]+\.?\d*)', 'amount'),
+    (r'Total Amount:\s*\$([\d,]+\.?\d*)', 'amount'),
+    (r'\$([\d,]+\.?\d*)', 'amount'),
+
+    # Start date patterns
+    (r'\*\*Start Date:\*\* (.+?)(?:\n|$)', 'start_date'),
+    (r'Start Date:\s*(.+?)(?:\n|$)', 'start_date'),
+    (r'(\w+ \d{1,2}, \d{4})', 'start_date'),
+
+    # Contract ID patterns
+    (r'Contract ID:\s*(\d+)', 'contract_id'),
+    (r'ID:\s*(\d+)', 'contract_id'),
+
+    # Status patterns
+    (r'Status:\s*(pending|active|completed|cancelled)', 'status'),
+    (r'\*\*Status:\*\* (pending|active|completed|cancelled)', 'status'),
+
+    # Duration patterns
+    (r'Duration:\s*(\d+)\s*minutes?', 'duration'),
+    (r'\*\*Duration:\*\* (\d+)\s*minutes?', 'duration'),
+
+    # Rate patterns
+    (r'Rate:\s*\$([\d,]+\.?\d*)/session', 'rate'),
+    (r'\*\*Rate:\*\* \$([\d,]+\.?\d*)/session', 'rate')
+])
+
+SESSION_PATTERNS = _compile([
+    # Session ID patterns
+    (r'Session ID:\s*(\d+)', 'session_id'),
+    (r'ID:\s*(\d+)', 'session_id'),
+
+    # Session number patterns
+    (r'Session #(\d+)', 'session_number'),
+    (r'Session Number:\s*(\d+)', 'session_number'),
+
+    # Date and time patterns
+    (r'Scheduled:\s*(.+?)(?:\n|$)', 'scheduled_at'),
+    (r'Date:\s*(.+?)(?:\n|$)', 'scheduled_at'),
+    (r'Time:\s*(.+?)(?:\n|$)', 'scheduled_at'),
+    (r'(\w+ \d{1,2}, \d{4} at \d{1,2}:\d{2} [AP]M)', 'scheduled_at'),
+
+    # Duration patterns
+    (r'Duration:\s*(\d+)\s*minutes?', 'duration'),
+    (r'(\d+)\s*min', 'duration'),
+
+    # Status patterns
+    (r'Status:\s*(scheduled|confirmed|completed|cancelled|missed)', 'status'),
+    (r'\*\*Status:\*\* (scheduled|confirmed|completed|cancelled|missed)', 'status'),
+
+    # Session type patterns
+    (r'Type:\s*(free consultation|paid session|learning session)', 'session_type'),
+    (r'\*\*Type:\*\* (free consultation|paid session|learning session)', 'session_type'),
+
+    # Contract title patterns
+    (r'Contract:\s*(.+?)(?:\n|$)', 'contract_title'),
+    (r'\*\*Contract:\*\* (.+?)(?:\n|$)', 'contract_title'),
+
+    # Coach name patterns
+    (r'Coach:\s*(.+?)(?:\n|$)', 'coach_name'),
+    (r'\*\*Coach:\*\* (.+?)(?:\n|$)', 'coach_name'),
+
+    # Student name patterns
+    (r'Student:\s*(.+?)(?:\n|$)', 'student_name'),
+    (r'\*\*Student:\*\* (.+?)(?:\n|$)', 'student_name')
+])
+
+CONSULTATION_PATTERNS = _compile([
+    # Consultation ID patterns
+    (r'Consultation ID:\s*(\d+)', 'consultation_id'),
+    (r'ID:\s*(\d+)', 'consultation_id'),
+
+    # Date and time patterns
+    (r'Scheduled:\s*(.+?)(?:\n|$)', 'scheduled_at'),
+    (r'Date:\s*(.+?)(?:\n|$)', 'scheduled_at'),
+    (r'Time:\s*(.+?)(?:\n|$)', 'scheduled_at'),
+    (r'(\w+ \d{1,2}, \d{4} at \d{1,2}:\d{2} [AP]M)', 'scheduled_at'),
+
+    # Status patterns
+    (r'Status:\s*(scheduled|confirmed|completed|cancelled|missed)', 'status'),
+    (r'\*\*Status:\*\* (scheduled|confirmed|completed|cancelled|missed)', 'status'),
+
+    # Coach name patterns
+    (r'Coach:\s*(.+?)(?:\n|$)', 'coach_name'),
+    (r'\*\*Coach:\*\* (.+?)(?:\n|$)', 'coach_name'),
+
+    # Student name patterns
+    (r'Student:\s*(.+?)(?:\n|$)', 'student_name'),
+    (r'\*\*Student:\*\* (.+?)(?:\n|$)', 'student_name'),
+
+    # Duration patterns (consultations are typically 15 minutes)
+    (r'Duration:\s*(\d+)\s*minutes?', 'duration'),
+    (r'(\d+)\s*min', 'duration')
+])
+
+def _load_json_object(content: str) -> Optional[Dict[str, Any]]:
+    """Structured messages store a JSON object as their content"""
+    stripped = content.strip()
+    if stripped.startswith('{') and stripped.endswith('}'):
+        try:
+            data = json.loads(content)
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass  # Continue with regex parsing
+    return None
+
+def _apply_patterns(content: str, patterns) -> Dict[str, Any]:
+    info = {}
+    for pattern, key in patterns:
+        match = pattern.search(content)
+        if match:
+            info[key] = match.group(1).strip()
+    return info
+
+def parse_contract_info(content: str) -> Optional[Dict[str, Any]]:
+    """Extract contract information from message content"""
+    if not content:
+        return None
+
+    try:
+        json_data = _load_json_object(content)
+        if json_data is not None:
+            return {
+                'project': json_data.get('project', 'Learning Project'),
+                'sessions': str(json_data.get('sessions', 'N/A')),
+                'amount': json_data.get('amount', 'N/A'),  # Keep as number for JSON data
+                'start_date': json_data.get('start_date', 'N/A'),
+                'contract_id': json_data.get('contract_id'),
+                'status': json_data.get('status', 'pending'),
+                'duration': json_data.get('duration', 'N/A'),
+                'rate': json_data.get('rate', 'N/A')
+            }
+
+        contract_info = _apply_patterns(content, CONTRACT_PATTERNS)
+        if not contract_info:
+            return None
+
+        # Ensure amount has proper formatting
+        amount = contract_info.get('amount')
+        if isinstance(amount, str) and amount != 'N/A' and not amount.startswith('$'):
+            contract_info['amount'] = f"${amount}"
+
+        # Set defaults for missing fields
+        contract_info.setdefault('project', 'Learning Project')
+        contract_info.setdefault('sessions', 'N/A')
+        contract_info.setdefault('amount', 'N/A')
+        contract_info.setdefault('start_date', 'N/A')
+        contract_info.setdefault('status', 'pending')
+        contract_info.setdefault('duration', 'N/A')
+        contract_info.setdefault('rate', 'N/A')
+        return contract_info
+
+    except Exception as e:
+        logger.error(f"Error extracting contract info: {e}")
+        return None
+
+def parse_session_info(content: str) -> Optional[Dict[str, Any]]:
+    """Extract session information from message content"""
+    if not content:
+        return None
+
+    try:
+        json_data = _load_json_object(content)
+        if json_data is not None:
+            return {
+                'session_id': json_data.get('session_id'),
+                'session_number': json_data.get('session_number'),
+                'scheduled_at': json_data.get('scheduled_at'),
+                'duration': json_data.get('duration', '60'),
+                'status': json_data.get('status', 'scheduled'),
+                'session_type': json_data.get('session_type', 'paid'),
+                'contract_title': json_data.get('contract_title'),
+                'coach_name': json_data.get('coach_name'),
+                'student_name': json_data.get('student_name')
+            }
+
+        session_info = _apply_patterns(content, SESSION_PATTERNS)
+        if not session_info:
+            return None
+
+        # Set defaults for missing fields
+        session_info.setdefault('session_id', None)
+        session_info.setdefault('session_number', 'N/A')
+        session_info.setdefault('scheduled_at', 'N/A')
+        session_info.setdefault('duration', '60')
+        session_info.setdefault('status', 'scheduled')
+        session_info.setdefault('session_type', 'paid')
+        session_info.setdefault('contract_title', 'N/A')
+        session_info.setdefault('coach_name', 'N/A')
+        session_info.setdefault('student_name', 'N/A')
+        return session_info
+
+    except Exception as e:
+        logger.error(f"Error extracting session info: {e}")
+        return None
+
+def parse_consultation_info(content: str) -> Optional[Dict[str, Any]]:
+    """Extract consultation information from message content"""
+    if not content:
+        return None
+
+    try:
+        json_data = _load_json_object(content)
+        if json_data is not None:
+            return {
+                'consultation_id': json_data.get('consultation_id'),
+                'scheduled_at': json_data.get('scheduled_at'),
+                'status': json_data.get('status', 'scheduled'),
+                'coach_name': json_data.get('coach_name'),
+                'student_name': json_data.get('student_name'),
+                'duration': json_data.get('duration', '15')
+            }
+
+        consultation_info = _apply_patterns(content, CONSULTATION_PATTERNS)
+        if not consultation_info:
+            return None
+
+        # Set defaults for missing fields
+        consultation_info.setdefault('consultation_id', None)
+        consultation_info.setdefault('scheduled_at', 'N/A')
+        consultation_info.setdefault('status', 'scheduled')
+        consultation_info.setdefault('coach_name', 'N/A')
+        consultation_info.setdefault('student_name', 'N/A')
+        consultation_info.setdefault('duration', '15')
+        return consultation_info
+
+    except Exception as e:
+        logger.error(f"Error extracting consultation info: {e}")
+        return None
+
+PARSERS = {
+    'contract': parse_contract_info,
+    'session': parse_session_info,
+    'consultation': parse_consultation_info
+}
+
+def parse_message_info(key: str, content: str) -> Optional[Dict[str, Any]]:
+    """Parse one card kind ('contract', 'session' or 'consultation') from content"""
+    return PARSERS[key](content)
+
+def build_message_payload(content: str, message_type: str) -> Optional[Dict[str, Any]]:
+    """Payload stored with a message: the parsed card for its type, None for plain messages"""
+    key = PAYLOAD_KEYS.get(message_type)
+    if key is None:
+        return None
+    return {key: parse_message_info(key, content)}
+
+def ensure_payload_column(connection) -> bool:
+    """Add message.payload to databases created before the column existed"""
+    from schema_capabilities import has_table, has_column
+
+    if not has_table('message', connection) or has_column('message', 'payload', connection):
+        return False
+    connection.execute(text("ALTER TABLE message ADD COLUMN payload JSON"))
+    logger.info("Added payload column to message table")
+    return True
+
+def backfill_message_payloads(connection, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Parse payloads for existing card messages in id-ordered batches; returns rows updated"""
+    from models import Message
+
+    message_table = Message.__table__
+    update_payload = update(message_table).where(
+        message_table.c.id == bindparam('message_id')
+    ).values(payload=bindparam('payload'))
+
+    updated = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(message_table.c.id, message_table.c.content, message_table.c.message_type).where(
+                message_table.c.id > last_id,
+                message_table.c.message_type.in_(list(PAYLOAD_KEYS)),
+                message_table.c.payload.is_(None)
+            ).order_by(message_table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return updated
+
+        connection.execute(update_payload, [
+            {'message_id': message_id, 'payload': build_message_payload(content, message_type)}
+            for message_id, content, message_type in rows
+        ])
+        updated += len(rows)
+        last_id = rows[-1][0]
+
+def prepare_message_payloads() -> int:
+    """
+    Startup hook: add message.payload to databases that predate it and fill it. Once
+    the column exists, migration 018 or backfill_message_payloads.py has filled it
+    and new messages are parsed on write, so startup reads no messages.
+    """
+    from models import db
+
+    with db.engine.begin() as connection:
+        if not ensure_payload_column(connection):
+            return 0
+    with db.engine.begin() as connection:
+        updated = backfill_message_payloads(connection)
+    if updated:
+        logger.info(f"Backfilled payloads for {updated} messages")
+    return updated
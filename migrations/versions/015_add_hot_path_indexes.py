@@ -0,0 +1,66 @@
+"""Add composite indexes for messaging, notification, contract and scheduling hot paths
+
+Revision ID: 015
+Revises: 014
+Create Date: 2024-01-22 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns)
+HOT_PATH_INDEXES = [
+    ('ix_message_sender_recipient_created', 'message', ['sender_id', 'recipient_id', 'created_at']),
+    ('ix_message_recipient_read_sender', 'message', ['recipient_id', 'is_read', 'sender_id']),
+    ('ix_notification_user_created', 'notification', ['user_id', 'created_at']),
+    ('ix_session_proposal_status_scheduled', 'session', ['proposal_id', 'status', 'scheduled_at']),
+    ('ix_contract_coach_status', 'contract', ['coach_id', 'status']),
+    ('ix_contract_student_status', 'contract', ['student_id', 'status']),
+    ('ix_scheduled_call_status_scheduled', 'scheduled_call', ['status', 'scheduled_at']),
+    ('ix_scheduled_call_coach_status_scheduled', 'scheduled_call', ['coach_id', 'status', 'scheduled_at']),
+    ('ix_learning_request_active_created', 'learning_request', ['is_active', 'created_at']),
+]
+
+
+def upgrade():
+    for index_name, table, columns in HOT_PATH_INDEXES:
+        try:
+            op.create_index(index_name, table, columns)
+            print(f"Created index {index_name} on {table}")
+        except Exception as e:
+            if "already exists" in str(e):
+                print(f"Index {index_name} already exists on {table}")
+            else:
+                raise e
+
+    # Partial index so the unread badge only touches unread rows
+    try:
+        op.create_index(
+            'ix_notification_user_unread', 'notification', ['user_id', 'created_at'],
+            postgresql_where=sa.text('is_read = false'),
+            sqlite_where=sa.text('is_read = 0'),
+        )
+        print("Created index ix_notification_user_unread on notification")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Index ix_notification_user_unread already exists on notification")
+        else:
+            raise e
+
+
+def downgrade():
+    indexes_to_remove = [('ix_notification_user_unread', 'notification')]
+    indexes_to_remove += [(name, table) for name, table, _ in reversed(HOT_PATH_INDEXES)]
+
+    for index_name, table in indexes_to_remove:
+        try:
+            op.drop_index(index_name, table_name=table)
+            print(f"Removed index {index_name} from {table}")
+        except Exception as e:
+            print(f"Error removing index {index_name} from {table}: {e}")
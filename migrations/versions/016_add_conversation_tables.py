@@ -0,0 +1,74 @@
+"""Add conversation and conversation_participant tables and backfill them from messages
+
+Revision ID: 016
+Revises: 015
+Create Date: 2024-01-23 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '016'
+down_revision = '015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        op.create_table('conversation',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_low_id', sa.Integer(), nullable=False),
+            sa.Column('user_high_id', sa.Integer(), nullable=False),
+            sa.Column('last_message_id', sa.Integer(), nullable=True),
+            sa.Column('last_activity_at', sa.DateTime(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_low_id'], ['user.id'], ),
+            sa.ForeignKeyConstraint(['user_high_id'], ['user.id'], ),
+            sa.ForeignKeyConstraint(['last_message_id'], ['message.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_pair')
+        )
+        print("Created conversation table")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("conversation table already exists")
+        else:
+            raise e
+
+    try:
+        op.create_table('conversation_participant',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('conversation_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('partner_id', sa.Integer(), nullable=False),
+            sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.ForeignKeyConstraint(['conversation_id'], ['conversation.id'], ),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+            sa.ForeignKeyConstraint(['partner_id'], ['user.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('conversation_id', 'user_id', name='uq_conversation_participant')
+        )
+        op.create_index('ix_conversation_participant_user_partner', 'conversation_participant',
+                        ['user_id', 'partner_id'])
+        print("Created conversation_participant table")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("conversation_participant table already exists")
+        else:
+            raise e
+
+    # Build conversations for the existing message history in bulk
+    from conversation_manager import backfill_conversations
+    conversation_count = backfill_conversations(op.get_bind())
+    print(f"Backfilled {conversation_count} conversations")
+
+
+def downgrade():
+    for table in ['conversation_participant', 'conversation']:
+        try:
+            op.drop_table(table)
+            print(f"Dropped {table} table")
+        except Exception as e:
+            print(f"Error dropping {table} table: {e}")
@@ -0,0 +1,35 @@
+"""Add message index for after_id cursor polling
+
+Revision ID: 017
+Revises: 016
+Create Date: 2024-01-24 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '017'
+down_revision = '016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (sender_id, recipient_id, id) lets "id > after_id" polls read a short index range
+    try:
+        op.create_index('ix_message_sender_recipient_id', 'message', ['sender_id', 'recipient_id', 'id'])
+        print("Created index ix_message_sender_recipient_id on message")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Index ix_message_sender_recipient_id already exists on message")
+        else:
+            raise e
+
+
+def downgrade():
+    try:
+        op.drop_index('ix_message_sender_recipient_id', table_name='message')
+        print("Removed index ix_message_sender_recipient_id from message")
+    except Exception as e:
+        print(f"Error removing index ix_message_sender_recipient_id from message: {e}")
@@ -0,0 +1,39 @@
+"""Add message payload column for parsed card fields
+
+Revision ID: 018
+Revises: 017
+Create Date: 2024-01-25 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '018'
+down_revision = '017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Contract / session / consultation fields parsed from content when the message is written
+    try:
+        op.add_column('message', sa.Column('payload', sa.JSON(), nullable=True))
+        print("Added payload column to message")
+    except Exception as e:
+        if "already exists" in str(e) or "duplicate column name" in str(e):
+            print("payload column already exists on message")
+        else:
+            raise e
+
+    from message_payload import backfill_message_payloads
+    updated = backfill_message_payloads(op.get_bind())
+    print(f"Backfilled payloads for {updated} messages")
+
+
+def downgrade():
+    try:
+        op.drop_column('message', 'payload')
+        print("Removed payload column from message")
+    except Exception as e:
+        print(f"Error removing payload column from message: {e}")
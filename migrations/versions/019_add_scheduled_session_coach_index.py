@@ -0,0 +1,36 @@
+"""Add scheduled_session index for coach free/busy reads
+
+Revision ID: 019
+Revises: 018
+Create Date: 2024-01-26 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '019'
+down_revision = '018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (coach_id, status, scheduled_at) turns the busy-interval fetch into a range scan
+    try:
+        op.create_index('ix_scheduled_session_coach_status_scheduled', 'scheduled_session',
+                        ['coach_id', 'status', 'scheduled_at'])
+        print("Created index ix_scheduled_session_coach_status_scheduled on scheduled_session")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Index ix_scheduled_session_coach_status_scheduled already exists on scheduled_session")
+        else:
+            raise e
+
+
+def downgrade():
+    try:
+        op.drop_index('ix_scheduled_session_coach_status_scheduled', table_name='scheduled_session')
+        print("Removed index ix_scheduled_session_coach_status_scheduled from scheduled_session")
+    except Exception as e:
+        print(f"Error removing index ix_scheduled_session_coach_status_scheduled from scheduled_session: {e}")
@@ -0,0 +1,64 @@
+"""Add booking_range with a database-enforced no-overlap rule per coach
+
+Revision ID: 020
+Revises: 019
+Create Date: 2024-01-27 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '020'
+down_revision = '019'
+branch_labels = None
+depends_on = None
+
+NO_OVERLAP = 'booking_range_no_overlap'
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'booking_range',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('coach_id', sa.Integer(), nullable=False),
+            sa.Column('source_type', sa.String(length=20), nullable=False),
+            sa.Column('source_id', sa.Integer(), nullable=False),
+            sa.Column('booking_key', sa.String(length=40), nullable=False),
+            sa.Column('starts_at', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('ends_at', sa.DateTime(timezone=True), nullable=False),
+            sa.ForeignKeyConstraint(['coach_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('source_type', 'source_id', name='uq_booking_range_source')
+        )
+        op.create_index('ix_booking_range_coach_starts', 'booking_range', ['coach_id', 'starts_at'])
+        print("Created table booking_range")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Table booking_range already exists")
+            return
+        else:
+            raise e
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        op.execute(f"ALTER TABLE booking_range ADD CONSTRAINT {NO_OVERLAP} EXCLUDE USING gist "
+                   f"(coach_id WITH =, tstzrange(starts_at, ends_at, '[)') WITH &&, booking_key WITH <>)")
+        print(f"Added exclusion constraint {NO_OVERLAP} on booking_range")
+    else:
+        for operation, other_rows in (('insert', ''), ('update', 'AND id <> NEW.id ')):
+            op.execute(f"CREATE TRIGGER {NO_OVERLAP}_{operation} BEFORE {operation.upper()} ON booking_range "
+                       f"WHEN EXISTS (SELECT 1 FROM booking_range WHERE coach_id = NEW.coach_id "
+                       f"AND booking_key <> NEW.booking_key {other_rows}"
+                       f"AND starts_at < NEW.ends_at AND ends_at > NEW.starts_at) "
+                       f"BEGIN SELECT RAISE(ABORT, '{NO_OVERLAP}'); END")
+        print(f"Added triggers {NO_OVERLAP}_insert/_update on booking_range")
+
+
+def downgrade():
+    try:
+        op.drop_table('booking_range')
+        print("Removed table booking_range")
+    except Exception as e:
+        print(f"Error removing table booking_range: {e}")
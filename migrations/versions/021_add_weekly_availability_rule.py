@@ -0,0 +1,60 @@
+"""Add weekly_availability_rule and convert the per-day working-hour columns
+
+Revision ID: 021
+Revises: 020
+Create Date: 2024-01-28 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '021'
+down_revision = '020'
+branch_labels = None
+depends_on = None
+
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'weekly_availability_rule',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('coach_id', sa.Integer(), nullable=False),
+            sa.Column('weekday', sa.SmallInteger(), nullable=False),
+            sa.Column('start_minute', sa.SmallInteger(), nullable=False),
+            sa.Column('end_minute', sa.SmallInteger(), nullable=False),
+            sa.ForeignKeyConstraint(['coach_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('coach_id', 'weekday', 'start_minute',
+                                name='uq_weekly_availability_rule_coach_day_start')
+        )
+        op.create_index('ix_weekly_availability_rule_coach_id', 'weekly_availability_rule', ['coach_id'])
+        op.create_index('ix_weekly_availability_rule_weekday_start', 'weekly_availability_rule',
+                        ['weekday', 'start_minute'])
+        print("Created table weekly_availability_rule")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Table weekly_availability_rule already exists")
+            return
+        else:
+            raise e
+
+    # One rule per working day; empty columns take the old defaults (9:00-17:00)
+    for weekday, day in enumerate(DAY_NAMES):
+        start = f"COALESCE({day}_start, 540)"
+        end = f"COALESCE({day}_end, 1020)"
+        op.execute(f"INSERT INTO weekly_availability_rule (coach_id, weekday, start_minute, end_minute) "
+                   f"SELECT coach_id, {weekday}, {start}, {end} FROM coach_availability WHERE {start} < {end} "
+                   f"ON CONFLICT DO NOTHING")
+    print("Converted per-day working hours into weekly_availability_rule")
+
+
+def downgrade():
+    try:
+        op.drop_table('weekly_availability_rule')
+        print("Removed table weekly_availability_rule")
+    except Exception as e:
+        print(f"Error removing table weekly_availability_rule: {e}")
@@ -0,0 +1,121 @@
+"""Replace booking_range with calendar_event, one row per booking with a time
+
+Revision ID: 022
+Revises: 021
+Create Date: 2024-01-29 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '022'
+down_revision = '021'
+branch_labels = None
+depends_on = None
+
+NO_OVERLAP = 'calendar_event_no_overlap'
+BOOKING_RANGE_NO_OVERLAP = 'booking_range_no_overlap'
+RANGE_COLUMNS = ['starts_at', 'ends_at', 'busy', 'status', 'source_type', 'source_id']
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'calendar_event',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('coach_id', sa.Integer(), nullable=False),
+            sa.Column('student_id', sa.Integer(), nullable=True),
+            sa.Column('source_type', sa.String(length=20), nullable=False),
+            sa.Column('source_id', sa.Integer(), nullable=False),
+            sa.Column('booking_key', sa.String(length=40), nullable=False),
+            sa.Column('starts_at', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('ends_at', sa.DateTime(timezone=True), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('busy', sa.Boolean(), nullable=False),
+            sa.ForeignKeyConstraint(['coach_id'], ['user.id']),
+            sa.ForeignKeyConstraint(['student_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('source_type', 'source_id', name='uq_calendar_event_source')
+        )
+        op.create_index('ix_calendar_event_coach_range', 'calendar_event', ['coach_id'] + RANGE_COLUMNS)
+        op.create_index('ix_calendar_event_student_range', 'calendar_event', ['student_id'] + RANGE_COLUMNS)
+        print("Created table calendar_event")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Table calendar_event already exists")
+            return
+        else:
+            raise e
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        op.execute(f"ALTER TABLE calendar_event ADD CONSTRAINT {NO_OVERLAP} EXCLUDE USING gist "
+                   f"(coach_id WITH =, tstzrange(starts_at, ends_at, '[)') WITH &&, booking_key WITH <>) "
+                   f"WHERE (busy)")
+        print(f"Added exclusion constraint {NO_OVERLAP} on calendar_event")
+    else:
+        for operation, other_rows in (('insert', ''), ('update', 'AND id <> NEW.id ')):
+            op.execute(f"CREATE TRIGGER {NO_OVERLAP}_{operation} BEFORE {operation.upper()} ON calendar_event "
+                       f"WHEN NEW.busy AND EXISTS (SELECT 1 FROM calendar_event WHERE coach_id = NEW.coach_id "
+                       f"AND busy AND booking_key <> NEW.booking_key {other_rows}"
+                       f"AND starts_at < NEW.ends_at AND ends_at > NEW.starts_at) "
+                       f"BEGIN SELECT RAISE(ABORT, '{NO_OVERLAP}'); END")
+        print(f"Added triggers {NO_OVERLAP}_insert/_update on calendar_event")
+
+    # Rows are filled from the booking tables on first start (calendar_events.backfill_if_empty)
+    try:
+        op.drop_table('booking_range')
+        print("Removed table booking_range")
+    except Exception as e:
+        print(f"Error removing table booking_range: {e}")
+
+
+def create_booking_range():
+    """booking_range as migration 020 created it, with its no-overlap rule per coach"""
+    op.create_table(
+        'booking_range',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('coach_id', sa.Integer(), nullable=False),
+        sa.Column('source_type', sa.String(length=20), nullable=False),
+        sa.Column('source_id', sa.Integer(), nullable=False),
+        sa.Column('booking_key', sa.String(length=40), nullable=False),
+        sa.Column('starts_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('ends_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['coach_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('source_type', 'source_id', name='uq_booking_range_source')
+    )
+    op.create_index('ix_booking_range_coach_starts', 'booking_range', ['coach_id', 'starts_at'])
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(f"ALTER TABLE booking_range ADD CONSTRAINT {BOOKING_RANGE_NO_OVERLAP} EXCLUDE USING gist "
+                   f"(coach_id WITH =, tstzrange(starts_at, ends_at, '[)') WITH &&, booking_key WITH <>)")
+    else:
+        for operation, other_rows in (('insert', ''), ('update', 'AND id <> NEW.id ')):
+            op.execute(f"CREATE TRIGGER {BOOKING_RANGE_NO_OVERLAP}_{operation} BEFORE {operation.upper()} "
+                       f"ON booking_range WHEN EXISTS (SELECT 1 FROM booking_range WHERE coach_id = NEW.coach_id "
+                       f"AND booking_key <> NEW.booking_key {other_rows}"
+                       f"AND starts_at < NEW.ends_at AND ends_at > NEW.starts_at) "
+                       f"BEGIN SELECT RAISE(ABORT, '{BOOKING_RANGE_NO_OVERLAP}'); END")
+
+
+def downgrade():
+    # Revision 021 reads busy time from booking_range: bring it back with the busy events
+    try:
+        create_booking_range()
+        op.execute("INSERT INTO booking_range (coach_id, source_type, source_id, booking_key, starts_at, ends_at) "
+                   "SELECT coach_id, source_type, source_id, booking_key, starts_at, ends_at "
+                   "FROM calendar_event WHERE busy")
+        print("Restored table booking_range from calendar_event")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Table booking_range already exists")
+        else:
+            raise e
+
+    try:
+        op.drop_table('calendar_event')
+        print("Removed table calendar_event")
+    except Exception as e:
+        print(f"Error removing table calendar_event: {e}")
@@ -0,0 +1,42 @@
+"""Add calendar_event.updated_at for iCalendar feed validators and sync tokens
+
+Revision ID: 023
+Revises: 022
+Create Date: 2024-01-30 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '023'
+down_revision = '022'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        op.add_column('calendar_event', sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+        op.execute("UPDATE calendar_event SET updated_at = CURRENT_TIMESTAMP")
+        print("Added updated_at column to calendar_event table")
+    except Exception as e:
+        if "already exists" in str(e) or "duplicate column name" in str(e):
+            print("updated_at column already exists in calendar_event table")
+            return
+        else:
+            raise e
+
+    op.create_index('ix_calendar_event_coach_updated', 'calendar_event', ['coach_id', 'updated_at'])
+    op.create_index('ix_calendar_event_student_updated', 'calendar_event', ['student_id', 'updated_at'])
+    print("Created calendar_event updated_at indexes")
+
+
+def downgrade():
+    try:
+        op.drop_index('ix_calendar_event_student_updated', 'calendar_event')
+        op.drop_index('ix_calendar_event_coach_updated', 'calendar_event')
+        op.drop_column('calendar_event', 'updated_at')
+        print("Removed updated_at column from calendar_event table")
+    except Exception as e:
+        print(f"Error removing updated_at column from calendar_event table: {e}")
@@ -0,0 +1,47 @@
+"""Add job_run for background job run records
+
+Revision ID: 024
+Revises: 023
+Create Date: 2024-01-31 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '024'
+down_revision = '023'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'job_run',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('job_name', sa.String(length=50), nullable=False),
+            sa.Column('runner_id', sa.String(length=100), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('started_at', sa.DateTime(), nullable=False),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('duration_ms', sa.Integer(), nullable=True),
+            sa.Column('result', sa.JSON(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_job_run_job_started', 'job_run', ['job_name', 'started_at'])
+        print("Created table job_run")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Table job_run already exists")
+        else:
+            raise e
+
+
+def downgrade():
+    try:
+        op.drop_table('job_run')
+        print("Removed table job_run")
+    except Exception as e:
+        print(f"Error removing table job_run: {e}")
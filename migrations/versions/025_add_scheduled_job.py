@@ -0,0 +1,51 @@
+"""Add scheduled_job, the due-time queue of booking jobs
+
+Revision ID: 025
+Revises: 024
+Create Date: 2024-02-01 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '025'
+down_revision = '024'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'scheduled_job',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=40), nullable=False),
+            sa.Column('target_type', sa.String(length=20), nullable=False),
+            sa.Column('target_id', sa.Integer(), nullable=False),
+            sa.Column('due_at', sa.DateTime(), nullable=False),
+            sa.Column('state', sa.String(length=20), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('locked_by', sa.String(length=100), nullable=True),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('target_type', 'target_id', 'kind', name='uq_scheduled_job_target_kind')
+        )
+        op.create_index('ix_scheduled_job_state_due', 'scheduled_job', ['state', 'due_at'])
+        print("Created table scheduled_job")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Table scheduled_job already exists")
+        else:
+            raise e
+
+
+def downgrade():
+    try:
+        op.drop_table('scheduled_job')
+        print("Removed table scheduled_job")
+    except Exception as e:
+        print(f"Error removing table scheduled_job: {e}")
@@ -0,0 +1,40 @@
+"""Make call_notification unique per call and notification type
+
+Revision ID: 026
+Revises: 025
+Create Date: 2024-02-02 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '026'
+down_revision = '025'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        # Keep the first notification of each type per call
+        op.execute(
+            "DELETE FROM call_notification WHERE id NOT IN "
+            "(SELECT MIN(id) FROM call_notification GROUP BY call_id, notification_type)"
+        )
+        op.create_index('uq_call_notification_call_type', 'call_notification',
+                        ['call_id', 'notification_type'], unique=True)
+        print("Added unique index uq_call_notification_call_type")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Index uq_call_notification_call_type already exists")
+        else:
+            raise e
+
+
+def downgrade():
+    try:
+        op.drop_index('uq_call_notification_call_type', table_name='call_notification')
+        print("Removed index uq_call_notification_call_type")
+    except Exception as e:
+        print(f"Error removing index uq_call_notification_call_type: {e}")
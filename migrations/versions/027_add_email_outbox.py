@@ -0,0 +1,52 @@
+"""Add email_outbox, the queue of emails waiting to be sent
+
+Revision ID: 027
+Revises: 026
+Create Date: 2024-02-03 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '027'
+down_revision = '026'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    try:
+        op.create_table(
+            'email_outbox',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('recipients', sa.JSON(), nullable=False),
+            sa.Column('subject', sa.String(length=255), nullable=False),
+            sa.Column('html', sa.Text(), nullable=True),
+            sa.Column('text', sa.Text(), nullable=True),
+            sa.Column('sender', sa.String(length=255), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+            sa.Column('locked_by', sa.String(length=100), nullable=True),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_email_outbox_status_next_attempt', 'email_outbox', ['status', 'next_attempt_at'])
+        print("Created table email_outbox")
+    except Exception as e:
+        if "already exists" in str(e):
+            print("Table email_outbox already exists")
+        else:
+            raise e
+
+
+def downgrade():
+    try:
+        op.drop_table('email_outbox')
+        print("Removed table email_outbox")
+    except Exception as e:
+        print(f"Error removing table email_outbox: {e}")
@@ -3,7 +3,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import json
 import time
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import event, DDL, delete
+from sqlalchemy.orm import DeclarativeBase, object_session, Session as SASession
+from sqlalchemy import inspect as sa_inspect
 
 class Base(DeclarativeBase):
     pass
@@ -309,6 +311,11 @@ class LearningRequest(db.Model):
     timeframe = db.Column(db.String(100))  # e.g., "2 weeks", "1 month", "3 months"
     skill_tags = db.Column(db.Text)  # Comma-separated skill tags
 
+    # Browse/find-work listings filter active requests newest first
+    __table_args__ = (
+        db.Index('ix_learning_request_active_created', 'is_active', 'created_at'),
+    )
+
     # Relationships
     proposals = db.relationship('Proposal', backref='learning_request', lazy=True)
     student = db.relationship('User', backref='learning_requests')
@@ -504,6 +511,11 @@ class Session(db.Model):
 
     # Relationships
     proposal = db.relationship('Proposal', backref='sessions')
+
+    # Contract pages and dashboards look sessions up per proposal by status and time
+    __table_args__ = (
+        db.Index('ix_session_proposal_status_scheduled', 'proposal_id', 'status', 'scheduled_at'),
+    )
     
     def get_contract(self):
         """Safely get the contract associated with this session"""
@@ -914,6 +926,35 @@ class Session(db.Model):
             return True
         return False
     
+    def refresh_auto_status(self):
+        """Apply due auto-activation / auto-completion (no queries unless a transition is due)"""
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        if self.status == 'scheduled' and self.can_auto_activate() and not self.auto_activated:
+            try:
+                if self.auto_activate_meeting():
+                    logger.info(f"Auto-activated session {self.id}")
+                else:
+                    logger.warning(f"Failed to auto-activate session {self.id}")
+            except Exception as e:
+                logger.error(f"Error auto-activating session {self.id}: {e}")
+        
+        try:
+            if self.auto_complete_if_needed():
+                logger.info(f"Auto-completed session {self.id}")
+        except Exception as e:
+            logger.error(f"Error auto-completing session {self.id}: {e}")
+    
+    def get_status_info(self):
+        """Status fields polled by the waiting room"""
+        return {
+            'status': self.status,
+            'can_join_early': self.can_join_early(),
+            'scheduled_at': self.scheduled_at.isoformat() if self.scheduled_at else None,
+            'meeting_started_at': self.meeting_started_at.isoformat() if self.meeting_started_at else None
+        }
+    
     def get_button_state(self, user_role):
         """Get the appropriate button state for the session"""
         # First, check if session should be auto-completed
@@ -1062,6 +1103,12 @@ class Contract(db.Model):
     student = db.relationship('User', foreign_keys=[student_id], backref='student_contracts')
     coach = db.relationship('User', foreign_keys=[coach_id], backref='coach_contracts')
     session_payments = db.relationship('SessionPayment', backref='contract', lazy=True)
+
+    # Dashboards list contracts per participant and status
+    __table_args__ = (
+        db.Index('ix_contract_coach_status', 'coach_id', 'status'),
+        db.Index('ix_contract_student_status', 'student_id', 'status'),
+    )
     
     def get_progress_percentage(self):
         """Get completion percentage"""
@@ -1277,13 +1324,43 @@ class Message(db.Model):
     recipient_role = db.Column(db.String(20))  # 'student' or 'coach'
     message_type = db.Column(db.String(20), default='TEXT')  # TEXT, CONTRACT_OFFER, SYSTEM, CALL_SCHEDULED, FREE_CONSULTATION, SESSION_SCHEDULED
     call_id = db.Column(db.Integer, db.ForeignKey('scheduled_call.id'), nullable=True)  # Link to call for CALL_SCHEDULED messages
+    payload = db.Column(db.JSON(none_as_null=True))  # Card fields parsed from content at write time (see message_payload.py)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref='received_messages')
     call = db.relationship('ScheduledCall', backref='messages')
+
+    # Conversation threads, inbox listing, unread badges and after_id polling
+    __table_args__ = (
+        db.Index('ix_message_sender_recipient_created', 'sender_id', 'recipient_id', 'created_at'),
+        db.Index('ix_message_recipient_read_sender', 'recipient_id', 'is_read', 'sender_id'),
+        db.Index('ix_message_sender_recipient_id', 'sender_id', 'recipient_id', 'id'),
+    )
     
+    def get_payload_info(self, key):
+        """
+        Parsed card fields ('contract', 'session' or 'consultation') for this message.
+        Read from the stored payload; messages written before the payload existed are parsed on the fly.
+        """
+        if self.payload and key in self.payload:
+            return self.payload[key]
+        from message_payload import parse_message_info
+        return parse_message_info(key, self.content)
+
+    @property
+    def contract_info(self):
+        return self.get_payload_info('contract')
+
+    @property
+    def session_info(self):
+        return self.get_payload_info('session')
+
+    @property
+    def consultation_info(self):
+        return self.get_payload_info('consultation')
+
     def get_call(self):
         """
         Get the call associated with this message (supports CALL_SCHEDULED, FREE_CONSULTATION, SESSION_SCHEDULED)
@@ -1341,6 +1418,87 @@ class Message(db.Model):
         
         return None
 
+class Conversation(db.Model):
+    """One-to-one conversation keyed on the unordered user pair (lower ID first)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'))
+    last_activity_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    last_message = db.relationship('Message', foreign_keys=[last_message_id])
+    participants = db.relationship('ConversationParticipant', backref='conversation', lazy=True,
+                                   cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_pair'),
+    )
+
+    @staticmethod
+    def pair_for(user_a_id, user_b_id):
+        """Return the (low, high) key for a pair of users"""
+        return (min(user_a_id, user_b_id), max(user_a_id, user_b_id))
+
+    def __repr__(self):
+        return f'<Conversation {self.user_low_id}-{self.user_high_id}>'
+
+class ConversationParticipant(db.Model):
+    """Per-user view of a conversation with the partner and unread counter"""
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    partner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Relationships
+    user = db.relationship('User', foreign_keys=[user_id])
+    partner = db.relationship('User', foreign_keys=[partner_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('conversation_id', 'user_id', name='uq_conversation_participant'),
+        db.Index('ix_conversation_participant_user_partner', 'user_id', 'partner_id'),
+    )
+
+    def __repr__(self):
+        return f'<ConversationParticipant {self.user_id} -> {self.partner_id}: {self.unread_count} unread>'
+
+@event.listens_for(Message, 'before_insert')
+def parse_message_payload_on_insert(mapper, connection, target):
+    """Parse card fields once, when the message is written"""
+    from message_payload import build_message_payload
+    target.payload = build_message_payload(target.content, target.message_type)
+
+@event.listens_for(Message, 'before_update')
+def parse_message_payload_on_update(mapper, connection, target):
+    """Re-parse when the content or type of a message changes"""
+    state = sa_inspect(target)
+    if state.attrs.content.history.has_changes() or state.attrs.message_type.history.has_changes():
+        from message_payload import build_message_payload
+        target.payload = build_message_payload(target.content, target.message_type)
+
+@event.listens_for(Message, 'after_insert')
+def update_conversation_after_message(mapper, connection, target):
+    """Keep the conversation row and unread counters in step with every new message"""
+    from conversation_manager import record_message
+    from event_bus import queue_event, EVENT_MESSAGE
+    record_message(connection, target)
+    queue_event(object_session(target), (target.sender_id, target.recipient_id), EVENT_MESSAGE, {
+        'message_id': target.id,
+        'sender_id': target.sender_id,
+        'recipient_id': target.recipient_id
+    })
+
+@event.listens_for(Session, 'after_insert')
+@event.listens_for(Session, 'after_update')
+def publish_session_status_change(mapper, connection, target):
+    """Push status changes to both participants once the transaction commits"""
+    if not sa_inspect(target).attrs.status.history.has_changes():
+        return
+    from event_bus import queue_session_status
+    queue_session_status(object_session(target), target.id, target.status)
+
 class SavedJob(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     coach_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -1455,6 +1613,14 @@ class Notification(db.Model):
     # Relationship - no backref to avoid SQLAlchemy issues when table doesn't exist
     user = db.relationship('User')
     
+    # Recent notifications list plus a partial index for the unread badge
+    __table_args__ = (
+        db.Index('ix_notification_user_created', 'user_id', 'created_at'),
+        db.Index('ix_notification_user_unread', 'user_id', 'created_at',
+                 postgresql_where=db.text('is_read = false'),
+                 sqlite_where=db.text('is_read = 0')),
+    )
+    
     def to_dict(self):
         """Convert notification to dictionary for JSON responses"""
         return {
@@ -1507,12 +1673,23 @@ class Notification(db.Model):
     def mark_all_as_read(cls, user_id):
         """Mark all notifications as read for a user"""
         cls.query.filter_by(user_id=user_id, is_read=False).update({'is_read': True})
+        from event_bus import queue_notification_count
+        queue_notification_count(db.session, user_id)
         db.session.commit()
 
+@event.listens_for(Notification, 'after_insert')
+@event.listens_for(Notification, 'after_update')
+def publish_notification_count(mapper, connection, target):
+    """Refresh the user's unread badge once the transaction commits"""
+    from event_bus import queue_notification_count
+    queue_notification_count(object_session(target), target.user_id)
+
 # ============================================================================
 # ENTERPRISE SCHEDULING SYSTEM MODELS
 # ============================================================================
 
+DAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
 class CoachAvailability(db.Model):
     """Coach availability schedule management"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1559,22 +1736,81 @@ class CoachAvailability(db.Model):
     # Relationships - no backref to avoid SQLAlchemy issues when table doesn't exist
     coach = db.relationship('User')
     exceptions = db.relationship('AvailabilityException', backref='availability', lazy=True)
+    # Loaded in the same query as the settings; written by set_working_windows and sync_weekly_rules
+    weekly_rules = db.relationship(
+        'WeeklyAvailabilityRule', lazy='joined', viewonly=True,
+        primaryjoin='CoachAvailability.coach_id == foreign(WeeklyAvailabilityRule.coach_id)',
+        order_by='(WeeklyAvailabilityRule.weekday, WeeklyAvailabilityRule.start_minute)'
+    )
+    
+    # The per-day columns are the settings form's single window per day. They are
+    # mirrored into weekly_availability_rule, which is what availability is read from.
+    def column_window(self, day_of_week):
+        """The (start, end) window in a day's columns, None when the day is off"""
+        day = DAY_NAMES[day_of_week]
+        bounds = []
+        for name in (f'{day}_start', f'{day}_end'):
+            value = getattr(self, name)
+            if value is None:
+                value = self.__table__.c[name].default.arg
+            bounds.append(value)
+        start, end = bounds
+        return (start, end) if start < end else None
     
-    def get_working_hours(self, day_of_week):
-        """Get working hours for a specific day (0=Monday, 6=Sunday)"""
-        day_names = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    @property
+    def weekly_windows(self):
+        """Working windows (start, end minutes from midnight) for Monday..Sunday"""
+        if self.id is None:
+            # Not saved yet, so no rules: read the columns
+            windows = [self.column_window(day_of_week) for day_of_week in range(7)]
+            return [[window] if window else [] for window in windows]
+        windows = [[] for _ in range(7)]
+        for rule in self.weekly_rules:
+            windows[rule.weekday].append((rule.start_minute, rule.end_minute))
+        return windows
+    
+    def get_working_windows(self, day_of_week):
+        """Working windows for a specific day (0=Monday, 6=Sunday)"""
         if day_of_week < 0 or day_of_week > 6:
+            return []
+        return self.weekly_windows[day_of_week]
+    
+    def get_working_hours(self, day_of_week):
+        """Get working hours for a specific day (0=Monday, 6=Sunday): first start and last end"""
+        windows = self.get_working_windows(day_of_week)
+        if not windows:
             return None, None
-        
-        day = day_names[day_of_week]
-        start = getattr(self, f'{day}_start')
-        end = getattr(self, f'{day}_end')
-        return start, end
+        return windows[0][0], windows[-1][1]
     
     def is_working_day(self, day_of_week):
         """Check if a day is a working day"""
-        start, end = self.get_working_hours(day_of_week)
-        return start is not None and end is not None and start < end
+        return bool(self.get_working_windows(day_of_week))
+    
+    def set_working_windows(self, day_of_week, windows):
+        """
+        Replace a day's working windows with [(start_minute, end_minute), ...].
+        The day's columns keep the first start and last end for the settings form.
+        """
+        merged = []
+        for start, end in sorted((start, end) for start, end in windows if start < end):
+            if merged and start < merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        windows = merged
+        orm_session = object_session(self) or db.session
+        # Deleted now rather than at flush, where inserts run first and would hit the unique start
+        orm_session.execute(delete(WeeklyAvailabilityRule).where(
+            WeeklyAvailabilityRule.coach_id == self.coach_id, WeeklyAvailabilityRule.weekday == day_of_week
+        ))
+        for start, end in windows:
+            orm_session.add(WeeklyAvailabilityRule(coach_id=self.coach_id, weekday=day_of_week,
+                                                   start_minute=start, end_minute=end))
+        day = DAY_NAMES[day_of_week]
+        setattr(self, f'{day}_start', windows[0][0] if windows else 0)
+        setattr(self, f'{day}_end', windows[-1][1] if windows else 0)
+        if sa_inspect(self).persistent:
+            orm_session.expire(self, ['weekly_rules'])
     
     def get_available_slots(self, date, duration_minutes=None):
         """Get available time slots for a specific date"""
@@ -1582,10 +1818,8 @@ class CoachAvailability(db.Model):
             return []
         
         # Get day of week (0=Monday, 6=Sunday)
-        day_of_week = date.weekday()
-        start_minutes, end_minutes = self.get_working_hours(day_of_week)
-        
-        if not self.is_working_day(day_of_week):
+        windows = self.get_working_windows(date.weekday())
+        if not windows:
             return []
         
         # Check for exceptions
@@ -1596,32 +1830,53 @@ class CoachAvailability(db.Model):
         # Use session duration or default
         duration = duration_minutes or self.session_duration
         
-        # Generate time slots
+        # Generate time slots, starting afresh in each window
         slots = []
-        current_time = start_minutes
-        
-        while current_time + duration <= end_minutes:
-            slot_start = datetime.combine(date, datetime.min.time()) + timedelta(minutes=current_time)
-            slot_end = slot_start + timedelta(minutes=duration)
+        midnight = datetime.combine(date, datetime.min.time())
+        for start_minutes, end_minutes in windows:
+            current_time = start_minutes
             
-            # Check if slot conflicts with exceptions
-            slot_conflicts = False
-            for exception in exceptions:
-                if exception.overlaps_with(slot_start, slot_end):
-                    slot_conflicts = True
-                    break
-            
-            if not slot_conflicts:
-                slots.append({
-                    'start': slot_start,
-                    'end': slot_end,
-                    'available': True
-                })
-            
-            current_time += duration + self.buffer_after
+            while current_time + duration <= end_minutes:
+                slot_start = midnight + timedelta(minutes=current_time)
+                slot_end = slot_start + timedelta(minutes=duration)
+                
+                # Check if slot conflicts with exceptions
+                slot_conflicts = False
+                for exception in exceptions:
+                    if exception.overlaps_with(slot_start, slot_end):
+                        slot_conflicts = True
+                        break
+                
+                if not slot_conflicts:
+                    slots.append({
+                        'start': slot_start,
+                        'end': slot_end,
+                        'available': True
+                    })
+                
+                current_time += duration + self.buffer_after
         
         return slots
 
+class WeeklyAvailabilityRule(db.Model):
+    """
+    One recurring working window: coach_id works weekday (0=Monday) from start_minute
+    to end_minute, in minutes from midnight in the coach's timezone. A day may have
+    several windows; a day without rows is off.
+    """
+    __tablename__ = 'weekly_availability_rule'
+    id = db.Column(db.Integer, primary_key=True)
+    coach_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    weekday = db.Column(db.SmallInteger, nullable=False)
+    start_minute = db.Column(db.SmallInteger, nullable=False)
+    end_minute = db.Column(db.SmallInteger, nullable=False)
+    
+    # One window per coach, day and start, so concurrent backfills cannot double a coach's slots
+    __table_args__ = (
+        db.UniqueConstraint('coach_id', 'weekday', 'start_minute', name='uq_weekly_availability_rule_coach_day_start'),
+        db.Index('ix_weekly_availability_rule_weekday_start', 'weekday', 'start_minute'),
+    )
+
 class AvailabilityException(db.Model):
     """Exceptions to regular availability (blocked time, special hours, etc.)"""
     id = db.Column(db.Integer, primary_key=True)
@@ -1731,6 +1986,11 @@ class ScheduledSession(db.Model):
     session = db.relationship('Session', backref='scheduled_sessions')
     coach = db.relationship('User', foreign_keys=[coach_id], backref='coach_sessions')
     student = db.relationship('User', foreign_keys=[student_id], backref='student_sessions')
+
+    # Free/busy reads fetch a coach's active bookings by time window
+    __table_args__ = (
+        db.Index('ix_scheduled_session_coach_status_scheduled', 'coach_id', 'status', 'scheduled_at'),
+    )
     
     def can_be_cancelled(self, user_role):
         """Check if session can be cancelled by user"""
@@ -1937,6 +2197,12 @@ class ScheduledCall(db.Model):
     coach = db.relationship('User', foreign_keys=[coach_id], backref='scheduled_calls_as_coach')
     contract = db.relationship('Contract', backref='scheduled_calls')
     session = db.relationship('Session', backref='scheduled_call')
+
+    # Scheduler scans by status/time, availability checks by coach
+    __table_args__ = (
+        db.Index('ix_scheduled_call_status_scheduled', 'status', 'scheduled_at'),
+        db.Index('ix_scheduled_call_coach_status_scheduled', 'coach_id', 'status', 'scheduled_at'),
+    )
     
     def __repr__(self):
         return f'<ScheduledCall {self.id}: {self.call_type} at {self.scheduled_at}>'
@@ -2158,8 +2424,301 @@ class ScheduledCall(db.Model):
         
         return new_call
 
+# Columns whose changes move a booking on or off a coach's calendar
+BOOKING_CALENDAR_COLUMNS = ('status', 'scheduled_at', 'duration_minutes')
+
+def _booking_moved(target):
+    state = sa_inspect(target)
+    return any(getattr(state.attrs, column).history.has_changes() for column in BOOKING_CALENDAR_COLUMNS)
+
+@event.listens_for(ScheduledSession, 'after_insert')
+@event.listens_for(ScheduledSession, 'after_delete')
+@event.listens_for(ScheduledCall, 'after_insert')
+@event.listens_for(ScheduledCall, 'after_delete')
+def publish_booking_availability_change(mapper, connection, target):
+    """Drop the coach's cached calendar once a booking is made or removed"""
+    from event_bus import queue_availability_change
+    queue_availability_change(object_session(target), target.coach_id)
+
+@event.listens_for(ScheduledSession, 'after_update')
+@event.listens_for(ScheduledCall, 'after_update')
+def publish_booking_move(mapper, connection, target):
+    """Drop the coach's cached calendar when a booking is rescheduled, cancelled or reassigned"""
+    coach_history = sa_inspect(target).attrs.coach_id.history
+    if not (_booking_moved(target) or coach_history.has_changes()):
+        return
+    from event_bus import queue_availability_change
+    orm_session = object_session(target)
+    queue_availability_change(orm_session, target.coach_id)
+    for previous_coach_id in coach_history.deleted:
+        queue_availability_change(orm_session, previous_coach_id)
+
+@event.listens_for(Session, 'after_insert')
+@event.listens_for(Session, 'after_delete')
+def publish_session_availability_change(mapper, connection, target):
+    """Drop the coach's cached calendar when a contract session is booked or removed"""
+    from event_bus import queue_availability_change
+    coach_id = connection.execute(
+        db.select(Proposal.coach_id).where(Proposal.id == target.proposal_id)
+    ).scalar()
+    queue_availability_change(object_session(target), coach_id)
+
+@event.listens_for(Session, 'after_update')
+def publish_session_move(mapper, connection, target):
+    """Drop the coach's cached calendar when a contract session is rescheduled or cancelled"""
+    if _booking_moved(target):
+        publish_session_availability_change(mapper, connection, target)
+
+@event.listens_for(CoachAvailability, 'after_insert')
+@event.listens_for(CoachAvailability, 'after_update')
+@event.listens_for(CoachAvailability, 'after_delete')
+def publish_hours_availability_change(mapper, connection, target):
+    """Drop the coach's cached calendar when working hours or booking settings change"""
+    from event_bus import queue_availability_change
+    queue_availability_change(object_session(target), target.coach_id)
+
+@event.listens_for(AvailabilityException, 'after_insert')
+@event.listens_for(AvailabilityException, 'after_update')
+@event.listens_for(AvailabilityException, 'after_delete')
+def publish_exception_availability_change(mapper, connection, target):
+    """Drop the coach's cached calendar when a day is blocked or opened"""
+    from event_bus import queue_availability_change
+    coach_id = connection.execute(
+        db.select(CoachAvailability.coach_id).where(CoachAvailability.id == target.availability_id)
+    ).scalar()
+    queue_availability_change(object_session(target), coach_id)
+
+@event.listens_for(WeeklyAvailabilityRule, 'after_insert')
+@event.listens_for(WeeklyAvailabilityRule, 'after_update')
+@event.listens_for(WeeklyAvailabilityRule, 'after_delete')
+def publish_rule_availability_change(mapper, connection, target):
+    """Drop the coach's cached calendar when a working window is added or removed"""
+    from event_bus import queue_availability_change
+    queue_availability_change(object_session(target), target.coach_id)
+
+WEEKLY_HOUR_COLUMNS = tuple(f'{day}_{edge}' for day in DAY_NAMES for edge in ('start', 'end'))
+
+def weekly_rule_rows(availability, weekdays):
+    """weekly_availability_rule values for the column windows of some weekdays"""
+    rows = []
+    for weekday in weekdays:
+        window = availability.column_window(weekday)
+        if window:
+            rows.append({'coach_id': availability.coach_id, 'weekday': weekday,
+                         'start_minute': window[0], 'end_minute': window[1]})
+    return rows
+
+@event.listens_for(SASession, 'after_flush')
+def sync_weekly_rules(orm_session, flush_context):
+    """
+    Mirror the per-day columns of CoachAvailability rows written by this flush into
+    weekly_availability_rule: a changed day's rules are replaced by its column window.
+    Days whose rules were edited directly in the same flush keep those rules.
+    """
+    fresh = [target for target in orm_session.new if isinstance(target, CoachAvailability)]
+    changed = []
+    for target in orm_session.dirty:
+        if isinstance(target, CoachAvailability):
+            state = sa_inspect(target)
+            weekdays = {WEEKLY_HOUR_COLUMNS.index(column) // 2 for column in WEEKLY_HOUR_COLUMNS
+                        if getattr(state.attrs, column).history.has_changes()}
+            if weekdays:
+                changed.append((target, weekdays))
+    removed = [target.coach_id for target in orm_session.deleted if isinstance(target, CoachAvailability)]
+    if not (fresh or changed or removed):
+        return
+
+    edited = {(target.coach_id, target.weekday) for target in list(orm_session.new) + list(orm_session.deleted)
+              if isinstance(target, WeeklyAvailabilityRule)}
+    connection = orm_session.connection()
+    table = WeeklyAvailabilityRule.__table__
+    if removed:
+        connection.execute(table.delete().where(table.c.coach_id.in_(removed)))
+
+    rows = []
+    for target, weekdays in [(target, set(range(7))) for target in fresh] + changed:
+        weekdays = sorted(weekday for weekday in weekdays if (target.coach_id, weekday) not in edited)
+        if not weekdays:
+            continue
+        connection.execute(table.delete().where(table.c.coach_id == target.coach_id,
+                                                table.c.weekday.in_(weekdays)))
+        rows.extend(weekly_rule_rows(target, weekdays))
+        if target not in fresh:
+            orm_session.expire(target, ['weekly_rules'])
+    if rows:
+        connection.execute(table.insert(), rows)
+
+class CalendarEvent(db.Model):
+    """
+    Denormalized calendar: one row per ScheduledSession, Session or ScheduledCall that
+    has a time, written in the booking's own flush by sync_calendar_events. Conflict
+    checks, slot generation and upcoming-event lists read this table instead of the
+    three booking tables. The database refuses overlapping busy rows for a coach (an
+    exclusion constraint on PostgreSQL, triggers on SQLite). A contract session and
+    the scheduled session or call made for it share a booking_key and may overlap.
+    """
+    __tablename__ = 'calendar_event'
+    id = db.Column(db.Integer, primary_key=True)
+    coach_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    source_type = db.Column(db.String(20), nullable=False)  # scheduled_session, session, call
+    source_id = db.Column(db.Integer, nullable=False)
+    booking_key = db.Column(db.String(40), nullable=False)  # session:<id>, scheduled_session:<id>, call:<id>
+    starts_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    ends_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # the source booking's status, or deleted
+    busy = db.Column(db.Boolean, nullable=False)  # status holds time on the coach's calendar
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False)  # last write, for feed sync tokens
+
+    # Range reads by coach or student are answered from the indexes alone
+    __table_args__ = (
+        db.UniqueConstraint('source_type', 'source_id', name='uq_calendar_event_source'),
+        db.Index('ix_calendar_event_coach_range', 'coach_id', 'starts_at', 'ends_at', 'busy', 'status',
+                 'source_type', 'source_id'),
+        db.Index('ix_calendar_event_student_range', 'student_id', 'starts_at', 'ends_at', 'busy', 'status',
+                 'source_type', 'source_id'),
+        db.Index('ix_calendar_event_coach_updated', 'coach_id', 'updated_at'),
+        db.Index('ix_calendar_event_student_updated', 'student_id', 'updated_at'),
+    )
+
+# Name of the constraint (PostgreSQL) and trigger error (SQLite) raised for an overlapping booking
+BOOKING_OVERLAP_CONSTRAINT = 'calendar_event_no_overlap'
+
+# Status of the row left behind when its booking is deleted, so feed deltas can report it
+CALENDAR_EVENT_DELETED = 'deleted'
+
+event.listen(CalendarEvent.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+event.listen(CalendarEvent.__table__, 'after_create', DDL(
+    f"ALTER TABLE calendar_event ADD CONSTRAINT {BOOKING_OVERLAP_CONSTRAINT} EXCLUDE USING gist "
+    f"(coach_id WITH =, tstzrange(starts_at, ends_at, '[)') WITH &&, booking_key WITH <>) WHERE (busy)"
+).execute_if(dialect='postgresql'))
+# SQLite has a single writer, so the check and the write cannot interleave with another booking
+for _operation, _other_rows in (('insert', ''), ('update', 'AND id <> NEW.id ')):
+    event.listen(CalendarEvent.__table__, 'after_create', DDL(
+        f"CREATE TRIGGER {BOOKING_OVERLAP_CONSTRAINT}_{_operation} BEFORE {_operation.upper()} ON calendar_event "
+        f"WHEN NEW.busy AND EXISTS (SELECT 1 FROM calendar_event WHERE coach_id = NEW.coach_id AND busy "
+        f"AND booking_key <> NEW.booking_key {_other_rows}"
+        f"AND starts_at < NEW.ends_at AND ends_at > NEW.starts_at) "
+        f"BEGIN SELECT RAISE(ABORT, '{BOOKING_OVERLAP_CONSTRAINT}'); END"
+    ).execute_if(dialect='sqlite'))
+
+# calendar_event source_type for each booking model, and the columns copied into its row
+CALENDAR_EVENT_SOURCES = {
+    ScheduledSession: ('scheduled_session', ('coach_id', 'student_id', 'session_id')),
+    Session: ('session', ('proposal_id',)),
+    ScheduledCall: ('call', ('coach_id', 'student_id', 'session_id')),
+}
+
+def busy_statuses(target_or_model):
+    """Statuses that keep a booking of this kind on the coach's calendar"""
+    from free_busy import SCHEDULED_SESSION_BUSY_STATUSES, SESSION_BUSY_STATUSES, CALL_BUSY_STATUSES
+    model = target_or_model if isinstance(target_or_model, type) else type(target_or_model)
+    return {ScheduledSession: SCHEDULED_SESSION_BUSY_STATUSES, Session: SESSION_BUSY_STATUSES,
+            ScheduledCall: CALL_BUSY_STATUSES}[model]
+
+def calendar_event_row(target, coach_id, student_id):
+    """calendar_event values for a booking, or None when it has no time yet"""
+    from free_busy import DEFAULT_BUSY_MINUTES, to_naive_utc
+    if coach_id is None or target.scheduled_at is None:
+        return None
+
+    source_type = CALENDAR_EVENT_SOURCES[type(target)][0]
+    session_id = target.id if isinstance(target, Session) else target.session_id
+    start = to_naive_utc(target.scheduled_at)
+    status = target.status or ''
+    return {
+        'coach_id': coach_id,
+        'student_id': student_id,
+        'source_type': source_type,
+        'source_id': target.id,
+        'booking_key': f'session:{session_id}' if session_id else f'{source_type}:{target.id}',
+        'starts_at': start.replace(tzinfo=timezone.utc),
+        'ends_at': (start + timedelta(minutes=target.duration_minutes or DEFAULT_BUSY_MINUTES)
+                    ).replace(tzinfo=timezone.utc),
+        'status': status,
+        'busy': status in busy_statuses(target),
+        'updated_at': datetime.now(timezone.utc),
+    }
+
+def _calendar_event_changed(target):
+    """Whether an update changes the booking's calendar row: its time, people or status"""
+    state = sa_inspect(target)
+    columns = ('scheduled_at', 'duration_minutes', 'status') + CALENDAR_EVENT_SOURCES[type(target)][1]
+    return any(getattr(state.attrs, column).history.has_changes() for column in columns)
+
+def _calendar_people(connection, target):
+    """(coach_id, student_id) for a booking; a contract session's come from its proposal"""
+    if isinstance(target, Session):
+        people = connection.execute(
+            db.select(Proposal.coach_id, LearningRequest.student_id)
+            .join(LearningRequest, Proposal.learning_request_id == LearningRequest.id)
+            .where(Proposal.id == target.proposal_id)
+        ).first()
+        return tuple(people) if people else (None, None)
+    return target.coach_id, target.student_id
+
+@event.listens_for(SASession, 'after_flush')
+def sync_calendar_events(orm_session, flush_context):
+    """
+    Mirror bookings written by this flush into calendar_event, in the same transaction.
+    Removed rows go first and changed rows are released before being rewritten, so
+    a reschedule can overlap its own old slot and two bookings can swap times; an
+    overlapping busy row fails the flush with an IntegrityError. Deleted bookings
+    leave a row with status CALENDAR_EVENT_DELETED that no longer holds time.
+    """
+    stale = [target for target in orm_session.deleted if type(target) in CALENDAR_EVENT_SOURCES]
+    fresh = [target for target in orm_session.new if type(target) in CALENDAR_EVENT_SOURCES]
+    changed = [target for target in orm_session.dirty
+               if type(target) in CALENDAR_EVENT_SOURCES and _calendar_event_changed(target)]
+    if not (stale or fresh or changed):
+        return
+
+    connection = orm_session.connection()
+    table = CalendarEvent.__table__
+
+    def source_ids(targets):
+        grouped = {}
+        for target in targets:
+            grouped.setdefault(CALENDAR_EVENT_SOURCES[type(target)][0], []).append(target.id)
+        return grouped.items()
+
+    tombstone = {'status': CALENDAR_EVENT_DELETED, 'busy': False, 'updated_at': datetime.now(timezone.utc)}
+    for source_type, ids in source_ids(stale):
+        connection.execute(table.update().where(table.c.source_type == source_type, table.c.source_id.in_(ids))
+                           .values(**tombstone))
+    # SQLite may hand a new booking the id of a deleted one
+    for source_type, ids in source_ids(fresh):
+        connection.execute(table.delete().where(table.c.source_type == source_type, table.c.source_id.in_(ids),
+                                                table.c.status == CALENDAR_EVENT_DELETED))
+    for source_type, ids in source_ids(changed):
+        connection.execute(table.update().where(table.c.source_type == source_type, table.c.source_id.in_(ids))
+                           .values(busy=False))
+
+    rows = []
+    for target in changed:
+        row = calendar_event_row(target, *_calendar_people(connection, target))
+        where = (table.c.source_type == CALENDAR_EVENT_SOURCES[type(target)][0], table.c.source_id == target.id)
+        if row is None:
+            connection.execute(table.update().where(*where).values(**tombstone))
+        elif not connection.execute(table.update().where(*where).values(**row)).rowcount:
+            rows.append(row)
+    for target in fresh:
+        row = calendar_event_row(target, *_calendar_people(connection, target))
+        if row:
+            rows.append(row)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+# Unique index that makes call_notification a once-per-type delivery ledger
+CALL_NOTIFICATION_LEDGER_INDEX = 'uq_call_notification_call_type'
+
 class CallNotification(db.Model):
-    """Model for tracking call notifications"""
+    """
+    Model for tracking call notifications. Also the delivery ledger: a row is claimed
+    before a notification is sent, and the unique (call_id, notification_type) index
+    lets only one worker claim each type per call (see claim_call_notifications).
+    """
     id = db.Column(db.Integer, primary_key=True)
     call_id = db.Column(db.Integer, db.ForeignKey('scheduled_call.id'), nullable=False)
     notification_type = db.Column(db.String(50), nullable=False)  # scheduled, reminder_24h, reminder_1h, ready, completed
@@ -2172,5 +2731,114 @@ class CallNotification(db.Model):
     # Relationships
     call = db.relationship('ScheduledCall', backref='notifications')
     
+    __table_args__ = (
+        db.Index(CALL_NOTIFICATION_LEDGER_INDEX, 'call_id', 'notification_type', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<CallNotification {self.id}: {self.notification_type} for call {self.call_id}>'
+
+class JobRun(db.Model):
+    """One run of a background job by the elected job runner (see job_runner.py)"""
+    __tablename__ = 'job_run'
+    id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(50), nullable=False)
+    runner_id = db.Column(db.String(100), nullable=False)  # host:pid:nonce of the runner that ran it
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, succeeded, failed, abandoned
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Integer)
+    result = db.Column(db.JSON(none_as_null=True))  # what the job returned
+    error = db.Column(db.Text)
+
+    # Latest run per job decides when it is next due
+    __table_args__ = (
+        db.Index('ix_job_run_job_started', 'job_name', 'started_at'),
+    )
+
+    def __repr__(self):
+        return f'<JobRun {self.id}: {self.job_name} {self.status}>'
+
+class ScheduledJob(db.Model):
+    """
+    A timed job of one session or call, e.g. its 24-hour reminder or its auto-completion,
+    due at a moment derived from the booking's time. Written by sync_scheduled_jobs when
+    the booking is created, moved or cancelled, and claimed once due (see job_queue.py).
+    """
+    __tablename__ = 'scheduled_job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)  # the scheduler task that runs it, e.g. reminders_24h
+    target_type = db.Column(db.String(20), nullable=False)  # session, call
+    target_id = db.Column(db.Integer, nullable=False)
+    due_at = db.Column(db.DateTime, nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, skipped, expired, cancelled, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_by = db.Column(db.String(100))  # worker that claimed it
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # Claims read the due end of the pending range; a booking's jobs are found by target
+    __table_args__ = (
+        db.UniqueConstraint('target_type', 'target_id', 'kind', name='uq_scheduled_job_target_kind'),
+        db.Index('ix_scheduled_job_state_due', 'state', 'due_at'),
+    )
+
+    def __repr__(self):
+        return f'<ScheduledJob {self.id}: {self.kind} for {self.target_type} {self.target_id} {self.state}>'
+
+# scheduled_job target_type for each booking model that has timed jobs
+SCHEDULED_JOB_TARGETS = {Session: 'session', ScheduledCall: 'call'}
+
+def _scheduled_job_changed(target):
+    """Whether an update moves the booking's jobs: its time, length or status"""
+    state = sa_inspect(target)
+    return any(getattr(state.attrs, column).history.has_changes()
+               for column in ('scheduled_at', 'duration_minutes', 'status'))
+
+@event.listens_for(SASession, 'after_flush')
+def sync_scheduled_jobs(orm_session, flush_context):
+    """
+    Enqueue the timed jobs of sessions and calls written by this flush, in the same
+    transaction: new and moved bookings get their jobs (re)scheduled, bookings that
+    left a job's statuses have it cancelled, and deleted bookings lose their jobs.
+    """
+    stale = [target for target in orm_session.deleted if type(target) in SCHEDULED_JOB_TARGETS]
+    fresh = [target for target in orm_session.new if type(target) in SCHEDULED_JOB_TARGETS]
+    changed = [target for target in orm_session.dirty
+               if type(target) in SCHEDULED_JOB_TARGETS and _scheduled_job_changed(target)]
+    if not (stale or fresh or changed):
+        return
+
+    from job_queue import get_job_queue
+    get_job_queue().sync_booking_jobs(orm_session.connection(), fresh, changed, stale)
+
+class EmailOutbox(db.Model):
+    """
+    An email waiting to be sent. Written in the caller's transaction by send_email and
+    drained in batches over pooled SMTP connections by the job runner (see email_outbox.py).
+    """
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    recipients = db.Column(db.JSON, nullable=False)  # list of addresses
+    subject = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text)
+    text = db.Column(db.Text)
+    sender = db.Column(db.String(255))  # MAIL_DEFAULT_SENDER when empty
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # failed deliveries so far
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))  # sender that claimed it
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    # Batches are claimed from the due end of the pending range
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
     def __repr__(self):
-        return f'<CallNotification {self.id}: {self.notification_type} for call {self.call_id}>'
\ No newline at end of file
+        return f'<EmailOutbox {self.id}: {self.subject} {self.status}>'
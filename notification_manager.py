@@ -7,7 +7,7 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from models import Session, ScheduledCall, User, db
-from email_utils import send_email
+from email_utils import send_template_email, email_url
 from timezone_utils import convert_to_user_timezone, format_datetime_for_user
 
 logger = logging.getLogger(__name__)
@@ -16,23 +16,13 @@ class NotificationManager:
     """Manages advanced notifications with smart timing and professional templates"""
     
     def __init__(self):
+        # Email templates in templates/emails/, each with its subject, text and HTML parts
         self.notification_templates = {
-            'session_reminder': {
-                'subject': 'Reminder: Your session starts in {time_until}',
-                'template': 'notifications/session_reminder.html'
-            },
-            'session_confirmation': {
-                'subject': 'Session Confirmed: {session_title}',
-                'template': 'notifications/session_confirmation.html'
-            },
-            'session_cancelled': {
-                'subject': 'Session Cancelled: {session_title}',
-                'template': 'notifications/session_cancelled.html'
-            },
-            'session_rescheduled': {
-                'subject': 'Session Rescheduled: {session_title}',
-                'template': 'notifications/session_rescheduled.html'
-            }
+            'session_reminder': 'session_reminder',
+            'call_reminder': 'call_reminder',
+            'session_confirmation': 'session_confirmation',
+            'session_cancelled': 'session_cancelled',
+            'session_rescheduled': 'session_rescheduled'
         }
     
     def get_notifications_to_send(self) -> List[Dict[str, Any]]:
@@ -207,17 +197,13 @@ class NotificationManager:
                 'session_time': session_time,
                 'time_until': time_until,
                 'session_duration': session.duration_minutes or 60,
-                'join_url': f"/sessions/{session.id}/join",
-                'reschedule_url': f"/sessions/{session.id}/reschedule"
+                'join_url': email_url(f"/sessions/{session.id}/join"),
+                'reschedule_url': email_url(f"/sessions/{session.id}/reschedule")
             }
             
             # Send email
-            subject = f"Reminder: Your session starts in {time_until}"
-            return send_email(
-                to_email=user.email,
-                subject=subject,
-                template='notifications/session_reminder.html',
-                data=email_data
+            return send_template_email(
+                user.email, self.notification_templates['session_reminder'], commit=True, **email_data
             )
             
         except Exception as e:
@@ -236,16 +222,12 @@ class NotificationManager:
                 'call_time': call_time,
                 'time_until': time_until,
                 'call_duration': call.duration_minutes or 60,
-                'join_url': f"/calls/{call.id}/join"
+                'join_url': email_url(f"/calls/{call.id}/join")
             }
             
             # Send email
-            subject = f"Reminder: Your call starts in {time_until}"
-            return send_email(
-                to_email=user.email,
-                subject=subject,
-                template='notifications/call_reminder.html',
-                data=email_data
+            return send_template_email(
+                user.email, self.notification_templates['call_reminder'], commit=True, **email_data
             )
             
         except Exception as e:
@@ -265,16 +247,12 @@ class NotificationManager:
                 'session_title': session_title,
                 'session_time': session_time,
                 'session_duration': session.duration_minutes or 60,
-                'join_url': f"/sessions/{session.id}/join"
+                'join_url': email_url(f"/sessions/{session.id}/join")
             }
             
             # Send email
-            subject = f"Session Confirmed: {session_title}"
-            return send_email(
-                to_email=user.email,
-                subject=subject,
-                template='notifications/session_confirmation.html',
-                data=email_data
+            return send_template_email(
+                user.email, self.notification_templates['session_confirmation'], commit=True, **email_data
             )
             
         except Exception as e:
@@ -294,16 +272,12 @@ class NotificationManager:
                 'session_title': session_title,
                 'session_time': session_time,
                 'reason': reason or 'No reason provided',
-                'reschedule_url': f"/sessions/{session.id}/reschedule"
+                'reschedule_url': email_url(f"/sessions/{session.id}/reschedule")
             }
             
             # Send email
-            subject = f"Session Cancelled: {session_title}"
-            return send_email(
-                to_email=user.email,
-                subject=subject,
-                template='notifications/session_cancelled.html',
-                data=email_data
+            return send_template_email(
+                user.email, self.notification_templates['session_cancelled'], commit=True, **email_data
             )
             
         except Exception as e:
@@ -1,373 +1,147 @@
 import os
 import logging
-import schedule
-import time
 from datetime import datetime, timedelta
-from threading import Thread
 from flask import current_app
 from models import ScheduledCall, CallNotification, Session, Contract, db
-from scheduling_utils import send_call_notifications
+from scheduling_utils import claim_call_notifications, deliver_call_notification
+from schema_capabilities import has_table
+from job_queue import get_job_queue, process_due_jobs
+from email_outbox import get_email_outbox
 from email_utils import send_session_reminder_email
 
 logger = logging.getLogger(__name__)
 
 class NotificationScheduler:
-    """Background scheduler for call notifications and session reminders"""
+    """
+    Call notification and session reminder jobs. They are run by the single elected
+    job runner (job_runner.py) and by the /api/scheduler webhook, never by a thread
+    in each web worker. Each task runs only its scheduled_job rows that are due
+    (job_queue.py) instead of scanning every upcoming call or session.
+    """
     
     def __init__(self, app=None):
         self.app = app
-        self.running = False
-        self.thread = None
         
         if app is not None:
             self.init_app(app)
     
     def init_app(self, app):
-        """Initialize the scheduler with the Flask app"""
+        """Bind the Flask app the jobs run in"""
         self.app = app
-        
-        # Schedule jobs
-        self.schedule_jobs()
-        
-        # Start the scheduler in a separate thread
-        if not self.running:
-            self.start()
     
-    def schedule_jobs(self):
-        """Schedule all notification jobs"""
-        # Check for calls ready to join (every minute)
-        schedule.every().minute.do(self.check_calls_ready)
-        
-        # Send 24-hour reminders (every hour)
-        schedule.every().hour.do(self.send_24h_reminders)
-        
-        # Send 1-hour reminders (every 15 minutes)
-        schedule.every(15).minutes.do(self.send_1h_reminders)
-        
-        # Send session reminders (every 15 minutes)
-        schedule.every(15).minutes.do(self.send_session_reminders)
-        
-        # Clean up old notifications (daily at 2 AM)
-        schedule.every().day.at("02:00").do(self.cleanup_old_notifications)
-        
-        # Mark overdue calls as missed (every 30 minutes)
-        schedule.every(30).minutes.do(self.mark_overdue_calls)
-        
-        # Auto-complete sessions that have passed their duration (every 5 minutes)
-        schedule.every(5).minutes.do(self.auto_complete_sessions)
+    def job_definitions(self):
+        """(name, job, every_seconds, daily_at) for every job; names match the webhook's task names"""
+        return [
+            # Ready notifications, reminders, overdue calls and auto-completion as they fall due (every minute)
+            ('due_jobs', self.run_due_jobs, 60, None),
+            # Send the queued emails (every tick)
+            ('email_outbox', self.send_queued_emails, 15, None),
+            # Clean up old notifications and finished jobs (daily at 2 AM UTC)
+            ('cleanup', self.cleanup_old_notifications, None, '02:00'),
+        ]
     
-    def start(self):
-        """Start the scheduler in a background thread"""
-        if self.running:
-            return
-        
-        self.running = True
-        self.thread = Thread(target=self._run_scheduler, daemon=True)
-        self.thread.start()
-        logger.info("Notification scheduler started")
+    def queue_handlers(self):
+        """The scheduled_job kinds this scheduler runs one booking at a time, with their actions"""
+        return {
+            'session_reminders': self._send_session_reminder,
+            'mark_overdue': self._mark_call_missed,
+            'auto_complete_sessions': self._auto_complete_session,
+        }
     
-    def stop(self):
-        """Stop the scheduler"""
-        self.running = False
-        if self.thread:
-            self.thread.join()
-        logger.info("Notification scheduler stopped")
+    def queue_batch_handlers(self):
+        """The call notification kinds, run for all their due calls at once"""
+        return {
+            'calls_ready': lambda calls: self._send_call_notifications_once(calls, 'ready'),
+            'reminders_24h': lambda calls: self._send_call_notifications_once(calls, 'reminder_24h'),
+            'reminders_1h': lambda calls: self._send_call_notifications_once(calls, 'reminder_1h'),
+        }
     
-    def _run_scheduler(self):
-        """Run the scheduler loop"""
-        while self.running:
-            try:
-                schedule.run_pending()
-                time.sleep(60)  # Check every minute
-            except Exception as e:
-                logger.error(f"Error in notification scheduler: {e}")
-                time.sleep(60)  # Wait before retrying
-    
-    def check_calls_ready(self):
-        """Check for calls that are ready to join (within 5 minutes)"""
+    def run_due_jobs(self, kinds=None):
+        """Run the due scheduled jobs of the given kinds, or of all this scheduler's kinds"""
         try:
             with self.app.app_context():
-                # Check if required tables exist
-                try:
-                    # Simple check to see if ScheduledCall table exists
-                    db.session.execute(db.text("SELECT 1 FROM scheduled_call LIMIT 1"))
-                except Exception as e:
-                    logger.warning(f"Database schema issue detected: {e}")
-                    return  # Skip this job if tables don't exist yet
-                
-                now = datetime.utcnow()
-                ready_window = now + timedelta(minutes=5)
-                
-                # Find calls that are ready to join
-                ready_calls = ScheduledCall.query.filter(
-                    ScheduledCall.status == 'scheduled',
-                    ScheduledCall.scheduled_at <= ready_window,
-                    ScheduledCall.scheduled_at > now
-                ).all()
-                
-                notifications_sent = 0
-                for call in ready_calls:
-                    # Check if we already sent a ready notification
-                    existing_notification = CallNotification.query.filter_by(
-                        call_id=call.id,
-                        notification_type='ready'
-                    ).first()
-                    
-                    if not existing_notification:
-                        logger.info(f"Sending ready notification for call {call.id}")
-                        send_call_notifications(call, 'ready')
-                        notifications_sent += 1
-                
-                return {
-                    'calls_checked': len(ready_calls),
-                    'notifications_sent': notifications_sent
-                }
-                
+                handlers, batch_handlers = self.queue_handlers(), self.queue_batch_handlers()
+                if kinds is not None:
+                    handlers = {kind: handlers[kind] for kind in kinds if kind in handlers}
+                    batch_handlers = {kind: batch_handlers[kind] for kind in kinds if kind in batch_handlers}
+                return process_due_jobs(handlers, batch_handlers=batch_handlers)
         except Exception as e:
-            # Check if this is a missing column error
-            if "auto_activated" in str(e) or "column" in str(e).lower():
-                logger.warning(f"Database schema issue detected: {e}")
-                logger.info("Skipping notification check until database is updated")
-                return {'warning': 'Database schema needs update', 'calls_checked': 0, 'notifications_sent': 0}
-            else:
-                logger.error(f"Error checking calls ready: {e}")
-                return {'error': str(e)}
+            logger.error(f"Error running due jobs: {e}")
+            return {'error': str(e)}
+    
+    def check_calls_ready(self):
+        """Check for calls that are ready to join (within 5 minutes)"""
+        return self.run_due_jobs(['calls_ready'])
     
     def send_24h_reminders(self):
         """Send 24-hour reminders for upcoming calls"""
-        try:
-            with self.app.app_context():
-                # Check if required tables exist
-                try:
-                    db.session.execute(db.text("SELECT 1 FROM scheduled_call LIMIT 1"))
-                except Exception as e:
-                    logger.warning(f"Database schema issue detected: {e}")
-                    return {'warning': 'Database schema needs update', 'calls_checked': 0, 'reminders_sent': 0}
-                
-                now = datetime.utcnow()
-                reminder_window_start = now + timedelta(hours=24)
-                reminder_window_end = now + timedelta(hours=25)
-                
-                # Find calls that need 24-hour reminders
-                calls_for_reminder = ScheduledCall.query.filter(
-                    ScheduledCall.status == 'scheduled',
-                    ScheduledCall.scheduled_at >= reminder_window_start,
-                    ScheduledCall.scheduled_at <= reminder_window_end
-                ).all()
-                
-                reminders_sent = 0
-                for call in calls_for_reminder:
-                    # Check if we already sent a 24h reminder
-                    existing_notification = CallNotification.query.filter_by(
-                        call_id=call.id,
-                        notification_type='reminder_24h'
-                    ).first()
-                    
-                    if not existing_notification:
-                        logger.info(f"Sending 24h reminder for call {call.id}")
-                        send_call_notifications(call, 'reminder_24h')
-                        reminders_sent += 1
-                
-                return {
-                    'calls_checked': len(calls_for_reminder),
-                    'reminders_sent': reminders_sent
-                }
-                
-        except Exception as e:
-            # Check if this is a missing column error
-            if "auto_activated" in str(e) or "column" in str(e).lower():
-                logger.warning(f"Database schema issue detected: {e}")
-                logger.info("Skipping 24h reminder check until database is updated")
-                return {'warning': 'Database schema needs update', 'calls_checked': 0, 'reminders_sent': 0}
-            else:
-                logger.error(f"Error sending 24h reminders: {e}")
-                return {'error': str(e)}
+        return self.run_due_jobs(['reminders_24h'])
     
     def send_1h_reminders(self):
         """Send 1-hour reminders for upcoming calls"""
-        try:
-            with self.app.app_context():
-                # Check if required tables exist
-                try:
-                    db.session.execute(db.text("SELECT 1 FROM scheduled_call LIMIT 1"))
-                except Exception as e:
-                    logger.warning(f"Database schema issue detected: {e}")
-                    return {'warning': 'Database schema needs update', 'calls_checked': 0, 'reminders_sent': 0}
-                
-                now = datetime.utcnow()
-                reminder_window_start = now + timedelta(hours=1)
-                reminder_window_end = now + timedelta(hours=1, minutes=15)
-                
-                # Find calls that need 1-hour reminders
-                calls_for_reminder = ScheduledCall.query.filter(
-                    ScheduledCall.status == 'scheduled',
-                    ScheduledCall.scheduled_at >= reminder_window_start,
-                    ScheduledCall.scheduled_at <= reminder_window_end
-                ).all()
-                
-                reminders_sent = 0
-                for call in calls_for_reminder:
-                    # Check if we already sent a 1h reminder
-                    existing_notification = CallNotification.query.filter_by(
-                        call_id=call.id,
-                        notification_type='reminder_1h'
-                    ).first()
-                    
-                    if not existing_notification:
-                        logger.info(f"Sending 1h reminder for call {call.id}")
-                        send_call_notifications(call, 'reminder_1h')
-                        reminders_sent += 1
-                
-                return {
-                    'calls_checked': len(calls_for_reminder),
-                    'reminders_sent': reminders_sent
-                }
-                
-        except Exception as e:
-            # Check if this is a missing column error
-            if "auto_activated" in str(e) or "column" in str(e).lower():
-                logger.warning(f"Database schema issue detected: {e}")
-                logger.info("Skipping 1h reminder check until database is updated")
-                return {'warning': 'Database schema needs update', 'calls_checked': 0, 'reminders_sent': 0}
-            else:
-                logger.error(f"Error sending 1h reminders: {e}")
-                return {'error': str(e)}
+        return self.run_due_jobs(['reminders_1h'])
     
     def send_session_reminders(self):
         """Send session reminders for upcoming sessions"""
-        try:
-            with self.app.app_context():
-                # Check if required tables exist
-                try:
-                    db.session.execute(db.text("SELECT 1 FROM session LIMIT 1"))
-                except Exception as e:
-                    logger.warning(f"Database schema issue detected: {e}")
-                    return {'warning': 'Database schema needs update', 'sessions_checked': 0, 'reminders_sent': 0}
-                
-                now = datetime.utcnow()
-                reminder_window_start = now + timedelta(minutes=15) # 15 minutes before session
-                reminder_window_end = now + timedelta(minutes=30) # 30 minutes before session
-                
-                # Find sessions that need reminders
-                sessions_for_reminder = Session.query.filter(
-                    Session.status == 'scheduled',
-                    Session.scheduled_at >= reminder_window_start,
-                    Session.scheduled_at <= reminder_window_end
-                ).all()
-                
-                reminders_sent = 0
-                for session in sessions_for_reminder:
-                    # Check if we already sent a session reminder
-                    existing_notification = CallNotification.query.filter_by(
-                        call_id=session.id, # Assuming session ID is used for notification
-                        notification_type='session_reminder'
-                    ).first()
-                    
-                    if not existing_notification:
-                        logger.info(f"Sending session reminder for session {session.id}")
-                        send_session_reminder_email(session)
-                        reminders_sent += 1
-                
-                return {
-                    'sessions_checked': len(sessions_for_reminder),
-                    'reminders_sent': reminders_sent
-                }
-                
-        except Exception as e:
-            # Check if this is a missing column error
-            if "auto_activated" in str(e) or "column" in str(e).lower():
-                logger.warning(f"Database schema issue detected: {e}")
-                logger.info("Skipping session reminder check until database is updated")
-                return {'warning': 'Database schema needs update', 'sessions_checked': 0, 'reminders_sent': 0}
-            else:
-                logger.error(f"Error sending session reminders: {e}")
-                return {'error': str(e)}
+        return self.run_due_jobs(['session_reminders'])
     
     def mark_overdue_calls(self):
         """Mark calls that are overdue as missed"""
-        try:
-            with self.app.app_context():
-                # Check if required tables exist
-                try:
-                    db.session.execute(db.text("SELECT 1 FROM scheduled_call LIMIT 1"))
-                except Exception as e:
-                    logger.warning(f"Database schema issue detected: {e}")
-                    return {'warning': 'Database schema needs update', 'calls_checked': 0, 'calls_marked_missed': 0}
-                
-                now = datetime.utcnow()
-                overdue_threshold = now - timedelta(minutes=15)  # 15 minutes after scheduled time
-                
-                # Find overdue calls
-                overdue_calls = ScheduledCall.query.filter(
-                    ScheduledCall.status == 'scheduled',
-                    ScheduledCall.scheduled_at < overdue_threshold
-                ).all()
-                
-                calls_marked = 0
-                for call in overdue_calls:
-                    logger.info(f"Marking call {call.id} as missed")
-                    call.status = 'missed'
-                    call.notes = f"Call missed - no participants joined within 15 minutes of scheduled time"
-                    calls_marked += 1
-                
-                db.session.commit()
-                
-                return {
-                    'calls_checked': len(overdue_calls),
-                    'calls_marked_missed': calls_marked
-                }
-                
-        except Exception as e:
-            # Check if this is a missing column error
-            if "auto_activated" in str(e) or "column" in str(e).lower():
-                logger.warning(f"Database schema issue detected: {e}")
-                logger.info("Skipping overdue call check until database is updated")
-                return {'warning': 'Database schema needs update', 'calls_checked': 0, 'calls_marked_missed': 0}
-            else:
-                logger.error(f"Error marking overdue calls: {e}")
-                return {'error': str(e)}
+        return self.run_due_jobs(['mark_overdue'])
     
     def auto_complete_sessions(self):
         """Automatically complete sessions that have passed their duration"""
+        return self.run_due_jobs(['auto_complete_sessions'])
+    
+    def send_queued_emails(self):
+        """Send the emails waiting in the outbox, a batch per SMTP connection"""
         try:
             with self.app.app_context():
-                # Check if required tables exist
-                try:
-                    db.session.execute(db.text("SELECT 1 FROM session LIMIT 1"))
-                except Exception as e:
-                    logger.warning(f"Database schema issue detected: {e}")
-                    return {'warning': 'Database schema needs update', 'sessions_completed': 0}
-                
-                # Get all sessions that should be completed
-                sessions_to_complete = Session.query.filter(
-                    Session.status.in_(['scheduled', 'active'])
-                ).all()
-                
-                completed_count = 0
-                for session in sessions_to_complete:
-                    if session.should_be_completed():
-                        logger.info(f"Auto-completing session {session.id}")
-                        if session.auto_complete_if_needed():
-                            completed_count += 1
-                
-                return {
-                    'sessions_checked': len(sessions_to_complete),
-                    'sessions_completed': completed_count
-                }
-                
+                return get_email_outbox().drain()
         except Exception as e:
-            logger.error(f"Error auto-completing sessions: {e}")
+            logger.error(f"Error sending queued emails: {e}")
             return {'error': str(e)}
     
+    def _send_call_notifications_once(self, calls, notification_type):
+        """
+        Claim notification_type for the calls in one ledger insert and send only the
+        claimed ones; calls that already had it are skipped. Returns the claimed calls.
+        """
+        call_ids = [call.id for call in calls]
+        claimed = claim_call_notifications(call_ids, notification_type, db.session)
+        sent = []
+        for call_id, call in zip(call_ids, calls):
+            if call_id in claimed:
+                logger.info(f"Sending {notification_type} notification for call {call_id}")
+                deliver_call_notification(call, notification_type)
+                sent.append(call)
+        return sent
+    
+    def _send_session_reminder(self, session):
+        """Send the reminder email for a session starting in 15-30 minutes"""
+        logger.info(f"Sending session reminder for session {session.id}")
+        return send_session_reminder_email(session) > 0
+    
+    def _mark_call_missed(self, call):
+        """Mark a call nobody joined within 15 minutes of its time as missed"""
+        logger.info(f"Marking call {call.id} as missed")
+        call.status = 'missed'
+        call.notes = f"Call missed - no participants joined within 15 minutes of scheduled time"
+        db.session.commit()
+        return True
+    
+    def _auto_complete_session(self, session):
+        """Complete a session that has passed its duration"""
+        logger.info(f"Auto-completing session {session.id}")
+        return session.auto_complete_if_needed()
+    
     def cleanup_old_notifications(self):
         """Clean up old notification records"""
         try:
             with self.app.app_context():
                 # Check if required tables exist
-                try:
-                    db.session.execute(db.text("SELECT 1 FROM call_notification LIMIT 1"))
-                except Exception as e:
-                    logger.warning(f"Database schema issue detected: {e}")
+                if not has_table('call_notification'):
+                    logger.warning("Database schema issue detected: call_notification table missing")
                     return {'warning': 'Database schema needs update', 'notifications_deleted': 0}
                 
                 # Delete notifications older than 30 days
@@ -380,8 +154,13 @@ class NotificationScheduler:
                 db.session.commit()
                 logger.info(f"Cleaned up {deleted_count} old notifications")
                 
+                jobs_deleted = get_job_queue().purge() if has_table('scheduled_job') else 0
+                emails_deleted = get_email_outbox().purge() if has_table('email_outbox') else 0
+                
                 return {
-                    'notifications_deleted': deleted_count
+                    'notifications_deleted': deleted_count,
+                    'scheduled_jobs_deleted': jobs_deleted,
+                    'sent_emails_deleted': emails_deleted
                 }
                 
         except Exception as e:
@@ -438,3 +217,9 @@ def auto_complete_sessions():
     if notification_scheduler.app:
         return notification_scheduler.auto_complete_sessions()
     return {'error': 'Scheduler not initialized'}
+
+def send_queued_emails():
+    """Standalone function to send the queued emails"""
+    if notification_scheduler.app:
+        return notification_scheduler.send_queued_emails()
+    return {'error': 'Scheduler not initialized'}
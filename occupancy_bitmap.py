@@ -0,0 +1,325 @@
+"""
+Occupancy bitmaps for coach availability
+Each UTC day of a coach's calendar is two 288-bit bitmaps at 5-minute granularity:
+working time (weekly hours minus AvailabilityException rows) and booked time
+(scheduled sessions, contract sessions and calls). Slot lists, conflict checks and
+nearest-free-time searches become bit scans over cached days; the cache is an LRU
+over coaches that is dropped for a coach whenever its bookings, exceptions or
+hours change.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, date, timedelta
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Tuple
+from timezone_utils import zone_or_utc, localize, UTC
+
+from models import CoachAvailability
+from free_busy import get_free_busy_engine, availability_setting, weekly_windows, to_naive_utc
+from event_bus import get_event_bus, EVENT_AVAILABILITY
+
+logger = logging.getLogger(__name__)
+
+CELL = timedelta(minutes=5)
+CELLS_PER_DAY = 24 * 60 // 5
+DAY_BYTES = CELLS_PER_DAY // 8
+DAY_MASK = (1 << CELLS_PER_DAY) - 1
+
+# Working and booked cells of one UTC day, least significant bit first
+DayBitmap = namedtuple('DayBitmap', ['open', 'busy'])
+
+def cell_range(origin: datetime, start: datetime, end: datetime, inward: bool) -> Tuple[int, int]:
+    """
+    Cells [first, last) from origin covered by start..end. Inward rounding keeps only
+    whole cells (working time), outward rounding keeps every touched cell (bookings).
+    """
+    if inward:
+        return -((origin - start) // CELL), (end - origin) // CELL
+    return (start - origin) // CELL, -((origin - end) // CELL)
+
+def run_mask(first: int, last: int) -> int:
+    """Bits first..last-1 set"""
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+def fit_mask(free: int, cells: int) -> int:
+    """Bits i where free has `cells` consecutive set bits starting at i, in O(log cells) shift-ANDs"""
+    fits, length = free, 1
+    while length < cells:
+        step = min(length, cells - length)
+        fits &= fits >> step
+        length += step
+    return fits
+
+def grid_mask(total: int, every: int, first: int = 0) -> int:
+    """Bits first, first + every, ... below total"""
+    mask, width = 1, every
+    while width < total:
+        mask |= mask << width
+        width *= 2
+    return (mask << first) & ((1 << total) - 1)
+
+def local_to_utc(coach_tz, local_datetime: datetime) -> datetime:
+    return localize(local_datetime, coach_tz).astimezone(UTC).replace(tzinfo=None)
+
+def is_aligned(value: datetime) -> bool:
+    return value.minute % 5 == 0 and value.second == 0 and value.microsecond == 0
+
+class CoachOccupancy:
+    """Cached settings and day bitmaps for one coach"""
+
+    def __init__(self, settings: Optional[SimpleNamespace], generation: int):
+        self.settings = settings
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+        self.days: Dict[date, DayBitmap] = {}
+
+class OccupancyBitmapCache:
+    """LRU of per-coach occupancy bitmaps, built from the free/busy engine's queries"""
+
+    def __init__(self, max_coaches: int = 1024, ttl_seconds: int = 600):
+        self.engine = get_free_busy_engine()
+        self.max_coaches = max_coaches
+        # Safety net for changes made outside the ORM (raw SQL, other services)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._coaches = OrderedDict()
+        # Bumped on invalidation so a build that raced a commit is never stored
+        self._generations = {}
+        get_event_bus().add_listener(EVENT_AVAILABILITY, self._on_availability_changed)
+
+    def invalidate_coach(self, coach_id: int):
+        with self._lock:
+            self._coaches.pop(coach_id, None)
+            self._generations[coach_id] = self._generations.get(coach_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._coaches.clear()
+            self._generations.clear()
+
+    def settings(self, coach_id: int) -> Optional[SimpleNamespace]:
+        """Snapshot of the coach's availability row (None when they never saved one)"""
+        return self._coach(coach_id).settings
+
+    def is_busy(self, coach_id: int, start_time: datetime, end_time: datetime) -> Optional[bool]:
+        """
+        Whether any booking overlaps [start_time, end_time). Exact for times on the
+        5-minute grid; returns None for other times so the caller can ask SQL.
+        """
+        start_time = to_naive_utc(start_time)
+        end_time = to_naive_utc(end_time)
+        if not (is_aligned(start_time) and is_aligned(end_time)):
+            return None
+        origin, _, busy = self._window(coach_id, start_time, end_time)
+        return bool(busy & run_mask(*cell_range(origin, start_time, end_time, inward=False)))
+
+    def get_slots(self, coach_id: int, start_date: date, end_date: date, duration_minutes: int = None,
+                  timezone: str = 'UTC', step_minutes: int = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Free slots per day, same grid and shape as FreeBusyEngine.get_slots.
+        A slot is kept when every cell it touches is working and unbooked.
+        """
+        entry = self._coach(coach_id)
+        settings = entry.settings
+        if not availability_setting(settings, 'is_available'):
+            return {}
+
+        duration = duration_minutes or availability_setting(settings, 'session_duration')
+        step = step_minutes or duration + (availability_setting(settings, 'buffer_after') or 0)
+        coach_tz = zone_or_utc(availability_setting(settings, 'timezone'))
+        target_tz = zone_or_utc(timezone)
+        hours = weekly_windows(settings)
+
+        candidates = []
+        day = start_date
+        while day <= end_date:
+            midnight = datetime.combine(day, datetime.min.time())
+            for start_minutes, end_minutes in hours[day.weekday()]:
+                minute = start_minutes
+                while minute + duration <= end_minutes:
+                    candidates.append((local_to_utc(coach_tz, midnight + timedelta(minutes=minute)),
+                                       local_to_utc(coach_tz, midnight + timedelta(minutes=minute + duration)), day))
+                    minute += step
+            day += timedelta(days=1)
+        if not candidates:
+            return {}
+
+        origin, open_cells, busy = self._window(coach_id, min(c[0] for c in candidates),
+                                                max(c[1] for c in candidates))
+        free = open_cells & ~busy
+
+        slots = {}
+        for slot_start, slot_end, day in candidates:
+            mask = run_mask(*cell_range(origin, slot_start, slot_end, inward=False))
+            if free & mask == mask:
+                start_utc = slot_start.replace(tzinfo=UTC)
+                end_utc = slot_end.replace(tzinfo=UTC)
+                slots.setdefault(day.isoformat(), []).append({
+                    'start': start_utc.astimezone(target_tz),
+                    'end': end_utc.astimezone(target_tz),
+                    'start_utc': start_utc,
+                    'end_utc': end_utc,
+                    'available': True
+                })
+        return slots
+
+    def nearest_free_starts(self, coach_id: int, requested_start: datetime, duration_minutes: int,
+                            limit: int = 5, horizon_days: int = 60, step_minutes: int = 15,
+                            not_before: datetime = None) -> List[datetime]:
+        """
+        Up to `limit` free start times (naive UTC) nearest to requested_start, nearest
+        first, within horizon_days either side and not before not_before (default now).
+        One pass over the horizon: shift-ANDs mark every start on the step grid whose
+        cells are all working and unbooked, then set bits are taken outward from the
+        requested cell. Local offsets are whole quarter hours, so a UTC step of 15 or
+        a multiple of it lines up with the coach's local clock.
+        """
+        settings = self._coach(coach_id).settings
+        if not availability_setting(settings, 'is_available'):
+            return []
+
+        requested_start = to_naive_utc(requested_start)
+        not_before = to_naive_utc(not_before or datetime.utcnow())
+        horizon = timedelta(days=horizon_days)
+        window_start = max(requested_start - horizon, not_before)
+        window_end = requested_start + horizon + timedelta(minutes=duration_minutes)
+        if window_end <= window_start:
+            return []
+
+        origin, open_cells, busy = self._window(coach_id, window_start, window_end)
+        total = (requested_start + horizon - origin) // CELL + 1
+        every = max(step_minutes // 5, 1)
+        first = -((origin - window_start) // CELL)
+        first += -first % every
+        fits = fit_mask(open_cells & ~busy, -(-duration_minutes // 5)) & grid_mask(total, every, first)
+
+        # Starts at or after the requested time, and before it
+        target = max(-((origin - requested_start) // CELL), 0)
+        after = (fits >> target) << target
+        before = fits ^ after
+        offset = requested_start - origin
+        starts = []
+        while len(starts) < limit and (after or before):
+            later = (after & -after).bit_length() - 1 if after else None
+            earlier = before.bit_length() - 1 if before else None
+            if earlier is not None and (later is None or offset - earlier * CELL <= later * CELL - offset):
+                starts.append(earlier)
+                before ^= 1 << earlier
+            else:
+                starts.append(later)
+                after ^= 1 << later
+        return [origin + cell * CELL for cell in starts]
+
+    def _coach(self, coach_id: int) -> CoachOccupancy:
+        with self._lock:
+            entry = self._coaches.get(coach_id)
+            if entry is not None and time.monotonic() - entry.loaded_at <= self.ttl_seconds:
+                self._coaches.move_to_end(coach_id)
+                return entry
+            generation = self._generations.get(coach_id, 0)
+
+        availability = self.engine.load_availability(coach_id)
+        settings = None
+        if availability is not None:
+            settings = SimpleNamespace(weekly_windows=availability.weekly_windows,
+                                       **{column.name: getattr(availability, column.name)
+                                          for column in CoachAvailability.__table__.columns})
+        entry = CoachOccupancy(settings, generation)
+        self._store(coach_id, entry)
+        return entry
+
+    def _store(self, coach_id: int, entry: CoachOccupancy):
+        with self._lock:
+            if self._generations.get(coach_id, 0) != entry.generation:
+                return
+            self._coaches[coach_id] = entry
+            self._coaches.move_to_end(coach_id)
+            while len(self._coaches) > self.max_coaches:
+                self._coaches.popitem(last=False)
+
+    def _window(self, coach_id: int, start_time: datetime, end_time: datetime) -> Tuple[datetime, int, int]:
+        """(origin, working bits, booked bits) for the UTC days spanning the window"""
+        entry = self._coach(coach_id)
+        first_day = start_time.date()
+        last_day = (end_time - timedelta(microseconds=1)).date()
+        day_count = (last_day - first_day).days + 1
+
+        missing = [first_day + timedelta(days=offset) for offset in range(day_count)
+                   if first_day + timedelta(days=offset) not in entry.days]
+        if missing:
+            built = self._build_days(coach_id, entry.settings, missing[0], missing[-1])
+            with self._lock:
+                if self._generations.get(coach_id, 0) == entry.generation:
+                    entry.days.update(built)
+        else:
+            built = {}
+
+        open_cells = busy = 0
+        for offset in range(day_count):
+            day = first_day + timedelta(days=offset)
+            bitmap = entry.days.get(day) or built[day]
+            open_cells |= int.from_bytes(bitmap.open, 'little') << (offset * CELLS_PER_DAY)
+            busy |= int.from_bytes(bitmap.busy, 'little') << (offset * CELLS_PER_DAY)
+        return datetime.combine(first_day, datetime.min.time()), open_cells, busy
+
+    def _build_days(self, coach_id: int, settings: Optional[SimpleNamespace], first_day: date,
+                    last_day: date) -> Dict[date, DayBitmap]:
+        """Rasterize working time and bookings for a run of UTC days (two queries)"""
+        origin = datetime.combine(first_day, datetime.min.time())
+        window_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+        coach_tz = zone_or_utc(availability_setting(settings, 'timezone'))
+
+        # A local day overlaps at most the UTC day before and after it
+        local_first = first_day - timedelta(days=1)
+        local_last = last_day + timedelta(days=1)
+        exceptions = self.engine.load_exceptions(settings, local_first, local_last)
+        open_cells = 0
+        for _, _, local_free in self.engine.working_days(settings, exceptions, local_first, local_last):
+            for local_start, local_end in local_free:
+                first, last = cell_range(origin, local_to_utc(coach_tz, local_start),
+                                         local_to_utc(coach_tz, local_end), inward=True)
+                open_cells |= run_mask(max(first, 0), last)
+
+        busy = 0
+        for busy_start, busy_end in self.engine.get_busy_intervals(coach_id, origin, window_end):
+            first, last = cell_range(origin, busy_start, busy_end, inward=False)
+            busy |= run_mask(max(first, 0), last)
+
+        days = {}
+        for offset in range((last_day - first_day).days + 1):
+            shift = offset * CELLS_PER_DAY
+            days[first_day + timedelta(days=offset)] = DayBitmap(
+                ((open_cells >> shift) & DAY_MASK).to_bytes(DAY_BYTES, 'little'),
+                ((busy >> shift) & DAY_MASK).to_bytes(DAY_BYTES, 'little')
+            )
+        return days
+
+    def _on_availability_changed(self, event: Dict[str, Any]):
+        self.invalidate_coach(event['data'].get('coach_id', event['user_id']))
+
+# Global occupancy bitmap cache
+occupancy_cache = OccupancyBitmapCache()
+
+def get_occupancy_cache() -> OccupancyBitmapCache:
+    """Get the global occupancy bitmap cache"""
+    return occupancy_cache
+
+def is_coach_busy(coach_id: int, start_time: datetime, end_time: datetime) -> Optional[bool]:
+    """Whether a booking overlaps the range (None when the range is off the 5-minute grid)"""
+    return occupancy_cache.is_busy(coach_id, start_time, end_time)
+
+def nearest_free_starts(coach_id: int, requested_start: datetime, duration_minutes: int, limit: int = 5,
+                        horizon_days: int = 60, step_minutes: int = 15) -> List[datetime]:
+    """Get the free start times nearest to a requested time from the occupancy bitmaps"""
+    return occupancy_cache.nearest_free_starts(coach_id, requested_start, duration_minutes, limit, horizon_days,
+                                               step_minutes)
+
+def get_cached_slots(coach_id: int, start_date: date, end_date: date, duration_minutes: int = None,
+                     timezone: str = 'UTC', step_minutes: int = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Get free slots per day from the occupancy bitmaps"""
+    return occupancy_cache.get_slots(coach_id, start_date, end_date, duration_minutes, timezone, step_minutes)
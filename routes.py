@@ -1,14 +1,17 @@
 from forms import RoleSwitchForm, UpgradeToCoachForm, UpgradeToStudentForm
-from flask import render_template, request, redirect, url_for, flash, session as flask_session, jsonify, send_from_directory
+from flask import render_template, request, redirect, url_for, flash, session as flask_session, jsonify, send_from_directory, make_response
 # Remove circular import - csrf will be imported later
 from models import *
 from forms import *
 from utils import *
 from utils import get_available_timezones
+from schema_capabilities import has_table, has_column
+from calendar_events import get_calendar_event_store
 # Notification utilities imported inside functions to avoid circular imports
 from datetime import datetime, timezone
 import json
 import os
+import time
 import logging
 import traceback
 from wtforms import StringField, TextAreaField
@@ -1077,10 +1080,10 @@ def test_email():
         </html>
         """
         
-        success = send_email([test_email_address], subject, html_content)
+        success = send_email([test_email_address], subject, html_content, commit=True)
         
         if success:
-            return f"✅ Test email sent successfully to {test_email_address}. Check your inbox!"
+            return f"✅ Test email queued for {test_email_address}. It goes out with the next email outbox run - check your inbox!"
         else:
             return f"❌ Failed to send test email to {test_email_address}. Check logs for details."
             
@@ -1771,14 +1774,12 @@ def coach_dashboard():
     
     # Get upcoming sessions with enhanced query
     try:
-        upcoming_sessions = Session.query.join(Proposal).join(Contract).filter(
-            Contract.coach_id == user.id,
-            Session.status == 'scheduled',
-            Session.scheduled_at > datetime.utcnow()
+        upcoming_sessions = get_calendar_event_store().upcoming_query(
+            Session, user.id, 'coach', ['scheduled']
         ).options(
             db.joinedload(Session.proposal).joinedload(Proposal.contracts),
             db.joinedload(Session.proposal).joinedload(Proposal.student).joinedload(User.student_profile)
-        ).order_by(Session.scheduled_at).limit(5).all()
+        ).limit(5).all()
     except Exception:
         upcoming_sessions = []
 
@@ -1841,13 +1842,11 @@ def student_dashboard():
     
     # Get upcoming sessions with enhanced query
     try:
-        upcoming_sessions = Session.query.join(Proposal).join(Contract).filter(
-            Contract.student_id == user.id,
-            Session.status == 'scheduled',
-            Session.scheduled_at > datetime.utcnow()
+        upcoming_sessions = get_calendar_event_store().upcoming_query(
+            Session, user.id, 'student', ['scheduled']
         ).options(
             db.joinedload(Session.proposal).joinedload(Proposal.coach).joinedload(User.coach_profile)
-        ).order_by(Session.scheduled_at).limit(5).all()
+        ).limit(5).all()
     except Exception:
         upcoming_sessions = []
 
@@ -1861,21 +1860,16 @@ def student_dashboard():
                          stats=stats,
                          student=user.student_profile)
 
-@app.route('/browse-coaches')
-@login_required
-@student_required
-def browse_coaches():
-    user = get_current_user()
-
-    # Get filters from query parameters
-    search = request.args.get('search', '')
-    price_range = request.args.get('price_range', '')
-    location = request.args.get('location', '')
-    language = request.args.get('language', '')
-    skill_tags = request.args.get('skill_tags', '')
-    specialties = request.args.get('specialties', '')
-    experience = request.args.get('experience', '')
-    sort = request.args.get('sort', 'top')
+def build_coach_search_query(args):
+    """Approved coaches matching the browse filters, sorted as requested"""
+    search = args.get('search', '')
+    price_range = args.get('price_range', '')
+    location = args.get('location', '')
+    language = args.get('language', '')
+    skill_tags = args.get('skill_tags', '')
+    specialties = args.get('specialties', '')
+    experience = args.get('experience', '')
+    sort = args.get('sort', 'top')
 
     # Build query for approved coaches
     query = CoachProfile.query.filter_by(is_approved=True)
@@ -1959,7 +1953,73 @@ def browse_coaches():
     else:  # 'top' - default sorting
         query = query.order_by(CoachProfile.rating.desc(), CoachProfile.hourly_rate.asc())
 
-    coaches = query.all()
+    return query
+
+def parse_availability_search(args, default_timezone='UTC'):
+    """
+    (window_start, window_end, duration_minutes, timezone) in UTC from available_date,
+    available_time, duration_minutes, flex_minutes and timezone; None when no date
+    was asked for. Raises ValueError on bad input.
+    """
+    from free_busy import MAX_SEARCH_DAYS
+    import pytz
+
+    date_str = args.get('available_date', '')
+    if not date_str:
+        return None
+    time_str = args.get('available_time', '') or '00:00'
+    timezone_name = args.get('timezone', '') or default_timezone or 'UTC'
+    duration_minutes = int(args.get('duration_minutes', 60))
+    if args.get('available_time'):
+        flex_minutes = int(args.get('flex_minutes', 0))
+    else:
+        # No time of day means any start that day
+        flex_minutes = 24 * 60 - duration_minutes
+
+    if not 0 < duration_minutes <= 8 * 60:
+        raise ValueError('Duration must be between 1 minute and 8 hours')
+    if not 0 <= flex_minutes <= MAX_SEARCH_DAYS * 24 * 60:
+        raise ValueError(f'Flexibility must be between 0 minutes and {MAX_SEARCH_DAYS} days')
+    try:
+        timezone = pytz.timezone(timezone_name)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f'Unknown timezone {timezone_name}')
+
+    local_start = datetime.strptime(f'{date_str} {time_str}', '%Y-%m-%d %H:%M')
+    window_start = timezone.localize(local_start).astimezone(pytz.UTC).replace(tzinfo=None)
+    window_end = window_start + timedelta(minutes=flex_minutes)
+    if window_end < datetime.utcnow():
+        raise ValueError('That time has already passed')
+    return max(window_start, datetime.utcnow()), window_end, duration_minutes, timezone_name
+
+@app.route('/browse-coaches')
+@login_required
+@student_required
+def browse_coaches():
+    user = get_current_user()
+
+    # Get filters from query parameters
+    search = request.args.get('search', '')
+    skill_tags = request.args.get('skill_tags', '')
+    language = request.args.get('language', '')
+
+    coaches = build_coach_search_query(request.args).all()
+
+    # "Free at" filter: every matching coach is checked in a fixed number of queries
+    earliest_free = {}
+    try:
+        availability_search = parse_availability_search(request.args, user.timezone)
+    except ValueError as e:
+        flash(str(e), 'error')
+        availability_search = None
+    if availability_search:
+        from free_busy import get_free_coaches
+        import pytz
+        window_start, window_end, duration_minutes, timezone_name = availability_search
+        free = get_free_coaches([coach.user_id for coach in coaches], window_start, window_end, duration_minutes)
+        timezone = pytz.timezone(timezone_name)
+        coaches = [coach for coach in coaches if coach.user_id in free]
+        earliest_free = {coach_id: pytz.UTC.localize(start).astimezone(timezone) for coach_id, start in free.items()}
 
     # Determine the header text based on search/filters
     header_text = "Discover coaches"
@@ -1975,7 +2035,8 @@ def browse_coaches():
                          header_text=header_text,
                          search_term=search,
                          skill_tags_filter=skill_tags,
-                         language_filter=language)
+                         language_filter=language,
+                         earliest_free=earliest_free)
 
 # Job and Request Routes
 @app.route('/find-work')
@@ -2382,18 +2443,7 @@ def accept_proposal(proposal_id):
         
         # Create notification for coach (only if table exists)
         try:
-            from sqlalchemy import text
-            # Check if notification table exists
-            result = db.session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if table_exists:
+            if has_table('notification'):
                 from notification_utils import create_job_notification
                 create_job_notification(learning_request, 'job_accepted', proposal)
         except Exception as e:
@@ -2447,18 +2497,7 @@ def reject_proposal(proposal_id):
         
         # Create notification for coach (only if table exists)
         try:
-            from sqlalchemy import text
-            # Check if notification table exists
-            result = db.session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if table_exists:
+            if has_table('notification'):
                 from notification_utils import create_job_notification
                 create_job_notification(learning_request, 'job_rejected', proposal)
         except Exception as e:
@@ -3225,60 +3264,16 @@ def delete_education(education_id):
 def inbox():
     user = get_current_user()
 
-    # Get all conversations
-    try:
-        conversations = get_db().session.query(Message).filter(
-            (Message.sender_id == user.id) | (Message.recipient_id == user.id)
-        ).order_by(Message.created_at.desc()).all()
-    except Exception as e:
-        # Fallback query without message_type if column doesn't exist
-        if "message_type" in str(e):
-            conversations = get_db().session.execute(
-                get_db().text("""
-                    SELECT id, sender_id, recipient_id, content, is_read, created_at 
-                    FROM message 
-                    WHERE sender_id = :user_id OR recipient_id = :user_id 
-                    ORDER BY created_at DESC
-                """),
-                {'user_id': user.id}
-            ).fetchall()
-            # Convert to Message objects
-            conversations = []
-            for row in conversations:
-                msg = Message()
-                msg.id = row[0]
-                msg.sender_id = row[1]
-                msg.recipient_id = row[2]
-                msg.content = row[3]
-                msg.is_read = row[4]
-                msg.created_at = row[5]
-                msg.message_type = 'TEXT'  # Default value
-                conversations.append(msg)
-        else:
-            raise e
-
-    # Group by conversation partner
-    conversation_partners = {}
-    for message in conversations:
-        partner_id = message.recipient_id if message.sender_id == user.id else message.sender_id
-        if partner_id not in conversation_partners:
-            partner = User.query.get(partner_id)
-            conversation_partners[partner_id] = {
-                'partner': partner,
-                'last_message': message,
-                'unread_count': 0
-            }
-
-    # Count unread messages
-    for partner_id in conversation_partners:
-        unread_count = Message.query.filter_by(
-            sender_id=partner_id,
-            recipient_id=user.id,
-            is_read=False
-        ).count()
-        conversation_partners[partner_id]['unread_count'] = unread_count
+    # One query for the last message, partner and unread count per conversation;
+    # ?before=<message_id> pages through older conversations
+    from conversation_manager import get_conversation_summaries
+    before_message_id = request.args.get('before', type=int)
+    conversation_partners, next_cursor = get_conversation_summaries(
+        user.id, before_message_id=before_message_id
+    )
 
-    return render_template('messages/inbox.html', conversations=conversation_partners)
+    return render_template('messages/inbox.html', conversations=conversation_partners,
+                           next_cursor=next_cursor)
 
 @app.route('/messages/<int:user_id>')
 @login_required
@@ -3295,19 +3290,14 @@ def conversation(user_id):
             flash('Unable to start conversation with this user.', 'error')
         return redirect(url_for('inbox'))
 
-    # Get messages between users
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.recipient_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.recipient_id == current_user.id))
-    ).order_by(Message.created_at.asc()).all()
-
-    # Mark messages as read
-    Message.query.filter_by(
-        sender_id=user_id,
-        recipient_id=current_user.id,
-        is_read=False
-    ).update({'is_read': True})
-    get_db().session.commit()
+    # Latest page of messages between users; older pages load from conversation_history
+    from conversation_manager import get_message_page, mark_messages_read
+    messages, has_more = get_message_page(current_user.id, user_id)
+
+    # Mark the messages on screen as read (committed after rendering so the
+    # loaded rows are not expired and reloaded one by one by the template)
+    if messages:
+        mark_messages_read(current_user.id, user_id, from_id=messages[0].id, up_to_id=messages[-1].id)
 
     form = MessageForm()
     
@@ -3320,11 +3310,14 @@ def conversation(user_id):
             LearningRequest.student_id == current_user.id
         ).all()
 
-    return render_template('messages/conversation.html',
+    html = render_template('messages/conversation.html',
                          messages=messages,
+                         has_more=has_more,
                          other_user=other_user,
                          form=form,
                          proposals=proposals)
+    get_db().session.commit()
+    return html
 
 @app.route('/send-message/<int:recipient_id>', methods=['POST'])
 @login_required
@@ -3359,18 +3352,7 @@ def send_message(recipient_id):
 
         # Create notification for recipient (only if table exists)
         try:
-            from sqlalchemy import text
-            # Check if notification table exists
-            result = get_db().session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if table_exists:
+            if has_table('notification'):
                 from notification_utils import create_message_notification
                 create_message_notification(current_user, recipient, form.content.data)
         except Exception as e:
@@ -3422,31 +3404,26 @@ def start_conversation(user_id):
             flash('Unable to start conversation with this user.', 'error')
         return redirect(request.referrer or url_for('index'))
 
-    # Check if conversation already exists
-    existing_conversation = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.recipient_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.recipient_id == current_user.id))
-    ).first()
-
-    if existing_conversation:
-        # Redirect to existing conversation
-        return redirect(url_for('conversation', user_id=user_id))
-    else:
-        # Redirect to conversation page to start new conversation
-        return redirect(url_for('conversation', user_id=user_id))
+    # Existing and new conversations both open on the conversation page
+    return redirect(url_for('conversation', user_id=user_id))
 
 @app.route('/messages/<int:user_id>/mark-read', methods=['POST'])
 @login_required
 def mark_messages_read(user_id):
-    """Mark messages from a specific user as read"""
+    """
+    Mark messages from a specific user as read.
+    ?from_id= / ?up_to_id= (or the same keys in a JSON body) limit it to the
+    messages the client has on screen; without them every unread message is marked.
+    """
     current_user = get_current_user()
 
-    # Mark messages as read
-    updated = Message.query.filter_by(
-        sender_id=user_id,
-        recipient_id=current_user.id,
-        is_read=False
-    ).update({'is_read': True})
+    from conversation_manager import mark_messages_read
+    bounds = request.get_json(silent=True) or {}
+    from_id = request.args.get('from_id', type=int) or bounds.get('from_id')
+    up_to_id = request.args.get('up_to_id', type=int) or bounds.get('up_to_id')
+    updated = mark_messages_read(current_user.id, user_id,
+                                 from_id=int(from_id) if from_id else None,
+                                 up_to_id=int(up_to_id) if up_to_id else None)
 
     get_db().session.commit()
 
@@ -3455,52 +3432,109 @@ def mark_messages_read(user_id):
 
     return redirect(url_for('conversation', user_id=user_id))
 
+@app.route('/messages/<int:user_id>/history')
+@login_required
+def conversation_history(user_id):
+    """
+    Older messages for scroll-back: ?before_id=<oldest message on screen>.
+    Returns the rendered message rows (so cards look the same as on first load)
+    plus the cursor for the next page.
+    """
+    current_user = get_current_user()
+    other_user = User.query.get_or_404(user_id)
+
+    from conversation_manager import get_message_page, mark_messages_read, DEFAULT_PAGE_SIZE
+    before_id = request.args.get('before_id', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    messages, has_more = get_message_page(current_user.id, user_id, before_id=before_id, limit=limit)
+
+    if messages:
+        mark_messages_read(current_user.id, user_id, from_id=messages[0].id, up_to_id=messages[-1].id)
+
+    # The message right after this page decides the date separator at the seam
+    following_message = get_db().session.get(Message, before_id) if before_id else None
+    if following_message and {following_message.sender_id, following_message.recipient_id} != {current_user.id, user_id}:
+        following_message = None
+    html = render_template('messages/components/conversation_messages.html',
+                           messages=messages,
+                           following_message=following_message,
+                           other_user=other_user)
+    get_db().session.commit()
+
+    return jsonify({
+        'success': True,
+        'html': html,
+        'count': len(messages),
+        'has_more': has_more,
+        'before_id': messages[0].id if messages else None
+    })
+
 @app.route('/messages/<int:user_id>/new-messages')
 @login_required
 def get_new_messages(user_id):
-    """Get new messages from a specific user since last check"""
+    """
+    Get new messages from a specific user since last check.
+
+    Preferred mode is ?after_id=<last seen message id>: a 204 is returned when
+    nothing is newer, otherwise only the newer rows. Every response carries an
+    ETag for the newest message so If-None-Match polls short-circuit with 304.
+    The older ?since=<iso timestamp> mode is still accepted.
+    """
     current_user = get_current_user()
 
-    # Get timestamp from query parameter
+    from conversation_manager import (
+        get_last_message_id, get_messages_after, get_latest_messages, serialize_message, POLL_BATCH_SIZE
+    )
+
+    # One probe for the newest message between the pair decides whether anything changed
+    last_message_id = get_last_message_id(current_user.id, user_id)
+    etag = f'W/"msg-{last_message_id}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = make_response('', 304)
+        response.headers['ETag'] = etag
+        return response
+
+    after_id = request.args.get('after_id', type=int)
     since = request.args.get('since')
-    if since:
+    since_dt = None
+    if after_id is None and since:
         try:
-            from datetime import datetime
             since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-        except:
+            if since_dt.tzinfo:
+                since_dt = since_dt.astimezone(timezone.utc).replace(tzinfo=None)
+        except ValueError:
             since_dt = None
-    else:
-        since_dt = None
-
-    # Build query for new messages
-    query = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.recipient_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.recipient_id == current_user.id))
-    )
-
-    if since_dt:
-        query = query.filter(Message.created_at > since_dt)
 
-    messages = query.order_by(Message.created_at.asc()).all()
+    if after_id is not None:
+        if last_message_id <= after_id:
+            response = make_response('', 204)
+            response.headers['ETag'] = etag
+            return response
+        messages = get_messages_after(current_user.id, user_id, after_id)
+    elif since_dt:
+        messages = Message.query.filter(
+            ((Message.sender_id == current_user.id) & (Message.recipient_id == user_id)) |
+            ((Message.sender_id == user_id) & (Message.recipient_id == current_user.id)),
+            Message.created_at > since_dt
+        ).order_by(Message.id.asc()).limit(POLL_BATCH_SIZE).all()
+    else:
+        # No usable cursor: send the latest page so the client can switch to after_id
+        messages = get_latest_messages(current_user.id, user_id)
 
     # Convert messages to JSON
-    messages_data = []
-    for msg in messages:
-        messages_data.append({
-            'id': msg.id,
-            'content': msg.content,
-            'sender_id': msg.sender_id,
-            'recipient_id': msg.recipient_id,
-            'created_at': msg.created_at.replace(tzinfo=timezone.utc).isoformat(),
-            'is_read': msg.is_read,
-            'time_display': msg.created_at.strftime('%H:%M')
-        })
+    messages_data = [serialize_message(msg) for msg in messages]
 
-    return jsonify({
+    # The ETag names the newest message this response brings the client up to,
+    # so a batch cut short by the limit never matches a later If-None-Match
+    last_id = messages[-1].id if messages else (after_id or last_message_id)
+    response = jsonify({
         'success': True,
         'messages': messages_data,
-        'current_user_id': current_user.id
+        'current_user_id': current_user.id,
+        'last_id': last_id
     })
+    response.headers['ETag'] = f'W/"msg-{last_id}"'
+    return response
 
 
 # Contract and Call Scheduling Routes for Messages Interface
@@ -4372,11 +4406,6 @@ def inject_role_context():
 def currency_filter(amount):
     return format_currency(amount)
 
-@app.template_global()
-def get_current_user():
-    if 'user_id' in session:
-        return User.query.get(session['user_id'])
-    return None
 # Role Switching Routes
 @app.route('/simple-role-switch', methods=['POST'])
 @login_required
@@ -5921,15 +5950,19 @@ def get_coach_calendar(coach_id):
     try:
         year = int(request.args.get('year', datetime.now().year))
         month = int(request.args.get('month', datetime.now().month))
+        duration_minutes = int(request.args.get('duration_minutes', 60))
+        if not 1 <= month <= 12 or not 0 < duration_minutes <= 1440:
+            return jsonify({'error': 'Invalid month or duration'}), 400
         
-        # Get calendar days for the month
+        # Slot counts for the whole month come from one sweep and are cached per coach
         from availability_manager import get_coach_calendar_days
-        calendar_data = get_coach_calendar_days(coach_id, year, month)
+        calendar_data = get_coach_calendar_days(coach_id, year, month, duration_minutes)
         
         return jsonify({
             'coach_id': coach_id,
             'year': year,
             'month': month,
+            'duration_minutes': duration_minutes,
             'days': calendar_data
         })
         
@@ -5937,6 +5970,52 @@ def get_coach_calendar(coach_id):
         logger.error(f"Error getting coach calendar: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/coaches/available', methods=['GET'])
+@login_required
+def find_available_coaches():
+    """Approved coaches matching the browse filters who are free at a time, with their earliest free start"""
+    try:
+        user = get_current_user()
+        try:
+            availability_search = parse_availability_search(request.args, user.timezone)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if not availability_search:
+            return jsonify({'success': False, 'error': 'available_date is required'}), 400
+
+        from free_busy import get_free_coaches
+        import pytz
+        window_start, window_end, duration_minutes, timezone_name = availability_search
+        coach_ids = [coach_id for coach_id, in build_coach_search_query(request.args)
+                     .with_entities(CoachProfile.user_id).all()]
+        free = get_free_coaches(coach_ids, window_start, window_end, duration_minutes)
+
+        timezone = pytz.timezone(timezone_name)
+        coaches = []
+        # Keep the requested sort order
+        for coach_id in coach_ids:
+            if coach_id in free:
+                start_utc = pytz.UTC.localize(free[coach_id])
+                coaches.append({
+                    'coach_id': coach_id,
+                    'earliest_start': start_utc.astimezone(timezone).isoformat(),
+                    'earliest_start_utc': start_utc.isoformat()
+                })
+
+        return jsonify({
+            'success': True,
+            'window_start_utc': pytz.UTC.localize(window_start).isoformat(),
+            'window_end_utc': pytz.UTC.localize(window_end).isoformat(),
+            'duration_minutes': duration_minutes,
+            'timezone': timezone_name,
+            'count': len(coaches),
+            'coaches': coaches
+        })
+
+    except Exception as e:
+        logger.error(f"Error finding available coaches: {e}")
+        return jsonify({'success': False, 'error': 'Internal server error'}), 500
+
 @app.route('/api/coaches/<int:coach_id>/suggest-times', methods=['POST'])
 @login_required
 def suggest_alternative_times_api(coach_id):
@@ -5946,9 +6025,12 @@ def suggest_alternative_times_api(coach_id):
         start_time_str = data.get('start_time')
         end_time_str = data.get('end_time')
         duration_minutes = data.get('duration_minutes', 60)
+        limit = data.get('limit', 5)
         
         if not start_time_str:
             return jsonify({'error': 'start_time is required'}), 400
+        if not isinstance(limit, int) or not 1 <= limit <= 20:
+            return jsonify({'error': 'limit must be between 1 and 20'}), 400
         
         # Parse datetime
         start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
@@ -5959,7 +6041,7 @@ def suggest_alternative_times_api(coach_id):
         
         # Get suggestions
         from availability_manager import suggest_alternative_times
-        suggestions = suggest_alternative_times(coach_id, start_time, end_time, duration_minutes)
+        suggestions = suggest_alternative_times(coach_id, start_time, end_time, duration_minutes, limit)
         
         return jsonify({
             'coach_id': coach_id,
@@ -5972,6 +6054,62 @@ def suggest_alternative_times_api(coach_id):
         logger.error(f"Error suggesting alternative times: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/calendar/feed-url', methods=['GET'])
+@login_required
+def calendar_feed_url():
+    """Private iCalendar URL for the signed-in user's sessions and calls"""
+    from calendar_feed import get_calendar_feed
+
+    user = get_current_user()
+    token = get_calendar_feed().feed_token(user.id)
+    return jsonify({'success': True, 'url': url_for('calendar_feed_ics', token=token, _external=True)})
+
+@app.route('/calendar/<token>.ics', methods=['GET'])
+def calendar_feed_ics(token):
+    """
+    iCalendar feed for calendar clients, authorised by the token in the URL.
+
+    One probe of the user's calendar_event rows decides the ETag and Last-Modified,
+    so an unchanged feed is a 304. With ?sync-token=<X-Sync-Token of an earlier
+    response> only events written since are returned.
+    """
+    from flask import Response, stream_with_context
+    from werkzeug.http import http_date
+    from calendar_feed import get_calendar_feed
+
+    feed = get_calendar_feed()
+    user_id = feed.user_for_token(token)
+    if user_id is None:
+        return make_response('Calendar feed not found', 404)
+
+    sync_token = request.args.get('sync-token')
+    changed_since = None
+    if sync_token:
+        try:
+            changed_since = feed.parse_sync_token(sync_token)
+        except ValueError:
+            return make_response('Invalid sync token', 400)
+
+    now = datetime.utcnow()
+    version = feed.version(user_id)
+    etag = feed.etag(user_id, version, sync_token, now)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if version.last_modified:
+        headers['Last-Modified'] = http_date(version.last_modified)
+
+    if_none_match = request.headers.get('If-None-Match')
+    if_modified_since = request.if_modified_since
+    if (if_none_match and etag in if_none_match) or (
+            not if_none_match and if_modified_since and version.last_modified and not sync_token
+            and version.last_modified.replace(microsecond=0) <= if_modified_since):
+        response = make_response('', 304)
+        response.headers.update(headers)
+        return response
+
+    headers['X-Sync-Token'] = feed.issue_sync_token(now)
+    return Response(stream_with_context(feed.write(user_id, changed_since, now)),
+                    mimetype='text/calendar', headers=headers)
+
 @app.route('/api/sessions/<int:session_id>/status', methods=['GET'])
 @login_required
 def check_meeting_status(session_id):
@@ -5984,29 +6122,10 @@ def check_meeting_status(session_id):
     if not contract or (current_user.id not in [contract.coach_id, contract.student_id]):
         return jsonify({'error': 'Access denied'}), 403
     
-    # Auto-activate meeting if it's time and not already activated
-    if session.status == 'scheduled' and session.can_auto_activate() and not session.auto_activated:
-        try:
-            if session.auto_activate_meeting():
-                app.logger.info(f"Auto-activated session {session_id}")
-            else:
-                app.logger.warning(f"Failed to auto-activate session {session_id}")
-        except Exception as e:
-            app.logger.error(f"Error auto-activating session {session_id}: {e}")
-    
-    # Auto-complete session if it has passed its duration
-    try:
-        if session.auto_complete_if_needed():
-            app.logger.info(f"Auto-completed session {session_id}")
-    except Exception as e:
-        app.logger.error(f"Error auto-completing session {session_id}: {e}")
+    # Auto-activate meeting if it's time, auto-complete if it has passed its duration
+    session.refresh_auto_status()
     
-    return jsonify({
-        'status': session.status,
-        'can_join_early': session.can_join_early(),
-        'scheduled_at': session.scheduled_at.isoformat() if session.scheduled_at else None,
-        'meeting_started_at': session.meeting_started_at.isoformat() if session.meeting_started_at else None
-    })
+    return jsonify(session.get_status_info())
 
 
 # Google Meet Integration Routes
@@ -6118,13 +6237,8 @@ def save_meeting_link(scheduled_session_id):
         
         # Send email notification to student
         try:
-            from email_utils import send_email
-            send_email(
-                to_email=session.student.email,
-                subject=f"Meeting Link Ready - {session.coach.first_name}",
-                template='notifications/meeting_link_ready.html',
-                session=session
-            )
+            from email_utils import send_meeting_link_email
+            send_meeting_link_email(session)
         except Exception as e:
             print(f"Warning: Could not send email notification: {e}")
         
@@ -6438,13 +6552,8 @@ def save_call_meeting_link(call_id):
         db.session.commit()
         
         # Send notification to student
-        from email_utils import send_email
-        send_email(
-            to_email=call.student.email,
-            subject=f"Meeting Link Ready - {call.coach.first_name}",
-            template='notifications/meeting_link_ready.html',
-            call=call
-        )
+        from email_utils import send_meeting_link_email
+        send_meeting_link_email(call)
         
         flash('Meeting link added successfully! Student has been notified.', 'success')
     else:
@@ -6462,25 +6571,8 @@ def get_notifications():
         user = get_current_user()
         
         # Check if notification table exists
-        from sqlalchemy import text
-        try:
-            result = get_db().session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if not table_exists:
-                # Return empty notifications if table doesn't exist
-                return jsonify({
-                    'success': True,
-                    'notifications': []
-                })
-        except Exception:
-            # If we can't check table existence, assume it doesn't exist
+        if not has_table('notification'):
+            # Return empty notifications if table doesn't exist
             return jsonify({
                 'success': True,
                 'notifications': []
@@ -6507,25 +6599,8 @@ def get_unread_count():
         user = get_current_user()
         
         # Check if notification table exists
-        from sqlalchemy import text
-        try:
-            result = get_db().session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if not table_exists:
-                # Return 0 count if table doesn't exist
-                return jsonify({
-                    'success': True,
-                    'count': 0
-                })
-        except Exception:
-            # If we can't check table existence, assume it doesn't exist
+        if not has_table('notification'):
+            # Return 0 count if table doesn't exist
             return jsonify({
                 'success': True,
                 'count': 0
@@ -6552,22 +6627,8 @@ def mark_notification_read(notification_id):
         user = get_current_user()
         
         # Check if notification table exists
-        from sqlalchemy import text
-        try:
-            result = get_db().session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if not table_exists:
-                # Return success if table doesn't exist (nothing to mark)
-                return jsonify({'success': True})
-        except Exception:
-            # If we can't check table existence, return success
+        if not has_table('notification'):
+            # Return success if table doesn't exist (nothing to mark)
             return jsonify({'success': True})
         
         # Table exists, mark as read
@@ -6588,22 +6649,8 @@ def mark_all_notifications_read():
         user = get_current_user()
         
         # Check if notification table exists
-        from sqlalchemy import text
-        try:
-            result = get_db().session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if not table_exists:
-                # Return success if table doesn't exist (nothing to mark)
-                return jsonify({'success': True})
-        except Exception:
-            # If we can't check table existence, return success
+        if not has_table('notification'):
+            # Return success if table doesn't exist (nothing to mark)
             return jsonify({'success': True})
         
         # Table exists, mark all as read
@@ -6613,6 +6660,110 @@ def mark_all_notifications_read():
         # Return success on any error
         return jsonify({'success': True})
 
+@app.route('/api/heartbeat')
+@login_required
+def heartbeat():
+    """
+    Combined poll for notifications, messages, session status and upcoming calls.
+
+    Optional: ?conversation=<user id>&after_id=<message id> for new messages,
+    ?session=<session id> for waiting-room status, and <section>_version=<stamp>
+    with the stamps from the previous response so unchanged sections come back
+    without their rows.
+    """
+    from heartbeat_manager import build_heartbeat
+
+    user = get_current_user()
+    versions = {
+        section: request.args.get(f'{section}_version')
+        for section in ('notifications', 'messages', 'calls', 'session')
+    }
+    data = build_heartbeat(
+        user.id,
+        versions=versions,
+        partner_id=request.args.get('conversation', type=int),
+        after_id=request.args.get('after_id', type=int),
+        session_id=request.args.get('session', type=int)
+    )
+    data['success'] = True
+    response = jsonify(data)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+# Real-time event routes
+EVENT_STREAM_MAX_SECONDS = 55
+EVENT_STREAM_KEEPALIVE_SECONDS = 15
+EVENT_POLL_MAX_TIMEOUT = 25
+
+@app.route('/api/events/stream')
+@login_required
+def event_stream():
+    """Server-sent events for new messages, notification counts and session status"""
+    from event_bus import get_event_bus, format_sse
+
+    bus = get_event_bus()
+    user_id = flask_session['user_id']
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('last_event_id', 0, type=int)
+
+    if not bus.acquire_stream_slot():
+        # Every stream holds a worker thread; send the browser to long-polling instead
+        response = make_response('', 503)
+        response.headers['Retry-After'] = '30'
+        return response
+
+    def generate():
+        subscription = bus.subscribe(user_id)
+        try:
+            yield f"retry: 3000\n\n"
+            for event in bus.events_since(user_id, last_event_id):
+                yield format_sse(event)
+
+            deadline = time.monotonic() + EVENT_STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=EVENT_STREAM_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield format_sse(event)
+            # Close periodically so the browser reconnects and the thread is returned to the pool
+        finally:
+            subscription.close()
+            bus.release_stream_slot()
+
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/events/poll')
+@login_required
+def event_poll():
+    """Long-poll fallback: wait for events newer than last_event_id"""
+    from event_bus import get_event_bus, public_event
+
+    bus = get_event_bus()
+    user_id = flask_session['user_id']
+    last_event_id = request.args.get('last_event_id', 0, type=int)
+    timeout = max(0, min(request.args.get('timeout', EVENT_POLL_MAX_TIMEOUT, type=int), EVENT_POLL_MAX_TIMEOUT))
+
+    # Subscribe before reading the buffer so nothing published in between is missed
+    with bus.subscribe(user_id) as subscription:
+        events = bus.events_since(user_id, last_event_id)
+        if not events and timeout and bus.acquire_stream_slot():
+            try:
+                event = subscription.get(timeout=timeout)
+                if event is not None:
+                    events = [event] + subscription.drain()
+            finally:
+                bus.release_stream_slot()
+
+    events = sorted({e['id']: e for e in events if e['id'] > last_event_id}.values(), key=lambda e: e['id'])
+    return jsonify({
+        'success': True,
+        'events': [public_event(e) for e in events],
+        'last_event_id': events[-1]['id'] if events else last_event_id
+    })
+
 @app.route('/notifications')
 @login_required
 def notifications_page():
@@ -6621,22 +6772,8 @@ def notifications_page():
         user = get_current_user()
         
         # Check if notification table exists
-        from sqlalchemy import text
-        try:
-            result = get_db().session.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'notification'
-                );
-            """))
-            table_exists = result.scalar()
-            
-            if not table_exists:
-                # Return empty notifications if table doesn't exist
-                return render_template('notifications/notifications.html', notifications=[])
-        except Exception:
-            # If we can't check table existence, return empty notifications
+        if not has_table('notification'):
+            # Return empty notifications if table doesn't exist
             return render_template('notifications/notifications.html', notifications=[])
         
         # Table exists, get notifications
@@ -7786,16 +7923,7 @@ def create_scheduled_session_table():
         db = get_db()
         
         # Check if table already exists
-        result = db.session.execute(text("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'scheduled_session'
-            );
-        """))
-        table_exists = result.scalar()
-        
-        if table_exists:
+        if has_table('scheduled_session'):
             flash('Scheduled session table already exists!', 'info')
             return redirect(url_for('admin_dashboard'))
         
@@ -8195,7 +8323,7 @@ def api_check_availability(coach_id):
         scheduled_time = datetime.strptime(time_str, '%H:%M').time()
         
         available = check_call_availability(
-            coach_id, scheduled_date, scheduled_time, timezone_name, duration
+            coach_id, scheduled_date, scheduled_time, timezone_name, duration, use_cache=True
         )
         
         return jsonify({
@@ -8285,6 +8413,7 @@ def scheduler_webhook():
             mark_overdue_calls,
             cleanup_old_notifications,
             auto_complete_sessions,
+            send_queued_emails,
             init_notification_scheduler
         )
         
@@ -8340,6 +8469,10 @@ def scheduler_webhook():
             # Advanced notification tasks
             if task_type in ['all', 'advanced_notifications']:
                 results['advanced_notifications'] = send_pending_notifications()
+            
+            # Last, so the emails the tasks above queued go out in this call
+            if task_type in ['all', 'email_outbox']:
+                results['email_outbox'] = send_queued_emails()
                 
         except Exception as scheduler_error:
             app.logger.error(f"Scheduler function error: {scheduler_error}")
@@ -2,9 +2,14 @@ import os
 import logging
 from datetime import datetime, timedelta, timezone
 from flask import current_app
-from models import ScheduledCall, CallNotification, User, Contract, Message
-from email_utils import send_email
+from sqlalchemy import inspect as sa_inspect, text
+from models import ScheduledCall, CallNotification, User, Contract, Message, CALL_NOTIFICATION_LEDGER_INDEX
+from schema_capabilities import has_table
+from email_utils import send_template_emails, email_url
+from timezone_utils import get_formatter
 from notification_utils import create_system_notification
+from booking_guard import commit_booking
+from calendar_events import get_upcoming
 import pytz
 
 logger = logging.getLogger(__name__)
@@ -158,7 +163,7 @@ def schedule_free_consultation(student_id, coach_id, scheduled_date, scheduled_t
         
         session = get_db_session()
         session.add(call)
-        session.commit()
+        commit_booking(session)
         
         # Create CALL_SCHEDULED message in chat
         create_call_scheduled_message(call, session)
@@ -205,7 +210,7 @@ def schedule_paid_session(student_id, coach_id, contract_id, scheduled_date, sch
         
         session = get_db_session()
         session.add(call)
-        session.commit()
+        commit_booking(session)
         
         # Create CALL_SCHEDULED message in chat
         create_call_scheduled_message(call, session)
@@ -220,79 +225,126 @@ def schedule_paid_session(student_id, coach_id, contract_id, scheduled_date, sch
         logger.error(f"Error scheduling paid session: {e}")
         raise
 
+def claim_call_notifications(call_ids, notification_type, session):
+    """
+    Claim notification_type for the given calls and return the ids claimed, in one
+    INSERT ... ON CONFLICT DO NOTHING RETURNING on the call_notification ledger.
+    Calls that already have this notification, sent or being sent by another worker,
+    are left out, so each type goes out once per call.
+    """
+    call_ids = list(dict.fromkeys(call_ids))
+    if not call_ids:
+        return set()
+    
+    if session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = CallNotification.__table__
+    now = datetime.utcnow()
+    claimed = session.execute(
+        insert(table).values([
+            {'call_id': call_id, 'notification_type': notification_type, 'sent_at': now}
+            for call_id in call_ids
+        ]).on_conflict_do_nothing(
+            index_elements=['call_id', 'notification_type']
+        ).returning(table.c.call_id)
+    ).scalars().all()
+    session.commit()
+    return set(claimed)
+
+def ensure_call_notification_ledger(connection):
+    """
+    Add the unique (call_id, notification_type) index to call_notification tables
+    created before it, keeping the first row of any duplicates
+    """
+    if not has_table('call_notification', connection):
+        return False
+    if any(index['name'] == CALL_NOTIFICATION_LEDGER_INDEX
+           for index in sa_inspect(connection).get_indexes('call_notification')):
+        return False
+    
+    duplicates = connection.execute(text(
+        "DELETE FROM call_notification WHERE id NOT IN "
+        "(SELECT MIN(id) FROM call_notification GROUP BY call_id, notification_type)"
+    )).rowcount
+    connection.execute(text(
+        f"CREATE UNIQUE INDEX {CALL_NOTIFICATION_LEDGER_INDEX} "
+        f"ON call_notification (call_id, notification_type)"
+    ))
+    logger.info(f"Added {CALL_NOTIFICATION_LEDGER_INDEX} ({duplicates} duplicate notifications removed)")
+    return True
+
 def send_call_notifications(call, notification_type, session=None):
     """
-    Send notifications for call events
+    Send notifications for call events, unless this type was already sent for the call
     """
     try:
-        # Create notification record
-        notification = CallNotification(
-            call_id=call.id,
-            notification_type=notification_type
-        )
-        
         if session is None:
             session = get_db_session()
             should_close = True
         else:
             should_close = False
-            
-        session.add(notification)
-        session.commit()
+        
+        # Claim the ledger row first; another worker may already own it
+        claimed = claim_call_notifications([call.id], notification_type, session)
         
         if should_close:
             session.close()
         
-        # Send email notifications
-        if notification_type == 'scheduled':
-            send_call_scheduled_emails(call)
-        elif notification_type == 'reminder_24h':
-            send_call_reminder_emails(call, '24h')
-        elif notification_type == 'reminder_1h':
-            send_call_reminder_emails(call, '1h')
-        elif notification_type == 'ready':
-            send_call_ready_notifications(call)
+        if call.id not in claimed:
+            logger.info(f"Skipping {notification_type} notification for call {call.id}: already sent")
+            return False
         
-        # Send in-app notifications
-        send_in_app_call_notifications(call, notification_type)
+        deliver_call_notification(call, notification_type)
+        return True
         
     except Exception as e:
         logger.error(f"Error sending call notifications: {e}")
+        return False
+
+def deliver_call_notification(call, notification_type):
+    """
+    Send the emails and in-app notifications of a claimed call notification
+    """
+    # Send email notifications
+    if notification_type == 'scheduled':
+        send_call_scheduled_emails(call)
+    elif notification_type == 'reminder_24h':
+        send_call_reminder_emails(call, '24h')
+    elif notification_type == 'reminder_1h':
+        send_call_reminder_emails(call, '1h')
+    elif notification_type == 'ready':
+        send_call_ready_notifications(call)
+    
+    # Send in-app notifications
+    send_in_app_call_notifications(call, notification_type)
+
+def call_email_recipients(call, student, coach):
+    """(address, context) for the student and the coach of a call, each in their own timezone"""
+    return [
+        (user.email, {
+            'user_name': user.first_name,
+            'other_name': other.first_name,
+            'role': role,
+            'call_time': get_formatter(user.timezone).format(call.scheduled_at),
+        })
+        for user, other, role in ((student, coach, 'student'), (coach, student, 'coach'))
+    ]
 
 def send_call_scheduled_emails(call):
     """
     Send confirmation emails when call is scheduled
     """
     try:
-        # Email to student
         student = User.query.get(call.student_id)
         coach = User.query.get(call.coach_id)
         
-        if call.is_free_consultation:
-            subject = f"Free Consultation Scheduled with {coach.first_name}"
-            template = 'emails/free_consultation_scheduled.html'
-        else:
-            subject = f"Learning Session Scheduled with {coach.first_name}"
-            template = 'emails/paid_session_scheduled.html'
-        
-        # Send to student
-        send_email(
-            to_email=student.email,
-            subject=subject,
-            template=template,
-            call=call,
-            student=student,
-            coach=coach
-        )
-        
-        # Send to coach
-        send_email(
-            to_email=coach.email,
-            subject=f"New {call.call_type.replace('_', ' ').title()} Scheduled",
-            template=template,
-            call=call,
-            student=student,
-            coach=coach
+        send_template_emails(
+            'call_scheduled', call_email_recipients(call, student, coach), commit=True,
+            call_label='Free Consultation' if call.is_free_consultation else 'Learning Session',
+            call_duration=call.duration_minutes,
+            calls_url=email_url('/calls'),
         )
         
     except Exception as e:
@@ -306,31 +358,11 @@ def send_call_reminder_emails(call, reminder_type):
         student = User.query.get(call.student_id)
         coach = User.query.get(call.coach_id)
         
-        if reminder_type == '24h':
-            subject = f"Reminder: Your call with {coach.first_name} is tomorrow"
-            template = 'emails/call_reminder_24h.html'
-        else:
-            subject = f"Reminder: Your call with {coach.first_name} starts in 1 hour"
-            template = 'emails/call_reminder_1h.html'
-        
-        # Send to student
-        send_email(
-            to_email=student.email,
-            subject=subject,
-            template=template,
-            call=call,
-            student=student,
-            coach=coach
-        )
-        
-        # Send to coach
-        send_email(
-            to_email=coach.email,
-            subject=subject,
-            template=template,
-            call=call,
-            student=student,
-            coach=coach
+        send_template_emails(
+            'call_reminder', call_email_recipients(call, student, coach), commit=True,
+            time_until='24 hours' if reminder_type == '24h' else '1 hour',
+            call_duration=call.duration_minutes,
+            join_url=email_url(f"/calls/{call.id}/join"),
         )
         
     except Exception as e:
@@ -391,39 +423,31 @@ def send_in_app_call_notifications(call, notification_type):
 
 
 
-def check_call_availability(coach_id, scheduled_date, scheduled_time, timezone_name, duration_minutes=15):
+def check_call_availability(coach_id, scheduled_date, scheduled_time, timezone_name, duration_minutes=15,
+                            use_cache=False):
     """
     Check if coach is available at the specified time
+    
+    Any booking on the coach's calendar (calls, scheduled sessions, contract sessions)
+    makes the time unavailable. use_cache answers from the occupancy bitmaps; leave it
+    off right before creating a call.
     """
     try:
         # Convert to UTC
         user_tz = pytz.timezone(timezone_name)
         local_dt = user_tz.localize(datetime.combine(scheduled_date, scheduled_time))
         utc_dt = local_dt.astimezone(pytz.UTC)
-        
-        # Check for conflicts
         end_time = utc_dt + timedelta(minutes=duration_minutes)
         
-        # Get all scheduled calls for the coach that might conflict
-        conflicting_calls = ScheduledCall.query.filter(
-            ScheduledCall.coach_id == coach_id,
-            ScheduledCall.status == 'scheduled'
-        ).all()
-        
-        # Check for time overlaps
-        for call in conflicting_calls:
-            # Ensure call.scheduled_at is timezone-aware (assume UTC if naive)
-            call_scheduled_at = call.scheduled_at
-            if call_scheduled_at.tzinfo is None:
-                call_scheduled_at = pytz.UTC.localize(call_scheduled_at)
-            
-            call_end_time = call_scheduled_at + timedelta(minutes=call.duration_minutes)
-            
-            # Check if there's an overlap
-            if (utc_dt < call_end_time and end_time > call_scheduled_at):
-                return False
+        if use_cache:
+            from occupancy_bitmap import is_coach_busy
+            busy = is_coach_busy(coach_id, utc_dt, end_time)
+            if busy is not None:
+                return not busy
         
-        return True
+        # Only bookings overlapping the requested window are read
+        from free_busy import get_conflicts
+        return not get_conflicts(coach_id, utc_dt, end_time)
         
     except Exception as e:
         logger.error(f"Error checking call availability: {e}")
@@ -434,14 +458,7 @@ def get_upcoming_calls(user_id, limit=10):
     Get upcoming calls for a user
     """
     try:
-        # Use a timezone-naive datetime for comparison since database stores naive datetimes
-        now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
-        
-        calls = ScheduledCall.query.filter(
-            ScheduledCall.student_id == user_id,
-            ScheduledCall.status == 'scheduled',
-            ScheduledCall.scheduled_at > now_utc
-        ).order_by(ScheduledCall.scheduled_at).limit(limit).all()
+        calls = get_upcoming(ScheduledCall, user_id, 'student', ['scheduled'], limit)
         
         return calls
         
@@ -454,14 +471,7 @@ def get_coach_upcoming_calls(coach_id, limit=10):
     Get upcoming calls for a coach
     """
     try:
-        # Use a timezone-naive datetime for comparison since database stores naive datetimes
-        now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
-        
-        calls = ScheduledCall.query.filter(
-            ScheduledCall.coach_id == coach_id,
-            ScheduledCall.status == 'scheduled',
-            ScheduledCall.scheduled_at > now_utc
-        ).order_by(ScheduledCall.scheduled_at).limit(limit).all()
+        calls = get_upcoming(ScheduledCall, coach_id, 'coach', ['scheduled'], limit)
         
         return calls
         
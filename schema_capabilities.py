@@ -0,0 +1,120 @@
+"""
+Schema Capabilities registry for optional tables and columns
+Introspects the database once per worker and answers has_table / has_column from memory,
+so request handlers and scheduler jobs no longer query information_schema on every call.
+The snapshot is dropped whenever DDL runs in this process (migrations, schema fixes)
+and on SIGHUP, and is rebuilt on the next lookup.
+"""
+
+import logging
+import re
+import signal
+import threading
+import weakref
+from typing import Dict, FrozenSet, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_DDL_STATEMENT = re.compile(r'\s*(CREATE|ALTER|DROP)\b', re.IGNORECASE)
+
+class SchemaCapabilities:
+    """Per-engine snapshot of table names and their columns"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = weakref.WeakKeyDictionary()
+        self.load_count = 0
+
+    def snapshot(self, connection=None) -> Dict[str, FrozenSet[str]]:
+        """Table -> column names for the connection's engine, introspected on first use"""
+        if connection is None:
+            from models import db
+            connection = db.session.connection()
+
+        engine = connection.engine
+        tables = self._snapshots.get(engine)
+        if tables is None:
+            tables = self._introspect(connection)
+            with self._lock:
+                self._snapshots[engine] = tables
+        return tables
+
+    def has_table(self, table_name: str, connection=None) -> bool:
+        """True when the table exists"""
+        return table_name in self.snapshot(connection)
+
+    def has_column(self, table_name: str, column_name: str, connection=None) -> bool:
+        """True when the table exists and has the column"""
+        return column_name in self.snapshot(connection).get(table_name, ())
+
+    def refresh(self, engine: Optional[Engine] = None):
+        """Forget the snapshot for one engine (or all); the next lookup introspects again"""
+        with self._lock:
+            if engine is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(engine, None)
+
+    def _introspect(self, connection) -> Dict[str, FrozenSet[str]]:
+        # One catalog round-trip on Postgres (get_multi_columns), one PRAGMA per table on SQLite
+        columns = inspect(connection).get_multi_columns()
+        tables = {table: frozenset(column['name'] for column in table_columns)
+                  for (_, table), table_columns in columns.items()}
+        self.load_count += 1
+        logger.info(f"Schema capabilities loaded: {len(tables)} tables")
+        return tables
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _refresh_after_ddl(conn, cursor, statement, parameters, context, executemany):
+    """Any CREATE / ALTER / DROP run in this process invalidates the snapshot"""
+    if _DDL_STATEMENT.match(statement):
+        schema_capabilities.refresh(conn.engine)
+
+# Global schema capabilities instance
+schema_capabilities = SchemaCapabilities()
+
+def get_schema_capabilities() -> SchemaCapabilities:
+    """Get the global schema capabilities instance"""
+    return schema_capabilities
+
+def has_table(table_name: str, connection=None) -> bool:
+    """True when the table exists in the current database"""
+    return schema_capabilities.has_table(table_name, connection)
+
+def has_column(table_name: str, column_name: str, connection=None) -> bool:
+    """True when the column exists in the current database"""
+    return schema_capabilities.has_column(table_name, column_name, connection)
+
+def refresh_schema_capabilities(engine: Optional[Engine] = None):
+    """Re-introspect on the next lookup (after out-of-process migrations, for example)"""
+    schema_capabilities.refresh(engine)
+
+def install_sighup_handler():
+    """Refresh on SIGHUP (e.g. `kill -HUP <worker pid>` after running migrations)"""
+    previous = signal.getsignal(signal.SIGHUP)
+
+    def handle_sighup(signum, frame):
+        logger.info("SIGHUP received, refreshing schema capabilities")
+        schema_capabilities.refresh()
+        if callable(previous):
+            previous(signum, frame)
+
+    try:
+        signal.signal(signal.SIGHUP, handle_sighup)
+        return True
+    except (ValueError, AttributeError):
+        # Not on the main thread, or no SIGHUP on this platform
+        return False
+
+def init_schema_capabilities(app):
+    """Load the snapshot for this worker and hook up SIGHUP refreshes"""
+    from models import db
+
+    with app.app_context():
+        schema_capabilities.refresh(db.engine)
+        with db.engine.connect() as connection:
+            tables = schema_capabilities.snapshot(connection)
+    install_sighup_handler()
+    return tables
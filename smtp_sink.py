@@ -0,0 +1,128 @@
+"""
+Local SMTP sink
+A stand-in mail server for development and tests: it speaks just enough SMTP for
+smtplib and Flask-Mail, keeps every message in memory instead of delivering it, and
+counts connections so tests can see how many messages shared one. Chosen recipients
+can be refused to exercise retries and dead-lettering. Run `python smtp_sink.py [port]`
+and set MAIL_SERVER=127.0.0.1, MAIL_PORT=<port>, MAIL_USE_TLS=false to watch what the app sends.
+"""
+
+import socketserver
+import sys
+import threading
+from collections import namedtuple
+
+SunkMessage = namedtuple('SunkMessage', ['connection', 'mail_from', 'rcpt_tos', 'data'])
+
+def address(argument: str) -> str:
+    """The address in a MAIL FROM:<...> or RCPT TO:<...> argument"""
+    value = argument.split(':', 1)[1].strip()
+    if value.startswith('<'):
+        value = value[1:value.index('>')]
+    return value.split()[0] if value else value
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """One SMTP session"""
+
+    def reply(self, line: str):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        sink = self.server.sink
+        connection = sink.opened()
+        mail_from, rcpt_tos = None, []
+        self.reply('220 smtp-sink ESMTP ready')
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            verb = line.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-smtp-sink')
+                self.reply('250-8BITMIME')
+                self.reply('250 SMTPUTF8')
+            elif verb == 'HELO':
+                self.reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                mail_from, rcpt_tos = address(line), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = address(line)
+                if recipient in sink.reject:
+                    self.reply(f'{sink.reject[recipient]} mailbox unavailable')
+                else:
+                    rcpt_tos.append(recipient)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                if not rcpt_tos:
+                    self.reply('503 no valid recipients')
+                    continue
+                self.reply('354 end data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                sink.received(SunkMessage(connection, mail_from, rcpt_tos, b''.join(lines)))
+                mail_from, rcpt_tos = None, []
+                self.reply('250 OK queued')
+            elif verb == 'RSET':
+                mail_from, rcpt_tos = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                break
+            else:
+                self.reply('502 command not implemented')
+
+class SMTPSink:
+    """A threaded SMTP server on localhost collecting messages in memory"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, reject=None):
+        self.messages = []
+        self.connections = 0
+        # recipient -> SMTP code given to RCPT TO, e.g. {'gone@example.com': 550}
+        self.reject = dict(reject or {})
+        self._lock = threading.Lock()
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), SMTPSinkHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+        self.host, self.port = self.server.server_address
+        self._thread = None
+
+    def opened(self) -> int:
+        with self._lock:
+            self.connections += 1
+            return self.connections
+
+    def received(self, message: SunkMessage):
+        with self._lock:
+            self.messages.append(message)
+
+    def recipients(self) -> list:
+        """Every delivered recipient, in delivery order"""
+        return [recipient for message in self.messages for recipient in message.rcpt_tos]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+if __name__ == '__main__':
+    sink = SMTPSink(port=int(sys.argv[1]) if len(sys.argv) > 1 else 1025)
+    print(f"📭 SMTP sink listening on {sink.host}:{sink.port}")
+    try:
+        sink.server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"📭 {len(sink.messages)} messages over {sink.connections} connections")
@@ -0,0 +1,96 @@
+class EventStreamClient {
+    constructor() {
+        this.source = null;
+        this.lastEventId = 0;
+        this.connected = false;
+        this.polling = false;
+        this.eventTypes = ['message', 'notification_count', 'session_status'];
+
+        this.init();
+    }
+
+    init() {
+        if (window.EventSource) {
+            this.connect();
+        } else {
+            this.startLongPoll();
+        }
+    }
+
+    connect() {
+        this.source = new EventSource('/api/events/stream');
+
+        this.source.onopen = () => {
+            this.connected = true;
+        };
+
+        this.eventTypes.forEach(type => {
+            this.source.addEventListener(type, (e) => {
+                this.handleEvent(JSON.parse(e.data));
+            });
+        });
+
+        this.source.onerror = () => {
+            this.connected = false;
+            // CONNECTING means the browser retries on its own (the server closes streams periodically);
+            // CLOSED means the server refused the stream, so fall back to long-polling
+            if (this.source.readyState === EventSource.CLOSED) {
+                this.source = null;
+                this.startLongPoll();
+            }
+        };
+    }
+
+    async startLongPoll() {
+        if (this.polling) return;
+        this.polling = true;
+        this.connected = true;
+
+        while (this.polling) {
+            try {
+                const response = await fetch(`/api/events/poll?last_event_id=${this.lastEventId}&timeout=25`, {
+                    headers: { 'X-Requested-With': 'XMLHttpRequest' }
+                });
+                const data = await response.json();
+                if (data.success) {
+                    data.events.forEach(event => this.handleEvent(event));
+                    this.lastEventId = Math.max(this.lastEventId, data.last_event_id);
+                    if (data.events.length === 0) {
+                        // Poll returned without waiting (server busy); back off a little
+                        await this.sleep(2000);
+                    }
+                }
+            } catch (error) {
+                this.connected = false;
+                console.error('Error polling events:', error);
+                await this.sleep(5000);
+                this.connected = true;
+            }
+        }
+    }
+
+    handleEvent(event) {
+        if (event.id <= this.lastEventId) return;
+        this.lastEventId = event.id;
+        document.dispatchEvent(new CustomEvent(`skileez:${event.type}`, { detail: event.data }));
+    }
+
+    sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    // Public method for pages that keep a slower poll as a safety net
+    isConnected() {
+        return this.connected;
+    }
+}
+
+// Initialize the event stream when DOM is loaded
+document.addEventListener('DOMContentLoaded', function() {
+    window.eventStream = new EventStreamClient();
+});
+
+// Export for use in other scripts
+if (typeof module !== 'undefined' && module.exports) {
+    module.exports = EventStreamClient;
+}
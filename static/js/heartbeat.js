@@ -0,0 +1,108 @@
+class HeartbeatClient {
+    constructor() {
+        this.watchers = {};
+        this.versions = {};
+        this.timer = null;
+        this.inFlight = false;
+        this.pending = false;
+        this.slowInterval = 30000;
+    }
+
+    // Register a section handler: notifications, messages, calls or session.
+    // options.params() returns extra query parameters, options.interval the
+    // poll interval wanted while no event stream is connected.
+    watch(section, handler, options = {}) {
+        this.watchers[section] = {
+            handler: handler,
+            params: options.params || (() => ({})),
+            interval: options.interval || this.slowInterval
+        };
+        // A new watcher needs the full section on the next beat
+        delete this.versions[section];
+        this.schedule(50);
+    }
+
+    // Poll right away (e.g. after a pushed event)
+    refresh() {
+        this.schedule(0);
+    }
+
+    currentInterval() {
+        // Pushed events cover the fast path; keep a slow safety net while streaming
+        if (window.eventStream && window.eventStream.isConnected()) {
+            return this.slowInterval;
+        }
+        const intervals = Object.values(this.watchers).map(watcher => watcher.interval);
+        return Math.min(this.slowInterval, ...intervals);
+    }
+
+    schedule(delay) {
+        if (this.timer) {
+            clearTimeout(this.timer);
+        }
+        this.timer = setTimeout(() => this.beat(), delay);
+    }
+
+    buildUrl() {
+        const params = new URLSearchParams();
+        Object.entries(this.versions).forEach(([section, version]) => {
+            if (version) {
+                params.set(`${section}_version`, version);
+            }
+        });
+        Object.values(this.watchers).forEach(watcher => {
+            Object.entries(watcher.params()).forEach(([key, value]) => {
+                if (value !== null && value !== undefined) {
+                    params.set(key, value);
+                }
+            });
+        });
+        return `/api/heartbeat?${params.toString()}`;
+    }
+
+    async beat() {
+        if (Object.keys(this.watchers).length === 0) {
+            return;
+        }
+        if (this.inFlight) {
+            // Run again as soon as the current request finishes
+            this.pending = true;
+            return;
+        }
+
+        this.inFlight = true;
+        try {
+            const response = await fetch(this.buildUrl(), {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            });
+            const data = await response.json();
+
+            if (data.success) {
+                ['notifications', 'messages', 'calls', 'session'].forEach(section => {
+                    const payload = data[section];
+                    if (!payload) return;
+
+                    this.versions[section] = payload.version;
+                    const watcher = this.watchers[section];
+                    if (watcher && payload.changed) {
+                        watcher.handler(payload);
+                    }
+                });
+            }
+        } catch (error) {
+            console.error('Heartbeat failed:', error);
+        } finally {
+            this.inFlight = false;
+            this.schedule(this.pending ? 0 : this.currentInterval());
+            this.pending = false;
+        }
+    }
+}
+
+// Created immediately so page scripts can register watchers on DOMContentLoaded
+window.heartbeat = new HeartbeatClient();
+
+// Export for use in other scripts
+if (typeof module !== 'undefined' && module.exports) {
+    module.exports = HeartbeatClient;
+}
@@ -24,8 +24,11 @@ class NotificationManager {
         
         if (this.notificationBell) {
             this.setupEventListeners();
-            this.loadNotifications();
-            this.updateUnreadCount();
+            if (!window.heartbeat) {
+                // Without the heartbeat client, load the list and count directly
+                this.loadNotifications();
+                this.updateUnreadCount();
+            }
             this.startPolling();
         }
     }
@@ -363,6 +366,36 @@ class NotificationManager {
     }
 
     startPolling() {
+        // Pushed counts arrive through the event stream
+        document.addEventListener('skileez:notification_count', (e) => {
+            const oldCount = this.unreadCount;
+            this.unreadCount = e.detail.count;
+            this.updateBadge();
+            if (window.heartbeat) {
+                // The heartbeat brings the updated list (and its toast) right away
+                window.heartbeat.refresh();
+            } else if (this.unreadCount > oldCount) {
+                const newCount = this.unreadCount - oldCount;
+                this.showToast(`You have ${newCount} new notification${newCount > 1 ? 's' : ''}`, 'info');
+                if (this.isDropdownOpen) {
+                    this.loadNotifications();
+                }
+            }
+        });
+
+        // The shared heartbeat replaces the separate 30 second unread-count poll
+        if (window.heartbeat) {
+            window.heartbeat.watch('notifications', (section) => {
+                this.unreadCount = section.unread_count;
+                this.updateBadge();
+                if (section.notifications) {
+                    this.renderNotifications(section.notifications);
+                    this.checkForNewNotifications(section.notifications);
+                }
+            });
+            return;
+        }
+
         // Update unread count every 30 seconds
         this.pollingInterval = setInterval(() => {
             this.updateUnreadCount();
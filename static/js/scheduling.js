@@ -396,6 +396,15 @@ class SchedulingManager {
     }
 
     startPolling() {
+        // The shared heartbeat carries upcoming calls when it is loaded
+        if (window.heartbeat) {
+            window.heartbeat.watch('calls', (section) => {
+                this.upcomingCalls = section.calls;
+                this.updateUpcomingCallsDisplay();
+            });
+            return;
+        }
+
         // Poll for updates every 30 seconds
         setInterval(() => {
             this.loadUpcomingCalls();
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test Alternative Time Suggestions for Skileez
+This script checks that the K nearest free starts found in one sweep over the
+occupancy bitmaps match a brute-force scan of the slot engine, that the suggest
+API returns ranked free times, and that a warm 60-day search is sub-millisecond.
+"""
+
+import sys
+import os
+import random
+import time as timer
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from models import db, ScheduledCall, CoachAvailability, AvailabilityException
+from testing_app import make_test_app, add_users, check_timing
+from free_busy import get_free_busy_engine
+from occupancy_bitmap import get_occupancy_cache, fit_mask, grid_mask
+
+# US clocks go forward on Sunday 10 March 2030; the 11th is a Monday
+MONDAY = date(2030, 3, 11)
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app():
+    """One coach working 9:00-17:00 New York time on weekdays with random calls, and a student"""
+    import routes
+
+    app = make_test_app(views=[('/api/coaches/<int:coach_id>/suggest-times', routes.suggest_alternative_times_api,
+                                ['POST'])])
+    random.seed(5)
+    with app.app_context():
+        add_users((1, 2))
+        availability = CoachAvailability(coach_id=1, timezone='America/New_York', session_duration=60,
+                                         buffer_after=0, saturday_start=0, saturday_end=0,
+                                         sunday_start=0, sunday_end=0)
+        for day in ('monday', 'tuesday', 'wednesday', 'thursday', 'friday'):
+            setattr(availability, f'{day}_start', 9 * 60)
+            setattr(availability, f'{day}_end', 17 * 60)
+        db.session.add(availability)
+        db.session.flush()
+        # Two calls a day, one in each half of the working day
+        for offset in range(-7, 70):
+            day = MONDAY + timedelta(days=offset)
+            for hour in (random.choice((13, 14, 15)), random.choice((17, 18, 19))):
+                db.session.add(ScheduledCall(student_id=2, coach_id=1, call_type='paid_session',
+                                             scheduled_at=at(day, hour, random.choice((0, 10, 15, 40))),
+                                             duration_minutes=random.choice((15, 45, 60))))
+        db.session.add(AvailabilityException(availability_id=availability.id, date=MONDAY + timedelta(days=1)))
+        db.session.commit()
+        get_free_busy_engine().get_slots(1, MONDAY, MONDAY)  # table checks run once per engine
+    get_occupancy_cache().clear()
+    return app
+
+
+def brute_force(requested, duration, limit, horizon_days, not_before):
+    """Nearest starts on the 15-minute grid from the slot engine's 5-minute slots"""
+    window_start = max(requested - timedelta(days=horizon_days), not_before)
+    window_end = requested + timedelta(days=horizon_days)
+    slots = get_free_busy_engine().get_slots(1, window_start.date() - timedelta(days=1),
+                                             window_end.date() + timedelta(days=1), duration, step_minutes=5)
+    starts = {slot['start_utc'].replace(tzinfo=None) for day_slots in slots.values() for slot in day_slots}
+    starts = [start for start in starts
+              if window_start <= start <= window_end and start.minute % 15 == 0]
+    return sorted(starts, key=lambda start: (abs(start - requested), start))[:limit]
+
+
+def test_bit_helpers():
+    """Runs of free cells and grid masks"""
+    print("=" * 60)
+    print("ALTERNATIVE TIME SUGGESTION TEST")
+    print("=" * 60)
+
+    free = int('0111101110111111', 2)
+    for cells in (1, 2, 3, 4, 5, 6, 7):
+        expected = sum(1 << i for i in range(16) if all(free >> (i + k) & 1 for k in range(cells)))
+        assert fit_mask(free, cells) == expected, cells
+    assert grid_mask(20, 3, 2) == sum(1 << i for i in range(2, 20, 3))
+    assert grid_mask(5, 10) == 1
+    print("✅ Run and grid masks")
+
+
+def test_nearest_starts_match_brute_force():
+    """The sweep finds the same K nearest starts as checking every slot, across DST"""
+    app = create_test_app()
+    occupancy = get_occupancy_cache()
+    random.seed(9)
+    with app.app_context():
+        for _ in range(25):
+            requested = at(MONDAY + timedelta(days=random.randint(-3, 20)), random.randint(0, 23),
+                           random.choice((0, 7, 15, 30, 50)))
+            duration = random.choice((15, 30, 60, 90))
+            limit = random.choice((1, 5, 12))
+            not_before = requested - timedelta(hours=random.choice((1, 30, 500)))
+            found = occupancy.nearest_free_starts(1, requested, duration, limit, horizon_days=10,
+                                                  not_before=not_before)
+            assert found == brute_force(requested, duration, limit, 10, not_before), (requested, duration)
+        # The blocked Tuesday never shows up, and nothing is offered before not_before
+        tuesday = at(MONDAY + timedelta(days=1), 15)
+        found = occupancy.nearest_free_starts(1, tuesday, 60, 20, not_before=tuesday - timedelta(hours=30))
+        assert all(start.date() != tuesday.date() for start in found)
+        assert min(found) >= tuesday - timedelta(hours=30)
+    print("✅ Nearest starts match a brute-force scan")
+
+
+def test_suggest_api_ranks_free_times():
+    """The API returns ranked, free suggestions nearest to a busy request"""
+    app = create_test_app()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+
+    with app.app_context():
+        busy_call = ScheduledCall.query.filter(
+            ScheduledCall.scheduled_at >= at(MONDAY + timedelta(days=2), 0)
+        ).order_by(ScheduledCall.scheduled_at).first()
+        requested = busy_call.scheduled_at
+    data = client.post('/api/coaches/1/suggest-times', json={
+        'start_time': requested.isoformat() + 'Z', 'duration_minutes': 60, 'limit': 8
+    }).get_json()
+    suggestions = data['suggestions']
+    assert [suggestion['rank'] for suggestion in suggestions] == list(range(1, 9))
+    assert [suggestion['time_diff_hours'] for suggestion in suggestions] == \
+        sorted(suggestion['time_diff_hours'] for suggestion in suggestions)
+
+    with app.app_context():
+        from availability_manager import suggest_alternative_times, check_coach_availability
+        direct = suggest_alternative_times(1, requested, requested + timedelta(hours=1), 60, limit=8)
+        assert len(direct) == 8 and direct[0]['start_time'] != requested
+        for suggestion in direct:
+            # 2030 is beyond the one-year booking limit, so only conflicts are checked
+            assert check_coach_availability(1, suggestion['start_time'], suggestion['end_time'])['conflicts'] == []
+
+    response = client.post('/api/coaches/1/suggest-times', json={'start_time': requested.isoformat(), 'limit': 0})
+    assert response.status_code == 400
+    print(f"✅ API ranked {len(suggestions)} suggestions, nearest {suggestions[0]['time_diff_hours']}h away")
+
+
+def test_sixty_day_horizon_is_sub_millisecond():
+    """A cold 60-day search costs a fixed number of queries; warm searches run in under a millisecond"""
+    app = create_test_app()
+    occupancy = get_occupancy_cache()
+    requested = at(MONDAY + timedelta(days=3), 15)
+    not_before = at(MONDAY, 0)
+
+    with app.app_context():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            occupancy.nearest_free_starts(1, requested, 60, 5, horizon_days=60, not_before=not_before)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        # Availability settings, exceptions, busy intervals
+        assert len(statements) == 3, len(statements)
+
+        timings = []
+        for _ in range(50):
+            start = timer.perf_counter()
+            found = occupancy.nearest_free_starts(1, requested, 60, 5, horizon_days=60, not_before=not_before)
+            timings.append(timer.perf_counter() - start)
+        assert len(found) == 5
+        best = min(timings)
+        check_timing(best < 0.001, f"warm search took {best * 1000:.3f}ms, budget 1ms")
+    print(f"✅ 60-day horizon: cold in {len(statements)} queries, warm in {best * 1000:.3f}ms")
+
+
+if __name__ == '__main__':
+    test_bit_helpers()
+    test_nearest_starts_match_brute_force()
+    test_suggest_api_ranks_free_times()
+    test_sixty_day_horizon_is_sub_millisecond()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Test Database-Enforced Booking Conflicts for Skileez
+This script fires 100 parallel bookings at the same slot and checks that exactly one
+commits, that every kind of booking is covered by the calendar_event overlap trigger,
+and that cancelling, rescheduling and backfilling keep calendar_event in step.
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, date, time
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import (
+    db, LearningRequest, Proposal, Session, ScheduledSession, ScheduledCall, CalendarEvent
+)
+from testing_app import make_test_app, add_user
+from booking_guard import BookingConflictError, commit_booking
+from calendar_events import get_calendar_event_store
+
+# A Monday, far enough ahead to never be in the past
+MONDAY = date(2030, 6, 3)
+COACH_ID = 1
+STUDENT_COUNT = 100
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app(database_path):
+    """One coach, 100 students and a pending contract session for each of them"""
+    app = make_test_app(f'sqlite:///{database_path}',
+                        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 60}, 'pool_size': 20})
+    with app.app_context():
+        add_user(COACH_ID, 'coach@example.com', last_name='Coach')
+        for student_id in range(2, STUDENT_COUNT + 2):
+            add_user(student_id, f'student{student_id}@example.com', last_name='Student')
+        db.session.flush()
+        request = LearningRequest(student_id=2, title='Python', description='Learn Python')
+        db.session.add(request)
+        db.session.flush()
+        proposal = Proposal(learning_request_id=request.id, coach_id=COACH_ID, cover_letter='Hi',
+                            session_count=STUDENT_COUNT, price_per_session=10, session_duration=60,
+                            total_price=10 * STUDENT_COUNT)
+        db.session.add(proposal)
+        db.session.flush()
+        for number in range(1, STUDENT_COUNT + 1):
+            db.session.add(Session(id=number, proposal_id=proposal.id, session_number=number, status='pending'))
+        db.session.commit()
+    return app
+
+
+def ranges(app):
+    """Busy calendar rows: the ones the overlap trigger compares"""
+    with app.app_context():
+        return [(row.source_type, row.source_id, row.starts_at.strftime('%H:%M'))
+                for row in CalendarEvent.query.filter_by(busy=True).order_by(CalendarEvent.starts_at,
+                                                                             CalendarEvent.id)]
+
+
+def test_parallel_bookings_for_one_slot():
+    """100 students booking the same slot at once: one wins, 99 get a conflict"""
+    print("=" * 60)
+    print("BOOKING CONFLICT TEST")
+    print("=" * 60)
+
+    directory = tempfile.mkdtemp()
+    try:
+        app = create_test_app(os.path.join(directory, 'bookings.db'))
+        barrier = threading.Barrier(STUDENT_COUNT)
+        results = []
+
+        def book(student_id):
+            from utils import book_session
+            with app.app_context():
+                barrier.wait()
+                try:
+                    booked = book_session(COACH_ID, student_id, student_id - 1, at(MONDAY, 14), 60)
+                    results.append(('booked', booked.id))
+                except ValueError as e:
+                    results.append(('conflict', type(e).__name__))
+                except Exception as e:
+                    results.append(('error', repr(e)))
+
+        threads = [threading.Thread(target=book, args=(student_id,))
+                   for student_id in range(2, STUDENT_COUNT + 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        outcomes = [outcome for outcome, _ in results]
+        assert len(results) == STUDENT_COUNT
+        assert outcomes.count('booked') == 1, [result for result in results if result[0] != 'conflict']
+        assert outcomes.count('conflict') == STUDENT_COUNT - 1
+        with app.app_context():
+            assert ScheduledSession.query.count() == 1
+        assert ranges(app) == [('scheduled_session', dict(results)['booked'], '14:00')]
+        raced = sum(1 for outcome, name in results if name == 'BookingConflictError')
+        print(f"✅ 1 of {STUDENT_COUNT} parallel bookings committed ({raced} refused by the database)")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_every_booking_kind_is_guarded():
+    """Calls, scheduled sessions and contract sessions all refuse overlaps, even unchecked"""
+    directory = tempfile.mkdtemp()
+    try:
+        app = create_test_app(os.path.join(directory, 'bookings.db'))
+        with app.app_context():
+            db.session.add(ScheduledCall(student_id=2, coach_id=COACH_ID, call_type='free_consultation',
+                                         scheduled_at=at(MONDAY, 9), duration_minutes=15))
+            commit_booking(db.session)
+
+            for booking in (
+                ScheduledCall(student_id=3, coach_id=COACH_ID, call_type='paid_session',
+                              scheduled_at=at(MONDAY, 9, 10), duration_minutes=60),
+                ScheduledSession(session_id=2, coach_id=COACH_ID, student_id=3,
+                                 scheduled_at=at(MONDAY, 8, 30), duration_minutes=45),
+            ):
+                db.session.add(booking)
+                try:
+                    commit_booking(db.session)
+                    assert False, "overlapping booking was committed"
+                except BookingConflictError:
+                    pass
+
+            session = db.session.get(Session, 1)
+            session.status = 'scheduled'
+            session.scheduled_at = at(MONDAY, 9)
+            session.duration_minutes = 60
+            try:
+                commit_booking(db.session)
+                assert False, "overlapping session was committed"
+            except BookingConflictError:
+                pass
+
+            # Back to back is fine, and a session's own scheduled session may mirror it
+            session = db.session.get(Session, 1)
+            session.status = 'scheduled'
+            session.scheduled_at = at(MONDAY, 9, 15)
+            session.duration_minutes = 60
+            db.session.add(ScheduledSession(session_id=1, coach_id=COACH_ID, student_id=2,
+                                            scheduled_at=at(MONDAY, 9, 15), duration_minutes=60))
+            commit_booking(db.session)
+            row_ids = [row.id for row in CalendarEvent.query.order_by(CalendarEvent.id)]
+            # Starting the meeting keeps the session's row
+            session.status = 'active'
+            commit_booking(db.session)
+            assert [row.id for row in CalendarEvent.query.order_by(CalendarEvent.id)] == row_ids
+        assert sorted(row[0] for row in ranges(app)) == ['call', 'scheduled_session', 'session']
+        print("✅ Every booking kind is guarded")
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_cancel_and_reschedule_keep_ranges_in_step():
+    """Cancelling frees the slot; a call can be rescheduled into its own old slot"""
+    directory = tempfile.mkdtemp()
+    try:
+        app = create_test_app(os.path.join(directory, 'bookings.db'))
+        with app.app_context():
+            call = ScheduledCall(student_id=2, coach_id=COACH_ID, call_type='paid_session',
+                                 scheduled_at=at(MONDAY, 10), duration_minutes=60)
+            db.session.add(call)
+            commit_booking(db.session)
+
+            # Cancelling the old call and booking 30 minutes later happen in one flush
+            call.status = 'cancelled'
+            moved = ScheduledCall(student_id=2, coach_id=COACH_ID, call_type='paid_session',
+                                  scheduled_at=at(MONDAY, 10, 30), duration_minutes=60, rescheduled_from=call.id)
+            db.session.add(moved)
+            commit_booking(db.session)
+            assert ranges(app) == [('call', moved.id, '10:30')]
+
+            moved.status = 'cancelled'
+            commit_booking(db.session)
+            db.session.add(ScheduledCall(student_id=3, coach_id=COACH_ID, call_type='paid_session',
+                                         scheduled_at=at(MONDAY, 10), duration_minutes=60))
+            commit_booking(db.session)
+            assert [row[2] for row in ranges(app)] == ['10:00']
+
+            # Existing databases fill the table on first start; bookings that already clash stay off the busy set
+            CalendarEvent.query.delete()
+            db.session.commit()
+            ScheduledCall.query.filter_by(id=call.id).update({'status': 'scheduled'})
+            db.session.commit()
+            assert get_calendar_event_store().backfill_if_empty() == 3
+            assert get_calendar_event_store().backfill_if_empty() == 0
+            assert CalendarEvent.query.filter_by(source_id=moved.id).one().status == 'cancelled'
+        assert [row[2] for row in ranges(app)] == ['10:00']
+        print("✅ Cancelling and rescheduling keep calendar events in step")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    test_parallel_bookings_for_one_slot()
+    test_every_booking_kind_is_guarded()
+    test_cancel_and_reschedule_keep_ranges_in_step()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Test the Calendar Event Table for Skileez
+This script checks that calendar_event follows every booking through insert,
+reschedule, status change and delete, that busy time read from it matches the
+booking tables, that upcoming lists come from one query, and that the busy range
+read is answered from the coach index alone.
+"""
+
+import sys
+import os
+import random
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from models import (
+    db, LearningRequest, Proposal, Session, ScheduledSession, ScheduledCall, CalendarEvent
+)
+from testing_app import make_test_app, add_user
+from free_busy import get_free_busy_engine, SCHEDULED_SESSION_BUSY_STATUSES, SESSION_BUSY_STATUSES
+from calendar_events import get_calendar_event_store
+
+# A Monday, far enough ahead to never be in the past
+MONDAY = date(2030, 6, 3)
+COACH_ID = 1
+STUDENT_ID = 2
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app():
+    """One coach, one student and a contract with ten pending sessions"""
+    app = make_test_app()
+    with app.app_context():
+        add_user(COACH_ID, 'coach@example.com', last_name='Coach')
+        add_user(STUDENT_ID, 'student@example.com', last_name='Student')
+        db.session.flush()
+        request = LearningRequest(student_id=STUDENT_ID, title='Python', description='Learn Python')
+        db.session.add(request)
+        db.session.flush()
+        proposal = Proposal(learning_request_id=request.id, coach_id=COACH_ID, cover_letter='Hi',
+                            session_count=10, price_per_session=10, session_duration=60, total_price=100)
+        db.session.add(proposal)
+        db.session.flush()
+        for number in range(1, 11):
+            db.session.add(Session(id=number, proposal_id=proposal.id, session_number=number, status='pending'))
+        db.session.commit()
+    return app
+
+
+def event_row(source_type, source_id):
+    row = CalendarEvent.query.filter_by(source_type=source_type, source_id=source_id).first()
+    if row is None:
+        return None
+    return (row.coach_id, row.student_id, row.starts_at.strftime('%a %H:%M'), row.ends_at.strftime('%H:%M'),
+            row.status, row.busy)
+
+
+def test_rows_follow_their_bookings():
+    """Inserts, reschedules, status changes and deletes are mirrored in the same flush"""
+    print("=" * 60)
+    print("CALENDAR EVENT TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.app_context():
+        call = ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                             scheduled_at=at(MONDAY, 9), duration_minutes=30)
+        booked = ScheduledSession(session_id=3, coach_id=COACH_ID, student_id=STUDENT_ID,
+                                  scheduled_at=at(MONDAY, 11), duration_minutes=60)
+        db.session.add_all([call, booked])
+        db.session.commit()
+        assert event_row('call', call.id) == (COACH_ID, STUDENT_ID, 'Mon 09:00', '09:30', 'scheduled', True)
+        assert event_row('scheduled_session', booked.id) == \
+            (COACH_ID, STUDENT_ID, 'Mon 11:00', '12:00', 'scheduled', True)
+
+        # A pending contract session has no time; scheduling it gives it a row with the proposal's people
+        session = db.session.get(Session, 5)
+        assert event_row('session', 5) is None
+        session.scheduled_at = at(MONDAY, 14)
+        session.duration_minutes = 90
+        session.status = 'scheduled'
+        db.session.commit()
+        assert event_row('session', 5) == (COACH_ID, STUDENT_ID, 'Mon 14:00', '15:30', 'scheduled', True)
+
+        call.scheduled_at = at(MONDAY + timedelta(days=1), 16)
+        booked.status = 'completed'
+        db.session.commit()
+        assert event_row('call', call.id)[2:] == ('Tue 16:00', '16:30', 'scheduled', True)
+        assert event_row('scheduled_session', booked.id)[4:] == ('completed', False)
+
+        db.session.delete(call)
+        session.scheduled_at = None
+        db.session.commit()
+        # Both leave a row that holds no time, so feed deltas can report the removal
+        assert event_row('call', call.id)[4:] == ('deleted', False)
+        assert event_row('session', 5)[4:] == ('deleted', False)
+        assert CalendarEvent.query.filter_by(busy=True).count() == 0
+
+        # A new booking reusing a deleted booking's id replaces its row
+        reused = ScheduledCall(id=call.id, student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                               scheduled_at=at(MONDAY, 8), duration_minutes=15)
+        db.session.add(reused)
+        db.session.commit()
+        assert event_row('call', call.id)[2:] == ('Mon 08:00', '08:15', 'scheduled', True)
+    print("✅ Calendar rows follow inserts, reschedules, status changes and deletes")
+
+
+def test_busy_time_matches_booking_tables():
+    """Busy intervals from calendar_event equal the ones computed from each booking table"""
+    app = create_test_app()
+    random.seed(8)
+    with app.app_context():
+        # Back-to-back hours so busy bookings never overlap; every status, busy or not
+        hours = iter(range(6, 6 + 24 * 6))
+        for _ in range(40):
+            hour = next(hours)
+            start = at(MONDAY, 0) + timedelta(hours=hour)
+            kind = random.choice(('call', 'scheduled_session'))
+            if kind == 'call':
+                db.session.add(ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                                             scheduled_at=start, duration_minutes=random.choice((15, 45, 60)),
+                                             status=random.choice(('scheduled', 'cancelled', 'completed'))))
+            else:
+                db.session.add(ScheduledSession(session_id=random.randint(1, 10), coach_id=COACH_ID,
+                                                student_id=STUDENT_ID, scheduled_at=start,
+                                                duration_minutes=random.choice((30, 60, 45)),
+                                                status=random.choice(('scheduled', 'confirmed', 'cancelled'))))
+        for number in range(1, 11):
+            session = db.session.get(Session, number)
+            session.scheduled_at = at(MONDAY, 0) + timedelta(hours=next(hours))
+            session.status = random.choice(('scheduled', 'active', 'completed'))
+        db.session.commit()
+
+        expected = []
+        for call in ScheduledCall.query.filter_by(status='scheduled'):
+            expected.append((call.scheduled_at, call.scheduled_at + timedelta(minutes=call.duration_minutes),
+                             'call', call.id))
+        for booked in ScheduledSession.query.filter(ScheduledSession.status.in_(SCHEDULED_SESSION_BUSY_STATUSES)):
+            expected.append((booked.scheduled_at, booked.scheduled_at + timedelta(minutes=booked.duration_minutes),
+                             'scheduled_session', booked.id))
+        for session in Session.query.filter(Session.status.in_(SESSION_BUSY_STATUSES)):
+            expected.append((session.scheduled_at, session.scheduled_at + timedelta(minutes=60), 'session', session.id))
+
+        window_start, window_end = at(MONDAY, 20), at(MONDAY + timedelta(days=4), 8)
+        expected = sorted(entry for entry in expected if entry[0] < window_end and entry[1] > window_start)
+        found = get_free_busy_engine().get_busy_entries(COACH_ID, window_start, window_end)
+        assert [tuple(entry) for entry in found] == expected
+        assert {entry.kind for entry in found} == {'call', 'scheduled_session', 'session'}
+    print(f"✅ {len(found)} busy intervals match the booking tables")
+
+
+def test_upcoming_lists_are_one_query():
+    """Upcoming sessions and calls for either side come from a single joined range scan"""
+    from utils import get_upcoming_sessions_for_user
+    from scheduling_utils import get_upcoming_calls, get_coach_upcoming_calls
+
+    app = create_test_app()
+    with app.app_context():
+        for day in range(5):
+            db.session.add(ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                                         scheduled_at=at(MONDAY + timedelta(days=day), 9), duration_minutes=30,
+                                         status='cancelled' if day == 2 else 'scheduled'))
+            db.session.add(ScheduledSession(session_id=day + 1, coach_id=COACH_ID, student_id=STUDENT_ID,
+                                            scheduled_at=at(MONDAY + timedelta(days=day), 12), duration_minutes=60,
+                                            status='confirmed' if day % 2 else 'scheduled'))
+        db.session.add(ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                                     scheduled_at=datetime(2020, 1, 1, 9), duration_minutes=30))
+        db.session.commit()
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            student_calls = get_upcoming_calls(STUDENT_ID, limit=3)
+            coach_calls = get_coach_upcoming_calls(COACH_ID)
+            sessions = get_upcoming_sessions_for_user(COACH_ID, 'coach', limit=4)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert len(statements) == 3, statements
+
+        assert [call.scheduled_at.day for call in student_calls] == [3, 4, 6]
+        assert [call.scheduled_at.day for call in coach_calls] == [3, 4, 6, 7]
+        assert [booked.scheduled_at.day for booked in sessions] == [3, 4, 5, 6]
+        assert get_upcoming_sessions_for_user(STUDENT_ID, 'student', limit=10) == \
+            get_upcoming_sessions_for_user(COACH_ID, 'coach', limit=10)
+        window = get_calendar_event_store().events(STUDENT_ID, at(MONDAY, 0), at(MONDAY, 23), role='student')
+        assert [(row.source_type, row.starts_at.hour) for row in window] == [('call', 9), ('scheduled_session', 12)]
+    print("✅ Upcoming sessions and calls are one query each")
+
+
+def test_busy_read_uses_covering_index():
+    """The busy range query is served from ix_calendar_event_coach_range without touching the table"""
+    app = create_test_app()
+    with app.app_context():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            get_free_busy_engine().get_busy_entries_by_coach([COACH_ID, 7], at(MONDAY, 0), at(MONDAY, 23))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert len(statements) == 1
+
+        statement, parameters = statements[0]
+        plan = ' '.join(str(row[-1]) for row in db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + statement, parameters))
+        assert 'COVERING INDEX ix_calendar_event_coach_range' in plan, plan
+    print("✅ Busy reads use the covering coach index")
+
+
+if __name__ == '__main__':
+    test_rows_follow_their_bookings()
+    test_busy_time_matches_booking_tables()
+    test_upcoming_lists_are_one_query()
+    test_busy_read_uses_covering_index()
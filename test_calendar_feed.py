@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Test the iCalendar Feeds for Skileez
+This script checks that a user's .ics feed lists their sessions and calls as valid
+folded iCalendar, that unchanged feeds answer conditional GETs with 304 from one
+query, and that sync tokens return only the events written since, deletions included.
+"""
+
+import sys
+import os
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, update
+
+from models import db, ScheduledSession, ScheduledCall, CalendarEvent
+from testing_app import make_test_app, add_user
+from calendar_feed import get_calendar_feed, fold_line, escape_text
+
+COACH_ID = 1
+STUDENT_ID = 2
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+# Two days ahead, so the events are inside the feed window whenever the test runs
+DAY = date.today() + timedelta(days=2)
+
+
+def create_test_app():
+    """A coach with a long name, a student, two calls and a scheduled session"""
+    import routes
+
+    app = make_test_app(views=[('/calendar/<token>.ics', routes.calendar_feed_ics),
+                               ('/api/calendar/feed-url', routes.calendar_feed_url)])
+    with app.app_context():
+        add_user(COACH_ID, 'coach@example.com', first_name='Zoë, the',
+                 last_name='Extraordinarily Patient Python Coach From Saint-Étienne')
+        add_user(STUDENT_ID, 'student@example.com', first_name='Sam', last_name='Student')
+        db.session.flush()
+        db.session.add_all([
+            ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='free_consultation',
+                          scheduled_at=at(DAY, 9), duration_minutes=15),
+            ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                          scheduled_at=at(DAY, 11), duration_minutes=60, status='cancelled'),
+            ScheduledSession(session_id=1, coach_id=COACH_ID, student_id=STUDENT_ID,
+                             scheduled_at=at(DAY, 14), duration_minutes=45),
+            # Outside the window: older than the feed's 30 days of history
+            ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                          scheduled_at=at(DAY - timedelta(days=90), 9), duration_minutes=30),
+        ])
+        db.session.commit()
+        # Written well before any sync token the tests are issued
+        db.session.execute(update(CalendarEvent).values(updated_at=datetime.utcnow() - timedelta(minutes=10)))
+        db.session.commit()
+    return app
+
+
+def feed_url(app, user_id):
+    with app.test_request_context():
+        return f'/calendar/{get_calendar_feed().feed_token(user_id)}.ics'
+
+
+def unfold(body):
+    return body.replace('\r\n ', '').split('\r\n')
+
+
+def test_lines_are_folded_and_escaped():
+    """Long lines fold at 75 octets without splitting characters"""
+    print("=" * 60)
+    print("CALENDAR FEED TEST")
+    print("=" * 60)
+
+    line = 'SUMMARY:' + 'é' * 60 + 'x' * 50
+    folded = fold_line(line)
+    assert folded.endswith('\r\n')
+    assert all(len(part.encode('utf-8')) <= 75 for part in folded[:-2].split('\r\n'))
+    assert folded[:-2].replace('\r\n ', '') == line
+    assert escape_text('a,b;c\\d\ne') == 'a\\,b\\;c\\\\d\\ne'
+    print("✅ Content lines are folded and escaped")
+
+
+def test_full_feed_lists_the_users_events():
+    """Coach and student feeds list the same events, each titled with the other person"""
+    app = create_test_app()
+    client = app.test_client()
+
+    response = client.get(feed_url(app, COACH_ID))
+    assert response.status_code == 200 and response.mimetype == 'text/calendar'
+    assert response.is_streamed
+    body = response.get_data(as_text=True)
+    assert all(len(line.encode('utf-8')) <= 75 for line in body.split('\r\n'))
+    lines = unfold(body)
+    assert lines[0] == 'BEGIN:VCALENDAR' and lines[-2] == 'END:VCALENDAR'
+    assert lines.count('BEGIN:VEVENT') == 3
+    assert [line for line in lines if line.startswith('DTSTART')] == [
+        f"DTSTART:{DAY.strftime('%Y%m%d')}T{hour}0000Z" for hour in ('09', '11', '14')]
+    assert lines.count('SUMMARY:Call with Sam Student') == 2
+    assert lines.count('STATUS:CANCELLED') == 1 and lines.count('TRANSP:TRANSPARENT') == 1
+
+    student_lines = unfold(client.get(feed_url(app, STUDENT_ID)).get_data(as_text=True))
+    assert 'SUMMARY:Session with Zoë\\, the Extraordinarily Patient Python Coach From Saint-Étienne' in \
+        student_lines
+
+    assert client.get('/calendar/not-a-token.ics').status_code == 404
+    assert client.get(feed_url(app, COACH_ID) + '?sync-token=bogus').status_code == 400
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = STUDENT_ID
+    url = client.get('/api/calendar/feed-url').get_json()['url']
+    assert url.endswith(feed_url(app, STUDENT_ID))
+    print("✅ Full feeds list each user's sessions and calls")
+
+
+def test_conditional_get_returns_304():
+    """An unchanged feed is a 304 after one query; any write changes the validators"""
+    app = create_test_app()
+    client = app.test_client()
+    url = feed_url(app, COACH_ID)
+
+    first = client.get(url)
+    etag, last_modified = first.headers['ETag'], first.headers['Last-Modified']
+
+    with app.app_context():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            cached = client.get(url, headers={'If-None-Match': etag})
+            dated = client.get(url, headers={'If-Modified-Since': last_modified})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    assert cached.status_code == 304 and cached.headers['ETag'] == etag and cached.get_data() == b''
+    assert dated.status_code == 304
+    assert len(statements) == 2, statements
+
+    with app.app_context():
+        call = ScheduledCall.query.filter_by(status='cancelled').one()
+        call.status = 'scheduled'
+        db.session.commit()
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert unfold(changed.get_data(as_text=True)).count('STATUS:CANCELLED') == 0
+    print(f"✅ Unchanged feeds are a 304 in {len(statements) // 2} query")
+
+
+def test_sync_token_returns_only_changes():
+    """A delta has the moved, deleted and new events and nothing else"""
+    app = create_test_app()
+    client = app.test_client()
+    url = feed_url(app, COACH_ID)
+
+    token = client.get(url).headers['X-Sync-Token']
+    empty = client.get(f'{url}?sync-token={token}')
+    assert unfold(empty.get_data(as_text=True)).count('BEGIN:VEVENT') == 0
+
+    with app.app_context():
+        first_call = ScheduledCall.query.filter_by(call_type='free_consultation').one()
+        moved = ScheduledSession.query.one()
+        moved.scheduled_at = at(DAY, 16)
+        deleted = ScheduledCall.query.filter_by(status='cancelled').one()
+        deleted_id = deleted.id
+        db.session.delete(deleted)
+        db.session.add(ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                                     scheduled_at=at(DAY + timedelta(days=1), 10), duration_minutes=30))
+        db.session.commit()
+        unchanged_uid = f'UID:call-{first_call.id}@skileez'
+
+    delta = client.get(f'{url}?sync-token={token}')
+    lines = unfold(delta.get_data(as_text=True))
+    assert lines.count('BEGIN:VEVENT') == 3
+    assert unchanged_uid not in lines
+    assert f'UID:call-{deleted_id}@skileez' in lines and 'STATUS:CANCELLED' in lines
+    assert f"DTSTART:{DAY.strftime('%Y%m%d')}T160000Z" in lines
+    assert delta.headers['X-Sync-Token'] != token
+
+    # The full feed no longer lists the deleted call
+    full = unfold(client.get(url).get_data(as_text=True))
+    assert full.count('BEGIN:VEVENT') == 3 and f'UID:call-{deleted_id}@skileez' not in full
+    print("✅ Sync tokens return only the events changed since")
+
+
+def test_bad_sync_tokens_are_rejected():
+    """Tokens we did not issue, or out of any date's range, get a 400 rather than a 500"""
+    app = create_test_app()
+    client = app.test_client()
+    url = feed_url(app, COACH_ID)
+
+    for token in ('v2-1', 'v1-abc', 'v1-9999999999999999999999999', 'v1--9999999999999999999999999'):
+        response = client.get(f'{url}?sync-token={token}')
+        assert response.status_code == 400, (token, response.status_code)
+    print("✅ Bad sync tokens are rejected")
+
+
+if __name__ == '__main__':
+    test_lines_are_folded_and_escaped()
+    test_full_feed_lists_the_users_events()
+    test_conditional_get_returns_304()
+    test_sync_token_returns_only_changes()
+    test_bad_sync_tokens_are_rejected()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Test the Call Notification Ledger for Skileez
+This script checks that call_notification refuses a second row per call and type,
+that claiming notifications for many calls is one INSERT ... ON CONFLICT DO NOTHING
+whose rows go to exactly one of several concurrent workers, that the ready and
+reminder jobs send each notification once with a query count that does not grow
+with the number of due calls, and that older databases get the unique index.
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, text, inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+
+import notification_scheduler
+from models import db, ScheduledCall, CallNotification, CALL_NOTIFICATION_LEDGER_INDEX
+from testing_app import make_test_app, add_user
+from scheduling_utils import claim_call_notifications, ensure_call_notification_ledger
+from schema_capabilities import has_table
+
+STUDENT_ID = 1000
+
+
+def create_test_app(coach_count=1, uri='sqlite:///:memory:'):
+    """Coaches 1..coach_count and one student"""
+    app = make_test_app(uri)
+    with app.app_context():
+        add_user(STUDENT_ID, 'student@example.com', last_name='Student')
+        for coach_id in range(1, coach_count + 1):
+            add_user(coach_id, f'coach{coach_id}@example.com', first_name='Coach', last_name=str(coach_id))
+        db.session.commit()
+    return app
+
+
+def book_calls(count, starts_in):
+    """One call per coach, all starting at the same time"""
+    calls = [ScheduledCall(student_id=STUDENT_ID, coach_id=coach_id, call_type='paid_session',
+                           scheduled_at=datetime.utcnow() + starts_in, duration_minutes=30)
+             for coach_id in range(1, count + 1)]
+    db.session.add_all(calls)
+    db.session.commit()
+    return [call.id for call in calls]
+
+
+def counting_statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    return statements, record
+
+
+def test_ledger_refuses_duplicates():
+    """A second row for the same call and type is an IntegrityError"""
+    print("=" * 60)
+    print("CALL NOTIFICATION LEDGER TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.app_context():
+        call_id, = book_calls(1, timedelta(days=2))
+        db.session.add(CallNotification(call_id=call_id, notification_type='ready'))
+        db.session.add(CallNotification(call_id=call_id, notification_type='reminder_1h'))
+        db.session.commit()
+        db.session.add(CallNotification(call_id=call_id, notification_type='ready'))
+        try:
+            db.session.commit()
+            assert False, "duplicate notification was accepted"
+        except IntegrityError:
+            db.session.rollback()
+        assert CallNotification.query.count() == 2
+    print("✅ The ledger refuses a second notification of a type")
+
+
+def test_claim_is_one_statement_per_batch():
+    """Claiming many calls is one insert that returns only the calls not claimed before"""
+    app = create_test_app(coach_count=6)
+    with app.app_context():
+        call_ids = book_calls(6, timedelta(days=2))
+        statements, record = counting_statements()
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            first = claim_call_notifications(call_ids[:5], 'reminder_24h', db.session)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert first == set(call_ids[:5])
+        assert len(statements) == 1 and 'ON CONFLICT' in statements[0] and 'RETURNING' in statements[0]
+
+        assert claim_call_notifications(call_ids, 'reminder_24h', db.session) == {call_ids[5]}
+        assert claim_call_notifications(call_ids, 'reminder_24h', db.session) == set()
+        assert claim_call_notifications(call_ids[:2], 'reminder_1h', db.session) == set(call_ids[:2])
+        assert claim_call_notifications([], 'ready', db.session) == set()
+    print("✅ One statement claims a batch; claimed calls are never returned again")
+
+
+def test_concurrent_workers_split_the_claims():
+    """Workers claiming the same calls at once each get a disjoint share of them"""
+    directory = tempfile.mkdtemp()
+    try:
+        app = create_test_app(coach_count=40, uri=f"sqlite:///{os.path.join(directory, 'ledger.db')}")
+        with app.app_context():
+            call_ids = book_calls(40, timedelta(days=2))
+        claims = []
+
+        def worker():
+            with app.app_context():
+                for start in range(0, 40, 10):
+                    claims.append(claim_call_notifications(call_ids[start:start + 10], 'ready', db.session))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        claimed = [call_id for claim in claims for call_id in claim]
+        assert sorted(claimed) == sorted(call_ids), "every call claimed exactly once"
+        with app.app_context():
+            assert CallNotification.query.count() == 40
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(directory)
+    print("✅ Four concurrent workers claimed each of 40 calls exactly once")
+
+
+def run_calls_ready(app, delivered):
+    """check_calls_ready with delivery recorded instead of emailed; its result and statement count"""
+    original = notification_scheduler.deliver_call_notification
+    notification_scheduler.deliver_call_notification = \
+        lambda call, kind: delivered.append((sa_inspect(call).identity[0], kind))
+    statements, record = counting_statements()
+    try:
+        with app.app_context():
+            has_table('scheduled_job')  # load the schema capabilities before counting
+            event.listen(db.engine, 'before_cursor_execute', record)
+        result = notification_scheduler.NotificationScheduler(app).check_calls_ready()
+    finally:
+        notification_scheduler.deliver_call_notification = original
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return result, len(statements)
+
+
+def test_ready_notifications_go_out_once():
+    """A pass sends each due call its notification once, in a fixed number of queries"""
+    counts = {}
+    for due_calls in (4, 40):
+        app = create_test_app(coach_count=due_calls)
+        with app.app_context():
+            call_ids = book_calls(due_calls, timedelta(minutes=3))
+            book_calls(due_calls, timedelta(days=3))
+            # Already sent, e.g. by a webhook run
+            db.session.add(CallNotification(call_id=call_ids[0], notification_type='ready'))
+            db.session.commit()
+
+        delivered = []
+        result, counts[due_calls] = run_calls_ready(app, delivered)
+        assert result == {'jobs_due': due_calls, 'done': due_calls - 1, 'skipped': 1}, result
+        assert sorted(delivered) == [(call_id, 'ready') for call_id in call_ids[1:]]
+
+        again, _ = run_calls_ready(app, delivered)
+        assert again == {'jobs_due': 0} and len(delivered) == due_calls - 1
+        with app.app_context():
+            assert CallNotification.query.filter_by(notification_type='ready').count() == due_calls
+    assert counts[4] == counts[40], counts
+    print(f"✅ Ready notifications go out once, {counts[40]} statements for 4 or 40 due calls")
+
+
+def test_older_databases_get_the_index():
+    """Duplicates are dropped, keeping the first, before the unique index is added"""
+    app = create_test_app()
+    with app.app_context():
+        call_id, = book_calls(1, timedelta(days=2))
+        with db.engine.begin() as connection:
+            connection.execute(text(f"DROP INDEX {CALL_NOTIFICATION_LEDGER_INDEX}"))
+            for kind in ('ready', 'ready', 'reminder_1h', 'ready'):
+                connection.execute(text(
+                    "INSERT INTO call_notification (call_id, notification_type) VALUES (:call_id, :kind)"
+                ), {'call_id': call_id, 'kind': kind})
+
+        with db.engine.begin() as connection:
+            assert ensure_call_notification_ledger(connection)
+        with db.engine.begin() as connection:
+            assert not ensure_call_notification_ledger(connection)
+        assert [(row.id, row.notification_type) for row in CallNotification.query.order_by(CallNotification.id)] \
+            == [(1, 'ready'), (3, 'reminder_1h')]
+        assert CALL_NOTIFICATION_LEDGER_INDEX in [
+            index['name'] for index in sa_inspect(db.engine).get_indexes('call_notification')]
+    print("✅ Older databases get the unique index")
+
+
+if __name__ == '__main__':
+    test_ledger_refuses_duplicates()
+    test_claim_is_one_statement_per_batch()
+    test_concurrent_workers_split_the_claims()
+    test_ready_notifications_go_out_once()
+    test_older_databases_get_the_index()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test Coach Month Calendar for Skileez
+This script checks that a month of per-day slot counts costs a fixed number of
+queries, that repeat requests are served from the cache, and that bookings,
+reschedules and exceptions drop the cached month once they commit.
+"""
+
+import sys
+import os
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from models import (
+    db, LearningRequest, Proposal, Session, ScheduledCall, CoachAvailability, AvailabilityException
+)
+from testing_app import make_test_app, add_users
+from availability_manager import get_availability_manager
+from occupancy_bitmap import get_occupancy_cache
+
+# January 2030 has 23 weekdays; the 7th is a Monday
+YEAR, MONTH = 2030, 1
+MONDAY = date(2030, 1, 7)
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app():
+    """Minimal app with one coach working 9:00-12:00 UTC on weekdays and one student"""
+    import routes
+
+    app = make_test_app(views=[('/api/coaches/<int:coach_id>/calendar', routes.get_coach_calendar)])
+    with app.app_context():
+        add_users((1, 2))
+        availability = CoachAvailability(coach_id=1, timezone='UTC', session_duration=60, buffer_after=0,
+                                         saturday_start=0, saturday_end=0, sunday_start=0, sunday_end=0)
+        for day in ('monday', 'tuesday', 'wednesday', 'thursday', 'friday'):
+            setattr(availability, f'{day}_start', 9 * 60)
+            setattr(availability, f'{day}_end', 12 * 60)
+        db.session.add(availability)
+        db.session.commit()
+    # The caches are process-wide; start every test empty
+    get_availability_manager().calendar_cache.clear()
+    get_occupancy_cache().clear()
+    return app
+
+
+def month_counts(app, duration_minutes=60):
+    """Per-day slot counts and the number of statements it took"""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            days = get_availability_manager().get_coach_calendar_days(1, YEAR, MONTH, duration_minutes)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return {day['date']: day['available_slots'] for day in days}, len(statements)
+
+
+def test_month_in_one_pass_then_cached():
+    """The month is computed with a fixed number of queries and then served from memory"""
+    print("=" * 60)
+    print("COACH MONTH CALENDAR TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.app_context():
+        get_availability_manager().free_busy.get_slots(1, MONDAY, MONDAY)  # table checks run once per engine
+    counts, queries = month_counts(app)
+    assert len(counts) == 31
+    assert counts[MONDAY.isoformat()] == 5  # 9:00 to 11:00 every 30 minutes
+    assert counts[(MONDAY + timedelta(days=5)).isoformat()] == 0  # Saturday off
+    assert sum(1 for count in counts.values() if count) == 23
+    # Availability settings, exceptions, busy intervals
+    assert queries == 3, queries
+
+    cached, queries = month_counts(app)
+    assert cached == counts and queries == 0, queries
+
+    # Another duration is its own calendar entry, scanned from the same occupancy bitmaps
+    half_hour, queries = month_counts(app, duration_minutes=30)
+    assert half_hour[MONDAY.isoformat()] == 6 and queries == 0, queries
+    print("✅ Month computed in 3 queries, repeat requests in 0")
+
+
+def test_bookings_invalidate_after_commit():
+    """A committed booking drops the cached month; a rolled back one does not"""
+    app = create_test_app()
+    month_counts(app)
+
+    with app.app_context():
+        db.session.add(ScheduledCall(student_id=2, coach_id=1, call_type='free_consultation',
+                                     scheduled_at=at(MONDAY, 9), duration_minutes=60))
+        db.session.flush()
+        db.session.rollback()
+    _, queries = month_counts(app)
+    assert queries == 0, queries
+
+    with app.app_context():
+        db.session.add(ScheduledCall(student_id=2, coach_id=1, call_type='free_consultation',
+                                     scheduled_at=at(MONDAY, 9), duration_minutes=60))
+        db.session.commit()
+    counts, queries = month_counts(app)
+    assert queries == 3 and counts[MONDAY.isoformat()] == 3  # 10:00, 10:30, 11:00
+
+    # Bookkeeping updates leave the cache alone; a cancellation frees the slots again
+    with app.app_context():
+        call = ScheduledCall.query.first()
+        call.reminder_sent = True
+        db.session.commit()
+    _, queries = month_counts(app)
+    assert queries == 0, queries
+    with app.app_context():
+        call = ScheduledCall.query.first()
+        call.status = 'cancelled'
+        db.session.commit()
+    counts, _ = month_counts(app)
+    assert counts[MONDAY.isoformat()] == 5
+    print("✅ Bookings invalidate only once committed")
+
+
+def test_session_reschedule_and_exceptions_invalidate():
+    """Moving a contract session and blocking a day both refresh the calendar API"""
+    app = create_test_app()
+    with app.app_context():
+        request = LearningRequest(student_id=2, title='Python', description='Learn Python')
+        db.session.add(request)
+        db.session.flush()
+        proposal = Proposal(learning_request_id=request.id, coach_id=1, cover_letter='Hi',
+                            session_count=1, price_per_session=10, session_duration=60, total_price=10)
+        db.session.add(proposal)
+        db.session.flush()
+        db.session.add(Session(proposal_id=proposal.id, session_number=1, status='scheduled',
+                               scheduled_at=at(MONDAY, 9), duration_minutes=60))
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+
+    def api_counts():
+        data = client.get(f'/api/coaches/1/calendar?year={YEAR}&month={MONTH}&duration_minutes=60').get_json()
+        return {day['date']: day['available_slots'] for day in data['days']}
+
+    tuesday = (MONDAY + timedelta(days=1)).isoformat()
+    counts = api_counts()
+    assert counts[MONDAY.isoformat()] == 3 and counts[tuesday] == 5
+
+    with app.app_context():
+        session = Session.query.first()
+        session.scheduled_at = at(MONDAY + timedelta(days=1), 9)
+        db.session.commit()
+    counts = api_counts()
+    assert counts[MONDAY.isoformat()] == 5 and counts[tuesday] == 3
+
+    with app.app_context():
+        availability = CoachAvailability.query.filter_by(coach_id=1).first()
+        db.session.add(AvailabilityException(availability_id=availability.id, date=MONDAY))
+        db.session.commit()
+    counts = api_counts()
+    assert counts[MONDAY.isoformat()] == 0
+
+    response = client.get(f'/api/coaches/1/calendar?year={YEAR}&month=13')
+    assert response.status_code == 400
+    print("✅ Reschedules and exceptions refresh the calendar")
+
+
+if __name__ == '__main__':
+    test_month_in_one_pass_then_cached()
+    test_bookings_invalidate_after_commit()
+    test_session_reschedule_and_exceptions_invalidate()
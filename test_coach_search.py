@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Test Multi-Coach Availability Search for Skileez
+This script checks that "who is free at time T for N minutes" agrees with the
+per-coach slot engine, that it costs the same four queries for 5 or 60 coaches,
+and that the bulk API applies the browse filters.
+"""
+
+import sys
+import os
+import random
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from models import db, User, CoachProfile, ScheduledCall, CoachAvailability, AvailabilityException
+from testing_app import make_test_app, add_user
+from free_busy import get_free_busy_engine, ceil_to_grid
+
+# A Monday, far enough ahead to never be in the past
+MONDAY = date(2030, 4, 8)
+TIMEZONES = ('UTC', 'America/New_York', 'Europe/Paris', 'Asia/Kolkata', 'Australia/Sydney')
+STUDENT_ID = 1000
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app():
+    """Minimal app serving the bulk availability API"""
+    import routes
+
+    app = make_test_app(views=[('/api/coaches/available', routes.find_available_coaches)])
+    with app.app_context():
+        add_user(STUDENT_ID, 'student@example.com', last_name='Student', timezone='UTC')
+        db.session.commit()
+    return app
+
+
+def add_coaches(app, count, seed=3):
+    """Coaches in several timezones with random hours, bookings and exceptions"""
+    random.seed(seed)
+    with app.app_context():
+        # Hashing is deliberately slow; every coach shares one hash
+        password_hash = db.session.get(User, STUDENT_ID).password_hash
+        for coach_id in range(1, count + 1):
+            db.session.add(User(id=coach_id, email=f'coach{coach_id}@example.com', first_name='Coach',
+                                last_name=str(coach_id), password_hash=password_hash))
+            db.session.add(CoachProfile(user_id=coach_id, is_approved=coach_id % 10 != 0,
+                                        hourly_rate=20 if coach_id % 2 else 60, rating=coach_id % 5))
+            if coach_id % 7 == 0:
+                continue  # never saved availability: default hours
+            availability = CoachAvailability(coach_id=coach_id, timezone=random.choice(TIMEZONES),
+                                             session_duration=60, buffer_after=0,
+                                             is_available=coach_id % 11 != 0)
+            for day in ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'):
+                start = random.choice((6, 8, 9, 13, 18)) * 60 + random.choice((0, 30))
+                setattr(availability, f'{day}_start', start)
+                setattr(availability, f'{day}_end', min(start + random.choice((60, 120, 240, 480)), 24 * 60))
+            db.session.add(availability)
+            db.session.flush()
+            # Starts at least three hours apart: a coach's bookings may not overlap
+            starts = [(day_offset, hour) for day_offset in range(-1, 4) for hour in range(0, 24, 3)]
+            for day_offset, hour in random.sample(starts, random.randint(0, 6)):
+                db.session.add(ScheduledCall(student_id=STUDENT_ID, coach_id=coach_id, call_type='paid_session',
+                                             scheduled_at=at(MONDAY + timedelta(days=day_offset), hour,
+                                                             random.choice((0, 10, 30, 45))),
+                                             duration_minutes=random.choice((15, 60, 90))))
+            if coach_id % 3 == 0:
+                db.session.add(AvailabilityException(availability_id=availability.id,
+                                                     date=MONDAY + timedelta(days=random.randint(0, 2)),
+                                                     start_time=time(random.randint(6, 20)), end_time=time(22),
+                                                     is_blocked=coach_id % 2 == 0))
+        db.session.commit()
+
+
+def brute_force(coach_ids, window_start, window_end, duration):
+    """Earliest start per coach from the per-coach slot engine on a 5-minute grid"""
+    engine = get_free_busy_engine()
+    window_start = ceil_to_grid(window_start)
+    expected = {}
+    for coach_id in coach_ids:
+        slots = engine.get_slots(coach_id, window_start.date() - timedelta(days=1),
+                                 window_end.date() + timedelta(days=1), duration, step_minutes=5)
+        starts = sorted(slot['start_utc'].replace(tzinfo=None) for day_slots in slots.values() for slot in day_slots)
+        starts = [start for start in starts if window_start <= start <= window_end]
+        if starts:
+            expected[coach_id] = starts[0]
+    return expected
+
+
+def test_search_matches_per_coach_engine():
+    """The bulk search finds the same coaches and earliest starts as one-by-one lookups"""
+    print("=" * 60)
+    print("MULTI-COACH AVAILABILITY SEARCH TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    add_coaches(app, 40)
+    engine = get_free_busy_engine()
+    windows = [
+        (at(MONDAY, 14), at(MONDAY, 14), 60),
+        (at(MONDAY, 9, 7), at(MONDAY, 12), 30),
+        (at(MONDAY + timedelta(days=1), 0), at(MONDAY + timedelta(days=1), 23), 90),
+        (at(MONDAY + timedelta(days=2), 22), at(MONDAY + timedelta(days=3), 3), 45),
+    ]
+    with app.app_context():
+        coach_ids = list(range(1, 41))
+        for window_start, window_end, duration in windows:
+            found = engine.get_free_coaches(coach_ids, window_start, window_end, duration)
+            assert found == brute_force(coach_ids, window_start, window_end, duration), (window_start, duration)
+            assert all(coach_id % 11 != 0 for coach_id in found)  # availability switched off
+        assert engine.get_free_coaches(coach_ids, at(MONDAY, 14), at(MONDAY, 13), 60) == {}
+    print(f"✅ Bulk search matches per-coach slots for {len(windows)} windows")
+
+
+def count_search_queries(app, coach_count):
+    with app.app_context():
+        engine = db.engine
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            get_free_busy_engine().get_free_coaches(range(1, coach_count + 1), at(MONDAY, 6), at(MONDAY, 20), 60)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+def test_query_count_is_fixed():
+    """Searching 5 or 60 coaches costs the same queries"""
+    app = create_test_app()
+    add_coaches(app, 60)
+    with app.app_context():
+        get_free_busy_engine().get_slots(1, MONDAY, MONDAY)  # table checks run once per engine
+    few = count_search_queries(app, 5)
+    many = count_search_queries(app, 60)
+    # Timezones, weekly hours filtered in SQL, exceptions, busy intervals
+    assert few == many == 4, (few, many)
+    print(f"✅ {many} queries for 5 or 60 coaches")
+
+
+def test_bulk_api_applies_browse_filters():
+    """The API returns approved coaches matching the filters in sort order"""
+    app = create_test_app()
+    add_coaches(app, 40)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = STUDENT_ID
+
+    data = client.get(f'/api/coaches/available?available_date={MONDAY.isoformat()}&available_time=09:00'
+                      f'&duration_minutes=60&flex_minutes=600&price_range=10-25&sort=rating').get_json()
+    assert data['success'] and data['count'] == len(data['coaches']) > 0
+    coach_ids = [coach['coach_id'] for coach in data['coaches']]
+    assert all(coach_id % 2 == 1 and coach_id % 10 != 0 for coach_id in coach_ids)  # $20 and approved
+    with app.app_context():
+        ratings = [db.session.get(User, coach_id).coach_profile.rating for coach_id in coach_ids]
+        expected = brute_force(coach_ids, at(MONDAY, 9), at(MONDAY, 19), 60)
+    assert ratings == sorted(ratings, reverse=True)
+    assert {coach['coach_id']: coach['earliest_start_utc'][:16] for coach in data['coaches']} == \
+        {coach_id: start.isoformat()[:16] for coach_id, start in expected.items()}
+
+    response = client.get('/api/coaches/available?available_date=2001-01-01&available_time=09:00')
+    assert response.status_code == 400
+    response = client.get(f'/api/coaches/available?available_date={MONDAY.isoformat()}&duration_minutes=0')
+    assert response.status_code == 400
+    print(f"✅ Bulk API found {data['count']} matching coaches")
+
+
+if __name__ == '__main__':
+    test_search_matches_per_coach_engine()
+    test_query_count_is_fixed()
+    test_bulk_api_applies_browse_filters()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test Conversation History paging for Skileez
+This script checks that a conversation opens on its latest page, that older
+messages are reached with before_id, that mark-read only touches the loaded
+window, and benchmarks first paint of a 20k-message conversation.
+"""
+
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, insert
+
+from models import db, Message
+from testing_app import make_test_app, add_users, check_timing
+from conversation_manager import DEFAULT_PAGE_SIZE
+
+
+def create_test_app():
+    """Minimal app serving the history and mark-read endpoints against an in-memory database"""
+    import app as skileez
+    import routes
+
+    app = make_test_app(views=[('/messages/<int:user_id>/history', routes.conversation_history),
+                               ('/messages/<int:user_id>/mark-read', routes.mark_messages_read, ['POST'])])
+    app.jinja_env.filters.update(skileez.app.jinja_env.filters)
+    app.jinja_env.globals.update(skileez.app.jinja_env.globals)
+    with app.app_context():
+        add_users((1, 2))
+        db.session.commit()
+    return app
+
+
+def add_messages(app, count):
+    """Bulk insert an alternating conversation between users 1 and 2, unread for user 2"""
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        first_id = (db.session.query(db.func.max(Message.id)).scalar() or 0) + 1
+        db.session.execute(insert(Message), [
+            {'sender_id': 1 if i % 2 else 2, 'recipient_id': 2 if i % 2 else 1,
+             'content': f'message {first_id + i}', 'message_type': 'TEXT', 'is_read': False,
+             'created_at': start + timedelta(minutes=first_id + i)}
+            for i in range(count)
+        ])
+        db.session.commit()
+
+
+def logged_in_client(app, user_id=2):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def test_scroll_back_reaches_every_message_once():
+    """Paging with before_id walks the whole history without gaps or repeats"""
+    print("=" * 60)
+    print("CONVERSATION HISTORY TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    add_messages(app, 2 * DEFAULT_PAGE_SIZE + 7)
+    client = logged_in_client(app)
+
+    first = client.get('/messages/1/history').get_json()
+    assert first['count'] == DEFAULT_PAGE_SIZE and first['has_more']
+    assert 'data-message-id="107"' in first['html']
+
+    seen = first['count']
+    before_id = first['before_id']
+    while True:
+        page = client.get(f'/messages/1/history?before_id={before_id}').get_json()
+        seen += page['count']
+        if not page['has_more']:
+            break
+        before_id = page['before_id']
+    assert seen == 2 * DEFAULT_PAGE_SIZE + 7
+    assert page['before_id'] == 1
+    print("✅ Scroll-back reaches every message exactly once")
+
+
+def test_mark_read_is_limited_to_window():
+    """Only messages in the loaded window are marked read"""
+    app = create_test_app()
+    add_messages(app, 100)
+    client = logged_in_client(app)
+
+    response = client.post('/messages/1/mark-read', json={'from_id': 51, 'up_to_id': 100},
+                           headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert response.get_json()['marked_read'] == 25
+
+    with app.app_context():
+        unread = Message.query.filter_by(recipient_id=2, is_read=False).all()
+        assert len(unread) == 25
+        assert max(message.id for message in unread) < 51
+    print("✅ Mark-read stays within the visible window")
+
+
+def measure_first_paint(app, client):
+    """Time and count the statements of rendering the latest page"""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        start = time.perf_counter()
+        data = client.get('/messages/1/history').get_json()
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert data['html'].count('class="message-container') == DEFAULT_PAGE_SIZE
+    return elapsed, len(statements)
+
+
+def test_first_paint_cost_is_constant():
+    """Benchmark: the first page of a 20k-message conversation costs the same as a 1k one"""
+    app = create_test_app()
+    client = logged_in_client(app)
+
+    add_messages(app, 1000)
+    client.get('/messages/1/history')  # warm templates and table checks
+    small_time, small_queries = min(measure_first_paint(app, client) for _ in range(3))
+
+    add_messages(app, 19000)
+    large_time, large_queries = min(measure_first_paint(app, client) for _ in range(3))
+
+    assert small_queries == large_queries, (small_queries, large_queries)
+    # A full render of 20x the rows would be ~20x slower; allow generous noise
+    check_timing(large_time < small_time * 4 + 0.05,
+                 f"first paint {small_time * 1000:.1f}ms at 1k vs {large_time * 1000:.1f}ms at 20k messages")
+    print(f"✅ First paint: {small_time * 1000:.1f}ms at 1k messages, "
+          f"{large_time * 1000:.1f}ms at 20k messages ({large_queries} queries each)")
+
+
+if __name__ == '__main__':
+    test_scroll_back_reaches_every_message_once()
+    test_mark_read_is_limited_to_window()
+    test_first_paint_cost_is_constant()
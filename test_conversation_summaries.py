@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test Conversation Summaries for Skileez
+This script checks the inbox summary query against a naive per-partner
+computation and times it on a 50k message / 500 partner inbox.
+"""
+
+import sys
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+
+from models import db
+from testing_app import make_test_app, check_timing
+import conversation_manager
+from conversation_manager import get_conversation_summaries, backfill_conversations
+
+
+def create_test_app(message_count, partner_count, seed=7):
+    """In-memory database where user 1 talks to partner_count partners"""
+    app = make_test_app()
+
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    messages = []
+    for i in range(message_count):
+        partner_id = rng.randint(2, partner_count + 1)
+        sender_id, recipient_id = (1, partner_id) if rng.random() < 0.5 else (partner_id, 1)
+        messages.append({'sender_id': sender_id, 'recipient_id': recipient_id,
+                         'is_read': rng.random() < 0.8, 'created_at': base + timedelta(seconds=i)})
+    # Traffic between other users must not leak into user 1's inbox
+    messages.append({'sender_id': 2, 'recipient_id': 3, 'is_read': False,
+                     'created_at': base + timedelta(seconds=message_count)})
+
+    with app.app_context():
+        conn = db.session.connection()
+        conn.execute(text(
+            'INSERT INTO "user" (id, email, password_hash, first_name, last_name) '
+            "VALUES (:id, :email, 'x', 'Test', 'User')"
+        ), [{'id': i, 'email': f'user{i}@example.com'} for i in range(1, partner_count + 2)])
+        conn.execute(text(
+            "INSERT INTO message (sender_id, recipient_id, content, is_read, created_at) "
+            "VALUES (:sender_id, :recipient_id, 'hello', :is_read, :created_at)"
+        ), messages)
+        # Raw inserts bypass the Message hook, so build the conversation tables in bulk
+        backfill_conversations(conn)
+        db.session.commit()
+    return app, messages
+
+
+def expected_summaries(messages, user_id=1):
+    """Naive summary: last message ID and unread count per partner"""
+    expected = {}
+    for message_id, message in enumerate(messages, start=1):
+        if user_id not in (message['sender_id'], message['recipient_id']):
+            continue
+        partner_id = message['recipient_id'] if message['sender_id'] == user_id else message['sender_id']
+        entry = expected.setdefault(partner_id, {'last_message_id': 0, 'unread_count': 0})
+        entry['last_message_id'] = message_id
+        if message['recipient_id'] == user_id and not message['is_read']:
+            entry['unread_count'] += 1
+    return expected
+
+
+def test_summaries_match_naive_computation():
+    """Every partner appears once with the right last message and unread count"""
+    print("=" * 60)
+    print("CONVERSATION SUMMARY TEST")
+    print("=" * 60)
+
+    app, messages = create_test_app(message_count=2000, partner_count=40)
+    expected = expected_summaries(messages)
+
+    with app.app_context():
+        conversations, next_cursor = get_conversation_summaries(1, limit=200)
+        assert next_cursor is None
+        assert set(conversations) == set(expected)
+        for partner_id, summary in conversations.items():
+            assert summary['partner'].id == partner_id
+            assert summary['last_message'].id == expected[partner_id]['last_message_id']
+            assert summary['unread_count'] == expected[partner_id]['unread_count']
+
+        last_ids = [summary['last_message'].id for summary in conversations.values()]
+        assert last_ids == sorted(last_ids, reverse=True)
+        print(f"✅ {len(conversations)} summaries match the naive computation")
+
+        # Databases without the conversation tables aggregate the message history instead
+        with patch.object(conversation_manager, 'conversation_tables_available', return_value=False):
+            fallback, _ = get_conversation_summaries(1, limit=200)
+        assert list(fallback) == list(conversations)
+        for partner_id, summary in fallback.items():
+            assert summary['last_message'].id == expected[partner_id]['last_message_id']
+            assert summary['unread_count'] == expected[partner_id]['unread_count']
+        print("✅ Message history fallback matches")
+
+
+def test_keyset_pagination_covers_every_partner():
+    """Walking the cursor returns each partner exactly once"""
+    app, messages = create_test_app(message_count=2000, partner_count=40)
+    expected = expected_summaries(messages)
+
+    with app.app_context():
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = get_conversation_summaries(1, limit=7, before_message_id=cursor)
+            assert len(page) <= 7
+            seen.extend(page)
+            if cursor is None:
+                break
+        assert len(seen) == len(set(seen)) == len(expected)
+        print("✅ Keyset pagination covers every partner once")
+
+
+def test_inbox_performance():
+    """50k messages across 500 partners should summarize in under 50 ms"""
+    app, _ = create_test_app(message_count=50000, partner_count=500)
+
+    with app.app_context():
+        for tables_available, label in ((True, 'conversation tables'), (False, 'message history')):
+            with patch.object(conversation_manager, 'conversation_tables_available',
+                              return_value=tables_available):
+                get_conversation_summaries(1)
+                timings = []
+                for _ in range(3):
+                    db.session.expunge_all()
+                    start = time.perf_counter()
+                    conversations, next_cursor = get_conversation_summaries(1)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+            assert len(conversations) == 50
+            assert next_cursor is not None
+            print(f"⏱️  Inbox summary from {label}: {min(timings):.1f} ms (best of 3)")
+            check_timing(min(timings) < 50, f"inbox summary from {label} took {min(timings):.1f} ms, budget 50 ms")
+
+
+if __name__ == '__main__':
+    test_summaries_match_naive_computation()
+    test_keyset_pagination_covers_every_partner()
+    test_inbox_performance()
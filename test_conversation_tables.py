@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test Conversation Tables for Skileez
+This script checks that conversation rows and unread counters follow message
+writes, reads, rollbacks and the bulk backfill.
+"""
+
+import sys
+import os
+import random
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, Message, Conversation, ConversationParticipant
+from testing_app import make_test_app, add_users
+from conversation_manager import (
+    get_conversation, mark_conversation_read, get_unread_message_count,
+    backfill_conversations, backfill_conversations_if_empty
+)
+
+
+def create_test_app(user_count=4):
+    """In-memory database with a handful of users"""
+    app = make_test_app()
+    with app.app_context():
+        add_users(range(1, user_count + 1))
+        db.session.commit()
+    return app
+
+
+def send(sender_id, recipient_id, content='hello'):
+    message = Message(sender_id=sender_id, recipient_id=recipient_id, content=content)
+    db.session.add(message)
+    db.session.commit()
+    return message
+
+
+def participant(user_id, partner_id):
+    return ConversationParticipant.query.filter_by(user_id=user_id, partner_id=partner_id).one()
+
+
+def snapshot():
+    """Comparable state of both conversation tables"""
+    conversations = sorted(
+        (c.user_low_id, c.user_high_id, c.last_message_id) for c in Conversation.query.all()
+    )
+    participants = sorted(
+        (p.user_id, p.partner_id, p.unread_count) for p in ConversationParticipant.query.all()
+    )
+    return conversations, participants
+
+
+def test_messages_maintain_conversation():
+    """Sending creates one conversation per pair and counts unread messages"""
+    print("=" * 60)
+    print("CONVERSATION TABLE TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.app_context():
+        first = send(1, 2)
+        send(2, 1)
+        last = send(1, 2)
+
+        assert Conversation.query.count() == 1
+        conversation = get_conversation(2, 1)
+        assert (conversation.user_low_id, conversation.user_high_id) == (1, 2)
+        assert conversation.last_message_id == last.id
+        assert participant(2, 1).unread_count == 2
+        assert participant(1, 2).unread_count == 1
+        assert get_unread_message_count(2) == 2
+        assert first.id < last.id
+        print("✅ Conversation and unread counters follow new messages")
+
+
+def test_mark_read_recounts():
+    """Reading resets the counter without losing messages that arrived since"""
+    app = create_test_app()
+    with app.app_context():
+        send(1, 2)
+        send(1, 2)
+
+        Message.query.filter_by(sender_id=1, recipient_id=2, is_read=False).update({'is_read': True})
+        send(1, 2, 'arrived after the read')
+        mark_conversation_read(2, 1)
+        db.session.commit()
+
+        assert participant(2, 1).unread_count == 1
+        assert get_unread_message_count(2) == 1
+        print("✅ Mark-read recounts unread messages")
+
+
+def test_rollback_discards_conversation():
+    """The conversation row shares the message's transaction"""
+    app = create_test_app()
+    with app.app_context():
+        db.session.add(Message(sender_id=3, recipient_id=4, content='never sent'))
+        db.session.flush()
+        assert Conversation.query.count() == 1
+        db.session.rollback()
+
+        assert Conversation.query.count() == 0
+        assert ConversationParticipant.query.count() == 0
+        print("✅ Rollback discards the conversation row")
+
+
+def test_backfill_matches_incremental_updates():
+    """Rebuilding from history gives the same rows as live maintenance"""
+    app = create_test_app(user_count=6)
+    rng = random.Random(3)
+    with app.app_context():
+        for _ in range(200):
+            sender_id = rng.randint(1, 6)
+            send(sender_id, rng.choice([u for u in range(1, 7) if u != sender_id]))
+        send(5, 5, 'note to self')
+        Message.query.filter(Message.id % 3 == 0).update({'is_read': True}, synchronize_session=False)
+        for user_id in range(1, 7):
+            for partner_id in range(1, 7):
+                mark_conversation_read(user_id, partner_id)
+        db.session.commit()
+
+        incremental = snapshot()
+        backfill_conversations(db.session.connection())
+        db.session.commit()
+        assert snapshot() == incremental
+        assert participant(5, 5).unread_count == 0
+        print(f"✅ Backfill rebuilt {len(incremental[0])} conversations identically")
+
+
+def test_backfill_if_empty_only_runs_once():
+    """Startup backfill fills empty tables and leaves populated ones alone"""
+    app = create_test_app()
+    with app.app_context():
+        send(1, 2)
+        send(3, 1)
+        db.session.query(ConversationParticipant).delete()
+        db.session.query(Conversation).delete()
+        db.session.commit()
+
+        assert backfill_conversations_if_empty() == 2
+        assert backfill_conversations_if_empty() == 0
+        assert participant(2, 1).unread_count == 1
+        print("✅ Startup backfill runs only on empty tables")
+
+
+if __name__ == '__main__':
+    test_messages_maintain_conversation()
+    test_mark_read_recounts()
+    test_rollback_discards_conversation()
+    test_backfill_matches_incremental_updates()
+    test_backfill_if_empty_only_runs_once()
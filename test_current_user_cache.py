@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test Current User Cache for Skileez
+This script checks that the logged-in user is loaded once per request and
+shared by decorators, templates and views.
+"""
+
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import session, render_template_string
+
+from models import db, StudentProfile, CoachProfile
+from testing_app import make_test_app, add_users
+from utils import get_current_user, get_user_load_count, clear_current_user_cache, role_required
+
+
+def create_test_app():
+    """Minimal app with an in-memory database and one dual-role user"""
+    app = make_test_app()
+    app.jinja_env.globals['get_current_user'] = get_current_user
+
+    @app.route('/student-page')
+    @role_required('student')
+    def student_page():
+        user = get_current_user()
+        return render_template_string(
+            "{% for i in range(50) %}{{ get_current_user().first_name }}{% endfor %}"
+            "|{{ loads() }}",
+            loads=get_user_load_count
+        ) + f"|{user.id}"
+
+    with app.app_context():
+        for user in add_users((1, 2), is_student=True, is_coach=True, current_role='student'):
+            db.session.add(StudentProfile(user_id=user.id, bio='bio', country='US'))
+            db.session.add(CoachProfile(user_id=user.id))
+        db.session.commit()
+    return app
+
+
+def test_user_loaded_once_per_request():
+    """Repeated lookups within a request reuse the same object"""
+    print("=" * 60)
+    print("CURRENT USER CACHE TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.test_request_context('/'):
+        session['user_id'] = 1
+        first = get_current_user()
+        for _ in range(10):
+            assert get_current_user() is first
+        assert get_user_load_count() == 1
+
+        # Profiles arrive with the user, no lazy load needed
+        assert 'student_profile' in first.__dict__
+        assert 'coach_profile' in first.__dict__
+        print("✅ User loaded once with profiles")
+
+
+def test_cache_follows_session():
+    """Switching or clearing the session user is picked up"""
+    app = create_test_app()
+    with app.test_request_context('/'):
+        assert get_current_user() is None
+
+        session['user_id'] = 1
+        assert get_current_user().id == 1
+        session['user_id'] = 2
+        assert get_current_user().id == 2
+
+        clear_current_user_cache()
+        assert get_current_user().id == 2
+        assert get_user_load_count() == 3
+
+        session.clear()
+        assert get_current_user() is None
+
+        session['user_id'] = 1
+        db.session.remove()
+        assert get_current_user().first_name == 'Test'
+        print("✅ Cache follows the session user")
+
+
+def test_decorator_and_template_share_user():
+    """The decorator, view and 50 template calls perform a single load"""
+    app = create_test_app()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    response = client.get('/student-page')
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert body.endswith('|1|1')
+    assert body.count('Test') == 50
+    print("✅ Decorator, view and template share one user load")
+
+
+if __name__ == '__main__':
+    test_user_loaded_once_per_request()
+    test_cache_follows_session()
+    test_decorator_and_template_share_user()
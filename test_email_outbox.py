@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test the Email Outbox for Skileez
+This script checks that send_email only queues a row in the caller's transaction
+and leaves the caller's changes alone when it cannot, that a drain sends the
+queue to a local SMTP sink over one connection per MAIL_MAX_EMAILS messages, that refused messages are retried with backoff and then
+dead-lettered, that an unreachable server defers the batch without using up its
+attempts, and that two senders never claim the same email.
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask_mail import Mail
+
+from models import db, User, EmailOutbox
+from testing_app import make_test_app
+from email_outbox import EmailOutboxSender, get_email_outbox, queue_email, send_queued_emails, MAX_ATTEMPTS
+from email_utils import send_email
+from smtp_sink import SMTPSink
+
+
+def create_test_app(sink):
+    app = make_test_app(MAIL_SERVER=sink.host, MAIL_PORT=sink.port, MAIL_USE_TLS=False,
+                        MAIL_DEFAULT_SENDER='noreply@skileez.test', MAIL_MAX_EMAILS=10)
+    Mail(app)
+    return app
+
+
+def statuses():
+    return {email.id: email.status for email in EmailOutbox.query.order_by(EmailOutbox.id)}
+
+
+def test_send_email_only_queues():
+    """send_email writes an outbox row with the caller's changes and opens no connection"""
+    print("=" * 60)
+    print("EMAIL OUTBOX TEST")
+    print("=" * 60)
+
+    with SMTPSink() as sink:
+        app = create_test_app(sink)
+        with app.app_context():
+            # Rolled back with the caller's changes
+            db.session.add(User(email='gone@example.com', first_name='Gone', last_name='User', password_hash='x'))
+            assert send_email('gone@example.com', 'Welcome', '<p>Hi</p>')
+            db.session.rollback()
+            assert EmailOutbox.query.count() == 0 and User.query.count() == 0
+
+            # An email that cannot be queued leaves the caller's changes pending
+            user = User(email='new@example.com', first_name='New', last_name='User', password_hash='x')
+            db.session.add(user)
+            assert not send_email([None], 'Welcome', '<p>Hi</p>')
+            assert not send_email([''], 'Welcome', '<p>Hi</p>', commit=True)
+            assert user in db.session and EmailOutbox.query.count() == 0
+
+            # Committed with them
+            assert send_email('new@example.com', 'Welcome', '<p>Hi</p>', 'Hi')
+            db.session.commit()
+            email = EmailOutbox.query.one()
+            assert User.query.count() == 1
+            assert email.recipients == ['new@example.com'] and email.status == 'pending' and email.text == 'Hi'
+
+            # Or right away when asked to
+            assert send_email('later@example.com', 'Welcome', '<p>Hi</p>', commit=True)
+            db.session.rollback()
+            assert EmailOutbox.query.count() == 2
+        assert sink.connections == 0 and sink.messages == []
+    print("✅ send_email queues the email in the caller's transaction")
+
+
+def test_drain_pools_connections():
+    """25 emails go out over 3 connections with MAIL_MAX_EMAILS at 10"""
+    with SMTPSink() as sink:
+        app = create_test_app(sink)
+        with app.app_context():
+            for number in range(25):
+                queue_email([f'student{number}@example.com'], f'Reminder {number}', f'<p>Reminder {number}</p>',
+                            f'Reminder {number}')
+            result = send_queued_emails()
+            assert result == {'emails_due': 25, 'sent': 25}, result
+            assert set(statuses().values()) == {'sent'}
+            assert all(email.sent_at is not None for email in EmailOutbox.query)
+            assert send_queued_emails() == {'emails_due': 0}
+        assert sink.connections == 3, sink.connections
+        assert sink.recipients() == [f'student{number}@example.com' for number in range(25)]
+        assert b'Reminder 24' in sink.messages[-1].data
+    print(f"✅ 25 emails sent over {sink.connections} SMTP connections")
+
+
+def test_refused_emails_retry_then_dead_letter():
+    """A 4xx refusal is retried after 1, 2, 4... minutes; a 5xx one is dead-lettered at once"""
+    with SMTPSink(reject={'busy@example.com': 450, 'gone@example.com': 550}) as sink:
+        app = create_test_app(sink)
+        with app.app_context():
+            busy = queue_email('busy@example.com', 'Busy', '<p>Busy</p>').id
+            gone = queue_email('gone@example.com', 'Gone', '<p>Gone</p>').id
+            fine = queue_email('fine@example.com', 'Fine', '<p>Fine</p>').id
+
+            now = datetime.utcnow()
+            assert send_queued_emails(now) == {'emails_due': 3, 'sent': 1, 'retried': 1, 'dead': 1}
+            assert statuses() == {busy: 'pending', gone: 'dead', fine: 'sent'}
+            email = db.session.get(EmailOutbox, busy)
+            assert email.attempts == 1 and '450' in email.last_error
+            assert email.next_attempt_at == now + timedelta(minutes=1)
+
+            # Not due again until its delay is over
+            assert send_queued_emails(now + timedelta(seconds=30)) == {'emails_due': 0}
+            delays = []
+            for _ in range(MAX_ATTEMPTS - 1):
+                db.session.expire_all()
+                email = db.session.get(EmailOutbox, busy)
+                delays.append(email.next_attempt_at - now)
+                now = email.next_attempt_at
+                send_queued_emails(now)
+            db.session.expire_all()
+            email = db.session.get(EmailOutbox, busy)
+            assert delays == [timedelta(minutes=minutes) for minutes in (1, 2, 4, 8)]
+            assert email.status == 'dead' and email.attempts == MAX_ATTEMPTS
+
+            # Dead letters can be given another go once the mailbox is fixed
+            sink.reject.clear()
+            assert get_email_outbox().requeue_dead() == 2
+            assert send_queued_emails() == {'emails_due': 2, 'sent': 2}
+        assert sorted(sink.recipients()) == ['busy@example.com', 'fine@example.com', 'gone@example.com']
+    print("✅ Refused emails are retried with backoff, then dead-lettered")
+
+
+def test_unreachable_server_defers_the_batch():
+    """No connection: the batch waits a minute without losing attempts, then goes out"""
+    sink = SMTPSink().start()
+    app = create_test_app(sink)
+    sink.stop()
+    with app.app_context():
+        for number in range(3):
+            queue_email(f'student{number}@example.com', 'Reminder', '<p>Reminder</p>')
+        now = datetime.utcnow()
+        assert send_queued_emails(now) == {'emails_due': 3, 'deferred': 3}
+        assert {(email.status, email.attempts) for email in EmailOutbox.query} == {('pending', 0)}
+
+        with SMTPSink() as restarted:
+            app.extensions['mail'].port = restarted.port
+            assert send_queued_emails(now + timedelta(minutes=1)) == {'emails_due': 3, 'sent': 3}
+        assert restarted.connections == 1 and len(restarted.messages) == 3
+    print("✅ An unreachable server defers the batch")
+
+
+def test_senders_never_share_an_email():
+    """A second sender finds nothing to claim; a dead sender's emails come back"""
+    with SMTPSink() as sink:
+        app = create_test_app(sink)
+        with app.app_context():
+            for number in range(3):
+                queue_email(f'student{number}@example.com', 'Reminder', '<p>Reminder</p>')
+            first, second = EmailOutboxSender(), EmailOutboxSender()
+            claimed = first.claim()
+            assert len(claimed) == 3 and second.claim() == []
+
+            # first died holding them; after the lock timeout they are sent by second
+            assert second.release_stale(datetime.utcnow() + timedelta(minutes=11)) == 3
+            assert second.drain() == {'emails_due': 3, 'sent': 3}
+        assert len(sink.messages) == 3
+    print("✅ Senders never share an email")
+
+
+if __name__ == '__main__':
+    test_send_email_only_queues()
+    test_drain_pools_connections()
+    test_refused_emails_retry_then_dead_letter()
+    test_unreachable_server_defers_the_batch()
+    test_senders_never_share_an_email()
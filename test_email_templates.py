@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test the Precompiled Email Templates for Skileez
+This script checks that each email template is compiled once per process, that
+one render yields the subject, plain text and escaped HTML of an email, that a
+batch of recipients renders against one compiled template, that call reminders
+are queued for both participants in their own timezones, and that 10,000
+reminder emails render in well under a second each batch.
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, ScheduledCall, EmailOutbox
+from testing_app import make_test_app, add_user, check_timing
+from email_templates import EmailRenderer, TEMPLATE_FOLDER
+from email_utils import send_template_emails
+from scheduling_utils import send_call_reminder_emails
+
+REMINDER = {'time_until': '1 hour', 'call_duration': 30, 'join_url': 'https://skileez.test/calls/7/join'}
+
+
+def create_test_app():
+    return make_test_app(BASE_URL='https://skileez.test/')
+
+
+def reminder_recipients(count):
+    return [{'user_name': f'Student {number}', 'other_name': 'Dana', 'role': 'student',
+             'call_time': f'May {number % 28 + 1}, 2030 at 09:00 AM'} for number in range(count)]
+
+
+def test_templates_compile_once():
+    """Renders and batches reuse the template compiled on first use"""
+    print("=" * 60)
+    print("EMAIL TEMPLATES TEST")
+    print("=" * 60)
+
+    renderer = EmailRenderer()
+    for recipient in reminder_recipients(50):
+        renderer.render('call_reminder', **recipient, **REMINDER)
+    renderer.render_batch('call_reminder', reminder_recipients(50), **REMINDER)
+    assert renderer.compile_count == 1
+    renderer.render('verification', verification_url='https://skileez.test/verify-email/abc')
+    assert renderer.compile_count == 2
+
+    # Every email template has the parts an email needs
+    names = [name[:-5] for name in os.listdir(os.path.join(TEMPLATE_FOLDER, 'emails'))
+             if name.endswith('.html') and name != 'email_base.html']
+    for name in names:
+        renderer.template(name)
+    assert renderer.compile_count == len(names) >= 10
+
+    directory = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(directory, 'emails'))
+        with open(os.path.join(directory, 'emails', 'bare.html'), 'w') as template:
+            template.write('<p>No subject</p>')
+        try:
+            EmailRenderer(directory).render('bare')
+            assert False, "a template without subject and text blocks was accepted"
+        except ValueError as e:
+            assert 'subject, text' in str(e)
+    finally:
+        shutil.rmtree(directory)
+    print(f"✅ {len(names)} email templates, each compiled once")
+
+
+def test_one_render_gives_every_part():
+    """Subject and text are plain; only the HTML part is escaped"""
+    renderer = EmailRenderer()
+    email = renderer.render('call_reminder', user_name='Ann & <Bo>', other_name='Dana', role='student',
+                            call_time='May 1, 2030 at 09:00 AM', **{**REMINDER, 'time_until': '24 hours'})
+    assert email.subject == 'Reminder: Your call with Dana is tomorrow'
+    assert email.text.startswith('Hi Ann & <Bo>,\n\nYour call with Dana starts in 24 hours.')
+    assert 'https://skileez.test/calls/7/join' in email.text and '<div' not in email.text
+    assert '<p>Hi Ann &amp; &lt;Bo&gt;,</p>' in email.html and '<Bo>' not in email.html
+    assert email.html.lstrip().startswith('<!DOCTYPE html>') and 'Reminder: Your call' not in email.html
+
+    scheduled = renderer.render('call_scheduled', user_name='Dana', other_name='Ann', role='coach',
+                                call_label='Free Consultation', call_time='May 1', call_duration=15,
+                                calls_url='https://skileez.test/calls')
+    assert scheduled.subject == 'New Free Consultation Scheduled'
+    assert 'Your free consultation with Ann is booked.' in scheduled.text
+    print("✅ One render gives the subject, text and HTML parts")
+
+
+def test_batches_match_single_renders():
+    """A batch equals rendering each recipient alone; recipient values override shared ones"""
+    renderer = EmailRenderer()
+    recipients = reminder_recipients(3)
+    recipients[2]['time_until'] = '24 hours'
+    batch = renderer.render_batch('call_reminder', recipients, **REMINDER)
+    assert batch == [renderer.render('call_reminder', **{**REMINDER, **recipient}) for recipient in recipients]
+    assert [email.subject for email in batch] == ['Reminder: Your call with Dana starts in 1 hour'] * 2 + \
+        ['Reminder: Your call with Dana is tomorrow']
+    print("✅ Batches match single renders")
+
+
+def test_call_reminders_are_queued_for_both_participants():
+    """Student and coach each get their own reminder, in their own timezone, in one commit"""
+    app = create_test_app()
+    with app.app_context():
+        add_user(1, 'coach@example.com', first_name='Dana', last_name='Coach', timezone='America/New_York')
+        add_user(2, 'student@example.com', first_name='Ann', last_name='Student', timezone='Europe/London')
+        call = ScheduledCall(student_id=2, coach_id=1, call_type='paid_session',
+                             scheduled_at=datetime(2030, 6, 3, 14, 0), duration_minutes=45)
+        db.session.add(call)
+        db.session.commit()
+
+        send_call_reminder_emails(call, '24h')
+        emails = {email.recipients[0]: email for email in EmailOutbox.query}
+        assert sorted(emails) == ['coach@example.com', 'student@example.com']
+        assert emails['student@example.com'].subject == 'Reminder: Your call with Dana is tomorrow'
+        assert emails['coach@example.com'].subject == 'Reminder: Your call with Ann is tomorrow'
+        assert '03:00 PM' in emails['student@example.com'].text
+        assert '10:00 AM' in emails['coach@example.com'].text
+        assert f'https://skileez.test/calls/{call.id}/join' in emails['coach@example.com'].html
+
+        assert send_template_emails('call_reminder', [(None, {}), ('', {})], **REMINDER) == 0
+    print("✅ Call reminders are queued for both participants")
+
+
+def test_ten_thousand_reminders():
+    """10,000 reminder emails from one compiled template, against compiling on every send"""
+    renderer = EmailRenderer()
+    recipients = reminder_recipients(10000)
+    renderer.template('call_reminder')
+
+    start = time.perf_counter()
+    emails = renderer.render_batch('call_reminder', recipients, **REMINDER)
+    batch_time = time.perf_counter() - start
+    assert len(emails) == 10000 and emails[-1].subject == 'Reminder: Your call with Dana starts in 1 hour'
+    assert 'Student 9999' in emails[-1].text and 'Student 9999' in emails[-1].html
+
+    # How a per-send render_template_string costs: parse and compile the template each time
+    with open(os.path.join(TEMPLATE_FOLDER, 'emails', 'call_reminder.html')) as template:
+        source = template.read()
+    sample = recipients[:200]
+    start = time.perf_counter()
+    for recipient in sample:
+        renderer.environment.from_string(source).render(**recipient, **REMINDER)
+    compile_each = (time.perf_counter() - start) / len(sample) * 1e6
+
+    per_email = batch_time / len(recipients) * 1e6
+    check_timing(per_email * 10 < compile_each,
+                 f"batch render {per_email:.0f}µs per email vs compiling per send {compile_each:.0f}µs")
+    check_timing(batch_time < 10, f"10,000 reminder emails took {batch_time:.2f}s, budget 10s")
+    print(f"✅ 10,000 reminder emails in {batch_time:.2f}s: {per_email:.0f}µs each "
+          f"(compiling per send {compile_each:.0f}µs)")
+
+
+if __name__ == '__main__':
+    test_templates_compile_once()
+    test_one_render_gives_every_part()
+    test_batches_match_single_renders()
+    test_call_reminders_are_queued_for_both_participants()
+    test_ten_thousand_reminders()
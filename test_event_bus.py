@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Test Event Bus for Skileez
+This script checks publishing after commit, replay for reconnects, cross-worker
+fan-out through the SQLite file backend, and the stream / long-poll routes.
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, Message, Notification, LearningRequest, Proposal, Session
+from testing_app import make_test_app, add_users
+from event_bus import (
+    EventBus, SQLiteFileBackend, get_event_bus,
+    EVENT_MESSAGE, EVENT_NOTIFICATION_COUNT, EVENT_SESSION_STATUS, EVENT_AVAILABILITY
+)
+
+
+def create_test_app():
+    """Minimal app serving the event routes against an in-memory database"""
+    import routes
+
+    app = make_test_app(views=[('/api/events/stream', routes.event_stream),
+                               ('/api/events/poll', routes.event_poll)])
+    with app.app_context():
+        add_users((1, 2, 3))
+        db.session.commit()
+    return app
+
+
+def logged_in_client(app, user_id=1):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def test_publish_subscribe_and_replay():
+    """Subscribers get their own events; the buffer replays what they missed"""
+    print("=" * 60)
+    print("EVENT BUS TEST")
+    print("=" * 60)
+
+    bus = EventBus(buffer_size=3)
+    with bus.subscribe(1) as subscription:
+        first = bus.publish(1, EVENT_MESSAGE, {'message_id': 10})
+        bus.publish(2, EVENT_MESSAGE, {'message_id': 11})
+        assert subscription.get(timeout=1)['data'] == {'message_id': 10}
+        assert subscription.get(timeout=0.05) is None
+
+    for i in range(5):
+        bus.publish(1, EVENT_MESSAGE, {'message_id': 20 + i})
+    replay = bus.events_since(1, first['id'])
+    assert [e['data']['message_id'] for e in replay] == [22, 23, 24]
+    assert [e['id'] for e in replay] == sorted(e['id'] for e in replay)
+
+    # A burst keeps distinct, increasing ids once the browser parses them as doubles
+    burst = [bus.publish(1, EVENT_MESSAGE)['id'] for _ in range(100)]
+    assert all(event_id < 2 ** 53 for event_id in burst)
+    assert [float(event_id) for event_id in burst] == sorted({float(event_id) for event_id in burst})
+    print("✅ Publish, subscribe and replay work per user")
+
+
+def test_events_publish_only_after_commit():
+    """Message, notification and session events wait for the commit; rollbacks drop them"""
+    app = create_test_app()
+    bus = get_event_bus()
+
+    with app.app_context(), bus.subscribe(1) as sender, bus.subscribe(2) as recipient:
+        db.session.add(Message(sender_id=1, recipient_id=2, content='hello'))
+        db.session.flush()
+        assert recipient.get(timeout=0.05) is None
+        db.session.commit()
+        for subscription in (sender, recipient):
+            event = subscription.get(timeout=1)
+            assert event['type'] == EVENT_MESSAGE
+            assert event['data']['sender_id'] == 1
+
+        db.session.add(Message(sender_id=2, recipient_id=1, content='never sent'))
+        db.session.flush()
+        db.session.rollback()
+        assert sender.drain() == [] and recipient.drain() == []
+
+        Notification.create_notification(2, 'Hi', 'New proposal', 'system')
+        Notification.create_notification(2, 'Hi', 'Another one', 'system')
+        counts = [e['data']['count'] for e in recipient.drain() if e['type'] == EVENT_NOTIFICATION_COUNT]
+        assert counts == [1, 2]
+        Notification.mark_all_as_read(2)
+        assert recipient.get(timeout=1)['data'] == {'count': 0}
+
+        request = LearningRequest(student_id=2, title='Python', description='Learn Python')
+        db.session.add(request)
+        db.session.flush()
+        proposal = Proposal(learning_request_id=request.id, coach_id=1, cover_letter='Hi',
+                            session_count=1, price_per_session=10, session_duration=60, total_price=10)
+        db.session.add(proposal)
+        db.session.flush()
+        session = Session(proposal_id=proposal.id, session_number=1, status='scheduled')
+        db.session.add(session)
+        db.session.commit()
+        sender.drain()
+        recipient.drain()
+
+        session.status = 'active'
+        db.session.commit()
+        for subscription in (sender, recipient):
+            event = subscription.get(timeout=1)
+            assert event['type'] == EVENT_SESSION_STATUS
+            assert event['data'] == {'session_id': session.id, 'status': 'active'}
+        print("✅ Events are published after commit and dropped on rollback")
+
+
+def test_sqlite_file_backend_fans_out():
+    """Two buses sharing one event file see each other's events exactly once"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'events.db')
+        worker_a, worker_b = EventBus(), EventBus()
+        backend_a = SQLiteFileBackend(path, poll_interval=3600)
+        backend_b = SQLiteFileBackend(path, poll_interval=3600)
+        worker_a.configure(backend=backend_a)
+        worker_b.configure(backend=backend_b)
+        try:
+            with worker_a.subscribe(7) as on_a, worker_b.subscribe(7) as on_b:
+                event = worker_a.publish(7, EVENT_MESSAGE, {'message_id': 1})
+                backend_a.poll_once()
+                backend_b.poll_once()
+                assert [e['id'] for e in on_a.drain()] == [event['id']]
+                assert [e['id'] for e in on_b.drain()] == [event['id']]
+                assert worker_b.events_since(7, 0)[0]['data'] == {'message_id': 1}
+
+                # Internal events reach listeners on every worker but no user
+                heard = []
+                worker_b.add_listener(EVENT_AVAILABILITY, heard.append)
+                worker_a.broadcast(EVENT_AVAILABILITY, {'coach_id': 7})
+                backend_b.poll_once()
+                assert [e['data'] for e in heard] == [{'coach_id': 7}]
+                assert on_a.drain() == [] and on_b.drain() == []
+                assert [e['type'] for e in worker_a.events_since(7, 0)] == [EVENT_MESSAGE]
+                assert [e['type'] for e in worker_b.events_since(7, 0)] == [EVENT_MESSAGE]
+        finally:
+            backend_a.stop()
+            backend_b.stop()
+    print("✅ SQLite file backend fans out across workers, broadcasts to listeners only")
+
+
+def test_long_poll_route():
+    """Long-poll returns buffered events at once and waits for new ones"""
+    app = create_test_app()
+    bus = get_event_bus()
+    client = logged_in_client(app, user_id=3)
+
+    data = client.get('/api/events/poll?timeout=0').get_json()
+    baseline = data['last_event_id']
+
+    published = bus.publish(3, EVENT_NOTIFICATION_COUNT, {'count': 4})
+    data = client.get(f'/api/events/poll?last_event_id={baseline}&timeout=0').get_json()
+    assert [e['id'] for e in data['events']] == [published['id']]
+    assert data['last_event_id'] == published['id']
+
+    timer = threading.Timer(0.2, bus.publish, (3, EVENT_MESSAGE, {'message_id': 5}))
+    timer.start()
+    start = time.monotonic()
+    data = client.get(f"/api/events/poll?last_event_id={published['id']}&timeout=5").get_json()
+    assert time.monotonic() - start < 4
+    assert [e['data'] for e in data['events']] == [{'message_id': 5}]
+    print("✅ Long-poll returns buffered and new events")
+
+
+def test_stream_route():
+    """The stream replays after Last-Event-ID and refuses streams past the worker limit"""
+    app = create_test_app()
+    bus = get_event_bus()
+    client = logged_in_client(app, user_id=3)
+
+    first = bus.publish(3, EVENT_MESSAGE, {'message_id': 8})
+    second = bus.publish(3, EVENT_MESSAGE, {'message_id': 9})
+    response = client.get('/api/events/stream', headers={'Last-Event-ID': str(first['id'])}, buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    chunks = response.response
+    assert next(chunks).startswith(b'retry:')
+    assert next(chunks).startswith(f"id: {second['id']}\nevent: message\n".encode())
+    response.close()
+
+    bus.configure(max_streams=1)
+    assert bus.acquire_stream_slot()
+    try:
+        response = client.get('/api/events/stream')
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+    finally:
+        bus.release_stream_slot()
+        bus.configure(max_streams=4)
+    print("✅ Stream replays missed events and enforces the connection limit")
+
+
+if __name__ == '__main__':
+    test_publish_subscribe_and_replay()
+    test_events_publish_only_after_commit()
+    test_sqlite_file_backend_fans_out()
+    test_long_poll_route()
+    test_stream_route()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test Free/Busy engine for Skileez
+This script checks interval merging and subtraction, that slots skip every kind
+of booking and availability exceptions, and that a 30-day slot range costs a
+fixed number of queries.
+"""
+
+import sys
+import os
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from models import (
+    db, LearningRequest, Proposal, Session, ScheduledSession, ScheduledCall,
+    CoachAvailability, AvailabilityException
+)
+from testing_app import make_test_app, add_users
+from free_busy import merge_intervals, subtract_intervals, get_free_busy_engine
+
+# A Monday, far enough ahead to never be "today"
+MONDAY = date(2030, 1, 7)
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app():
+    """Minimal app with one coach working 9:00-12:00 UTC on weekdays and one student"""
+    import routes
+
+    app = make_test_app(views=[('/api/coaches/<int:coach_id>/availability-slots',
+                                routes.get_coach_availability_slots_api)])
+    with app.app_context():
+        add_users((1, 2))
+        availability = CoachAvailability(coach_id=1, timezone='UTC', session_duration=60, buffer_after=0,
+                                         saturday_start=0, saturday_end=0, sunday_start=0, sunday_end=0)
+        for day in ('monday', 'tuesday', 'wednesday', 'thursday', 'friday'):
+            setattr(availability, f'{day}_start', 9 * 60)
+            setattr(availability, f'{day}_end', 12 * 60)
+        db.session.add(availability)
+        db.session.commit()
+    return app
+
+
+def add_bookings(app):
+    """One booking of each kind on Monday, a blocked Tuesday and a blocked Wednesday hour"""
+    with app.app_context():
+        request = LearningRequest(student_id=2, title='Python', description='Learn Python')
+        db.session.add(request)
+        db.session.flush()
+        proposal = Proposal(learning_request_id=request.id, coach_id=1, cover_letter='Hi',
+                            session_count=1, price_per_session=10, session_duration=60, total_price=10)
+        db.session.add(proposal)
+        db.session.flush()
+        session = Session(proposal_id=proposal.id, session_number=1, status='scheduled',
+                          scheduled_at=at(MONDAY, 9), duration_minutes=60)
+        db.session.add(session)
+        db.session.flush()
+        db.session.add(ScheduledSession(id=5, session_id=session.id, coach_id=1, student_id=2,
+                                        scheduled_at=at(MONDAY, 10), duration_minutes=30))
+        db.session.add(ScheduledCall(student_id=2, coach_id=1, call_type='free_consultation',
+                                     scheduled_at=at(MONDAY, 11, 30), duration_minutes=15))
+        # Cancelled bookings don't block anything
+        db.session.add(ScheduledCall(student_id=2, coach_id=1, call_type='free_consultation', status='cancelled',
+                                     scheduled_at=at(MONDAY + timedelta(days=3), 9), duration_minutes=60))
+
+        availability = CoachAvailability.query.filter_by(coach_id=1).first()
+        db.session.add(AvailabilityException(availability_id=availability.id, date=MONDAY + timedelta(days=1)))
+        db.session.add(AvailabilityException(availability_id=availability.id, date=MONDAY + timedelta(days=2),
+                                             start_time=time(10), end_time=time(11), is_blocked=False))
+        db.session.commit()
+
+
+def test_interval_helpers():
+    """Merging and subtracting sorted intervals"""
+    print("=" * 60)
+    print("FREE/BUSY ENGINE TEST")
+    print("=" * 60)
+
+    merged = merge_intervals([(5, 7), (1, 3), (2, 4), (7, 8)])
+    assert merged == [(1, 4), (5, 8)]
+    assert subtract_intervals([(0, 10), (20, 30)], [(2, 3), (9, 21), (25, 40)]) == [(0, 2), (3, 9), (21, 25)]
+    assert subtract_intervals([(0, 10)], []) == [(0, 10)]
+    assert subtract_intervals([(0, 10)], [(0, 10)]) == []
+    print("✅ Interval merge and subtraction")
+
+
+def test_slots_skip_bookings_and_exceptions():
+    """Sessions, scheduled sessions, calls and exceptions all remove slots"""
+    app = create_test_app()
+    add_bookings(app)
+    with app.app_context():
+        from utils import get_available_slots_for_date, get_available_slots_for_range, check_availability_conflict
+
+        monday = get_available_slots_for_date(1, MONDAY)
+        assert monday == []  # 9-10 session, 10-10:30 scheduled session, 11:30 call
+
+        slots = get_available_slots_for_range(1, MONDAY, MONDAY + timedelta(days=6), duration_minutes=30)
+        starts = {day: [slot['start_utc'].strftime('%H:%M') for slot in day_slots]
+                  for day, day_slots in slots.items()}
+        assert starts[MONDAY.isoformat()] == ['10:30', '11:00']
+        assert (MONDAY + timedelta(days=1)).isoformat() not in starts  # blocked all day
+        assert starts[(MONDAY + timedelta(days=2)).isoformat()] == ['09:00', '09:30', '11:00', '11:30']
+        assert len(starts[(MONDAY + timedelta(days=3)).isoformat()]) == 6  # cancelled call ignored
+        assert (MONDAY + timedelta(days=5)).isoformat() not in starts  # Saturday off
+
+        has_conflict, conflicts = check_availability_conflict(1, at(MONDAY, 10, 15), at(MONDAY, 10, 45))
+        assert has_conflict and [c.kind for c in conflicts] == ['scheduled_session']
+        has_conflict, _ = check_availability_conflict(1, at(MONDAY, 10, 15), at(MONDAY, 10, 45),
+                                                      exclude_session_id=5)
+        assert not has_conflict
+    print("✅ Slots skip every booking kind and exceptions")
+
+
+def test_range_uses_fixed_query_count():
+    """A 30-day range costs the same queries as a single day"""
+    app = create_test_app()
+    add_bookings(app)
+    with app.app_context():
+        engine = get_free_busy_engine()
+        engine.get_slots(1, MONDAY, MONDAY)  # table checks run once per engine
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            engine.get_slots(1, MONDAY, MONDAY)
+            one_day = len(statements)
+            statements.clear()
+            month = engine.get_slots(1, MONDAY, MONDAY + timedelta(days=29))
+            thirty_days = len(statements)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        # Availability settings, exceptions, busy intervals
+        assert one_day == thirty_days == 3, (one_day, thirty_days)
+        assert len(month) == 20
+    print(f"✅ 30 days of slots in {thirty_days} queries")
+
+
+def test_availability_slots_api():
+    """The per-date API is built on the engine and uses the coach's real hours"""
+    app = create_test_app()
+    add_bookings(app)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 2
+
+    data = client.get(f'/api/coaches/1/availability-slots?date={MONDAY.isoformat()}&duration_minutes=30').get_json()
+    assert len(data['slots']) == 2, data
+    data = client.get(f'/api/coaches/1/availability-slots?date={(MONDAY + timedelta(days=3)).isoformat()}'
+                      f'&duration_minutes=60').get_json()
+    assert len(data['slots']) == 5  # 9:00 to 11:00 every 30 minutes
+    print("✅ Availability slots API")
+
+
+if __name__ == '__main__':
+    test_interval_helpers()
+    test_slots_skip_bookings_and_exceptions()
+    test_range_uses_fixed_query_count()
+    test_availability_slots_api()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test Heartbeat API for Skileez
+This script checks the combined heartbeat payload, its per-section version
+stamps, and that its query count does not grow with the data.
+"""
+
+import sys
+import os
+from datetime import datetime, date, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from models import (
+    db, Message, Notification, LearningRequest, Proposal, Session, Contract, ScheduledCall
+)
+from testing_app import make_test_app, add_users
+
+
+def create_test_app():
+    """Minimal app serving the heartbeat against an in-memory database"""
+    import routes
+
+    app = make_test_app(views=[('/api/heartbeat', routes.heartbeat)])
+    with app.app_context():
+        add_users((1, 2, 3))
+        db.session.flush()
+
+        # Coach 1 teaches student 2; user 3 is not part of the session
+        request = LearningRequest(student_id=2, title='Python', description='Learn Python')
+        db.session.add(request)
+        db.session.flush()
+        proposal = Proposal(learning_request_id=request.id, coach_id=1, cover_letter='Hi',
+                            session_count=1, price_per_session=10, session_duration=60, total_price=10)
+        db.session.add(proposal)
+        db.session.flush()
+        db.session.add(Contract(proposal_id=proposal.id, student_id=2, coach_id=1, contract_number='C-1',
+                                start_date=date.today(), total_sessions=1, total_amount=10,
+                                payment_model='per_session', rate=10, duration_minutes=60))
+        db.session.add(Session(id=1, proposal_id=proposal.id, session_number=1, status='scheduled',
+                               scheduled_at=datetime.utcnow() + timedelta(days=1), duration_minutes=60))
+        db.session.commit()
+    return app
+
+
+def add_rows(app, notifications=0, calls=0, messages=0):
+    with app.app_context():
+        for i in range(notifications):
+            db.session.add(Notification(user_id=2, title='Hi', message=f'n{i}', type='system'))
+        # A coach's calls may not overlap, so later batches start after the earlier ones
+        first_hour = ScheduledCall.query.count() + 1
+        for i in range(calls):
+            db.session.add(ScheduledCall(student_id=2, coach_id=1, call_type='free_consultation',
+                                         scheduled_at=datetime.utcnow() + timedelta(hours=first_hour + i)))
+        for i in range(messages):
+            db.session.add(Message(sender_id=1, recipient_id=2, content=f'm{i}'))
+        db.session.commit()
+
+
+def logged_in_client(app, user_id=2):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def count_queries(app, client, url):
+    """Run one request and count the SQL statements it issues"""
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response.get_json(), statements
+
+
+def test_heartbeat_sections():
+    """One call returns notifications, messages, calls and the session status"""
+    print("=" * 60)
+    print("HEARTBEAT TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    add_rows(app, notifications=3, calls=2, messages=4)
+    client = logged_in_client(app)
+
+    data = client.get('/api/heartbeat?conversation=1&after_id=2&session=1').get_json()
+    assert data['success']
+    assert data['notifications']['unread_count'] == 3
+    assert len(data['notifications']['notifications']) == 3
+    assert data['messages']['unread_count'] == 4
+    assert [m['id'] for m in data['messages']['conversation']['messages']] == [3, 4]
+    assert data['messages']['conversation']['last_id'] == 4
+    assert len(data['calls']['calls']) == 2
+    assert data['session']['status'] == 'scheduled'
+    assert data['session']['session_id'] == 1
+
+    outsider = logged_in_client(app, user_id=3)
+    data = outsider.get('/api/heartbeat?session=1').get_json()
+    assert data['session']['error'] == 'Access denied'
+    assert 'status' not in data['session']
+    print("✅ Heartbeat returns every section")
+
+
+def test_version_stamps_skip_unchanged_sections():
+    """Sending back the stamps returns unchanged sections without their rows"""
+    app = create_test_app()
+    add_rows(app, notifications=2, calls=1, messages=2)
+    client = logged_in_client(app)
+
+    first = client.get('/api/heartbeat?conversation=1&after_id=2&session=1').get_json()
+    versions = '&'.join(f'{section}_version={first[section]["version"]}'
+                        for section in ('notifications', 'messages', 'calls', 'session'))
+    second = client.get(f'/api/heartbeat?conversation=1&after_id=2&session=1&{versions}').get_json()
+    for section in ('notifications', 'messages', 'calls', 'session'):
+        assert second[section]['changed'] is False, section
+    assert 'notifications' not in second['notifications']
+    assert 'calls' not in second['calls']
+    assert 'status' not in second['session']
+
+    add_rows(app, notifications=1, messages=1)
+    third = client.get(f'/api/heartbeat?conversation=1&after_id=2&session=1&{versions}').get_json()
+    assert third['notifications']['changed'] and third['notifications']['unread_count'] == 3
+    assert third['messages']['changed']
+    assert [m['id'] for m in third['messages']['conversation']['messages']] == [3]
+    assert third['calls']['changed'] is False
+    print("✅ Version stamps skip unchanged sections")
+
+
+def test_query_count_is_fixed():
+    """The number of statements does not depend on how much data the user has"""
+    app = create_test_app()
+    client = logged_in_client(app)
+    url = '/api/heartbeat?conversation=1&after_id=0&session=1'
+
+    add_rows(app, notifications=2, calls=1, messages=2)
+    client.get(url)  # table checks run once per engine
+    _, small = count_queries(app, client, url)
+
+    add_rows(app, notifications=50, calls=9, messages=100)
+    data, large = count_queries(app, client, url)
+    assert len(data['notifications']['notifications']) == 20
+    assert len(data['calls']['calls']) == 10
+
+    # User load, counters, notification list, new messages, calls, session
+    assert len(small) == len(large) <= 6, (len(small), len(large))
+
+    versions = '&'.join(f'{section}_version={data[section]["version"]}'
+                        for section in ('notifications', 'messages', 'calls', 'session'))
+    last_id = data['messages']['conversation']['last_id']
+    _, idle = count_queries(app, client, f'/api/heartbeat?conversation=1&after_id={last_id}&session=1&{versions}')
+    assert len(idle) <= 4, len(idle)
+    print(f"✅ Heartbeat uses {len(large)} queries ({len(idle)} when idle) regardless of data size")
+
+
+if __name__ == '__main__':
+    test_heartbeat_sections()
+    test_version_stamps_skip_unchanged_sections()
+    test_query_count_is_fixed()
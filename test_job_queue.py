@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Test the Due-Time Job Queue for Skileez
+This script checks that booking, moving, cancelling and deleting calls and sessions
+keeps their scheduled_job rows in step, that a run claims only the due rows with one
+indexed query however many bookings lie ahead, that two workers never claim the same
+job, and that moved, expired and failing jobs are rescheduled, dropped or retried.
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, update
+
+from models import db, Session, ScheduledCall, ScheduledJob
+from testing_app import make_test_app, add_user
+from job_queue import JobQueue, get_job_queue, backfill_scheduled_jobs_if_empty
+
+COACH_ID = 1
+STUDENT_ID = 2
+
+CALL_KINDS = ['calls_ready', 'mark_overdue', 'meeting_activation', 'meeting_reminders', 'reminders_1h',
+              'reminders_24h']
+
+
+def create_test_app():
+    app = make_test_app()
+    with app.app_context():
+        add_user(COACH_ID, 'coach@example.com', last_name='Coach')
+        add_user(STUDENT_ID, 'student@example.com', last_name='Student')
+        db.session.commit()
+    return app
+
+
+def book_call(starts_in, duration_minutes=30):
+    call = ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                         scheduled_at=datetime.utcnow() + starts_in, duration_minutes=duration_minutes)
+    db.session.add(call)
+    db.session.commit()
+    return call
+
+
+def jobs(target_type, target_id):
+    return {job.kind: job for job in ScheduledJob.query.filter_by(target_type=target_type, target_id=target_id)}
+
+
+def test_bookings_keep_their_jobs_in_step():
+    """Booking, moving, cancelling and deleting a call rewrite its jobs in the same flush"""
+    print("=" * 60)
+    print("JOB QUEUE TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.app_context():
+        call = book_call(timedelta(days=3))
+        queued = jobs('call', call.id)
+        assert sorted(queued) == CALL_KINDS
+        assert queued['reminders_24h'].due_at == call.scheduled_at - timedelta(hours=25)
+        assert queued['mark_overdue'].due_at == call.scheduled_at + timedelta(minutes=15)
+        assert {job.state for job in queued.values()} == {'pending'}
+
+        # Booked ten hours ahead: too late for the 24h reminder
+        late = book_call(timedelta(hours=10))
+        assert 'reminders_24h' not in jobs('call', late.id) and 'reminders_1h' in jobs('call', late.id)
+
+        # Editing the notes leaves the jobs alone; a job that ran stays done after a status round trip
+        db.session.execute(update(ScheduledJob).where(ScheduledJob.kind == 'reminders_24h').values(state='done'))
+        call.notes = 'Bring questions'
+        db.session.commit()
+        assert jobs('call', call.id)['reminders_24h'].state == 'done'
+
+        # Moving the call moves every job and makes the done reminder pending again
+        call.scheduled_at += timedelta(days=1)
+        db.session.commit()
+        moved = jobs('call', call.id)
+        assert moved['reminders_24h'].state == 'pending'
+        assert moved['calls_ready'].due_at == call.scheduled_at - timedelta(minutes=5)
+
+        call.status = 'cancelled'
+        db.session.commit()
+        assert {job.state for job in jobs('call', call.id).values()} == {'cancelled'}
+        call.status = 'scheduled'
+        db.session.commit()
+        assert {job.state for job in jobs('call', call.id).values()} == {'pending'}
+
+        db.session.delete(call)
+        db.session.commit()
+        assert jobs('call', call.id) == {}
+
+        session = Session(proposal_id=1, session_number=1, scheduled_at=datetime.utcnow() + timedelta(days=2),
+                          duration_minutes=60)
+        db.session.add(session)
+        db.session.commit()
+        session_jobs = jobs('session', session.id)
+        assert sorted(session_jobs) == ['auto_complete_sessions', 'meeting_activation', 'meeting_reminders',
+                                        'session_reminders']
+        assert session_jobs['auto_complete_sessions'].due_at == session.scheduled_at + timedelta(minutes=60)
+    print("✅ Bookings keep their jobs in step")
+
+
+def test_runs_claim_only_due_jobs():
+    """Hundreds of future bookings cost nothing; the due ones come from one index range"""
+    app = create_test_app()
+    with app.app_context():
+        for day in range(2, 302):
+            db.session.add(ScheduledCall(student_id=STUDENT_ID, coach_id=COACH_ID, call_type='paid_session',
+                                         scheduled_at=datetime.utcnow() + timedelta(days=day),
+                                         duration_minutes=30))
+        db.session.commit()
+        soon = [book_call(timedelta(minutes=minutes), 1).id for minutes in (2, 3, 4)]
+
+        ran = []
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            result = get_job_queue().process_due({'calls_ready': lambda call: ran.append(call.id) or True})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert sorted(ran) == soon
+        assert result == {'jobs_due': 3, 'done': 3}
+        assert ScheduledJob.query.filter_by(kind='calls_ready', state='done').count() == 3
+
+        claim, parameters = next((statement, parameters) for statement, parameters in statements
+                                 if statement.startswith('UPDATE scheduled_job SET state=?, locked_by'))
+        plan = ' '.join(str(row[-1]) for row in db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + claim, parameters))
+        assert 'ix_scheduled_job_state_due' in plan, plan
+
+        # Nothing is due any more
+        assert get_job_queue().process_due({'calls_ready': lambda call: ran.append(call.id) or True}) == \
+            {'jobs_due': 0}
+    print("✅ A run claimed the 3 due jobs among 1800 queued, from the state/due index")
+
+
+def test_workers_never_share_a_job():
+    """A second worker finds nothing left to claim; a dead worker's jobs come back"""
+    app = create_test_app()
+    with app.app_context():
+        for minutes in (1, 2, 3):
+            book_call(timedelta(minutes=minutes), 1)
+        first, second = JobQueue(), JobQueue()
+        claimed = first.claim(['calls_ready'])
+        assert len(claimed) == 3 and second.claim(['calls_ready']) == []
+
+        # first died holding the jobs; after the lock timeout they can be claimed again
+        assert second.release_stale(datetime.utcnow() + timedelta(minutes=11)) == 3
+        reclaimed = second.claim(['calls_ready'])
+        assert [job.id for job in reclaimed] == [job.id for job in claimed]
+        assert {job.attempts for job in reclaimed} == {2}
+    print("✅ Workers never share a job")
+
+
+def test_moved_expired_and_failing_jobs():
+    """Jobs re-read their booking: moved ones wait, stale ones expire, errors are retried"""
+    app = create_test_app()
+    with app.app_context():
+        queue = get_job_queue()
+        call = book_call(timedelta(hours=24, minutes=30))
+        now = datetime.utcnow()
+
+        # Moved a week on behind the ORM's back: the claimed job waits for the new time
+        moved_to = call.scheduled_at + timedelta(days=7)
+        db.session.execute(update(ScheduledCall).where(ScheduledCall.id == call.id).values(scheduled_at=moved_to))
+        db.session.commit()
+        assert queue.process_due({'reminders_24h': lambda call: True}, now) == {'jobs_due': 1, 'rescheduled': 1}
+        assert jobs('call', call.id)['reminders_24h'].due_at == moved_to - timedelta(hours=25)
+
+        # Not run in time: an hour past its window the reminder is dropped
+        late = datetime.utcnow() + timedelta(days=8)
+        assert queue.process_due({'reminders_24h': lambda call: True}, late) == {'jobs_due': 1, 'expired': 1}
+
+        def broken(call):
+            raise RuntimeError('SMTP unavailable')
+
+        overdue = book_call(-timedelta(minutes=20))
+        assert queue.process_due({'mark_overdue': broken}) == {'jobs_due': 1, 'retried': 1}
+        job = jobs('call', overdue.id)['mark_overdue']
+        assert job.state == 'pending' and job.last_error == 'SMTP unavailable'
+        assert job.due_at > datetime.utcnow() + timedelta(seconds=50)
+
+        assert queue.process_due({'mark_overdue': broken}, job.due_at) == {'jobs_due': 1, 'retried': 1}
+        job_due = jobs('call', overdue.id)['mark_overdue'].due_at
+        assert queue.process_due({'mark_overdue': broken}, job_due) == {'jobs_due': 1, 'failed': 1}
+        assert jobs('call', overdue.id)['mark_overdue'].attempts == 3
+    print("✅ Moved jobs wait, stale jobs expire, failing jobs are retried then failed")
+
+
+def test_batches_tell_sessions_from_calls():
+    """A batch handler acting on a session leaves the call with the same id skipped"""
+    app = create_test_app()
+    with app.app_context():
+        call = book_call(timedelta(minutes=2))
+        session = Session(id=call.id, proposal_id=1, session_number=1, status='scheduled',
+                          scheduled_at=call.scheduled_at, duration_minutes=30)
+        db.session.add(session)
+        db.session.commit()
+
+        handled = []
+
+        def activate_sessions(meetings):
+            handled.extend(meetings)
+            return [meeting for meeting in meetings if isinstance(meeting, Session)]
+
+        result = get_job_queue().process_due({}, batch_handlers={'meeting_activation': activate_sessions})
+        assert result == {'jobs_due': 2, 'done': 1, 'skipped': 1}, result
+        assert {type(meeting) for meeting in handled} == {Session, ScheduledCall}
+        assert jobs('session', session.id)['meeting_activation'].state == 'done'
+        assert jobs('call', call.id)['meeting_activation'].state == 'skipped'
+    print("✅ Batches tell a session from a call with the same id")
+
+
+def test_scheduler_tasks_run_from_the_queue():
+    """Overdue calls are marked missed and ended sessions completed by their due jobs"""
+    from notification_scheduler import NotificationScheduler
+
+    app = create_test_app()
+    with app.app_context():
+        overdue = book_call(-timedelta(minutes=20))
+        upcoming = book_call(timedelta(hours=3))
+        ended = Session(proposal_id=1, session_number=1, scheduled_at=datetime.utcnow() - timedelta(minutes=90),
+                        duration_minutes=60)
+        db.session.add(ended)
+        db.session.commit()
+        ScheduledJob.query.delete()
+        db.session.commit()
+        assert backfill_scheduled_jobs_if_empty() == 9
+        assert backfill_scheduled_jobs_if_empty() == 0
+        overdue_id, upcoming_id, ended_id = overdue.id, upcoming.id, ended.id
+
+    scheduler = NotificationScheduler(app)
+    assert scheduler.mark_overdue_calls() == {'jobs_due': 1, 'done': 1}
+    assert scheduler.auto_complete_sessions() == {'jobs_due': 1, 'done': 1}
+    with app.app_context():
+        assert db.session.get(ScheduledCall, overdue_id).status == 'missed'
+        assert db.session.get(ScheduledCall, upcoming_id).status == 'scheduled'
+        assert db.session.get(Session, ended_id).status == 'completed'
+        # The missed call's other jobs were cancelled by its status change
+        assert jobs('call', overdue_id)['meeting_activation'].state == 'cancelled'
+    print("✅ Scheduler tasks run from the queue")
+
+
+if __name__ == '__main__':
+    test_bookings_keep_their_jobs_in_step()
+    test_runs_claim_only_due_jobs()
+    test_workers_never_share_a_job()
+    test_moved_expired_and_failing_jobs()
+    test_batches_tell_sessions_from_calls()
+    test_scheduler_tasks_run_from_the_queue()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test the Single-Leader Job Runner for Skileez
+This script checks that only one runner holds the lease, that two runners ticking
+side by side run every job exactly once per interval with a run record each, that
+a new leader continues the schedule and closes the old leader's unfinished runs,
+and that binding the notification jobs in a web worker starts no thread.
+"""
+
+import sys
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, JobRun
+from testing_app import make_test_app
+from job_runner import JobRunner, Job, SQLiteLease, is_due
+
+START = datetime(2030, 6, 3, 1, 0)
+
+
+def create_test_app():
+    return make_test_app()
+
+
+def counting_jobs(calls):
+    """A minutely job, a five-minute job and a daily 02:00 job that count their calls"""
+    def job(name):
+        def run():
+            calls[name] = calls.get(name, 0) + 1
+            return {'run': calls[name], 'at': datetime(2030, 1, 1)}
+        return run
+    return [Job('minutely', job('minutely'), 60, None), Job('five_minutes', job('five_minutes'), 300, None),
+            Job('nightly', job('nightly'), None, '02:00')]
+
+
+def make_runner(app, lock_path, jobs, name):
+    runner = JobRunner()
+    runner.runner_id = name
+    runner.configure(app, SQLiteLease(lock_path, name), jobs)
+    return runner
+
+
+def test_lease_has_one_holder():
+    """A live lease refuses other runners until it expires or is released"""
+    print("=" * 60)
+    print("JOB RUNNER TEST")
+    print("=" * 60)
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'job_runner.lock')
+        first, second = SQLiteLease(path, 'a', lease_seconds=60), SQLiteLease(path, 'b', lease_seconds=60)
+        assert first.acquire(now=1000) and not second.acquire(now=1000)
+        assert first.acquire(now=1050) and not second.acquire(now=1100)
+        # a stopped renewing: its lease runs out 60s after the last renewal
+        assert second.acquire(now=1111) and not first.acquire(now=1112)
+        second.release()
+        assert first.acquire(now=1113)
+    finally:
+        shutil.rmtree(directory)
+    print("✅ One lease holder at a time")
+
+
+def test_two_runners_run_each_job_once():
+    """Runners ticking side by side for two hours run each job once per interval"""
+    app = create_test_app()
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'job_runner.lock')
+        calls = {}
+        jobs = counting_jobs(calls)
+        runners = [make_runner(app, path, jobs, name) for name in ('a', 'b')]
+        for tick in range(2 * 60 * 4):  # every 15 seconds
+            now = START + timedelta(seconds=15 * tick)
+            for runner in runners:
+                runner.tick(now)
+
+        assert [runner.is_leader for runner in runners] == [True, False]
+        assert calls == {'minutely': 120, 'five_minutes': 24, 'nightly': 2}, calls
+        with app.app_context():
+            runs = JobRun.query.order_by(JobRun.id).all()
+            assert len(runs) == 146
+            assert {(run.runner_id, run.status) for run in runs} == {('a', 'succeeded')}
+            nightly = [run.started_at for run in runs if run.job_name == 'nightly']
+            assert nightly == [START, START.replace(hour=2)]
+            assert runs[-1].result['at'] == '2030-01-01 00:00:00'
+    finally:
+        shutil.rmtree(directory)
+    print(f"✅ Two runners, {len(runs)} runs: every job once per interval")
+
+
+def test_new_leader_continues_the_schedule():
+    """After the leader dies mid-run, the next one closes its run and keeps the cadence"""
+    app = create_test_app()
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'job_runner.lock')
+        calls = {}
+        jobs = counting_jobs(calls)
+        leader, follower = (make_runner(app, path, jobs, name) for name in ('a', 'b'))
+        leader.tick(START)
+        with app.app_context():
+            # a crashed while running the minutely job at 01:01
+            db.session.add(JobRun(job_name='minutely', runner_id='a', status='running',
+                                  started_at=START + timedelta(minutes=1)))
+            db.session.commit()
+        with sqlite3.connect(path) as connection:
+            connection.execute('UPDATE job_lease SET expires_at = 0')
+
+        assert follower.tick(START + timedelta(minutes=1, seconds=30)) == []  # nothing due yet
+        assert follower.is_leader
+        runs = follower.tick(START + timedelta(minutes=2))
+        assert [run.job_name for run in runs] == ['minutely']
+        with app.app_context():
+            assert JobRun.query.filter_by(status='abandoned').count() == 1
+            assert JobRun.query.filter_by(status='running').count() == 0
+        assert not leader.tick(START + timedelta(minutes=2, seconds=15)) and not leader.is_leader
+    finally:
+        shutil.rmtree(directory)
+    print("✅ A new leader continues the schedule")
+
+
+def test_failures_are_recorded():
+    """Raised errors and error results are failed runs; the other jobs still run"""
+    app = create_test_app()
+    directory = tempfile.mkdtemp()
+
+    def broken():
+        raise RuntimeError('SMTP unavailable')
+
+    try:
+        runner = make_runner(app, os.path.join(directory, 'job_runner.lock'), [
+            Job('broken', broken, 60, None),
+            Job('reported', lambda: {'error': 'table missing'}, 60, None),
+            Job('fine', lambda: {'sent': 3}, 60, None),
+        ], 'a')
+        runs = runner.tick(START)
+        assert [(run.job_name, run.status) for run in runs] == \
+            [('broken', 'failed'), ('reported', 'failed'), ('fine', 'succeeded')]
+        assert 'RuntimeError: SMTP unavailable' in runs[0].error
+        assert runs[1].error == 'table missing' and runs[2].result == {'sent': 3}
+        assert all(run.finished_at >= run.started_at and run.duration_ms is not None for run in runs)
+    finally:
+        shutil.rmtree(directory)
+    print("✅ Failed runs are recorded")
+
+
+def test_due_rules():
+    """Interval jobs are due after their interval, daily jobs once per slot"""
+    every_minute = Job('every_minute', None, 60, None)
+    nightly = Job('nightly', None, None, '02:00')
+    assert is_due(every_minute, None, START)
+    assert not is_due(every_minute, START, START + timedelta(seconds=59))
+    assert is_due(every_minute, START, START + timedelta(seconds=60))
+    assert is_due(nightly, START - timedelta(days=1), START)
+    assert not is_due(nightly, START.replace(hour=2, minute=5) - timedelta(days=1), START)
+    assert is_due(nightly, START, START.replace(hour=2))
+    print("✅ Due rules")
+
+
+def test_web_workers_start_no_scheduler_thread():
+    """Binding the notification jobs starts nothing; the queued kinds match the webhook's task names"""
+    from notification_scheduler import NotificationScheduler
+
+    app = create_test_app()
+    threads = threading.active_count()
+    scheduler = NotificationScheduler(app)
+    assert threading.active_count() == threads and scheduler.app is app
+    names = [name for name, _, _, _ in scheduler.job_definitions()]
+    assert names == ['due_jobs', 'email_outbox', 'cleanup']
+    assert sorted({**scheduler.queue_handlers(), **scheduler.queue_batch_handlers()}) == [
+        'auto_complete_sessions', 'calls_ready', 'mark_overdue', 'reminders_1h', 'reminders_24h', 'session_reminders']
+    print("✅ Web workers start no scheduler thread")
+
+
+if __name__ == '__main__':
+    test_lease_has_one_holder()
+    test_two_runners_run_each_job_once()
+    test_new_leader_continues_the_schedule()
+    test_failures_are_recorded()
+    test_due_rules()
+    test_web_workers_start_no_scheduler_thread()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test Message Payloads for Skileez
+This script checks that contract, session and consultation card fields are parsed
+once when a message is written, match the template filters, and that older
+messages are backfilled in batches.
+"""
+
+import sys
+import os
+import json
+import time
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, text
+
+from models import db, Message
+from testing_app import make_test_app, add_users, check_timing
+from message_payload import (
+    parse_contract_info, parse_session_info, parse_consultation_info,
+    build_message_payload, backfill_message_payloads, prepare_message_payloads
+)
+
+CONTRACT_TEXT = (
+    "📋 **New Contract Created**\n\n**Project:** Learn Flask\n**Sessions:** 4\n"
+    "**Total Amount:** $120.00\n**Start Date:** January 5, 2025\nContract ID: 17"
+)
+SESSION_JSON = json.dumps({'session_id': 9, 'session_number': 2, 'scheduled_at': '2025-01-05T10:00:00',
+                           'coach_name': 'Ada', 'student_name': 'Bob'})
+CONSULTATION_TEXT = "Free consultation\nScheduled: January 5, 2025 at 10:00 AM\nCoach: Ada\nDuration: 15 minutes"
+
+
+def create_test_app():
+    """Minimal app with two users against an in-memory database"""
+    app = make_test_app()
+    with app.app_context():
+        add_users((1, 2))
+        db.session.commit()
+    return app
+
+
+def test_payload_parsed_on_write():
+    """New card messages carry the same fields the template filters produced"""
+    print("=" * 60)
+    print("MESSAGE PAYLOAD TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.app_context():
+        contract = Message(sender_id=1, recipient_id=2, content=CONTRACT_TEXT, message_type='CONTRACT_OFFER')
+        session = Message(sender_id=1, recipient_id=2, content=SESSION_JSON, message_type='SESSION_SCHEDULED')
+        consultation = Message(sender_id=1, recipient_id=2, content=CONSULTATION_TEXT,
+                               message_type='FREE_CONSULTATION')
+        plain = Message(sender_id=1, recipient_id=2, content='Hello there')
+        db.session.add_all([contract, session, consultation, plain])
+        db.session.commit()
+        db.session.expire_all()
+
+        assert contract.payload == {'contract': parse_contract_info(CONTRACT_TEXT)}
+        assert contract.contract_info['project'] == 'Learn Flask'
+        assert contract.contract_info['amount'] == '$120.00'
+        assert session.payload == {'session': parse_session_info(SESSION_JSON)}
+        assert session.session_info['coach_name'] == 'Ada'
+        assert consultation.consultation_info == parse_consultation_info(CONSULTATION_TEXT)
+        assert consultation.consultation_info['scheduled_at'] == 'January 5, 2025 at 10:00 AM'
+        assert plain.payload is None
+        assert plain.contract_info is None
+
+        # Editing the content re-parses the card
+        contract.content = CONTRACT_TEXT.replace('Learn Flask', 'Learn Django')
+        db.session.commit()
+        db.session.expire_all()
+        assert contract.contract_info['project'] == 'Learn Django'
+
+        # The app's template filters still give the same answer
+        from app import extract_contract_info
+        assert extract_contract_info(CONTRACT_TEXT) == parse_contract_info(CONTRACT_TEXT)
+    print("✅ Card fields are parsed once, at write time")
+
+
+def test_backfill_fills_older_messages():
+    """Messages written without a payload are parsed in id-ordered batches"""
+    app = create_test_app()
+    with app.app_context():
+        rows = [(CONTRACT_TEXT, 'CONTRACT_OFFER'), (SESSION_JSON, 'SESSION_SCHEDULED'),
+                (CONSULTATION_TEXT, 'FREE_CONSULTATION'), ('Hello', 'TEXT')] * 3
+        for content, message_type in rows:
+            db.session.execute(text(
+                "INSERT INTO message (sender_id, recipient_id, content, message_type, is_read) "
+                "VALUES (1, 2, :content, :message_type, 0)"
+            ), {'content': content, 'message_type': message_type})
+        db.session.commit()
+
+        with db.engine.begin() as connection:
+            assert backfill_message_payloads(connection, batch_size=2) == 9
+        with db.engine.begin() as connection:
+            assert backfill_message_payloads(connection) == 0
+
+        for message in Message.query.all():
+            assert message.payload == build_message_payload(message.content, message.message_type)
+    print("✅ Backfill parses older messages once")
+
+
+def test_startup_fills_only_a_new_column():
+    """Startup backfills when it adds the column, and reads no messages once it exists"""
+    app = create_test_app()
+    with app.app_context():
+        db.session.execute(text("ALTER TABLE message DROP COLUMN payload"))
+        for content, message_type in [(CONTRACT_TEXT, 'CONTRACT_OFFER'), ('Hello', 'TEXT')] * 3:
+            db.session.execute(text(
+                "INSERT INTO message (sender_id, recipient_id, content, message_type, is_read) "
+                "VALUES (1, 2, :content, :message_type, 0)"
+            ), {'content': content, 'message_type': message_type})
+        db.session.commit()
+        assert prepare_message_payloads() == 3
+
+        # A message left without a payload is the backfill script's job, not every startup's
+        db.session.execute(text("UPDATE message SET payload = NULL"))
+        db.session.commit()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert prepare_message_payloads() == 0
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert not any('FROM message' in statement for statement in statements), statements
+    print("✅ Startup backfills a new payload column and skips the scan afterwards")
+
+
+def test_rendering_reads_stored_payload():
+    """Reading the stored payload is much cheaper than re-parsing content"""
+    app = create_test_app()
+    with app.app_context():
+        db.session.add_all([Message(sender_id=1, recipient_id=2, content=CONTRACT_TEXT,
+                                    message_type='CONTRACT_OFFER') for _ in range(200)])
+        db.session.commit()
+        messages = Message.query.all()
+
+        start = time.perf_counter()
+        for _ in range(10):
+            stored = [message.contract_info for message in messages]
+        stored_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(10):
+            parsed = [parse_contract_info(message.content) for message in messages]
+        parse_time = time.perf_counter() - start
+
+        assert stored == parsed
+        check_timing(stored_time < parse_time,
+                     f"stored payload reads {stored_time * 1000:.1f}ms vs parsing {parse_time * 1000:.1f}ms")
+    print(f"✅ 2000 card reads: {stored_time * 1000:.1f}ms stored vs {parse_time * 1000:.1f}ms parsed")
+
+
+if __name__ == '__main__':
+    test_payload_parsed_on_write()
+    test_backfill_fills_older_messages()
+    test_startup_fills_only_a_new_column()
+    test_rendering_reads_stored_payload()
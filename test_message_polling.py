@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test Message Polling for Skileez
+This script checks the after_id cursor mode of the new-messages endpoint:
+only newer rows, 204 when idle, and ETag / If-None-Match short-circuits.
+"""
+
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models import db, Message
+from testing_app import make_test_app, add_users
+
+
+def create_test_app():
+    """Minimal app serving the polling view against an in-memory database"""
+    import routes
+
+    app = make_test_app(views=[('/messages/<int:user_id>/new-messages', routes.get_new_messages)])
+    with app.app_context():
+        add_users((1, 2, 3))
+        db.session.commit()
+    return app
+
+
+def send(app, sender_id, recipient_id, content='hello'):
+    with app.app_context():
+        message = Message(sender_id=sender_id, recipient_id=recipient_id, content=content)
+        db.session.add(message)
+        db.session.commit()
+        return message.id
+
+
+def logged_in_client(app, user_id=1):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def test_after_id_returns_only_newer_messages():
+    """Cursor mode returns rows above after_id, in order, with the new cursor"""
+    print("=" * 60)
+    print("MESSAGE POLLING TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    first = send(app, 1, 2)
+    second = send(app, 2, 1)
+    send(app, 3, 1)  # other conversation
+    third = send(app, 1, 2)
+
+    client = logged_in_client(app)
+    response = client.get(f'/messages/2/new-messages?after_id={first}')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [m['id'] for m in data['messages']] == [second, third]
+    assert data['last_id'] == third
+    assert response.headers['ETag'] == f'W/"msg-{third}"'
+    print("✅ after_id returns only newer messages")
+
+
+def test_idle_poll_returns_204():
+    """Nothing newer than the cursor gives an empty 204"""
+    app = create_test_app()
+    last = send(app, 2, 1)
+
+    client = logged_in_client(app)
+    response = client.get(f'/messages/2/new-messages?after_id={last}')
+    assert response.status_code == 204
+    assert response.get_data() == b''
+
+    response = client.get('/messages/3/new-messages?after_id=0')
+    assert response.status_code == 204
+    print("✅ Idle polls return 204")
+
+
+def test_if_none_match_short_circuits():
+    """A matching ETag gets a 304 until a new message arrives"""
+    app = create_test_app()
+    send(app, 2, 1)
+
+    client = logged_in_client(app)
+    response = client.get('/messages/2/new-messages?after_id=0')
+    etag = response.headers['ETag']
+
+    response = client.get('/messages/2/new-messages?after_id=0', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    newest = send(app, 2, 1)
+    response = client.get('/messages/2/new-messages?after_id=0', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['last_id'] == newest
+    print("✅ If-None-Match short-circuits with 304")
+
+
+def test_missing_cursor_is_bounded():
+    """Without a usable cursor only the latest page is returned"""
+    app = create_test_app()
+    with app.app_context():
+        db.session.add_all([Message(sender_id=1, recipient_id=2, content=f'm{i}') for i in range(80)])
+        db.session.commit()
+
+    client = logged_in_client(app)
+    for url in ('/messages/2/new-messages', '/messages/2/new-messages?since=not-a-date'):
+        data = client.get(url).get_json()
+        ids = [m['id'] for m in data['messages']]
+        assert len(ids) == 50
+        assert ids == sorted(ids)
+        assert data['last_id'] == ids[-1] == 80
+    print("✅ Missing cursor returns a bounded latest page")
+
+
+def test_truncated_batch_does_not_hide_rows():
+    """When a batch is cut at the limit, its ETag must not cover the remaining rows"""
+    from conversation_manager import POLL_BATCH_SIZE
+
+    app = create_test_app()
+    with app.app_context():
+        db.session.add_all([Message(sender_id=2, recipient_id=1, content=f'm{i}')
+                            for i in range(POLL_BATCH_SIZE + 5)])
+        db.session.commit()
+
+    client = logged_in_client(app)
+    response = client.get('/messages/2/new-messages?after_id=0')
+    data = response.get_json()
+    assert len(data['messages']) == POLL_BATCH_SIZE
+
+    response = client.get(f"/messages/2/new-messages?after_id={data['last_id']}",
+                          headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 200
+    assert len(response.get_json()['messages']) == 5
+    print("✅ Truncated batches keep the remaining rows reachable")
+
+
+if __name__ == '__main__':
+    test_after_id_returns_only_newer_messages()
+    test_idle_poll_returns_204()
+    test_if_none_match_short_circuits()
+    test_missing_cursor_is_bounded()
+    test_truncated_batch_does_not_hide_rows()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Test Occupancy Bitmaps for Skileez
+This script checks that slots and conflicts read from the cached 5-minute bitmaps
+match the free/busy engine's SQL answers, that warm lookups run no queries, and
+that booking, cancelling and exception edits invalidate a coach's bitmaps.
+"""
+
+import sys
+import os
+import random
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from models import db, ScheduledCall, CoachAvailability, AvailabilityException
+from testing_app import make_test_app, add_users
+from free_busy import get_free_busy_engine
+from occupancy_bitmap import get_occupancy_cache, OccupancyBitmapCache, DAY_BYTES
+
+# US clocks go forward on Sunday 10 March 2030; the 11th is a Monday
+MONDAY = date(2030, 3, 11)
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app(coach_ids=(1,)):
+    """Coaches working 9:00-17:00 New York time on weekdays, plus one student (id 99)"""
+    app = make_test_app()
+    with app.app_context():
+        add_users(tuple(coach_ids) + (99,))
+        for coach_id in coach_ids:
+            availability = CoachAvailability(coach_id=coach_id, timezone='America/New_York', session_duration=60,
+                                             buffer_after=0, saturday_start=0, saturday_end=0,
+                                             sunday_start=0, sunday_end=0)
+            for day in ('monday', 'tuesday', 'wednesday', 'thursday', 'friday'):
+                setattr(availability, f'{day}_start', 9 * 60)
+                setattr(availability, f'{day}_end', 17 * 60)
+            db.session.add(availability)
+        db.session.commit()
+        get_free_busy_engine().get_slots(coach_ids[0], MONDAY, MONDAY)  # table checks run once per engine
+    get_occupancy_cache().clear()
+    return app
+
+
+def add_bookings(app):
+    """Calls on and off the 5-minute grid, across the DST change, and two exceptions"""
+    random.seed(7)
+    with app.app_context():
+        for offset in range(-14, 60, 2):
+            day = MONDAY + timedelta(days=offset)
+            hour = random.choice((13, 14, 15, 16, 17, 18, 19))
+            db.session.add(ScheduledCall(student_id=99, coach_id=1, call_type='paid_session',
+                                         scheduled_at=at(day, hour, random.choice((0, 15, 30))),
+                                         duration_minutes=random.choice((15, 45, 60))))
+        # Off the grid: 10:02-10:17 New York time on the Tuesday
+        db.session.add(ScheduledCall(student_id=99, coach_id=1, call_type='free_consultation',
+                                     scheduled_at=at(MONDAY + timedelta(days=1), 14, 2), duration_minutes=15))
+        availability = CoachAvailability.query.filter_by(coach_id=1).first()
+        db.session.add(AvailabilityException(availability_id=availability.id, date=MONDAY + timedelta(days=3)))
+        db.session.add(AvailabilityException(availability_id=availability.id, date=MONDAY + timedelta(days=4),
+                                             start_time=time(12), end_time=time(13, 30), is_blocked=False))
+        db.session.commit()
+
+
+def count_statements(app, func):
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            result = func()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return result, len(statements)
+
+
+def test_bitmap_slots_match_engine():
+    """Bit scans give the same slots as the SQL engine, across DST and off-grid bookings"""
+    print("=" * 60)
+    print("OCCUPANCY BITMAP TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    add_bookings(app)
+    occupancy = get_occupancy_cache()
+    engine = get_free_busy_engine()
+    start, end = MONDAY - timedelta(days=14), MONDAY + timedelta(days=45)
+    with app.app_context():
+        for duration, step in ((60, None), (30, None), (45, 30), (15, 5)):
+            expected = engine.get_slots(1, start, end, duration, 'Europe/Paris', step_minutes=step)
+            actual = occupancy.get_slots(1, start, end, duration, 'Europe/Paris', step_minutes=step)
+            assert actual == expected, duration
+        tuesday = occupancy.get_slots(1, MONDAY + timedelta(days=1), MONDAY + timedelta(days=1), 15)
+        starts = [slot['start_utc'].strftime('%H:%M') for slot in tuesday[(MONDAY + timedelta(days=1)).isoformat()]]
+        assert '14:00' not in starts and '14:15' not in starts and '13:45' in starts and '14:30' in starts
+        assert len(occupancy._coaches[1].days[MONDAY].open) == DAY_BYTES
+    print("✅ Bitmap slots match the engine for 60 days")
+
+
+def test_conflicts_match_engine():
+    """is_busy agrees with the SQL conflict check on the grid and defers off it"""
+    app = create_test_app()
+    add_bookings(app)
+    occupancy = get_occupancy_cache()
+    engine = get_free_busy_engine()
+    random.seed(11)
+    with app.app_context():
+        for _ in range(500):
+            start = at(MONDAY + timedelta(days=random.randint(-3, 20)), random.randint(0, 23),
+                       random.choice(range(0, 60, 5)))
+            end = start + timedelta(minutes=random.choice((5, 15, 30, 60, 90)))
+            assert occupancy.is_busy(1, start, end) == bool(engine.get_conflicts(1, start, end)), start
+        assert occupancy.is_busy(1, at(MONDAY, 14, 3), at(MONDAY, 14, 18)) is None
+    print("✅ Bitmap conflicts match the engine")
+
+
+def test_warm_lookups_run_no_queries():
+    """A built month answers slot lists and conflict checks from memory"""
+    app = create_test_app()
+    add_bookings(app)
+    occupancy = get_occupancy_cache()
+    month_end = MONDAY + timedelta(days=30)
+
+    _, cold = count_statements(app, lambda: occupancy.get_slots(1, MONDAY, month_end, 60))
+    assert cold == 3, cold  # availability settings, exceptions, bookings
+    _, warm = count_statements(app, lambda: (occupancy.get_slots(1, MONDAY, month_end, 30),
+                                             occupancy.is_busy(1, at(MONDAY, 15), at(MONDAY, 16))))
+    assert warm == 0, warm
+
+    def check_call():
+        from scheduling_utils import check_call_availability
+        return check_call_availability(1, MONDAY + timedelta(days=7), time(10), 'America/New_York', 15,
+                                       use_cache=True)
+    available, queries = count_statements(app, check_call)
+    assert available and queries == 0, queries
+    print(f"✅ Cold month in {cold} queries, warm lookups in {warm}")
+
+
+def test_writes_invalidate_bitmaps():
+    """Booking, cancelling and exception edits are visible on the next lookup"""
+    app = create_test_app()
+    occupancy = get_occupancy_cache()
+    wednesday = MONDAY + timedelta(days=2)
+
+    def wednesday_starts():
+        with app.app_context():
+            slots = occupancy.get_slots(1, wednesday, wednesday, 60)
+        return [slot['start_utc'].strftime('%H:%M') for slot in slots.get(wednesday.isoformat(), [])]
+
+    assert wednesday_starts()[0] == '13:00'  # 9:00 in New York after the clocks change
+
+    with app.app_context():
+        from utils import book_session
+        from models import LearningRequest, Proposal, Session
+        request = LearningRequest(student_id=99, title='Python', description='Learn Python')
+        db.session.add(request)
+        db.session.flush()
+        proposal = Proposal(learning_request_id=request.id, coach_id=1, cover_letter='Hi',
+                            session_count=1, price_per_session=10, session_duration=60, total_price=10)
+        db.session.add(proposal)
+        db.session.flush()
+        # Not scheduled yet, so it holds no time on the calendar
+        session = Session(proposal_id=proposal.id, session_number=1, status='pending')
+        db.session.add(session)
+        db.session.flush()
+        booked = book_session(1, 99, session.id, at(wednesday, 13), 60)
+        booked_id = booked.id
+    assert wednesday_starts()[0] == '14:00'
+
+    with app.app_context():
+        from models import ScheduledSession
+        db.session.get(ScheduledSession, booked_id).status = 'cancelled'
+        db.session.commit()
+    assert wednesday_starts()[0] == '13:00'
+
+    with app.app_context():
+        availability = CoachAvailability.query.filter_by(coach_id=1).first()
+        db.session.add(AvailabilityException(availability_id=availability.id, date=wednesday))
+        db.session.commit()
+    assert wednesday_starts() == []
+
+    with app.app_context():
+        AvailabilityException.query.filter_by(date=wednesday).delete()
+        db.session.commit()
+    # Bulk deletes skip the ORM hooks; the coach is dropped explicitly like any out-of-band edit
+    occupancy.invalidate_coach(1)
+    assert len(wednesday_starts()) == 8
+    print("✅ Writes invalidate the coach's bitmaps")
+
+
+def test_lru_caps_coaches():
+    """Only the most recently used coaches stay cached"""
+    app = create_test_app(coach_ids=(1, 2, 3))
+    occupancy = OccupancyBitmapCache(max_coaches=2)
+    with app.app_context():
+        for coach_id in (1, 2, 3, 2):
+            occupancy.get_slots(coach_id, MONDAY, MONDAY, 60)
+    assert list(occupancy._coaches) == [3, 2]
+    print("✅ LRU keeps the two most recent coaches")
+
+
+if __name__ == '__main__':
+    test_bitmap_slots_match_engine()
+    test_conflicts_match_engine()
+    test_warm_lookups_run_no_queries()
+    test_writes_invalidate_bitmaps()
+    test_lru_caps_coaches()
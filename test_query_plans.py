@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Test Query Plans for Skileez
+This script checks that the hot query paths are served by indexes.
+Set QUERY_PLAN_MESSAGES=1000000 to run against a full-size seed.
+"""
+
+import sys
+import os
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from check_query_plans import check_query_plans, find_full_scans
+
+
+def test_hot_queries_use_indexes():
+    """Every hot query shape should avoid a full table scan"""
+    print("=" * 60)
+    print("QUERY PLAN TEST")
+    print("=" * 60)
+
+    message_count = int(os.environ.get('QUERY_PLAN_MESSAGES', '5000'))
+    failures = check_query_plans(message_count=message_count, verbose=False)
+
+    for name, scans in failures.items():
+        print(f"❌ {name}: {scans}")
+    assert failures == {}
+    print("✅ All hot queries use an index")
+
+
+def test_full_scan_detection():
+    """The plan checker should flag full scans on both SQLite and Postgres"""
+    assert find_full_scans(['SCAN message'], 'sqlite') == ['SCAN message']
+    assert find_full_scans(['SEARCH message USING INDEX ix_message_sender_recipient_created (sender_id=?)'], 'sqlite') == []
+    # Walking a whole index reads every row too
+    assert find_full_scans(['SCAN message USING INDEX ix_message_sender_recipient_created'], 'sqlite') != []
+    assert find_full_scans(['SCAN message USING COVERING INDEX ix_message_recipient_read_sender'], 'sqlite') != []
+    assert find_full_scans(['SCAN user'], 'sqlite') == []
+    assert find_full_scans(['  ->  Seq Scan on message  (cost=0.00..1.01 rows=1)'], 'postgresql') != []
+    assert find_full_scans(['Index Scan using ix_contract_coach_status on contract',
+                            '  Index Cond: (coach_id = 1)'], 'postgresql') == []
+    assert find_full_scans(['Limit  (cost=0.29..0.41 rows=1)',
+                            '  ->  Index Only Scan using ix_message_recipient_read_sender on message',
+                            '        Filter: (NOT is_read)',
+                            '  ->  Index Scan using message_pkey on message m2',
+                            '        Index Cond: (id = 5)'], 'postgresql') == \
+        ['->  Index Only Scan using ix_message_recipient_read_sender on message']
+    print("✅ Full scan detection works")
+
+
+if __name__ == '__main__':
+    test_hot_queries_use_indexes()
+    test_full_scan_detection()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test Schema Capabilities for Skileez
+This script checks the cached has_table / has_column registry: one introspection
+per worker, refresh after DDL and on SIGHUP, and notification endpoints that now
+work on SQLite without a catalog query per request.
+"""
+
+import sys
+import os
+import signal
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, text
+
+from models import db, Notification
+from testing_app import make_test_app, add_user
+from schema_capabilities import (
+    get_schema_capabilities, has_table, has_column, install_sighup_handler
+)
+
+
+def create_test_app():
+    """Minimal app serving the notification endpoints against an in-memory database"""
+    import routes
+
+    app = make_test_app(views=[('/api/notifications/unread-count', routes.get_unread_count)])
+    with app.app_context():
+        add_user(1)
+        db.session.add_all([Notification(user_id=1, title='Hi', message=f'n{i}', type='system')
+                            for i in range(3)])
+        db.session.commit()
+    return app
+
+
+def test_lookups_introspect_once():
+    """Many lookups share one introspection"""
+    print("=" * 60)
+    print("SCHEMA CAPABILITIES TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    capabilities = get_schema_capabilities()
+    with app.app_context():
+        has_table('notification')
+        loads = capabilities.load_count
+        for _ in range(100):
+            assert has_table('notification')
+            assert has_column('session', 'auto_activated')
+            assert not has_table('no_such_table')
+            assert not has_column('notification', 'no_such_column')
+        assert capabilities.load_count == loads
+        print("✅ Lookups are answered from one snapshot")
+
+
+def test_ddl_refreshes_snapshot():
+    """Tables and columns created in this process show up on the next lookup"""
+    app = create_test_app()
+    with app.app_context():
+        assert not has_table('feature_flag')
+        db.session.execute(text("CREATE TABLE feature_flag (id INTEGER PRIMARY KEY)"))
+        assert has_table('feature_flag')
+        assert not has_column('feature_flag', 'enabled')
+        db.session.execute(text("\n    ALTER TABLE feature_flag ADD COLUMN enabled BOOLEAN"))
+        assert has_column('feature_flag', 'enabled')
+        db.session.execute(text("DROP TABLE feature_flag"))
+        assert not has_table('feature_flag')
+        print("✅ DDL refreshes the snapshot")
+
+
+def test_sighup_refreshes_snapshot():
+    """SIGHUP drops the snapshot so the next lookup introspects again"""
+    app = create_test_app()
+    capabilities = get_schema_capabilities()
+    previous = signal.getsignal(signal.SIGHUP)
+    try:
+        assert install_sighup_handler()
+        with app.app_context():
+            has_table('notification')
+            loads = capabilities.load_count
+            os.kill(os.getpid(), signal.SIGHUP)
+            assert has_table('notification')
+            assert capabilities.load_count == loads + 1
+    finally:
+        signal.signal(signal.SIGHUP, previous)
+    print("✅ SIGHUP refreshes the snapshot")
+
+
+def test_unread_count_without_catalog_queries():
+    """The unread-count endpoint works on SQLite and only queries what it needs"""
+    app = create_test_app()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    assert client.get('/api/notifications/unread-count').get_json()['count'] == 3
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert client.get('/api/notifications/unread-count').get_json()['count'] == 3
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert not any('information_schema' in s or 'PRAGMA' in s for s in statements), statements
+    # Current user load plus the count itself
+    assert len(statements) == 2, statements
+    print("✅ Unread count runs without catalog queries")
+
+
+if __name__ == '__main__':
+    test_lookups_introspect_once()
+    test_ddl_refreshes_snapshot()
+    test_sighup_refreshes_snapshot()
+    test_unread_count_without_catalog_queries()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test the Timezone Service for Skileez
+This script checks that ZoneInfo-based localizing and formatting agree with the old
+pytz code across DST changes, that zones and formatters are memoized, that template
+filters bind one formatter per request, and that 1,000 timestamps format in microseconds.
+"""
+
+import sys
+import os
+import time as timer
+from datetime import datetime, date, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytz
+from flask import render_template_string, session
+
+from models import db
+from testing_app import make_test_app, add_user, check_timing
+from timezone_utils import (
+    get_zone, localize, get_formatter, get_request_formatter, convert_many, to_utc, UserTimeFormatter
+)
+
+ZONES = ('America/New_York', 'Europe/London', 'Australia/Sydney', 'Asia/Kolkata', 'America/St_Johns')
+
+
+def pytz_format(value, timezone_name, pattern):
+    """How utils.format_datetime_for_user rendered a stored UTC datetime before"""
+    return pytz.UTC.localize(value).astimezone(pytz.timezone(timezone_name)).strftime(pattern)
+
+
+def test_localize_matches_pytz_across_dst():
+    """Every half hour through two DST changes, including repeated and skipped times"""
+    print("=" * 60)
+    print("TIMEZONE SERVICE TEST")
+    print("=" * 60)
+
+    checked = 0
+    for timezone_name in ZONES:
+        old_zone, new_zone = pytz.timezone(timezone_name), get_zone(timezone_name)
+        for first in (datetime(2030, 3, 8), datetime(2030, 10, 24)):
+            local = first
+            while local < first + timedelta(days=12):
+                expected = old_zone.localize(local).astimezone(pytz.UTC).replace(tzinfo=None)
+                actual = to_utc(local, timezone_name).replace(tzinfo=None)
+                assert actual == expected, (timezone_name, local)
+                assert localize(local, new_zone).utcoffset() == old_zone.localize(local).utcoffset()
+                local += timedelta(minutes=30)
+                checked += 1
+    # pytz zones passed in are still localized by pytz
+    assert localize(datetime(2030, 1, 1), pytz.timezone('Asia/Tokyo')).tzinfo.zone == 'Asia/Tokyo'
+    print(f"✅ {checked} local times localize as pytz did")
+
+
+def test_formatter_matches_old_formatting():
+    """Formats, dates, naive and aware inputs render as before"""
+    from utils import format_datetime_for_user, convert_utc_to_user_timezone, convert_timezone
+
+    patterns = {'date': '%B %d, %Y', 'time': '%I:%M %p', 'short': '%m/%d/%Y %I:%M %p',
+                'full': '%B %d, %Y at %I:%M %p', 'other': '%B %d, %Y at %I:%M %p'}
+    stored = datetime(2030, 11, 3, 6, 30)  # 1:30 in New York, the repeated hour
+    for timezone_name in ZONES:
+        for format_type, pattern in patterns.items():
+            assert format_datetime_for_user(stored, timezone_name, format_type) == \
+                pytz_format(stored, timezone_name, pattern), (timezone_name, format_type)
+        aware = pytz.UTC.localize(stored)
+        assert get_formatter(timezone_name).format(aware) == pytz_format(stored, timezone_name, patterns['full'])
+
+    assert format_datetime_for_user(date(2030, 1, 2), 'Asia/Tokyo', 'short') == '01/02/2030'
+    assert format_datetime_for_user(None, 'UTC') == ''
+    assert convert_utc_to_user_timezone(date(2030, 1, 2), 'Asia/Tokyo') == date(2030, 1, 2)
+    assert convert_timezone(datetime(2030, 7, 1, 9), 'Europe/Paris', 'UTC').hour == 7
+    # Unknown zones fall back to UTC instead of raising mid-render
+    assert get_formatter('Mars/Olympus').format(stored, 'time') == '06:30 AM'
+
+    stamps = [stored + timedelta(hours=hours) for hours in range(48)] + [None, date(2030, 1, 2)]
+    formatter = get_formatter('Europe/London')
+    assert formatter.format_many(stamps, 'short') == [formatter.format(stamp, 'short') for stamp in stamps]
+    assert convert_many(stamps, 'Europe/London') == [formatter.to_local(stamp) for stamp in stamps]
+    print("✅ Formatter output matches the old pytz formatting")
+
+
+def test_zones_and_formatters_are_memoized():
+    """Repeated lookups reuse the same objects"""
+    assert get_zone('America/New_York') is get_zone('America/New_York')
+    assert get_zone('EST') is get_zone('America/New_York')
+    assert get_zone('Not/AZone') is None
+    assert get_formatter('Asia/Kolkata') is get_formatter('Asia/Kolkata')
+    print("✅ Zones and formatters are memoized")
+
+
+def create_test_app():
+    """Minimal app with the template filters from app.py"""
+    app = make_test_app()
+    app.add_template_filter(lambda value, format_type='full': get_request_formatter().format(value, format_type),
+                            'format_datetime')
+    app.add_template_filter(lambda value: get_request_formatter().relative(value), 'relative_time')
+
+    with app.app_context():
+        add_user(1, 'user@example.com', timezone='Asia/Kolkata')
+        db.session.commit()
+    return app
+
+
+def test_request_formatter_is_bound_once():
+    """Filters in one request share a formatter for the signed-in user's zone"""
+    app = create_test_app()
+    stored = datetime(2030, 5, 1, 12)
+    with app.test_request_context():
+        session['user_id'] = 1
+        formatter = get_request_formatter()
+        assert formatter.timezone_name == 'Asia/Kolkata'
+        assert get_request_formatter() is formatter
+        rendered = render_template_string("{{ when|format_datetime('time') }} {{ when|format_datetime('date') }}",
+                                          when=stored)
+        assert rendered == '05:30 PM May 01, 2030'
+        assert render_template_string("{{ when|relative_time }}", when=datetime.utcnow()) == 'Just now'
+    with app.test_request_context():
+        assert get_request_formatter().timezone_name == 'UTC'
+    print("✅ One formatter per request, bound to the user's zone")
+
+
+def test_thousand_timestamps_in_microseconds():
+    """Formatting 1,000 stored timestamps costs a few microseconds each"""
+    stamps = [datetime(2030, 1, 1) + timedelta(minutes=37 * index) for index in range(1000)]
+    formatter = UserTimeFormatter('America/New_York')
+
+    def best_of(func):
+        timings = []
+        for _ in range(5):
+            start = timer.perf_counter()
+            func()
+            timings.append(timer.perf_counter() - start)
+        return min(timings) / len(stamps) * 1e6
+
+    one_by_one = best_of(lambda: [formatter.format(stamp) for stamp in stamps])
+    batch = best_of(lambda: formatter.format_many(stamps))
+    old = best_of(lambda: [pytz_format(stamp, 'America/New_York', '%B %d, %Y at %I:%M %p') for stamp in stamps])
+    assert formatter.format_many(stamps) == [pytz_format(stamp, 'America/New_York', '%B %d, %Y at %I:%M %p')
+                                            for stamp in stamps]
+    check_timing(one_by_one < 20 and batch < 20, f"{one_by_one:.1f}µs / {batch:.1f}µs per timestamp, budget 20µs")
+    print(f"✅ 1,000 timestamps: {one_by_one:.1f}µs each, {batch:.1f}µs batched (pytz path {old:.1f}µs)")
+
+
+if __name__ == '__main__':
+    test_localize_matches_pytz_across_dst()
+    test_formatter_matches_old_formatting()
+    test_zones_and_formatters_are_memoized()
+    test_request_formatter_is_bound_once()
+    test_thousand_timestamps_in_microseconds()
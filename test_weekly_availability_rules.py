@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Test Weekly Availability Rules for Skileez
+This script checks that the per-day columns are mirrored into weekly_availability_rule,
+that days with several windows produce the same slots in the model, the free/busy
+engine and the occupancy bitmaps, and that "who works Tuesday 18:00-19:00" is one
+indexed query.
+"""
+
+import sys
+import os
+import random
+import shutil
+import tempfile
+import threading
+from datetime import datetime, date, time, timedelta
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from models import db, CoachAvailability, WeeklyAvailabilityRule
+from testing_app import make_test_app, add_user
+from free_busy import get_free_busy_engine, backfill_weekly_rules_if_empty
+from occupancy_bitmap import get_occupancy_cache
+
+# A Monday, far enough ahead to never be in the past
+MONDAY = date(2030, 6, 3)
+TUESDAY = MONDAY + timedelta(days=1)
+
+
+def at(day, hour, minute=0):
+    return datetime.combine(day, time(hour, minute))
+
+
+def create_test_app(coach_count=1, uri='sqlite:///:memory:'):
+    """Coaches with the default columns, in UTC, plus one student (id 1000)"""
+    app = make_test_app(uri)
+    with app.app_context():
+        add_user(1000, 'student@example.com', last_name='Student')
+        for coach_id in range(1, coach_count + 1):
+            add_user(coach_id, f'coach{coach_id}@example.com', first_name='Coach', last_name=str(coach_id))
+            db.session.add(CoachAvailability(coach_id=coach_id, timezone='UTC', buffer_after=0))
+        db.session.commit()
+        get_free_busy_engine().get_slots(1, MONDAY, MONDAY)  # table checks run once per engine
+    get_occupancy_cache().clear()
+    return app
+
+
+def rules(coach_id):
+    return [(rule.weekday, rule.start_minute, rule.end_minute) for rule in WeeklyAvailabilityRule.query.filter_by(
+        coach_id=coach_id).order_by(WeeklyAvailabilityRule.weekday, WeeklyAvailabilityRule.start_minute)]
+
+
+def test_columns_are_mirrored_into_rules():
+    """Saving the settings form's columns replaces that day's rules"""
+    print("=" * 60)
+    print("WEEKLY AVAILABILITY RULES TEST")
+    print("=" * 60)
+
+    app = create_test_app()
+    with app.app_context():
+        assert rules(1) == [(weekday, 540, 1020) for weekday in range(7)]
+
+        availability = CoachAvailability.query.filter_by(coach_id=1).first()
+        availability.monday_start = 600
+        availability.sunday_start = availability.sunday_end = 0  # day off
+        db.session.commit()
+        assert rules(1)[0] == (0, 600, 1020)
+        assert [rule[0] for rule in rules(1)] == [0, 1, 2, 3, 4, 5]
+
+        # Several windows on one day; the columns keep the outer bounds
+        availability.set_working_windows(1, [(780, 1020), (540, 720), (700, 760)])
+        db.session.commit()
+        assert rules(1)[1:3] == [(1, 540, 760), (1, 780, 1020)]
+        assert (availability.tuesday_start, availability.tuesday_end) == (540, 1020)
+        assert availability.get_working_hours(1) == (540, 1020)
+        assert not availability.is_working_day(6)
+
+        # Editing another day's columns leaves the split day alone
+        availability.wednesday_end = 900
+        db.session.commit()
+        assert rules(1)[1:4] == [(1, 540, 760), (1, 780, 1020), (2, 540, 900)]
+
+        db.session.delete(availability)
+        db.session.commit()
+        assert rules(1) == []
+    print("✅ Column edits are mirrored into weekly rules")
+
+
+def test_split_days_give_the_same_slots_everywhere():
+    """Model, engine and bitmap slots all restart at each window and skip the gap"""
+    app = create_test_app()
+    with app.app_context():
+        availability = CoachAvailability.query.filter_by(coach_id=1).first()
+        availability.set_working_windows(1, [(540, 720), (810, 1020)])
+        db.session.commit()
+
+        model_starts = [slot['start'] for slot in availability.get_available_slots(TUESDAY, 60)]
+        assert [start.strftime('%H:%M') for start in model_starts] == \
+            ['09:00', '10:00', '11:00', '13:30', '14:30', '15:30']
+
+        engine = get_free_busy_engine().get_slots(1, MONDAY, MONDAY + timedelta(days=6), 60)
+        bitmap = get_occupancy_cache().get_slots(1, MONDAY, MONDAY + timedelta(days=6), 60)
+        assert engine == bitmap
+        assert [slot['start_utc'].replace(tzinfo=None) for slot in engine[TUESDAY.isoformat()]] == model_starts
+
+        # Lunch is not bookable, even for the bulk search
+        found = get_free_busy_engine().get_free_coaches([1], at(TUESDAY, 12), at(TUESDAY, 13), 30)
+        assert found == {}
+        found = get_free_busy_engine().get_free_coaches([1], at(TUESDAY, 12), at(TUESDAY, 14), 30)
+        assert found == {1: at(TUESDAY, 13, 30)}
+    print("✅ Split days give the same slots in the model, engine and bitmaps")
+
+
+def test_coaches_working_is_one_indexed_query():
+    """Tuesday 18:00-19:00 across many coaches comes from a single index scan"""
+    app = create_test_app(coach_count=80)
+    random.seed(4)
+    with app.app_context():
+        for availability in CoachAvailability.query.all():
+            availability.set_working_windows(1, random.choice((
+                [], [(540, 1020)], [(960, 1140)], [(600, 720), (1080, 1200)], [(1110, 1260)]
+            )))
+        db.session.commit()
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            working = get_free_busy_engine().coaches_working(1, 18 * 60, 19 * 60)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert len(statements) == 1
+
+        expected = [availability.coach_id for availability in CoachAvailability.query.order_by(
+            CoachAvailability.coach_id) if any(start <= 1080 and end >= 1140
+                                              for start, end in availability.get_working_windows(1))]
+        assert working == expected and working
+
+        statement, parameters = statements[0]
+        plan = ' '.join(str(row[-1]) for row in db.session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + statement, parameters))
+        assert 'ix_weekly_availability_rule_weekday_start' in plan, plan
+    print(f"✅ {len(working)} of 80 coaches work Tuesday 18:00-19:00, found in one indexed query")
+
+
+def test_backfill_converts_existing_columns():
+    """Databases from before the rules table get one rule per working day on first start"""
+    app = create_test_app(coach_count=3)
+    with app.app_context():
+        availability = CoachAvailability.query.filter_by(coach_id=2).first()
+        availability.saturday_start = availability.saturday_end = 0
+        availability.friday_end = None  # empty columns keep the 17:00 default
+        db.session.commit()
+        expected = {coach_id: rules(coach_id) for coach_id in (1, 2, 3)}
+
+        WeeklyAvailabilityRule.query.delete()
+        db.session.commit()
+        assert backfill_weekly_rules_if_empty() == 20
+        assert backfill_weekly_rules_if_empty() == 0
+        assert {coach_id: rules(coach_id) for coach_id in (1, 2, 3)} == expected
+        assert (4, 540, 1020) in expected[2] and 5 not in [rule[0] for rule in expected[2]]
+    print("✅ Backfill converts the per-day columns")
+
+
+def test_concurrent_backfills_insert_each_rule_once():
+    """Workers starting together may all find the table empty; each rule is still written once"""
+    directory = tempfile.mkdtemp()
+    try:
+        app = create_test_app(coach_count=3, uri=f"sqlite:///{os.path.join(directory, 'rules.db')}")
+        with app.app_context():
+            WeeklyAvailabilityRule.query.delete()
+            db.session.commit()
+        inserted = []
+
+        def worker():
+            with app.app_context():
+                inserted.append(backfill_weekly_rules_if_empty())
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            assert sum(inserted) == 21 and WeeklyAvailabilityRule.query.count() == 21
+            slots = CoachAvailability.query.filter_by(coach_id=1).first().get_available_slots(MONDAY)
+            assert len(slots) == len(set(slot['start'] for slot in slots))
+
+            db.session.add(WeeklyAvailabilityRule(coach_id=1, weekday=0, start_minute=540, end_minute=600))
+            try:
+                db.session.commit()
+                assert False, "a second rule with the same start was accepted"
+            except IntegrityError:
+                db.session.rollback()
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(directory)
+    print("✅ Concurrent backfills insert each rule once")
+
+
+if __name__ == '__main__':
+    test_columns_are_mirrored_into_rules()
+    test_split_days_give_the_same_slots_everywhere()
+    test_coaches_working_is_one_indexed_query()
+    test_backfill_converts_existing_columns()
+    test_concurrent_backfills_insert_each_rule_once()
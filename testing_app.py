@@ -0,0 +1,67 @@
+"""
+Shared setup for the test scripts
+Each test_*.py builds a small Flask app against its own database, serving only the
+routes it exercises, and seeds its own scenario. The app, database and user
+boilerplate they have in common lives here (pytest only collects test_*.py, so
+this module is imported by the tests rather than run as one).
+"""
+
+import os
+
+from flask import Flask
+from werkzeug.security import generate_password_hash
+
+import models
+from models import db, User
+
+# Wall-clock budgets depend on the machine, so benchmarks only fail on them with BENCHMARK_ASSERTS=true
+BENCHMARK_ASSERTS = os.environ.get('BENCHMARK_ASSERTS', 'false').lower() == 'true'
+
+_password_hash = None
+
+def password_hash() -> str:
+    """Hash of 'password', computed once per process since hashing is deliberately slow"""
+    global _password_hash
+    if _password_hash is None:
+        _password_hash = generate_password_hash('password')
+    return _password_hash
+
+def make_test_app(uri: str = 'sqlite:///:memory:', views=(), **config) -> Flask:
+    """
+    App with its tables created in a fresh database at uri. views are (rule, view)
+    or (rule, view, methods) tuples, each served under the view's name next to a
+    /login stub for login_required to redirect to. Keyword arguments go into app.config.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'test'
+    app.config.update(config)
+    models.db.init_app(app)
+    for rule, view, *methods in views:
+        app.add_url_rule(rule, view.__name__, view, methods=methods[0] if methods else None)
+    if views:
+        app.add_url_rule('/login', 'login', lambda: 'login')
+
+    with app.app_context():
+        db.create_all()
+    return app
+
+def add_user(user_id: int, email: str = None, first_name: str = 'Test', last_name: str = 'User',
+             **fields) -> User:
+    """Add a user with password 'password', by default user<id>@example.com"""
+    user = User(id=user_id, email=email or f'user{user_id}@example.com', first_name=first_name,
+                last_name=last_name, password_hash=password_hash(), **fields)
+    db.session.add(user)
+    return user
+
+def add_users(user_ids, **fields) -> list:
+    """Add a user for each id, all with the same fields"""
+    return [add_user(user_id, **fields) for user_id in user_ids]
+
+def check_timing(within_budget: bool, detail) -> None:
+    """Fail a missed timing budget when BENCHMARK_ASSERTS is set, otherwise only report it"""
+    if BENCHMARK_ASSERTS:
+        assert within_budget, detail
+    elif not within_budget:
+        print(f"⚠️  Over the timing budget: {detail}")
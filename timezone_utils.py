@@ -1,50 +1,217 @@
 """
 Enhanced timezone utilities for Calendly-like functionality
 Handles timezone conversion, DST, and user timezone preferences
+
+This is the one timezone service for the app. Zones are memoized ZoneInfo objects,
+so converting a datetime is an offset lookup instead of a registry lookup plus a
+pytz localize. Templates format through a UserTimeFormatter bound once per request
+to the current user's zone, and lists of datetimes convert in one batch.
 """
 
 import pytz
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from datetime import datetime, date, timezone
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Iterable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import logging
 
 logger = logging.getLogger(__name__)
 
+UTC = timezone.utc
+
+# Abbreviations accepted in place of zone names
+TIMEZONE_ALIASES = {
+    'EST': 'America/New_York',
+    'EDT': 'America/New_York',
+    'CST': 'America/Chicago',
+    'CDT': 'America/Chicago',
+    'MST': 'America/Denver',
+    'MDT': 'America/Denver',
+    'PST': 'America/Los_Angeles',
+    'PDT': 'America/Los_Angeles',
+    'GMT': 'Europe/London',
+    'BST': 'Europe/London',
+    'CET': 'Europe/Paris',
+    'CEST': 'Europe/Paris',
+    'JST': 'Asia/Tokyo',
+    'IST': 'Asia/Kolkata',
+    'AEST': 'Australia/Sydney',
+    'AEDT': 'Australia/Sydney'
+}
+
+# strftime patterns for the format types used by templates and emails
+DATETIME_FORMATS = {
+    'date': '%B %d, %Y',
+    'time': '%I:%M %p',
+    'short': '%m/%d/%Y %I:%M %p',
+    'full': '%B %d, %Y at %I:%M %p'
+}
+DATE_FORMATS = {
+    'short': '%m/%d/%Y'
+}
+
+@lru_cache(maxsize=1024)
+def get_zone(timezone_name: Optional[str]) -> Optional[ZoneInfo]:
+    """Memoized ZoneInfo for a zone name or abbreviation (None when unknown)"""
+    name = TIMEZONE_ALIASES.get(timezone_name, timezone_name)
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        logger.error(f"Invalid timezone: {timezone_name}, error: {e}")
+        return None
+
+def zone_or_utc(timezone_name: Optional[str]):
+    return get_zone(timezone_name) or UTC
+
+def localize(local_datetime: datetime, zone) -> datetime:
+    """
+    Attach a zone to a naive local time. Times repeated or skipped by a DST change
+    resolve to standard time, as pytz's localize() does by default.
+    """
+    if hasattr(zone, 'localize'):
+        return zone.localize(local_datetime)
+    first = local_datetime.replace(tzinfo=zone)
+    second = local_datetime.replace(tzinfo=zone, fold=1)
+    if first.utcoffset() == second.utcoffset():
+        return first
+    return second if first.dst() else first
+
+def as_utc(value) -> datetime:
+    """Aware datetime for a stored value: naive datetimes are UTC, dates are UTC midnight"""
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
+
+def format_relative_time(datetime_obj) -> str:
+    """Format datetime as relative time (e.g., '2 hours ago')"""
+    if not datetime_obj:
+        return ''
+    
+    # Handle date objects
+    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
+        diff = date.today() - datetime_obj
+        
+        if diff.days > 0:
+            return f"{diff.days} day{'s' if diff.days != 1 else ''} ago"
+        elif diff.days == 0:
+            return "Today"
+        else:
+            return f"in {abs(diff.days)} day{'s' if abs(diff.days) != 1 else ''}"
+    
+    # Handle datetime objects
+    now = datetime.now(datetime_obj.tzinfo) if datetime_obj.tzinfo else datetime.now()
+    diff = now - datetime_obj
+    
+    if diff.days > 0:
+        return f"{diff.days} day{'s' if diff.days != 1 else ''} ago"
+    elif diff.seconds > 3600:
+        hours = diff.seconds // 3600
+        return f"{hours} hour{'s' if hours != 1 else ''} ago"
+    elif diff.seconds > 60:
+        minutes = diff.seconds // 60
+        return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
+    else:
+        return "Just now"
+
+class UserTimeFormatter:
+    """Converts and formats stored UTC datetimes for one zone"""
+    
+    def __init__(self, timezone_name: Optional[str] = 'UTC'):
+        self.timezone_name = timezone_name or 'UTC'
+        self.zone = zone_or_utc(self.timezone_name)
+    
+    def to_local(self, value):
+        """Datetime in this zone; naive values are UTC, dates pass through unchanged"""
+        if not value:
+            return None
+        if not isinstance(value, datetime):
+            return value
+        return as_utc(value).astimezone(self.zone)
+    
+    def to_local_many(self, values: Iterable) -> List:
+        """to_local for a list, with the zone and conversion looked up once"""
+        zone = self.zone
+        return [
+            (value.replace(tzinfo=UTC) if value.tzinfo is None else value).astimezone(zone)
+            if isinstance(value, datetime) else (value or None)
+            for value in values
+        ]
+    
+    def format(self, value, format_type: str = 'full') -> str:
+        """Format a stored datetime (or date) as 'date', 'time', 'short' or 'full'"""
+        if not value:
+            return ''
+        if not isinstance(value, datetime):
+            return value.strftime(DATE_FORMATS.get(format_type, '%B %d, %Y'))
+        pattern = DATETIME_FORMATS.get(format_type, DATETIME_FORMATS['full'])
+        return as_utc(value).astimezone(self.zone).strftime(pattern)
+    
+    def format_many(self, values: Iterable, format_type: str = 'full') -> List[str]:
+        """Format a list of stored datetimes in one pass"""
+        pattern = DATETIME_FORMATS.get(format_type, DATETIME_FORMATS['full'])
+        return [
+            value.strftime(pattern) if value and isinstance(value, datetime) else self.format(value, format_type)
+            for value in self.to_local_many(values)
+        ]
+    
+    def relative(self, value) -> str:
+        """Relative time ('2 hours ago') measured in this zone"""
+        if not value:
+            return ''
+        return format_relative_time(self.to_local(value))
+
+@lru_cache(maxsize=1024)
+def get_formatter(timezone_name: Optional[str] = 'UTC') -> UserTimeFormatter:
+    """Shared formatter for a zone; formatters hold no per-request state"""
+    return UserTimeFormatter(timezone_name)
+
+def get_request_formatter() -> UserTimeFormatter:
+    """Formatter for the current user's zone, resolved once per request"""
+    from flask import g, has_request_context
+    if not has_request_context():
+        return get_formatter('UTC')
+    formatter = g.get('timezone_formatter')
+    if formatter is None:
+        from utils import get_current_user, get_user_timezone
+        formatter = get_formatter(get_user_timezone(get_current_user()))
+        g.timezone_formatter = formatter
+    return formatter
+
 class TimezoneManager:
     """Manages timezone conversions and user timezone preferences"""
     
     def __init__(self):
-        self.common_timezones = {
-            'UTC': 'UTC',
-            'EST': 'America/New_York',
-            'EDT': 'America/New_York',
-            'CST': 'America/Chicago',
-            'CDT': 'America/Chicago',
-            'MST': 'America/Denver',
-            'MDT': 'America/Denver',
-            'PST': 'America/Los_Angeles',
-            'PDT': 'America/Los_Angeles',
-            'GMT': 'Europe/London',
-            'BST': 'Europe/London',
-            'CET': 'Europe/Paris',
-            'CEST': 'Europe/Paris',
-            'JST': 'Asia/Tokyo',
-            'IST': 'Asia/Kolkata',
-            'AEST': 'Australia/Sydney',
-            'AEDT': 'Australia/Sydney'
-        }
+        self.common_timezones = dict(TIMEZONE_ALIASES, UTC='UTC')
     
-    def get_timezone_object(self, timezone_name: str) -> Optional[pytz.timezone]:
+    def get_timezone_object(self, timezone_name: str) -> Optional[ZoneInfo]:
         """Get timezone object from timezone name"""
-        try:
-            # Handle common abbreviations
-            if timezone_name in self.common_timezones:
-                timezone_name = self.common_timezones[timezone_name]
-            
-            return pytz.timezone(timezone_name)
-        except Exception as e:
-            logger.error(f"Invalid timezone: {timezone_name}, error: {e}")
-            return None
+        return get_zone(timezone_name)
+    
+    def localize(self, local_datetime: datetime, timezone_name: str) -> datetime:
+        """Attach the named zone to a naive local time (standard time when ambiguous)"""
+        return localize(local_datetime, zone_or_utc(timezone_name))
+    
+    def to_utc(self, value: datetime, timezone_name: str = 'UTC') -> datetime:
+        """Aware UTC datetime; naive values are local time in timezone_name"""
+        if value.tzinfo is None:
+            value = localize(value, zone_or_utc(timezone_name))
+        return value.astimezone(UTC)
+    
+    def to_local(self, value, timezone_name: str):
+        """Stored UTC datetime in the named zone"""
+        return get_formatter(timezone_name).to_local(value)
+    
+    def convert_many(self, values: Iterable, timezone_name: str) -> List:
+        """Batch conversion of stored UTC datetimes into the named zone"""
+        return get_formatter(timezone_name).to_local_many(values)
+    
+    def formatter(self, timezone_name: str) -> UserTimeFormatter:
+        """Formatter bound to the named zone"""
+        return get_formatter(timezone_name)
     
     def convert_datetime(self, dt: datetime, from_tz: str, to_tz: str) -> Optional[datetime]:
         """Convert datetime from one timezone to another"""
@@ -57,11 +224,10 @@ class TimezoneManager:
             
             # If datetime is naive, assume it's in from_tz
             if dt.tzinfo is None:
-                dt = from_tz_obj.localize(dt)
+                dt = localize(dt, from_tz_obj)
             
             # Convert to target timezone
-            converted_dt = dt.astimezone(to_tz_obj)
-            return converted_dt
+            return dt.astimezone(to_tz_obj)
             
         except Exception as e:
             logger.error(f"Error converting datetime: {e}")
@@ -89,18 +255,10 @@ class TimezoneManager:
             if not tz_obj:
                 return dt.strftime(format_str)
             
-            # Convert to target timezone
-            if dt.tzinfo is None:
-                dt = pytz.UTC.localize(dt)
+            local_dt = as_utc(dt).astimezone(tz_obj)
             
-            local_dt = dt.astimezone(tz_obj)
-            
-            # Get timezone abbreviation
-            tz_abbr = local_dt.strftime('%Z')
-            
-            # Format with timezone
-            formatted = local_dt.strftime(format_str)
-            return f"{formatted} {tz_abbr}"
+            # Format with timezone abbreviation
+            return f"{local_dt.strftime(format_str)} {local_dt.strftime('%Z')}"
             
         except Exception as e:
             logger.error(f"Error formatting datetime: {e}")
@@ -145,7 +303,9 @@ class TimezoneManager:
         
         for tz_name in pytz.all_timezones:
             try:
-                tz_obj = pytz.timezone(tz_name)
+                tz_obj = get_zone(tz_name)
+                if not tz_obj:
+                    continue
                 now = datetime.now(tz_obj)
                 offset = now.strftime('%z')
                 
@@ -261,3 +421,11 @@ def get_common_timezones() -> List[str]:
         'Australia/Sydney',
         'Pacific/Auckland'
     ]
+
+def to_utc(value: datetime, timezone_name: str = 'UTC') -> datetime:
+    """Aware UTC datetime; naive values are local time in timezone_name"""
+    return timezone_manager.to_utc(value, timezone_name)
+
+def convert_many(values: Iterable, timezone_name: str) -> List:
+    """Convert a list of stored UTC datetimes into a zone in one batch"""
+    return timezone_manager.convert_many(values, timezone_name)
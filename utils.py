@@ -1,5 +1,5 @@
 from functools import wraps
-from flask import session, redirect, url_for, flash, jsonify, request
+from flask import session, redirect, url_for, flash, jsonify, request, g
 import os
 import uuid
 import logging
@@ -108,7 +108,7 @@ def role_required(required_role):
                 flash('Please log in to access this page.', 'error')
                 return redirect(url_for('login'))
 
-            user = get_user_model().query.get(session['user_id'])
+            user = get_current_user()
             if not user:
                 flash('Please log in to access this page.', 'error')
                 return redirect(url_for('login'))
@@ -226,7 +226,7 @@ def profile_completion_required(f):
             flash('Please log in to access this page.', 'error')
             return redirect(url_for('login'))
 
-        user = get_user_model().query.get(session['user_id'])
+        user = get_current_user()
         if not user:
             flash('Please log in to access this page.', 'error')
             return redirect(url_for('login'))
@@ -256,9 +256,49 @@ def profile_completion_required(f):
     return decorated_function
 
 def get_current_user():
-    if 'user_id' in session:
-        return get_user_model().query.get(session['user_id'])
-    return None
+    """
+    Return the logged-in user, loaded once per request.
+
+    The user (with student and coach profiles eager-loaded) is kept on
+    flask.g so decorators, the context processor, template filters and the
+    view itself all share one object instead of re-querying.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+
+    cached = g.get('_current_user')
+    if cached is not None and cached[0] == user_id:
+        user = cached[1]
+        if user is None or not _is_detached(user):
+            return user
+
+    user = _load_user_with_profiles(user_id)
+    g._current_user = (user_id, user)
+    return user
+
+def _load_user_with_profiles(user_id):
+    """Load a user and both role profiles in one query, counting the load"""
+    from sqlalchemy.orm import joinedload
+    User = get_user_model()
+    g.user_load_count = g.get('user_load_count', 0) + 1
+    return User.query.options(
+        joinedload(User.student_profile),
+        joinedload(User.coach_profile)
+    ).filter_by(id=user_id).first()
+
+def _is_detached(obj):
+    """True when the cached object was dropped from the session (e.g. session.remove())"""
+    from sqlalchemy import inspect as sa_inspect
+    return sa_inspect(obj).detached
+
+def clear_current_user_cache():
+    """Forget the cached user so the next get_current_user() reloads it"""
+    g.pop('_current_user', None)
+
+def get_user_load_count():
+    """Number of user loads performed by the current request (debug aid)"""
+    return g.get('user_load_count', 0)
 
 def validate_role_switch(user, target_role):
     """
@@ -765,6 +805,11 @@ def get_contract_model():
 # ============================================================================
 # TIMEZONE UTILITY FUNCTIONS
 # ============================================================================
+# Thin wrappers over the timezone service in timezone_utils
+
+from timezone_utils import (
+    get_zone, zone_or_utc, localize, get_formatter, format_relative_time, UTC
+)
 
 def get_user_timezone(user=None):
     """Get user's timezone preference, defaulting to UTC"""
@@ -777,153 +822,67 @@ def get_user_timezone(user=None):
             pass
     return 'UTC'
 
-def get_timezone_object(timezone_name):
-    """Get pytz timezone object, defaulting to UTC if invalid"""
-    try:
-        return pytz.timezone(timezone_name)
-    except pytz.exceptions.UnknownTimeZoneError:
-        return pytz.UTC
-
-def convert_utc_to_user_timezone(utc_datetime, user_timezone='UTC'):
-    """Convert UTC datetime to user's local timezone"""
-    if not utc_datetime:
+def convert_timezone(datetime_obj, from_tz, to_tz):
+    """Convert datetime between timezones"""
+    if not datetime_obj:
         return None
     
-    # Handle date objects (convert to datetime at midnight UTC)
-    if isinstance(utc_datetime, date) and not isinstance(utc_datetime, datetime):
-        # It's a date object, convert to datetime at midnight UTC
-        from datetime import datetime as dt
-        utc_datetime = dt.combine(utc_datetime, dt.min.time())
+    # Handle date objects (convert to datetime at midnight)
+    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
+        datetime_obj = datetime.combine(datetime_obj, datetime.min.time())
     
-    # Ensure datetime is timezone-aware
-    if utc_datetime.tzinfo is None:
-        utc_datetime = utc_datetime.replace(tzinfo=pytz.UTC)
+    # Make datetime timezone-aware if it isn't already
+    if datetime_obj.tzinfo is None:
+        from_zone = zone_or_utc(from_tz) if isinstance(from_tz, str) else from_tz
+        datetime_obj = localize(datetime_obj, from_zone)
     
-    # Convert to user timezone
-    user_tz = get_timezone_object(user_timezone)
-    return utc_datetime.astimezone(user_tz)
+    # Convert to target timezone
+    to_zone = zone_or_utc(to_tz) if isinstance(to_tz, str) else to_tz
+    return datetime_obj.astimezone(to_zone)
+
+def convert_utc_to_user_timezone(datetime_obj, user_timezone='UTC'):
+    """Convert UTC datetime to user's timezone (dates are returned unchanged)"""
+    return get_formatter(user_timezone).to_local(datetime_obj)
 
 def convert_user_timezone_to_utc(local_datetime, user_timezone='UTC'):
     """Convert user's local datetime to UTC"""
     if not local_datetime:
         return None
-    
-    # Ensure datetime is timezone-aware
-    if local_datetime.tzinfo is None:
-        user_tz = get_timezone_object(user_timezone)
-        local_datetime = user_tz.localize(local_datetime)
-    
-    # Convert to UTC
-    return local_datetime.astimezone(pytz.UTC)
+    return convert_timezone(local_datetime, user_timezone, UTC)
 
 def format_datetime_for_user(datetime_obj, user_timezone='UTC', format_type='full'):
-    """Format datetime for user's timezone with different format options"""
-    if not datetime_obj:
-        return ''
-    
-    # Handle date objects (they don't need timezone conversion)
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        # It's a date object, format directly
-        if format_type == 'time_only':
-            return ''  # No time for date objects
-        elif format_type == 'date_only':
-            return datetime_obj.strftime('%b %d, %Y')
-        elif format_type == 'short':
-            return datetime_obj.strftime('%b %d')
-        elif format_type == 'relative':
-            # For date objects, just return the formatted date
-            return datetime_obj.strftime('%b %d, %Y')
-        else:  # full
-            return datetime_obj.strftime('%B %d, %Y')
-    
-    # Handle datetime objects (convert to user timezone)
-    local_time = convert_utc_to_user_timezone(datetime_obj, user_timezone)
-    
-    # Format based on type
-    if format_type == 'time_only':
-        return local_time.strftime('%I:%M %p')
-    elif format_type == 'date_only':
-        return local_time.strftime('%b %d, %Y')
-    elif format_type == 'short':
-        return local_time.strftime('%b %d, %I:%M %p')
-    elif format_type == 'relative':
-        return format_relative_time(local_time)
-    else:  # full
-        return local_time.strftime('%B %d, %Y at %I:%M %p')
-
-def format_relative_time(datetime_obj):
-    """Format datetime as relative time (e.g., '2 hours ago')"""
+    """Format datetime for user's timezone ('date', 'time', 'short' or 'full')"""
+    return get_formatter(user_timezone).format(datetime_obj, format_type)
+
+def format_datetime_in_timezone(datetime_obj, timezone_name, format_str="%Y-%m-%d %H:%M"):
+    """Format datetime in a specific timezone"""
     if not datetime_obj:
-        return ''
-    
-    # Handle date objects
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        # For date objects, just return the formatted date
-        return datetime_obj.strftime('%b %d, %Y')
-    
-    # Convert date objects to datetime for comparison
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        from datetime import datetime as dt
-        datetime_obj = dt.combine(datetime_obj, dt.min.time())
-    
-    # Handle timezone-aware datetime objects
-    if hasattr(datetime_obj, 'tzinfo') and datetime_obj.tzinfo:
-        now = datetime.now(datetime_obj.tzinfo)
-    else:
-        now = datetime.now()
-    
-    diff = now - datetime_obj
-    
-    if diff.days > 0:
-        if diff.days == 1:
-            return 'Yesterday'
-        elif diff.days < 7:
-            return f'{diff.days} days ago'
-        else:
-            return datetime_obj.strftime('%b %d')
-    
-    hours = diff.seconds // 3600
-    if hours > 0:
-        if hours == 1:
-            return '1 hour ago'
-        else:
-            return f'{hours} hours ago'
-    
-    minutes = (diff.seconds % 3600) // 60
-    if minutes > 0:
-        if minutes == 1:
-            return '1 minute ago'
-        else:
-            return f'{minutes} minutes ago'
+        return ""
     
-    return 'Just now'
-
-
+    converted = convert_timezone(datetime_obj, 'UTC', timezone_name)
+    return converted.strftime(format_str)
 
 def is_dst_active(timezone_name):
     """Check if daylight saving time is active in the given timezone"""
-    try:
-        tz = pytz.timezone(timezone_name)
-        now = datetime.now(tz)
-        return now.dst() != timedelta(0)
-    except:
+    zone = get_zone(timezone_name)
+    if not zone:
         return False
+    return datetime.now(zone).dst() != timedelta(0)
 
 def get_timezone_offset(timezone_name):
-    """Get current timezone offset from UTC"""
-    try:
-        tz = pytz.timezone(timezone_name)
-        now = datetime.now(tz)
-        offset = now.utcoffset()
-        hours = int(offset.total_seconds() // 3600)
-        minutes = int((offset.total_seconds() % 3600) // 60)
-        
-        if hours >= 0:
-            return f"+{hours:02d}:{minutes:02d}"
-        else:
-            return f"-{abs(hours):02d}:{minutes:02d}"
-    except:
-        return "+00:00"
+    """Get current offset for a timezone"""
+    zone = get_zone(timezone_name)
+    if not zone:
+        return "UTC"
+    
+    offset = datetime.now(zone).utcoffset()
+    hours = int(offset.total_seconds() / 3600)
+    minutes = int((offset.total_seconds() % 3600) / 60)
+    
+    if minutes == 0:
+        return f"UTC{hours:+d}"
+    else:
+        return f"UTC{hours:+d}:{minutes:02d}"
 
 # ============================================================================
 # ENTERPRISE SCHEDULING SYSTEM UTILITIES
@@ -934,24 +893,6 @@ from datetime import datetime, timedelta, date
 from typing import List, Dict, Optional, Tuple
 import json
 
-def get_user_timezone(user):
-    """Get user's timezone, defaulting to UTC"""
-    if hasattr(user, 'timezone') and user.timezone:
-        return user.timezone
-    return 'UTC'
-
-def convert_timezone(dt, from_tz, to_tz):
-    """Convert datetime between timezones"""
-    if isinstance(from_tz, str):
-        from_tz = pytz.timezone(from_tz)
-    if isinstance(to_tz, str):
-        to_tz = pytz.timezone(to_tz)
-    
-    if dt.tzinfo is None:
-        dt = from_tz.localize(dt)
-    
-    return dt.astimezone(to_tz)
-
 def get_coach_availability(coach_id):
     """Get or create coach availability settings"""
     from models import CoachAvailability
@@ -976,108 +917,39 @@ def get_booking_rules(coach_id):
     
     return rules
 
-def check_availability_conflict(coach_id, start_time, end_time, exclude_session_id=None):
-    """Check if a time slot conflicts with existing sessions"""
-    from models import ScheduledSession
-    
-    # Get all scheduled sessions for the coach in the time range
-    query = ScheduledSession.query.filter(
-        ScheduledSession.coach_id == coach_id,
-        ScheduledSession.status.in_(['scheduled', 'confirmed', 'started']),
-        ScheduledSession.scheduled_at < end_time,
-        ScheduledSession.scheduled_at + timedelta(minutes=ScheduledSession.duration_minutes) > start_time
-    )
+def check_availability_conflict(coach_id, start_time, end_time, exclude_session_id=None, use_cache=False):
+    """
+    Check if a time slot conflicts with the coach's bookings (scheduled sessions,
+    contract sessions and calls). exclude_session_id is a ScheduledSession ID.
+    Returns (has_conflict, conflicting bookings as free_busy.BusyInterval).
+    use_cache answers a free slot from the occupancy bitmaps without SQL; leave it
+    off right before writing a booking.
+    """
+    from free_busy import get_conflicts
     
-    if exclude_session_id:
-        query = query.filter(ScheduledSession.id != exclude_session_id)
+    if use_cache and exclude_session_id is None:
+        from occupancy_bitmap import is_coach_busy
+        if is_coach_busy(coach_id, start_time, end_time) is False:
+            return False, []
     
-    conflicting_sessions = query.all()
-    return len(conflicting_sessions) > 0, conflicting_sessions
+    conflicts = get_conflicts(coach_id, start_time, end_time,
+                              exclude_scheduled_session_id=exclude_session_id)
+    return len(conflicts) > 0, conflicts
 
 def get_available_slots_for_date(coach_id, target_date, duration_minutes=None, timezone='UTC'):
     """Get available time slots for a specific date"""
-    from models import CoachAvailability, AvailabilityException, ScheduledSession
-    
-    # Get coach availability
-    availability = get_coach_availability(coach_id)
-    if not availability.is_available:
-        return []
-    
-    # Convert date to coach's timezone
-    coach_tz = pytz.timezone(availability.timezone or 'UTC')
-    target_tz = pytz.timezone(timezone)
-    
-    # Get working hours for the day
-    day_of_week = target_date.weekday()
-    start_minutes, end_minutes = availability.get_working_hours(day_of_week)
-    
-    if not availability.is_working_day(day_of_week):
-        return []
-    
-    # Check for exceptions
-    exceptions = AvailabilityException.query.filter_by(
-        availability_id=availability.id,
-        date=target_date
-    ).all()
-    
-    if any(ex.is_blocked for ex in exceptions):
-        return []
-    
-    # Use provided duration or coach's default
-    duration = duration_minutes or availability.session_duration
-    
-    # Generate time slots
-    slots = []
-    current_time = start_minutes
-    
-    while current_time + duration <= end_minutes:
-        slot_start = datetime.combine(target_date, datetime.min.time()) + timedelta(minutes=current_time)
-        slot_end = slot_start + timedelta(minutes=duration)
-        
-        # Convert to UTC for database queries
-        slot_start_utc = coach_tz.localize(slot_start).astimezone(pytz.UTC)
-        slot_end_utc = coach_tz.localize(slot_end).astimezone(pytz.UTC)
-        
-        # Check if slot conflicts with exceptions
-        slot_conflicts = False
-        for exception in exceptions:
-            if exception.overlaps_with(slot_start, slot_end):
-                slot_conflicts = True
-                break
-        
-        if not slot_conflicts:
-            # Check if slot conflicts with existing sessions
-            has_conflict, _ = check_availability_conflict(coach_id, slot_start_utc, slot_end_utc)
-            
-            if not has_conflict:
-                # Convert back to target timezone for display
-                slot_start_display = slot_start_utc.astimezone(target_tz)
-                slot_end_display = slot_end_utc.astimezone(target_tz)
-                
-                slots.append({
-                    'start': slot_start_display,
-                    'end': slot_end_display,
-                    'start_utc': slot_start_utc,
-                    'end_utc': slot_end_utc,
-                    'available': True
-                })
-        
-        current_time += duration + availability.buffer_after
-    
-    return slots
+    slots = get_available_slots_for_range(coach_id, target_date, target_date, duration_minutes, timezone)
+    return slots.get(target_date.isoformat(), [])
 
 def get_available_slots_for_range(coach_id, start_date, end_date, duration_minutes=None, timezone='UTC'):
-    """Get available slots for a date range"""
-    all_slots = {}
-    current_date = start_date
-    
-    while current_date <= end_date:
-        slots = get_available_slots_for_date(coach_id, current_date, duration_minutes, timezone)
-        if slots:
-            all_slots[current_date.isoformat()] = slots
-        current_date += timedelta(days=1)
+    """Get available slots for a date range from the coach's cached occupancy bitmaps"""
+    from occupancy_bitmap import get_occupancy_cache
     
-    return all_slots
+    occupancy = get_occupancy_cache()
+    if occupancy.settings(coach_id) is None:
+        # Creates the default availability row for coaches who never saved one
+        get_coach_availability(coach_id)
+    return occupancy.get_slots(coach_id, start_date, end_date, duration_minutes, timezone)
 
 def book_session(coach_id, student_id, session_id, scheduled_at, duration_minutes, 
                 session_type='paid', is_consultation=False, timezone='UTC'):
@@ -1090,10 +962,9 @@ def book_session(coach_id, student_id, session_id, scheduled_at, duration_minute
     
     if scheduled_at.tzinfo is None:
         # Assume it's in the specified timezone
-        tz = pytz.timezone(timezone)
-        scheduled_at = tz.localize(scheduled_at)
+        scheduled_at = localize(scheduled_at, zone_or_utc(timezone))
     
-    scheduled_at_utc = scheduled_at.astimezone(pytz.UTC)
+    scheduled_at_utc = scheduled_at.astimezone(UTC)
     end_time_utc = scheduled_at_utc + timedelta(minutes=duration_minutes)
     
     # Check for conflicts
@@ -1116,9 +987,11 @@ def book_session(coach_id, student_id, session_id, scheduled_at, duration_minute
         is_consultation=is_consultation
     )
     
+    # The calendar_event overlap constraint settles two requests that passed the check together
+    from booking_guard import commit_booking
     db = get_db()
     db.session.add(scheduled_session)
-    db.session.commit()
+    commit_booking(db.session)
     
     return scheduled_session
 
@@ -1186,21 +1059,9 @@ def can_schedule_post_contract(student_id, coach_id):
 def get_upcoming_sessions_for_user(user_id, role, limit=10):
     """Get upcoming sessions for a user"""
     from models import ScheduledSession
-    
-    if role == 'coach':
-        sessions = ScheduledSession.query.filter(
-            ScheduledSession.coach_id == user_id,
-            ScheduledSession.status.in_(['scheduled', 'confirmed']),
-            ScheduledSession.scheduled_at > datetime.utcnow()
-        ).order_by(ScheduledSession.scheduled_at).limit(limit).all()
-    else:  # student
-        sessions = ScheduledSession.query.filter(
-            ScheduledSession.student_id == user_id,
-            ScheduledSession.status.in_(['scheduled', 'confirmed']),
-            ScheduledSession.scheduled_at > datetime.utcnow()
-        ).order_by(ScheduledSession.scheduled_at).limit(limit).all()
-    
-    return sessions
+    from calendar_events import get_upcoming
+
+    return get_upcoming(ScheduledSession, user_id, role, ['scheduled', 'confirmed'], limit)
 
 def send_session_notifications(scheduled_session, notification_type):
     """Send notifications for session events"""
@@ -1275,8 +1136,7 @@ def format_time_slot(slot, timezone='UTC'):
         start_time = slot['start']
     
     if start_time.tzinfo is None:
-        tz = pytz.timezone(timezone)
-        start_time = tz.localize(start_time)
+        start_time = localize(start_time, zone_or_utc(timezone))
     
     return {
         'start': start_time.strftime('%I:%M %p'),
@@ -1342,8 +1202,7 @@ def get_timezone_choices():
         for tz_name in timezones:
             if tz_name in all_timezones:
                 try:
-                    tz = pytz.timezone(tz_name)
-                    offset = tz.utcoffset(now)
+                    offset = now.replace(tzinfo=get_zone(tz_name)).utcoffset()
                     offset_str = f"UTC{'+' if offset.total_seconds() >= 0 else ''}{int(offset.total_seconds() / 3600):+d}"
                     
                     # Create a user-friendly name
@@ -1359,11 +1218,11 @@ def get_timezone_choices():
                     timezone_choices.append((tz_name, tz_name))
     
     # Add remaining timezones (not in our organized list)
+    listed = {choice[0] for choice in timezone_choices}
     for tz_name in all_timezones:
-        if tz_name not in [choice[0] for choice in timezone_choices]:
+        if tz_name not in listed:
             try:
-                tz = pytz.timezone(tz_name)
-                offset = tz.utcoffset(now)
+                offset = now.replace(tzinfo=get_zone(tz_name)).utcoffset()
                 offset_str = f"UTC{'+' if offset.total_seconds() >= 0 else ''}{int(offset.total_seconds() / 3600):+d}"
                 
                 if '/' in tz_name:
@@ -1379,8 +1238,7 @@ def get_timezone_choices():
     # Sort by offset for better organization
     def sort_key(choice):
         try:
-            tz = pytz.timezone(choice[0])
-            offset = tz.utcoffset(now)
+            offset = now.replace(tzinfo=get_zone(choice[0])).utcoffset()
             return offset.total_seconds()
         except:
             return 0
@@ -1397,7 +1255,6 @@ def get_available_timezones():
 
 def get_common_timezones():
     """Get a beautifully organized list of the most common timezones"""
-    import pytz
     from datetime import datetime
     
     now = datetime.now()
@@ -1466,8 +1323,7 @@ def get_common_timezones():
         
         for tz_name, city_name in timezones:
             try:
-                tz = pytz.timezone(tz_name)
-                offset = tz.utcoffset(now)
+                offset = now.replace(tzinfo=get_zone(tz_name)).utcoffset()
                 offset_str = f"UTC{'+' if offset.total_seconds() >= 0 else ''}{int(offset.total_seconds() / 3600):+d}"
                 
                 # Create beautiful display name
@@ -1482,132 +1338,6 @@ def get_common_timezones():
     
     return common_timezones
 
-def convert_timezone(datetime_obj, from_tz, to_tz):
-    """Convert datetime between timezones"""
-    import pytz
-    from datetime import date, datetime
-    
-    if not datetime_obj:
-        return None
-    
-    # Handle date objects (convert to datetime at midnight)
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        datetime_obj = datetime.combine(datetime_obj, datetime.min.time())
-    
-    # Make datetime timezone-aware if it isn't already
-    if datetime_obj.tzinfo is None:
-        from_tz = pytz.timezone(from_tz) if isinstance(from_tz, str) else from_tz
-        datetime_obj = from_tz.localize(datetime_obj)
-    
-    # Convert to target timezone
-    to_tz = pytz.timezone(to_tz) if isinstance(to_tz, str) else to_tz
-    return datetime_obj.astimezone(to_tz)
-
-def get_timezone_offset(timezone_name):
-    """Get current offset for a timezone"""
-    import pytz
-    from datetime import datetime
-    
-    try:
-        tz = pytz.timezone(timezone_name)
-        offset = tz.utcoffset(datetime.now())
-        hours = int(offset.total_seconds() / 3600)
-        minutes = int((offset.total_seconds() % 3600) / 60)
-        
-        if minutes == 0:
-            return f"UTC{hours:+d}"
-        else:
-            return f"UTC{hours:+d}:{minutes:02d}"
-    except Exception:
-        return "UTC"
-
-def format_datetime_in_timezone(datetime_obj, timezone_name, format_str="%Y-%m-%d %H:%M"):
-    """Format datetime in a specific timezone"""
-    if not datetime_obj:
-        return ""
-    
-    converted = convert_timezone(datetime_obj, 'UTC', timezone_name)
-    return converted.strftime(format_str)
-
-def get_user_timezone(user):
-    """Get user's timezone, defaulting to UTC if not set"""
-    if user and hasattr(user, 'timezone') and user.timezone:
-        return user.timezone
-    return 'UTC'
-
-def convert_utc_to_user_timezone(datetime_obj, user_timezone):
-    """Convert UTC datetime to user's timezone"""
-    from datetime import date, datetime
-    
-    # Handle date objects (no timezone conversion needed for dates)
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        return datetime_obj
-    
-    return convert_timezone(datetime_obj, 'UTC', user_timezone)
-
-def format_datetime_for_user(datetime_obj, user_timezone, format_type='full'):
-    """Format datetime for user's timezone"""
-    from datetime import date, datetime
-    
-    if not datetime_obj:
-        return ''
-    
-    # Handle date objects differently
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        # For date objects, just format the date directly
-        if format_type == 'date':
-            return datetime_obj.strftime('%B %d, %Y')
-        elif format_type == 'short':
-            return datetime_obj.strftime('%m/%d/%Y')
-        else:  # full or any other type
-            return datetime_obj.strftime('%B %d, %Y')
-    
-    # For datetime objects, use timezone conversion
-    converted = convert_utc_to_user_timezone(datetime_obj, user_timezone)
-    
-    if format_type == 'date':
-        return converted.strftime('%B %d, %Y')
-    elif format_type == 'time':
-        return converted.strftime('%I:%M %p')
-    elif format_type == 'short':
-        return converted.strftime('%m/%d/%Y %I:%M %p')
-    else:  # full
-        return converted.strftime('%B %d, %Y at %I:%M %p')
-
-def format_relative_time(datetime_obj):
-    """Format datetime as relative time (e.g., '2 hours ago')"""
-    from datetime import datetime, date
-    
-    if not datetime_obj:
-        return ''
-    
-    # Handle date objects
-    if isinstance(datetime_obj, date) and not isinstance(datetime_obj, datetime):
-        now = date.today()
-        diff = now - datetime_obj
-        
-        if diff.days > 0:
-            return f"{diff.days} day{'s' if diff.days != 1 else ''} ago"
-        elif diff.days == 0:
-            return "Today"
-        else:
-            return f"in {abs(diff.days)} day{'s' if abs(diff.days) != 1 else ''}"
-    
-    # Handle datetime objects
-    now = datetime.now(datetime_obj.tzinfo) if datetime_obj.tzinfo else datetime.now()
-    diff = now - datetime_obj
-    
-    if diff.days > 0:
-        return f"{diff.days} day{'s' if diff.days != 1 else ''} ago"
-    elif diff.seconds > 3600:
-        hours = diff.seconds // 3600
-        return f"{hours} hour{'s' if hours != 1 else ''} ago"
-    elif diff.seconds > 60:
-        minutes = diff.seconds // 60
-        return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
-    else:
-        return "Just now"
-
 def validate_session_booking(coach_id, student_id, scheduled_at, duration_minutes, session_type):
     """Validate session booking parameters"""
     errors = []
@@ -1622,7 +1352,7 @@ def validate_session_booking(coach_id, student_id, scheduled_at, duration_minute
     
     # Check for conflicts
     end_time = scheduled_at + timedelta(minutes=duration_minutes)
-    has_conflict, _ = check_availability_conflict(coach_id, scheduled_at, end_time)
+    has_conflict, _ = check_availability_conflict(coach_id, scheduled_at, end_time, use_cache=True)
     if has_conflict:
         errors.append("Selected time slot conflicts with existing sessions")
     
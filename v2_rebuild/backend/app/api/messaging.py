@@ -7,10 +7,11 @@ from typing import List
 from datetime import datetime, timezone
 
 from ..models.database import get_db
-from ..models.messaging import Message, Notification
+from ..models.messaging import Message, Notification, Conversation, ConversationParticipant
 from ..models.user import User
 from ..models.marketplace import Contract, Proposal, LearningRequest
 from ..schemas.messaging import MessageCreate, MessageOut, NotificationOut
+from ..services.conversations import record_message
 from .deps import get_current_user
 
 router = APIRouter(prefix="/messages", tags=["Messaging"])
@@ -53,6 +54,10 @@ async def send_message(
         sender_id=current_user.id
     )
     db.add(new_msg)
+    await db.flush()
+    
+    # Keep the shared conversation row and unread counter in the same transaction
+    await record_message(db, new_msg)
     
     # Create notification for recipient
     notif = Notification(
@@ -88,31 +93,24 @@ async def get_conversations(
     db: AsyncSession = Depends(get_db)
 ):
     """Get list of recent conversations (for sidebar)"""
-    # This is a complex query to get distinct users.
-    # For now, simplistic approach: Get all unique conversation partners.
-    # Proper SQL would be better but keeping it simple for V2 prototype first.
-    
-    # Find all messages involving user
+    # One row per partner from the maintained conversation tables
     result = await db.execute(
-        select(Message)
-        .where(or_(Message.sender_id == current_user.id, Message.recipient_id == current_user.id))
-        .order_by(Message.created_at.desc())
+        select(ConversationParticipant, Message)
+        .join(Conversation, Conversation.id == ConversationParticipant.conversation_id)
+        .join(Message, Message.id == Conversation.last_message_id)
+        .where(ConversationParticipant.user_id == current_user.id)
+        .order_by(desc(Conversation.last_message_id))
     )
-    messages = result.scalars().all()
     
-    # Process in python
-    partners = {}
-    for m in messages:
-        pid = m.recipient_id if m.sender_id == current_user.id else m.sender_id
-        if pid not in partners:
-            partners[pid] = {
-                "user_id": pid,
-                "last_message": m.content,
-                "timestamp": m.created_at,
-                "unread": 0 # Logic needed
-            }
-            
-    return list(partners.values())
+    return [
+        {
+            "user_id": participant.partner_id,
+            "last_message": message.content,
+            "timestamp": message.created_at,
+            "unread": participant.unread_count
+        }
+        for participant, message in result.all()
+    ]
 
 @router.get("/context/{other_user_id}")
 async def get_conversation_context(
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from .database import Base
@@ -26,6 +26,38 @@ class Message(Base):
     recipient = relationship("User", foreign_keys=[recipient_id], backref="received_messages")
     session = relationship("Session", backref="messages")
 
+class Conversation(Base):
+    __tablename__ = "conversation"
+    __table_args__ = (
+        UniqueConstraint("user_low_id", "user_high_id", name="uq_conversation_pair"),
+    )
+
+    # 1:1 Mirror of the v1 conversation table (unordered user pair, lower ID first)
+    id = Column(Integer, primary_key=True, index=True)
+    user_low_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    user_high_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    last_message_id = Column(Integer, ForeignKey("message.id"), nullable=True)
+    last_activity_at = Column(DateTime)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    last_message = relationship("Message", foreign_keys=[last_message_id])
+    participants = relationship("ConversationParticipant", back_populates="conversation")
+
+class ConversationParticipant(Base):
+    __tablename__ = "conversation_participant"
+    __table_args__ = (
+        UniqueConstraint("conversation_id", "user_id", name="uq_conversation_participant"),
+        Index("ix_conversation_participant_user_partner", "user_id", "partner_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversation.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    partner_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+    conversation = relationship("Conversation", back_populates="participants")
+
 class Notification(Base):
     __tablename__ = "notification"
 
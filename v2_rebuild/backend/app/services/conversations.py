@@ -0,0 +1,78 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import update, or_
+from datetime import datetime, timezone
+from ..models.messaging import Message, Conversation, ConversationParticipant
+
+def pair_for(user_a_id: int, user_b_id: int):
+    """Unordered user pair key (lower ID first), same as v1"""
+    return (min(user_a_id, user_b_id), max(user_a_id, user_b_id))
+
+def _insert_ignoring_conflicts(db: AsyncSession, model, index_elements):
+    """INSERT that skips rows already present under a unique key (Postgres and SQLite), as in v1"""
+    if db.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model).on_conflict_do_nothing(index_elements=index_elements)
+
+async def _find_conversation(db: AsyncSession, user_low_id: int, user_high_id: int):
+    result = await db.execute(
+        select(Conversation).where(
+            Conversation.user_low_id == user_low_id,
+            Conversation.user_high_id == user_high_id
+        )
+    )
+    return result.scalars().first()
+
+async def get_or_create_conversation(db: AsyncSession, user_a_id: int, user_b_id: int) -> Conversation:
+    """
+    The pair's conversation, created with its participant rows on first use. Two
+    first messages sent at once both insert with ON CONFLICT DO NOTHING, so the
+    slower one reuses the row the other created instead of failing.
+    """
+    user_low_id, user_high_id = pair_for(user_a_id, user_b_id)
+    conversation = await _find_conversation(db, user_low_id, user_high_id)
+    if conversation:
+        return conversation
+
+    await db.execute(
+        _insert_ignoring_conflicts(db, Conversation, ['user_low_id', 'user_high_id']).values(
+            user_low_id=user_low_id, user_high_id=user_high_id, created_at=datetime.now(timezone.utc)
+        )
+    )
+    conversation = await _find_conversation(db, user_low_id, user_high_id)
+
+    participants = [{'conversation_id': conversation.id, 'user_id': user_low_id,
+                     'partner_id': user_high_id, 'unread_count': 0}]
+    if user_low_id != user_high_id:
+        participants.append({'conversation_id': conversation.id, 'user_id': user_high_id,
+                             'partner_id': user_low_id, 'unread_count': 0})
+    await db.execute(
+        _insert_ignoring_conflicts(db, ConversationParticipant, ['conversation_id', 'user_id']), participants
+    )
+    return conversation
+
+async def record_message(db: AsyncSession, message: Message):
+    """Fold a flushed message into its conversation; commits with the caller's transaction"""
+    conversation = await get_or_create_conversation(db, message.sender_id, message.recipient_id)
+    activity_at = message.created_at or datetime.now(timezone.utc)
+
+    await db.execute(
+        update(Conversation)
+        .where(
+            Conversation.id == conversation.id,
+            or_(Conversation.last_message_id.is_(None), Conversation.last_message_id < message.id)
+        )
+        .values(last_message_id=message.id, last_activity_at=activity_at)
+    )
+
+    if not message.is_read and message.sender_id != message.recipient_id:
+        await db.execute(
+            update(ConversationParticipant)
+            .where(
+                ConversationParticipant.conversation_id == conversation.id,
+                ConversationParticipant.user_id == message.recipient_id
+            )
+            .values(unread_count=ConversationParticipant.unread_count + 1)
+        )